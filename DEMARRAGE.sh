@@ -31,7 +31,8 @@ sleep 1
 
 # Activer l'environnement virtuel et démarrer
 source env/bin/activate
-nohup python backend/api.py > backend_logs.txt 2>&1 &
+python backend/migrations.py index > backend_logs.txt 2>&1
+nohup python backend/api.py >> backend_logs.txt 2>&1 &
 BACKEND_PID=$!
 
 # Attendre que le backend soit prêt
@@ -0,0 +1,250 @@
+"""
+Contrôle d'admission des routes de reconnaissance lourdes
+
+Sans limite, un afflux de vidéos en début de cours fait décoder trop de
+vidéos à la fois : le worker manque de mémoire et les routes CRUD expirent.
+Chaque route lourde (video, webcam, reconnaissance) a donc, par worker:
+
+  - un nombre maximal d'analyses simultanées ;
+  - une file d'attente bornée, où une requête attend au plus
+    ADMISSION_ATTENTE_MAX secondes ;
+  - une part maximale par séance (code du cours).
+
+Refus:
+    503 file_pleine : la file de la route est pleine
+    503 attente     : place non obtenue dans le délai
+    429 seance      : la séance a déjà trop d'analyses en cours ou en attente
+    413 taille      : corps de requête trop gros (vérifié avant lecture)
+    413 duree       : vidéo trop longue (vérifié avant décodage)
+
+Les refus 429/503 portent un Retry-After estimé d'après la durée récente
+des analyses de la route. Refus, file et attente: /metrics.
+
+La séance est lue dans l'en-tête X-Code-Cours ou le paramètre ?code_cours=,
+jamais dans le corps : une requête refusée ne coûte pas l'envoi de sa
+vidéo. Sans l'un ni l'autre, la part par séance ne s'applique pas.
+
+Les compteurs sont ceux du processus. Ils ne valent pour toute la machine
+que si un seul processus sert les routes lourdes : c'est le cas du pool
+lourd de production (gunicorn.conf.py, un worker gthread par machine).
+Avec WORKERS > 1, chaque limite s'applique par worker.
+
+Usage:
+    from admission import ADMISSIONS
+    with ADMISSIONS['video'].entrer(code_cours):
+        resultat = analyser_video(...)
+"""
+import asyncio
+import math
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+import config
+from metriques import ADMISSION_EN_COURS, ADMISSION_FILE, ADMISSION_ATTENTE, ADMISSION_REFUS
+
+# Poids de la dernière durée dans la moyenne glissante (Retry-After)
+LISSAGE_DUREE = 0.2
+
+# En-tête portant la séance d'une requête lourde (sinon paramètre ?code_cours=)
+ENTETE_SEANCE = 'X-Code-Cours'
+
+
+class AdmissionRefusee(Exception):
+    """Requête refusée : statut HTTP, raison (voir le module) et Retry-After en secondes"""
+
+    def __init__(self, statut, raison, message, retry_after=None):
+        super().__init__(message)
+        self.statut = statut
+        self.raison = raison
+        self.message = message
+        self.retry_after = retry_after
+
+
+class Admission:
+    """Sémaphore à file d'attente bornée, avec part maximale par séance"""
+
+    def __init__(self, nom, concurrence, file_max, attente_max=None, par_seance=0, taille_max=None):
+        """
+        Args:
+            nom: Nom de la route (label des métriques)
+            concurrence: Analyses simultanées au plus
+            file_max: Requêtes en attente au plus (0 = refus immédiat si plein)
+            attente_max: Secondes d'attente au plus (défaut: ADMISSION_ATTENTE_MAX)
+            par_seance: Requêtes admises ou en attente par séance au plus (0 = sans limite)
+            taille_max: Octets au plus pour le corps de la requête (None = sans limite)
+        """
+        self.nom = nom
+        self.concurrence = concurrence
+        self.file_max = file_max
+        self.attente_max = attente_max if attente_max is not None else config.ADMISSION_ATTENTE_MAX
+        self.par_seance = par_seance
+        self.taille_max = taille_max
+        self._condition = threading.Condition()
+        self._en_cours = 0
+        self._en_attente = 0
+        self._seances = {}  # {seance: requêtes admises ou en attente}
+        self._duree_moyenne = None
+
+    def _retry_after(self):
+        """Secondes avant qu'une place se libère probablement (sous verrou)"""
+        duree = self._duree_moyenne or 1.0
+        vagues = (self._en_attente + 1) / max(1, self.concurrence)
+        return max(1, math.ceil(duree * vagues))
+
+    def refuser(self, statut, raison, message, retry_after=True):
+        """Compte le refus et lève AdmissionRefusee"""
+        ADMISSION_REFUS.inc(route=self.nom, raison=raison)
+        if retry_after:
+            with self._condition:
+                retry_after = self._retry_after()
+        raise AdmissionRefusee(statut, raison, message, retry_after or None)
+
+    def verifier_taille(self, octets):
+        """Refuse (413) un corps de requête annoncé au-delà de taille_max"""
+        if self.taille_max is not None and octets is not None and octets > self.taille_max:
+            self.refuser(
+                413, 'taille',
+                f"Requête trop volumineuse ({octets / 1e6:.1f} Mo, maximum {self.taille_max / 1e6:.0f} Mo)",
+                retry_after=False
+            )
+
+    def _acquerir(self, seance):
+        """Attend une place ; lève AdmissionRefusee en cas de saturation"""
+        debut = time.monotonic()
+        with self._condition:
+            compte = False
+            if self.par_seance and seance is not None and self._seances.get(seance, 0) >= self.par_seance:
+                refus = (429, 'seance', f"Analyse déjà en cours pour {seance}, réessayez plus tard")
+            elif self._en_cours < self.concurrence and self._en_attente == 0:
+                refus = None
+            elif self._en_attente >= self.file_max:
+                refus = (503, 'file_pleine', 'Serveur saturé, réessayez plus tard')
+            else:
+                # Une requête en attente compte dans la part de sa séance :
+                # une séance ne peut pas occuper toute la file
+                self._compter_seance(seance, 1)
+                compte = True
+                refus = self._attendre(debut)
+                if refus is not None:
+                    self._compter_seance(seance, -1)
+            if refus is None:
+                self._en_cours += 1
+                if not compte:
+                    self._compter_seance(seance, 1)
+                ADMISSION_EN_COURS.inc(route=self.nom)
+        if refus is not None:
+            self.refuser(*refus)
+        ADMISSION_ATTENTE.observe(time.monotonic() - debut, route=self.nom)
+        return time.monotonic()
+
+    def _attendre(self, debut):
+        """Attente dans la file (sous verrou) ; retourne le refus éventuel"""
+        self._en_attente += 1
+        ADMISSION_FILE.inc(route=self.nom)
+        try:
+            while self._en_cours >= self.concurrence:
+                restant = self.attente_max - (time.monotonic() - debut)
+                if restant <= 0:
+                    return (503, 'attente', 'Serveur saturé, réessayez plus tard')
+                self._condition.wait(restant)
+            return None
+        finally:
+            self._en_attente -= 1
+            ADMISSION_FILE.dec(route=self.nom)
+
+    def _compter_seance(self, seance, ecart):
+        """Ajoute `ecart` aux requêtes admises ou en attente de la séance (sous verrou)"""
+        if seance is None:
+            return
+        nombre = self._seances.get(seance, 0) + ecart
+        if nombre:
+            self._seances[seance] = nombre
+        else:
+            del self._seances[seance]
+
+    def _liberer(self, seance, debut):
+        with self._condition:
+            self._en_cours -= 1
+            self._compter_seance(seance, -1)
+            if debut is not None:
+                duree = time.monotonic() - debut
+                self._duree_moyenne = duree if self._duree_moyenne is None else \
+                    (1 - LISSAGE_DUREE) * self._duree_moyenne + LISSAGE_DUREE * duree
+            ADMISSION_EN_COURS.dec(route=self.nom)
+            self._condition.notify()
+
+    @contextmanager
+    def entrer(self, seance=None):
+        """Occupe une place pendant le bloc (threads Flask/gunicorn)"""
+        debut = self._acquerir(seance)
+        try:
+            yield
+        finally:
+            self._liberer(seance, debut)
+
+    @asynccontextmanager
+    async def entrer_async(self, seance=None):
+        """
+        Variante pour api_async : l'attente se fait dans un thread, la
+        boucle d'événements reste libre (au plus file_max threads attendent)
+        """
+        acquisition = asyncio.ensure_future(asyncio.to_thread(self._acquerir, seance))
+        try:
+            debut = await asyncio.shield(acquisition)
+        except asyncio.CancelledError:
+            # Requête abandonnée pendant l'attente : rendre la place si elle arrive
+            acquisition.add_done_callback(
+                lambda tache: tache.cancelled() or tache.exception() or self._liberer(seance, None)
+            )
+            raise
+        try:
+            yield
+        finally:
+            self._liberer(seance, debut)
+
+    def etat(self):
+        with self._condition:
+            return {
+                'en_cours': self._en_cours,
+                'en_attente': self._en_attente,
+                'concurrence': self.concurrence,
+                'file_max': self.file_max,
+                'duree_moyenne': round(self._duree_moyenne, 3) if self._duree_moyenne is not None else None
+            }
+
+
+ADMISSIONS = {
+    'video': Admission(
+        'video', config.ADMISSION_VIDEO_CONCURRENCE, config.ADMISSION_VIDEO_FILE,
+        par_seance=config.ADMISSION_PAR_SEANCE, taille_max=config.VIDEO_TAILLE_MAX_MO * 1024 * 1024
+    ),
+    'webcam': Admission(
+        'webcam', config.ADMISSION_WEBCAM_CONCURRENCE, config.ADMISSION_WEBCAM_FILE,
+        par_seance=config.ADMISSION_PAR_SEANCE, taille_max=config.WEBCAM_TAILLE_MAX_MO * 1024 * 1024
+    ),
+    'reconnaissance': Admission(
+        'reconnaissance', config.ADMISSION_RECONNAISSANCE_CONCURRENCE, config.ADMISSION_RECONNAISSANCE_FILE,
+        taille_max=config.WEBCAM_TAILLE_MAX_MO * 1024 * 1024
+    ),
+}
+
+
+def seance_requete(requete):
+    """Séance (code du cours) d'une requête Flask ou Quart, sans lire le corps ; None si absente"""
+    return requete.headers.get(ENTETE_SEANCE) or requete.args.get('code_cours') or None
+
+
+def verifier_duree_video(duree):
+    """Refuse (413) une vidéo plus longue que VIDEO_DUREE_MAX secondes"""
+    if duree is not None and duree > config.VIDEO_DUREE_MAX:
+        ADMISSIONS['video'].refuser(
+            413, 'duree',
+            f"Vidéo trop longue ({duree / 60:.1f} min, maximum {config.VIDEO_DUREE_MAX / 60:.0f} min)",
+            retry_after=False
+        )
+
+
+def etat_admission():
+    """Places occupées et files d'attente par route"""
+    return {nom: admission.etat() for nom, admission in ADMISSIONS.items()}
@@ -1,27 +1,40 @@
 """
 Flask + MongoDB + Reconnaissance Faciale
 """
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file, g, Response
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 import sys
-from datetime import datetime
-import base64
-import io
-from PIL import Image
+from datetime import datetime, timedelta
+import functools
+import hmac
+import importlib
+import json
 import logging
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import cv2
-import face_recognition
-import numpy as np
+import time
 
 # Ajouter le répertoire parent au path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from database import DatabaseManager
-from face_manager import FaceRecognitionManager
+from demarrage import Paresseux, chronometrer, rapport
+
+# Les modules de reconnaissance (cv2, face_recognition) ne sont importés que
+# par les routes qui en ont besoin : un worker CRUD ne charge jamais dlib.
+with chronometrer('import_dependances'):
+    from database import DatabaseManager
+    from face_manager import FaceRecognitionManager
+    from rapports import GenerateurRapports, FORMATS
+from notifications import OutboxNotifications, ExpediteurEmails
+from journal_presences import JournalPresences, VidangeJournal
+from photos import MagasinPhotos, PhotoInvalide, ENTETE_CACHE
+from metriques import REGISTRE, REQUETES, REQUETE_DUREE, mesurer
+from serialisation import FournisseurJSON, reponse_flux
+import ordonnanceur
+import memoire
+import profilage
+from service_appariement import AppariementIndisponible
+from admission import ADMISSIONS, AdmissionRefusee, verifier_duree_video, etat_admission, seance_requete
 import config
 
 # Configuration logging
@@ -34,32 +47,254 @@ logger = logging.getLogger(__name__)
 # Initialiser Flask
 app = Flask(__name__)
 CORS(app)  # Autoriser CORS pour le frontend
+app.json = FournisseurJSON(app)  # ObjectId, datetime... convertis à l'encodage (serialisation.py)
+
+# Initialiser managers (créés au premier usage ; les index sont créés par
+# `python migrations.py index`)
+db = Paresseux('connexion_mongodb', DatabaseManager)
+face_mgr = Paresseux('galerie', FaceRecognitionManager)
+rapports = Paresseux('rapports', lambda: GenerateurRapports(db))
+reconnaissance = Paresseux('import_reconnaissance', lambda: importlib.import_module('reconnaissance'))
+magasin_photos = MagasinPhotos()
+
+# Durée des commandes MongoDB dans les profils à la demande (avant la création du client)
+if config.DIAGNOSTIC_JETON:
+    profilage.installer_ecoute_mongo()
+
+# Notifications email: les routes déposent, l'expéditeur envoie en arrière-plan
+outbox = OutboxNotifications(db)
+if config.EMAIL_EXPEDITEUR_INTEGRE:
+    ExpediteurEmails(db).demarrer()
+
+# Présences: déposées dans le journal local, écrites dans MongoDB en arrière-plan
+journal = JournalPresences()
+vidange = VidangeJournal(journal, db)
+if config.JOURNAL_PRESENCES_ACTIF and config.JOURNAL_VIDANGE_INTEGREE:
+    vidange.demarrer()
+
+REGISTRE.jauge(
+    'presence_galerie_taille', 'Encodages de visages chargés en mémoire',
+    fonction=lambda: len(face_mgr.known_ids) if face_mgr.est_initialise else 0
+)
+REGISTRE.jauge(
+    'presence_journal_en_attente', 'Présences journalisées pas encore écrites dans MongoDB',
+    fonction=lambda: journal.taille() if config.JOURNAL_PRESENCES_ACTIF else 0
+)
+REGISTRE.jauge(
+    'presence_journal_plus_ancienne_secondes', 'Âge de la plus ancienne présence journalisée en attente',
+    fonction=lambda: journal.age() if config.JOURNAL_PRESENCES_ACTIF else 0
+)
+
+def enregistrer_presences(code_cours, presents, source, confiances=None):
+    """
+    Enregistre les présents d'une séance sans attendre MongoDB
+
+    La présence est déposée dans le journal local puis écrite par la
+    vidange ; sans journal (JOURNAL_PRESENCES_ACTIF=false), elle est écrite
+    directement comme avant.
+
+    Returns:
+        str: ID de l'entrée du journal (ou de la présence MongoDB)
+    """
+    if not config.JOURNAL_PRESENCES_ACTIF:
+        return db.ajouter_presence(code_cours, presents, datetime.now(), source=source, confiances=confiances)
+    with mesurer('journal'):
+        identifiant = journal.deposer(code_cours, presents, datetime.now(), source=source, confiances=confiances)
+    vidange.signaler()
+    return identifiant
+
+def galerie_a_jour():
+    """
+    Galerie du worker, rechargée si un autre processus a inscrit ou supprimé
+    un étudiant depuis son chargement (voir FaceRecognitionManager.actualiser)
+    """
+    face_mgr.actualiser()
+    return face_mgr
+
+# ==================== MÉTRIQUES ====================
+
+@app.before_request
+def demarrer_chrono():
+    """Mémorise l'heure de début de la requête"""
+    g.debut_requete = time.perf_counter()
+    if config.MEMOIRE_INSTRUMENTATION:
+        g.rss_debut = memoire.rss_octets()
+
+@app.after_request
+def enregistrer_metriques(response):
+    """Compte la requête et sa durée par route (motif, pas l'URL réelle)"""
+    route = request.url_rule.rule if request.url_rule else 'inconnue'
+    REQUETES.inc(route=route, methode=request.method, statut=response.status_code)
+    if 'debut_requete' in g:
+        REQUETE_DUREE.observe(time.perf_counter() - g.debut_requete, route=route)
+    if 'rss_debut' in g:
+        memoire.enregistrer_requete(route, request.method, g.rss_debut)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métriques au format d'exposition Prometheus"""
+    return Response(REGISTRE.exporter(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
-# Initialiser managers
-db = DatabaseManager()
-face_mgr = FaceRecognitionManager()
+@app.route('/api/ordonnanceur', methods=['GET'])
+def etat_ordonnanceur():
+    """Files d'attente et débit par séance de l'ordonnanceur de ce worker (pool lourd)"""
+    etat = ordonnanceur.etat_ordonnanceur()
+    return jsonify({'success': True, 'actif': etat is not None, 'data': etat, 'admission': etat_admission()}), 200
 
-# Configuration Email (vous pouvez modifier ces paramètres)
-EMAIL_HOST = 'smtp.gmail.com'
-EMAIL_PORT = 587
-EMAIL_USER = 'votre.email@gmail.com'  # À configurer
-EMAIL_PASSWORD = 'votre_mot_de_passe'  # À configurer avec mot de passe d'application
-EMAIL_FROM = 'Système de Présence ISIMM <noreply@isimm.tn>'
+# ==================== DIAGNOSTIC (MÉMOIRE, PROFILAGE) ====================
 
+def jeton_diagnostic_valide():
+    """L'en-tête X-Jeton-Diagnostic correspond à DIAGNOSTIC_JETON (administrateurs)"""
+    jeton = request.headers.get('X-Jeton-Diagnostic', '')
+    return bool(config.DIAGNOSTIC_JETON) and hmac.compare_digest(
+        jeton.encode('utf-8'), config.DIAGNOSTIC_JETON.encode('utf-8')
+    )
 
+def jeton_diagnostic(vue):
+    """Réserve une route de diagnostic aux appels munis de l'en-tête X-Jeton-Diagnostic"""
+    @functools.wraps(vue)
+    def verifier(*args, **kwargs):
+        if not config.DIAGNOSTIC_JETON:
+            return jsonify({'success': False, 'erreur': 'Diagnostic désactivé (DIAGNOSTIC_JETON)'}), 404
+        if not jeton_diagnostic_valide():
+            return jsonify({'success': False, 'erreur': 'Jeton de diagnostic invalide'}), 403
+        return vue(*args, **kwargs)
+    return verifier
 
-# Initialiser managers
-db = DatabaseManager()
-face_mgr = FaceRecognitionManager()
+def profilable(vue):
+    """
+    Profilage à la demande d'une route de reconnaissance (voir profilage.py)
+
+    Activé par l'en-tête X-Profil ou le paramètre ?profil= (etapes,
+    cprofile, echantillons), avec le jeton de diagnostic. Le détail des
+    étapes est ajouté à la réponse JSON et à l'en-tête Server-Timing.
+    """
+    @functools.wraps(vue)
+    def executer(*args, **kwargs):
+        mode = request.headers.get('X-Profil') or request.args.get('profil')
+        if not mode:
+            return vue(*args, **kwargs)
+        if not jeton_diagnostic_valide():
+            return jsonify({'success': False, 'erreur': 'Profilage réservé aux administrateurs'}), 403
+        if mode not in profilage.MODES:
+            return jsonify({
+                'success': False, 'erreur': f"Mode de profilage inconnu: {mode} ({', '.join(profilage.MODES)})"
+            }), 400
+
+        profil = profilage.Profil(mode, request.url_rule.rule)
+        with profil.activer():
+            reponse = app.make_response(vue(*args, **kwargs))
+        donnees = reponse.get_json(silent=True)
+        if isinstance(donnees, dict):
+            donnees['profil'] = profil.resume()
+            reponse.set_data(app.json.dumps(donnees))
+        reponse.headers['Server-Timing'] = profil.server_timing()
+        return reponse
+    return executer
+
+@app.route('/api/diagnostic/memoire', methods=['GET'])
+@jeton_diagnostic
+def etat_memoire():
+    """RSS, traçage tracemalloc et mémoire de la galerie du worker qui répond"""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'rss_octets': memoire.rss_octets(),
+        'instrumentation': config.MEMOIRE_INSTRUMENTATION,
+        'limite_worker_octets': config.WORKER_RSS_MAX_MO * memoire.MO or None,
+        'tracemalloc': memoire.INSTANTANES.etat(),
+        'galerie': face_mgr.memoire_galerie() if face_mgr.est_initialise else None
+    }), 200
+
+@app.route('/api/diagnostic/memoire/instantanes', methods=['POST'])
+@jeton_diagnostic
+def capturer_instantane():
+    """Prend un instantané tracemalloc (démarre le traçage au premier appel)"""
+    return jsonify({'success': True, 'pid': os.getpid(), 'data': memoire.INSTANTANES.capturer()}), 201
+
+@app.route('/api/diagnostic/memoire/instantanes', methods=['DELETE'])
+@jeton_diagnostic
+def arreter_instantanes():
+    """Arrête tracemalloc et oublie les instantanés"""
+    memoire.INSTANTANES.arreter()
+    return jsonify({'success': True, 'pid': os.getpid()}), 200
+
+@app.route('/api/diagnostic/memoire/comparaison', methods=['GET'])
+@jeton_diagnostic
+def comparer_instantanes():
+    """Allocations qui ont le plus augmenté entre deux instantanés (?depuis=0&jusqua=-1&grouper=lineno&limite=25)"""
+    try:
+        comparaison = memoire.INSTANTANES.comparer(
+            depuis=request.args.get('depuis', 0, type=int),
+            jusqua=request.args.get('jusqua', -1, type=int),
+            grouper=request.args.get('grouper', 'lineno'),
+            limite=request.args.get('limite', 25, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'erreur': str(e)}), 400
+    return jsonify({'success': True, 'pid': os.getpid(), 'data': comparaison}), 200
+
+# ==================== CONTRÔLE D'ADMISSION ====================
+
+@app.errorhandler(AppariementIndisponible)
+def appariement_indisponible(erreur):
+    """Appariement impossible : aucune présence enregistrée, le client peut réessayer"""
+    logger.error(f"❌ {request.path}: {erreur}")
+    return jsonify({'success': False, 'erreur': str(erreur)}), 503
+
+@app.errorhandler(AdmissionRefusee)
+def refus_admission(erreur):
+    """Route lourde saturée (429/503, avec Retry-After) ou envoi trop gros (413)"""
+    logger.warning(f"⛔ {request.path}: {erreur.message} ({erreur.raison})")
+    reponse = jsonify({'success': False, 'erreur': erreur.message, 'raison': erreur.raison})
+    reponse.status_code = erreur.statut
+    if erreur.retry_after:
+        reponse.headers['Retry-After'] = str(erreur.retry_after)
+    return reponse
+
+def admettre(nom):
+    """
+    Contrôle d'admission d'une route lourde (voir admission.py)
+
+    Le pool léger de production refuse la route (421) sans lire le corps.
+    La taille annoncée et la part de la séance (code du cours en en-tête
+    X-Code-Cours ou en paramètre ?code_cours=) sont vérifiées avant toute
+    lecture du corps, puis la requête attend sa place dans la file de la
+    route : une requête refusée ne coûte pas l'envoi de la vidéo.
+    """
+    admission = ADMISSIONS[nom]
+    
+    def decorateur(route):
+        @functools.wraps(route)
+        def enveloppe(*args, **kwargs):
+            if config.POOL == 'leger':
+                # Mauvais pool : le client doit s'adresser au pool lourd
+                return jsonify({
+                    'success': False,
+                    'erreur': f"Route de reconnaissance servie par le pool lourd ({config.POOL_LOURD_URL})",
+                    'pool_lourd': config.POOL_LOURD_URL
+                }), 421
+            admission.verifier_taille(request.content_length)
+            request.max_content_length = admission.taille_max
+            with admission.entrer(seance_requete(request)):
+                try:
+                    request.form  # corps sans Content-Length : taille vérifiée à la lecture
+                except RequestEntityTooLarge:
+                    admission.refuser(413, 'taille', 'Requête trop volumineuse', retry_after=False)
+                return route(*args, **kwargs)
+        return enveloppe
+    return decorateur
 
 # ==================== ROUTES SANTÉ ====================
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Vérification de la santé du service"""
+    """Vérification de la santé du service (temps constant)"""
     try:
         # Tester MongoDB
-        etudiants_count = len(db.obtenir_tous_etudiants())
+        db.ping()
+        etudiants_count = db.compter_etudiants()
         
         return jsonify({
             'status': 'healthy',
@@ -67,7 +302,8 @@ def health_check():
             'timestamp': datetime.now().isoformat(),
             'mongodb': 'connected',
             'etudiants': etudiants_count,
-            'encodages': len(face_mgr.known_encodings)
+            # La galerie n'est pas chargée par /health (workers CRUD)
+            'encodages': len(face_mgr.known_encodings) if face_mgr.est_initialise else None
         }), 200
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -83,17 +319,19 @@ def get_etudiants():
     """Récupérer tous les étudiants"""
     try:
         etudiants = db.obtenir_tous_etudiants()
-        # Convertir ObjectId en string et reformater
+        # Reformater (ObjectId et dates sont convertis par le sérialiseur)
         etudiants_formatted = []
         for e in etudiants:
             numero = e.get('numero_etudiant', '')
             etudiants_formatted.append({
-                '_id': str(e['_id']),
+                '_id': e['_id'],
                 'numero_etudiant': numero,  # Champ principal
                 'id_etudiant': numero,       # Alias pour compatibilité
                 'nom': f"{e.get('nom', '')} {e.get('prenom', '')}".strip(),
                 'email': e.get('email', ''),
-                'date_inscription': e.get('date_inscription', datetime.now()).isoformat() if 'date_inscription' in e else datetime.now().isoformat()
+                'date_inscription': e.get('date_inscription', datetime.now()),
+                # Miniature générée à l'inscription, mise en cache par le navigateur
+                'miniature': f"/api/photos/{e['photo']}/miniature" if e.get('photo') else None
             })
         
         return jsonify({
@@ -109,34 +347,82 @@ def get_etudiants():
 
 @app.route('/api/presences', methods=['GET'])
 def get_presences():
-    """Récupérer l'historique des présences"""
+    """Récupérer l'historique des présences (envoyé en flux, sans liste en mémoire)"""
     
     try:
-        presences = db.obtenir_toutes_presences()
-        for p in presences:
-            if '_id' in p:
-                p['_id'] = str(p['_id'])
-            if 'etudiant_id' in p and hasattr(p['etudiant_id'], '__iter__'):
-                if isinstance(p['etudiant_id'], list):
-                    p['etudiant_id'] = [str(eid) if not isinstance(eid, str) else eid for eid in p['etudiant_id']]
-                else:
-                    p['etudiant_id'] = str(p['etudiant_id'])
-            if 'date' in p and hasattr(p['date'], 'isoformat'):
-                p['date'] = p['date'].isoformat()
+        presences = db.iterer_presences()
+        return reponse_flux(app, {'success': True}, 'presences', presences)
+    except Exception as e:
+        logger.error(f"Error getting presences: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# SÉANCES 
+
+def _formater_seance(seance):
+    """Convertit une séance MongoDB en dict sérialisable"""
+    return {
+        '_id': seance['_id'],
+        'cours_code': seance.get('cours_code'),
+        'date': seance.get('date'),
+        'source': seance.get('source'),
+        'nb_presents': seance.get('nb_presents', 0),
+        'presents': [
+            {
+                'etudiant_id': p['etudiant_id'],
+                'etudiant_numero': p.get('etudiant_numero'),
+                'confiance': p.get('confiance')
+            }
+            for p in seance.get('presents', [])
+        ]
+    }
+
+@app.route('/api/seances', methods=['GET'])
+def get_seances():
+    """Récupérer les séances d'un cours ou d'un étudiant"""
+    try:
+        code_cours = request.args.get('code_cours')
+        numero = request.args.get('etudiant')
+        
+        if code_cours:
+            seances = db.obtenir_seances_cours(code_cours)
+        elif numero:
+            seances = db.obtenir_seances_etudiant(numero)
+        else:
+            return jsonify({'success': False, 'error': 'Paramètre code_cours ou etudiant requis'}), 400
         
+        seances_formatted = [_formater_seance(s) for s in seances]
         return jsonify({
             'success': True,
-            'count': len(presences),
-            'presences': presences
+            'count': len(seances_formatted),
+            'seances': seances_formatted
         }), 200
     except Exception as e:
-        logger.error(f"Error getting presences: {e}")
+        logger.error(f"Error getting sessions: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/seances/<seance_id>', methods=['GET'])
+def get_seance(seance_id):
+    """Récupérer une séance complète (un seul document)"""
+    try:
+        seance = db.obtenir_seance(seance_id)
+        if not seance:
+            return jsonify({'success': False, 'error': 'Séance introuvable'}), 404
+        
+        return jsonify({'success': True, 'seance': _formater_seance(seance)}), 200
+    except Exception as e:
+        logger.error(f"Error getting session {seance_id}: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/etudiants', methods=['POST'])
 def add_etudiant():
     """Ajouter un nouvel étudiant"""
     try:
+        # Refuser un envoi trop gros avant de lire le formulaire
+        if request.content_length and request.content_length > (config.PHOTOS_TAILLE_MAX_MO + 1) * 1024 * 1024:
+            return jsonify({
+                'success': False, 'erreur': f'Photo trop volumineuse (maximum {config.PHOTOS_TAILLE_MAX_MO} Mo)'
+            }), 413
+        
         # Récupérer les données du formulaire
         id_etudiant = request.form.get('id_etudiant')
         nom = request.form.get('nom')
@@ -153,21 +439,18 @@ def add_etudiant():
         nom_famille = nom_parts[0]
         
         # Traiter la photo si fournie
-        photo_path = None
+        photo_empreinte = None
         encoding = None
         
         if photo and photo.filename:
-            # Créer le dossier photos s'il n'existe pas
-            photos_dir = os.path.join(config.BASE_DIR, 'photos')
-            os.makedirs(photos_dir, exist_ok=True)
-            
-            # Sauvegarder la photo
-            photo_filename = f"{id_etudiant}_{photo.filename}"
-            photo_path = os.path.join(photos_dir, photo_filename)
-            photo.save(photo_path)
+            # Normaliser la photo et la ranger sous son empreinte (miniature comprise)
+            try:
+                photo_empreinte = magasin_photos.ajouter(photo.read())
+            except PhotoInvalide as e:
+                return jsonify({'success': False, 'erreur': str(e)}), 400
             
             # Générer l'encodage facial
-            encoding = face_mgr.encoder_visage(photo_path, id_etudiant)
+            encoding = face_mgr.encoder_visage(magasin_photos.chemin(photo_empreinte), id_etudiant)
             
             if encoding is None:
                 logger.warning(f"Impossible d'encoder le visage pour {id_etudiant}")
@@ -178,7 +461,7 @@ def add_etudiant():
             nom_famille,
             prenom,
             email,
-            photo_path
+            photo_empreinte
         )
         
         if not etudiant_id:
@@ -208,14 +491,12 @@ def delete_etudiant(numero):
         if not etudiant:
             return jsonify({'success': False, 'erreur': 'Étudiant introuvable'}), 404
         
-        # Supprimer le fichier d'encodage s'il existe
-        encodages_dir = os.path.join(os.path.dirname(__file__), '..', 'encodages')
-        encoding_file = os.path.join(encodages_dir, f"{numero}.pkl")
-        if os.path.exists(encoding_file):
-            os.remove(encoding_file)
-            logger.info(f"Encodage supprimé: {encoding_file}")
+        # Supprimer le fichier d'encodage s'il existe (et le retirer de la galerie)
+        face_mgr.supprimer_encodage(numero)
         
-        # Supprimer la photo si elle existe
+        # Les photos du magasin (champ photo) peuvent être partagées : elles sont
+        # retirées par `python photos.py gc` quand plus personne ne les référence.
+        # Anciennes photos (chemin complet) : supprimées directement
         if 'photo_path' in etudiant and etudiant['photo_path']:
             photo_path = etudiant['photo_path']
             if os.path.exists(photo_path):
@@ -226,9 +507,6 @@ def delete_etudiant(numero):
         result = db.supprimer_etudiant(numero)
         
         if result:
-            # Recharger les encodages
-            face_mgr.charger_encodages()
-            
             return jsonify({
                 'success': True,
                 'message': f'Étudiant {numero} supprimé avec succès'
@@ -240,6 +518,25 @@ def delete_etudiant(numero):
         logger.error(f"Error deleting student {numero}: {e}")
         return jsonify({'success': False, 'erreur': str(e)}), 500
 
+# PHOTOS 
+
+@app.route('/api/photos/<empreinte>', defaults={'variante': 'original'}, methods=['GET'])
+@app.route('/api/photos/<empreinte>/<variante>', methods=['GET'])
+def servir_photo(empreinte, variante):
+    """Photo d'un étudiant (original normalisé ou miniature), immuable : mise en cache par le navigateur"""
+    chemin = magasin_photos.chemin(empreinte, variante)
+    if chemin is None or not os.path.exists(chemin):
+        return jsonify({'success': False, 'erreur': 'Photo introuvable'}), 404
+    
+    etag = magasin_photos.etag(empreinte, variante)
+    if request.if_none_match.contains(etag):
+        reponse = Response(status=304)
+    else:
+        reponse = send_file(chemin, mimetype='image/jpeg', etag=False, conditional=False)
+    reponse.set_etag(etag)
+    reponse.headers['Cache-Control'] = ENTETE_CACHE
+    return reponse
+
 #  COURS 
 
 @app.route('/api/cours', methods=['GET'])
@@ -247,10 +544,6 @@ def get_cours():
     """Récupérer tous les cours"""
     try:
         cours = db.obtenir_tous_cours()
-        for c in cours:
-            c['_id'] = str(c['_id'])
-            if 'date_creation' in c:
-                c['date_creation'] = c['date_creation'].isoformat()
         
         return jsonify({
             'success': True,
@@ -320,6 +613,8 @@ def delete_cours(code_cours):
 # PRÉSENCES 
 
 @app.route('/api/presences/video', methods=['POST'])
+@profilable
+@admettre('video')
 def enregistrer_presence_video():
     """Enregistrer la présence à partir d'une vidéo et envoyer email au professeur"""
     try:
@@ -340,87 +635,27 @@ def enregistrer_presence_video():
         video_path = f'/tmp/presence_{code_cours}_{datetime.now().timestamp()}.mp4'
         video.save(video_path)
         
+        # Durée lue dans l'en-tête, avant tout décodage
+        try:
+            verifier_duree_video(reconnaissance.duree_video(video_path))
+        except AdmissionRefusee:
+            os.remove(video_path)
+            raise
+        
         logger.info(f" Analyse vidéo pour {code_cours}: {video.filename}")
         
         # Analyser la vidéo avec reconnaissance faciale
-        etudiants_detectes = {}  # {id: nombre_detections}
-        visages_inconnus = 0
-        frames_analysees = 0
-        
-        try:
-            # Ouvrir la vidéo
-            video_capture = cv2.VideoCapture(video_path)
-            frame_count = 0
-            
-            while video_capture.isOpened():
-                ret, frame = video_capture.read()
-                
-                if not ret:
-                    break
-                
-                # Analyser 1 frame sur 10 (pour la performance)
-                frame_count += 1
-                if frame_count % 10 != 0:
-                    continue
-                
-                frames_analysees += 1
-                
-                # Convertir BGR (OpenCV) en RGB (face_recognition)
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                # Détecter les visages
-                face_locations = face_recognition.face_locations(rgb_frame, model='hog')
-                
-                if not face_locations:
-                    continue
-                
-                # Encoder les visages
-                face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-                
-                # Comparer avec les encodages connus
-                for encoding in face_encodings:
-                    if len(face_mgr.known_encodings) == 0:
-                        visages_inconnus += 1
-                        continue
-                    
-                    # Calculer les distances
-                    face_distances = face_recognition.face_distance(
-                        face_mgr.known_encodings,
-                        encoding
-                    )
-                    
-                    best_match_index = np.argmin(face_distances)
-                    best_distance = face_distances[best_match_index]
-                    
-                    # Tolérance stricte
-                    if best_distance < 0.5:
-                        etudiant_id = face_mgr.known_ids[best_match_index]
-                        
-                        if etudiant_id in etudiants_detectes:
-                            etudiants_detectes[etudiant_id] += 1
-                        else:
-                            etudiants_detectes[etudiant_id] = 1
-                            logger.info(f" Étudiant détecté: {etudiant_id}")
-                    else:
-                        visages_inconnus += 1
-            
-            video_capture.release()
-            
-        except Exception as e:
-            logger.error(f" Erreur analyse vidéo: {e}")
-            import traceback
-            traceback.print_exc()
+        resultat = reconnaissance.analyser_video(
+            video_path, galerie_a_jour(), detecteur=config.DETECTEUR_VIDEO, session=code_cours
+        )
+        etudiants_detectes = resultat['detections']
         
-        logger.info(f" Frames analysées: {frames_analysees}")
+        logger.info(f" Frames analysées: {resultat['frames_analysees']}")
         logger.info(f" Détections: {etudiants_detectes}")
-        logger.info(f" Visages inconnus: {visages_inconnus}")
-        
-        # Ne garder que les étudiants détectés au moins 3 fois
-        presents_ids = [id for id, count in etudiants_detectes.items() if count >= 3]
+        logger.info(f" Visages inconnus: {resultat['visages_inconnus']}")
+        logger.info(f" Visages ignorés (qualité): {resultat['visages_ignores']}")
         
-        # Si personne n'est détecté 3 fois mais qu'il y a des détections, prendre ceux détectés au moins 1 fois
-        if len(presents_ids) == 0 and len(etudiants_detectes) > 0:
-            presents_ids = list(etudiants_detectes.keys())
+        presents_ids = reconnaissance.valider_presents_video(etudiants_detectes)
         
         logger.info(f" Présents validés: {presents_ids}")
         
@@ -438,22 +673,23 @@ def enregistrer_presence_video():
         
         # Enregistrer les présences
         if presents_ids:
-            presence_id = db.ajouter_presence(
+            presence_id = enregistrer_presences(
                 code_cours,
                 presents_ids,
-                datetime.now()
+                "video",
+                confiances=reconnaissance.confiances(resultat, presents_ids)
             )
             logger.info(f" Présence vidéo enregistrée: {len(presents_ids)} présents")
         
         etudiants_absents = []  # Pas de notion d'absents sans liste d'inscrits
         
-        # Envoyer email au professeur si demandé
+        # Notifier le professeur si demandé (envoi en arrière-plan)
         email_envoye = False
         email_destinataire = None
         
         if envoyer_email and cours.get('email_professeur'):
             email_destinataire = cours['email_professeur']
-            success, message = envoyer_email_presence(
+            notification_id = outbox.planifier(
                 email_destinataire,
                 code_cours,
                 cours.get('nom', 'Cours sans nom'),
@@ -461,8 +697,7 @@ def enregistrer_presence_video():
                 etudiants_absents,
                 datetime.now().strftime('%d/%m/%Y à %H:%M')
             )
-            email_envoye = success
-            logger.info(f"Email {'envoyé' if success else 'non envoyé'}: {message}")
+            email_envoye = notification_id is not None
         
         # Nettoyer
         try:
@@ -475,16 +710,21 @@ def enregistrer_presence_video():
             'etudiants_presents': etudiants_presents,
             'nombre_presents': len(etudiants_presents),
             'nombre_absents': len(etudiants_absents),
+            'visages_ignores': resultat['visages_ignores'],
             'email_envoye': email_envoye,
             'email_destinataire': email_destinataire,
             'message': 'Présence enregistrée avec succès'
         }), 201
         
+    except (AdmissionRefusee, AppariementIndisponible):
+        raise
     except Exception as e:
         logger.error(f"Error recording video presence: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/presences/webcam', methods=['POST'])
+@profilable
+@admettre('webcam')
 def enregistrer_presence_webcam():
     """
     Enregistrer présence via frames webcam (capturées côté client)
@@ -508,84 +748,17 @@ def enregistrer_presence_webcam():
         logger.info(f"Analyse webcam pour {code_cours}: {len(frames)} images reçues")
         
         # Analyser toutes les frames
-        etudiants_detectes = {}  # {id: nombre_detections}
-        visages_inconnus = 0
-        
-        for idx, frame_file in enumerate(frames):
-            # Sauvegarder temporairement
-            temp_path = f'/tmp/webcam_frame_{datetime.now().timestamp()}_{idx}.jpg'
-            frame_file.save(temp_path)
-            
-            try:
-                # Charger l'image
-                image = face_recognition.load_image_file(temp_path)
-                
-                # Détecter les visages
-                face_locations = face_recognition.face_locations(image, model='hog')
-                
-                if face_locations:
-                    logger.info(f"Frame {idx+1}: {len(face_locations)} visage(s) détecté(s)")
-                    
-                    # Encoder les visages détectés
-                    face_encodings = face_recognition.face_encodings(image, face_locations)
-                    
-                    # Comparer avec les encodages connus
-                    for encoding in face_encodings:
-                        if len(face_mgr.known_encodings) == 0:
-                            logger.warning("Aucun encodage connu dans le système")
-                            visages_inconnus += 1
-                            continue
-                        
-                        # Calculer les distances avec TOUS les encodages
-                        face_distances = face_recognition.face_distance(
-                            face_mgr.known_encodings,
-                            encoding
-                        )
-                        
-                        # Trouver le meilleur match
-                        best_match_index = np.argmin(face_distances)
-                        best_distance = face_distances[best_match_index]
-                        
-                        # Tolérance stricte: 0.5 (plus bas = plus strict)
-                        if best_distance < 0.5:
-                            etudiant_id = face_mgr.known_ids[best_match_index]
-                            
-                            # Compter le nombre de fois qu'il est détecté
-                            if etudiant_id in etudiants_detectes:
-                                etudiants_detectes[etudiant_id] += 1
-                            else:
-                                etudiants_detectes[etudiant_id] = 1
-                            
-                            logger.info(f" Étudiant reconnu: {etudiant_id} (confiance: {1-best_distance:.2f}, distance: {best_distance:.3f})")
-                        else:
-                            visages_inconnus += 1
-                            logger.info(f"Visage non reconnu (distance minimale: {best_distance:.3f})")
-                else:
-                    logger.info(f"Frame {idx+1}: Aucun visage détecté")
-                
-            except Exception as e:
-                logger.warning(f"Erreur analyse frame {idx+1}: {e}")
-                import traceback
-                traceback.print_exc()
-            
-            # Supprimer le fichier temporaire
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-        
-        # Ne garder que les étudiants détectés au moins 2 fois (pour éviter les faux positifs)
-        presents = [id for id, count in etudiants_detectes.items() if count >= 2]
+        resultat = reconnaissance.analyser_images_concurrentes(
+            [f.read() for f in frames], galerie_a_jour(), detecteur=config.DETECTEUR_WEBCAM, session=code_cours
+        )
+        etudiants_detectes = resultat['detections']
+        visages_inconnus = resultat['visages_inconnus']
         
-        # Si un étudiant n'est détecté qu'une fois mais qu'il n'y a qu'une personne, le garder
-        if len(presents) == 0 and len(etudiants_detectes) == 1:
-            presents = list(etudiants_detectes.keys())
+        presents = reconnaissance.valider_presents_webcam(etudiants_detectes)
         
         logger.info(f" Détections: {etudiants_detectes}")
         logger.info(f" Visages inconnus: {visages_inconnus}")
-        logger.info(f" Présents validés: {presents}")
-        logger.info(f" Détections: {etudiants_detectes}")
-        logger.info(f" Visages inconnus: {visages_inconnus}")
+        logger.info(f" Visages ignorés (qualité): {resultat['visages_ignores']}")
         logger.info(f" Présents validés: {presents}")
         
         # Pour les absents: NE PAS utiliser tous les étudiants de la BDD
@@ -595,15 +768,16 @@ def enregistrer_presence_webcam():
         absents = []
         
         # Enregistrer la présence
-        presence_id = db.ajouter_presence(
+        presence_id = enregistrer_presences(
             code_cours,
             presents,
-            datetime.now()
+            "webcam",
+            confiances=reconnaissance.confiances(resultat, presents)
         )
         
         logger.info(f"Présence webcam enregistrée: {len(presents)} présents")
         
-        # Envoyer l'email au professeur
+        # Notifier le professeur (envoi en arrière-plan)
         email_envoye = False
         email_destinataire = None
         envoyer_email_param = request.form.get('envoyer_email', 'false').lower() == 'true'
@@ -629,7 +803,7 @@ def enregistrer_presence_webcam():
                     else:
                         etudiants_absents_info.append(etud_id)
                 
-                email_envoye, message = envoyer_email_presence(
+                notification_id = outbox.planifier(
                     email_destinataire,
                     code_cours,
                     cours.get('nom', code_cours),
@@ -637,14 +811,10 @@ def enregistrer_presence_webcam():
                     etudiants_absents_info,
                     datetime.now().strftime('%d/%m/%Y à %H:%M')
                 )
-                
-                if email_envoye:
-                    logger.info(f" Email envoyé à {email_destinataire}")
-                else:
-                    logger.warning(f" Échec envoi email à {email_destinataire}: {message}")
+                email_envoye = notification_id is not None
                     
             except Exception as e:
-                logger.error(f"Erreur envoi email: {e}")
+                logger.error(f"Erreur planification email: {e}")
         
         return jsonify({
             'success': True,
@@ -653,18 +823,58 @@ def enregistrer_presence_webcam():
             'absents': etudiants_absents_info if envoyer_email_param else absents,
             'nb_presents': len(presents),
             'nb_absents': len(absents),
+            'visages_ignores': resultat['visages_ignores'],
             'email_envoye': email_envoye,
             'email_destinataire': email_destinataire,
             'message': f'Présence enregistrée: {len(presents)} étudiant(s) reconnu(s)'
         }), 201
         
+    except AppariementIndisponible:
+        raise
     except Exception as e:
         logger.error(f"Erreur présence webcam: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'erreur': str(e)}), 500
 
+def reponse_reconnaissance(resultat, nombre_images):
+    """Réponse des routes de reconnaissance : l'étudiant reconnu le plus souvent"""
+    etudiants_detectes = resultat['detections']
+
+    # Déterminer qui a été reconnu le plus souvent
+    if etudiants_detectes:
+        # Prendre l'étudiant avec le plus de détections
+        best_student = max(etudiants_detectes.items(), key=lambda x: x[1])
+        student_id = best_student[0]
+        detections = best_student[1]
+        
+        # Récupérer les infos de l'étudiant
+        etudiant = db.obtenir_etudiant(student_id)
+        
+        if etudiant:
+            logger.info(f" Étudiant reconnu: {etudiant.get('nom')} ({student_id}) - {detections} détection(s)")
+            
+            return jsonify({
+                'success': True,
+                'recognized': True,
+                'student_id': student_id,
+                'student_name': etudiant.get('nom'),
+                'detections': detections,
+                'total_frames': nombre_images
+            }), 200
+    
+    # Aucun visage reconnu
+    logger.info(" Aucun visage reconnu")
+    return jsonify({
+        'success': True,
+        'recognized': False,
+        'message': 'Aucun visage reconnu',
+        'visages_ignores': resultat['visages_ignores']
+    }), 200
+
 @app.route('/api/presences/recognize', methods=['POST'])
+@profilable
+@admettre('reconnaissance')
 def recognize_face():
     """
     Reconnaissance de visage SANS enregistrement
@@ -679,80 +889,63 @@ def recognize_face():
         logger.info(f" Reconnaissance: {len(frames)} image(s) reçue(s)")
         
         # Analyser toutes les frames
-        etudiants_detectes = {}  # {id: nombre_detections}
+        resultat = reconnaissance.analyser_images_concurrentes(
+            [f.read() for f in frames], galerie_a_jour(), detecteur=config.DETECTEUR_RECONNAISSANCE,
+            session=request.form.get('code_cours')
+        )
+        return reponse_reconnaissance(resultat, len(frames))
         
-        for idx, frame_file in enumerate(frames):
-            # Sauvegarder temporairement
-            temp_path = f'/tmp/recognize_frame_{datetime.now().timestamp()}_{idx}.jpg'
-            frame_file.save(temp_path)
-            
-            try:
-                # Charger l'image
-                image = face_recognition.load_image_file(temp_path)
-                
-                # Détecter les visages
-                face_locations = face_recognition.face_locations(image, model='hog')
-                
-                if face_locations:
-                    # Encoder les visages détectés
-                    face_encodings = face_recognition.face_encodings(image, face_locations)
-                    
-                    for encoding in face_encodings:
-                        # Comparer avec tous les encodages connus
-                        if len(face_mgr.known_encodings) == 0:
-                            logger.warning(" Aucun encodage disponible")
-                            continue
-                        
-                        face_distances = face_recognition.face_distance(face_mgr.known_encodings, encoding)
-                        best_match_index = np.argmin(face_distances)
-                        best_distance = face_distances[best_match_index]
-                        
-                        if best_distance < 0.5:  # Seuil strict
-                            etudiant_id = face_mgr.known_ids[best_match_index]
-                            confiance = 1 - best_distance
-                            
-                            etudiants_detectes[etudiant_id] = etudiants_detectes.get(etudiant_id, 0) + 1
-                            
-                            logger.info(f" Reconnu: {etudiant_id} (distance: {best_distance:.3f}, confiance: {confiance:.2f})")
-                
-                # Supprimer le fichier temporaire
-                os.remove(temp_path)
-                
-            except Exception as e:
-                logger.error(f"Erreur analyse frame {idx}: {e}")
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-        
-        # Déterminer qui a été reconnu le plus souvent
-        if etudiants_detectes:
-            # Prendre l'étudiant avec le plus de détections
-            best_student = max(etudiants_detectes.items(), key=lambda x: x[1])
-            student_id = best_student[0]
-            detections = best_student[1]
-            
-            # Récupérer les infos de l'étudiant
-            etudiant = db.obtenir_etudiant(student_id)
-            
-            if etudiant:
-                logger.info(f" Étudiant reconnu: {etudiant.get('nom')} ({student_id}) - {detections} détection(s)")
-                
-                return jsonify({
-                    'success': True,
-                    'recognized': True,
-                    'student_id': student_id,
-                    'student_name': etudiant.get('nom'),
-                    'detections': detections,
-                    'total_frames': len(frames)
-                }), 200
-        
-        # Aucun visage reconnu
-        logger.info(" Aucun visage reconnu")
-        return jsonify({
-            'success': True,
-            'recognized': False,
-            'message': 'Aucun visage reconnu'
-        }), 200
+    except AppariementIndisponible:
+        raise
+    except Exception as e:
+        logger.error(f"Erreur reconnaissance: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/presences/recognize/vignettes', methods=['POST'])
+@profilable
+@admettre('reconnaissance')
+def recognize_face_vignettes():
+    """
+    Reconnaissance SANS enregistrement à partir de vignettes recadrées par le navigateur
+
+    Champs multipart:
+        vignettes: images du visage recadrées et réduites
+        boites: JSON, pour chaque vignette [haut, droite, bas, gauche] du
+                visage dans la vignette, ou null (détection côté serveur)
+    """
+    try:
+        vignettes = request.files.getlist('vignettes')
+        
+        if not vignettes:
+            return jsonify({'success': False, 'recognized': False, 'message': 'Aucune vignette reçue'}), 400
+        if len(vignettes) > config.VIGNETTES_CLIENT_NOMBRE_MAX:
+            return jsonify({
+                'success': False, 'recognized': False,
+                'message': f'Au plus {config.VIGNETTES_CLIENT_NOMBRE_MAX} vignettes par requête'
+            }), 400
+        
+        try:
+            boites = json.loads(request.form.get('boites') or 'null') or [None] * len(vignettes)
+        except ValueError:
+            return jsonify({'success': False, 'recognized': False, 'message': 'boites: JSON invalide'}), 400
+        if not isinstance(boites, list) or len(boites) != len(vignettes):
+            return jsonify({
+                'success': False, 'recognized': False,
+                'message': 'boites doit contenir une entrée par vignette'
+            }), 400
+        
+        logger.info(f" Reconnaissance: {len(vignettes)} vignette(s) reçue(s)")
         
+        resultat = reconnaissance.analyser_vignettes_client(
+            [f.read() for f in vignettes], boites, galerie_a_jour(), detecteur=config.DETECTEUR_RECONNAISSANCE,
+            session=request.form.get('code_cours')
+        )
+        return reponse_reconnaissance(resultat, len(vignettes))
+        
+    except AppariementIndisponible:
+        raise
     except Exception as e:
         logger.error(f"Erreur reconnaissance: {e}")
         import traceback
@@ -785,14 +978,10 @@ def finalize_interactive_presence():
         # Enregistrer les présences
         presence_id = None
         if presents:
-            presence_id = db.ajouter_presence(
-                code_cours,
-                presents,
-                datetime.now()
-            )
+            presence_id = enregistrer_presences(code_cours, presents, "interactive")
             logger.info(f" {len(presents)} présence(s) enregistrée(s)")
         
-        # Envoyer l'email au professeur
+        # Notifier le professeur (envoi en arrière-plan)
         email_envoye = False
         email_destinataire = None
         
@@ -817,7 +1006,7 @@ def finalize_interactive_presence():
                     else:
                         etudiants_absents_info.append(etud_id)
                 
-                email_envoye, message = envoyer_email_presence(
+                notification_id = outbox.planifier(
                     email_destinataire,
                     code_cours,
                     cours.get('nom', code_cours),
@@ -825,14 +1014,10 @@ def finalize_interactive_presence():
                     etudiants_absents_info,
                     datetime.now().strftime('%d/%m/%Y à %H:%M')
                 )
-                
-                if email_envoye:
-                    logger.info(f" Email envoyé à {email_destinataire}")
-                else:
-                    logger.warning(f" Échec envoi email: {message}")
+                email_envoye = notification_id is not None
                     
             except Exception as e:
-                logger.error(f" Erreur envoi email: {e}")
+                logger.error(f" Erreur planification email: {e}")
         
         return jsonify({
             'success': True,
@@ -850,6 +1035,47 @@ def finalize_interactive_presence():
         traceback.print_exc()
         return jsonify({'erreur': str(e)}), 500
 
+# RAPPORTS 
+
+@app.route('/api/rapports/presences', methods=['GET'])
+def telecharger_rapport_presences():
+    """
+    Télécharger la matrice de présence étudiants × séances d'un cours
+    Paramètres: code_cours, debut/fin (AAAA-MM-JJ, optionnels), format (xlsx|csv)
+    """
+    try:
+        code_cours = request.args.get('code_cours')
+        format_rapport = request.args.get('format', 'xlsx').lower()
+        
+        if not code_cours:
+            return jsonify({'success': False, 'error': 'Paramètre code_cours requis'}), 400
+        if format_rapport not in FORMATS:
+            return jsonify({'success': False, 'error': f'Format non supporté: {format_rapport}'}), 400
+        
+        try:
+            date_debut = date_fin = None
+            if request.args.get('debut'):
+                date_debut = datetime.strptime(request.args['debut'], '%Y-%m-%d')
+            if request.args.get('fin'):
+                # Fin incluse: jusqu'à la fin de la journée
+                date_fin = datetime.strptime(request.args['fin'], '%Y-%m-%d') + timedelta(days=1, microseconds=-1)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Dates attendues au format AAAA-MM-JJ'}), 400
+        
+        chemin = rapports.generer(code_cours, date_debut, date_fin, format_rapport)
+        if not chemin:
+            return jsonify({'success': False, 'error': 'Cours introuvable'}), 404
+        
+        return send_file(
+            chemin,
+            as_attachment=True,
+            download_name=f"presences_{code_cours}.{format_rapport}"
+        )
+        
+    except Exception as e:
+        logger.error(f"Error generating report: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ==================== DÉMARRAGE ====================
 
 if __name__ == '__main__':
@@ -857,5 +1083,6 @@ if __name__ == '__main__':
     logger.info(f"📊 MongoDB: {config.MONGODB_URI}")
     logger.info(f"🎯 Base: {config.DATABASE_NAME}")
     logger.info(f"👥 Étudiants encodés: {len(face_mgr.known_encodings)}")
+    logger.info(f"⏱️ Démarrage: {rapport()}")
     
     app.run(host='0.0.0.0', port=5000, debug=True)
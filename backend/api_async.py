@@ -0,0 +1,913 @@
+"""
+Quart (ASGI) + MongoDB asynchrone + Reconnaissance Faciale
+
+Variante asynchrone de api.py exposant les mêmes routes. Les accès MongoDB
+passent par AsyncDatabaseManager et la reconnaissance (CPU-bound) est
+exécutée dans un pool de processus, afin que la boucle d'événements continue
+de servir les routes légères (/health, listes) pendant l'analyse d'une vidéo.
+
+Différences avec api.py :
+  - /api/ordonnanceur : les analyses tournent dans les processus du pool,
+    seul l'état du contrôle d'admission est rapporté ;
+  - /api/rapports/presences : généré par GenerateurRapports avec le client
+    MongoDB synchrone, dans un thread ;
+  - pas de profilage à la demande (X-Profil) des routes de reconnaissance.
+
+Démarrage:
+    hypercorn api_async:app --bind 0.0.0.0:5001
+"""
+from quart import Quart, request, jsonify, send_file, Response, g
+from quart_cors import cors
+from werkzeug.exceptions import RequestEntityTooLarge
+import asyncio
+import functools
+import hmac
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import logging
+
+# Ajouter le répertoire parent au path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from demarrage import Paresseux
+from database import DatabaseManager
+from database_async import AsyncDatabaseManager
+from face_manager import FaceRecognitionManager
+from rapports import GenerateurRapports, FORMATS
+from notifications import construire_notification
+from journal_presences import JournalPresences, VidangeJournal
+from photos import MagasinPhotos, PhotoInvalide, ENTETE_CACHE
+from reconnaissance import (
+    initialiser_worker, analyser_video_worker, analyser_images_worker, analyser_vignettes_client_worker,
+    valider_presents_video, valider_presents_webcam, confiances, duree_video
+)
+from service_appariement import AppariementIndisponible
+from admission import ADMISSIONS, AdmissionRefusee, verifier_duree_video, etat_admission, seance_requete
+from metriques import REGISTRE, REQUETES, REQUETE_DUREE
+from serialisation import FournisseurJSON, reponse_flux_async
+import ordonnanceur
+import memoire
+import config
+
+# Configuration logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Initialiser Quart
+app = Quart(__name__)
+app = cors(app, allow_origin="*")  # Autoriser CORS pour le frontend
+app.json = FournisseurJSON(app)  # ObjectId, datetime... convertis à l'encodage (serialisation.py)
+
+# Initialiser managers
+db = AsyncDatabaseManager()
+face_mgr = FaceRecognitionManager()
+magasin_photos = MagasinPhotos()
+# Client MongoDB synchrone (vidange du journal et rapports, utilisés dans des threads)
+db_sync = Paresseux('connexion_mongodb_sync', DatabaseManager)
+rapports = Paresseux('rapports', lambda: GenerateurRapports(db_sync))
+
+# Pool de processus pour la reconnaissance (créé au démarrage du serveur)
+executeur = None
+
+# Présences: déposées dans le journal local, écrites dans MongoDB en
+# arrière-plan (la vidange utilise le client MongoDB synchrone, dans son thread)
+journal = JournalPresences()
+vidange = None
+
+
+async def enregistrer_presences(code_cours, presents, source, confiances=None):
+    """Enregistre les présents d'une séance sans attendre MongoDB (voir api.enregistrer_presences)"""
+    if not config.JOURNAL_PRESENCES_ACTIF:
+        return await db.ajouter_presence(code_cours, presents, datetime.now(), source=source, confiances=confiances)
+    identifiant = await asyncio.to_thread(
+        journal.deposer, code_cours, presents, datetime.now(), source, confiances
+    )
+    if vidange is not None:
+        vidange.signaler()
+    return identifiant
+
+
+async def planifier_notification(cours, presents, absents):
+    """
+    Dépose une notification de présence dans l'outbox
+
+    L'envoi est assuré par l'expéditeur de notifications.py (intégré à
+    api.py ou lancé seul avec `python notifications.py`).
+    """
+    destinataire = cours.get('email_professeur')
+    if not destinataire:
+        return None
+    notification = construire_notification(
+        destinataire,
+        cours['code_cours'],
+        cours.get('nom', cours['code_cours']),
+        presents,
+        absents,
+        datetime.now().strftime('%d/%m/%Y à %H:%M')
+    )
+    result = await db.db[config.COLLECTION_NOTIFICATIONS].insert_one(notification)
+    return str(result.inserted_id)
+
+
+@app.before_serving
+async def demarrer_pool():
+    """Crée le pool de reconnaissance et précharge la galerie dans chaque processus"""
+    global executeur
+    executeur = ProcessPoolExecutor(
+        max_workers=config.ASYNC_PROCESSUS_RECONNAISSANCE,
+        initializer=initialiser_worker,
+        initargs=(config.ASYNC_PROCESSUS_RECONNAISSANCE,)
+    )
+    logger.info(f"🧵 Pool de reconnaissance: {config.ASYNC_PROCESSUS_RECONNAISSANCE} processus")
+
+    global vidange
+    if config.JOURNAL_PRESENCES_ACTIF and config.JOURNAL_VIDANGE_INTEGREE:
+        vidange = VidangeJournal(journal, db_sync)
+        vidange.demarrer()
+
+
+@app.after_serving
+async def arreter_pool():
+    """Arrête le pool de reconnaissance et la vidange du journal, ferme MongoDB"""
+    executeur.shutdown(wait=True)
+    if vidange is not None:
+        vidange.arreter()
+    await db.fermer_connexion()
+    if db_sync.est_initialise:
+        db_sync.fermer_connexion()
+
+
+async def executer_reconnaissance(fonction, *args):
+    """Exécute une analyse CPU-bound hors de la boucle d'événements"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executeur, fonction, *args)
+
+# ==================== MÉTRIQUES ====================
+
+REGISTRE.jauge(
+    'presence_galerie_taille', 'Encodages de visages chargés en mémoire',
+    fonction=lambda: len(face_mgr.known_ids)
+)
+REGISTRE.jauge(
+    'presence_journal_en_attente', 'Présences journalisées pas encore écrites dans MongoDB',
+    fonction=lambda: journal.taille() if config.JOURNAL_PRESENCES_ACTIF else 0
+)
+REGISTRE.jauge(
+    'presence_journal_plus_ancienne_secondes', 'Âge de la plus ancienne présence journalisée en attente',
+    fonction=lambda: journal.age() if config.JOURNAL_PRESENCES_ACTIF else 0
+)
+
+
+@app.before_request
+async def demarrer_chrono():
+    """Mémorise l'heure de début de la requête"""
+    g.debut_requete = time.perf_counter()
+    if config.MEMOIRE_INSTRUMENTATION:
+        g.rss_debut = memoire.rss_octets()
+
+
+@app.after_request
+async def enregistrer_metriques(response):
+    """Compte la requête et sa durée par route (motif, pas l'URL réelle)"""
+    route = request.url_rule.rule if request.url_rule else 'inconnue'
+    REQUETES.inc(route=route, methode=request.method, statut=response.status_code)
+    if 'debut_requete' in g:
+        REQUETE_DUREE.observe(time.perf_counter() - g.debut_requete, route=route)
+    if 'rss_debut' in g:
+        memoire.enregistrer_requete(route, request.method, g.rss_debut)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Métriques au format d'exposition Prometheus (les jauges du journal lisent SQLite : dans un thread)"""
+    texte = await asyncio.to_thread(REGISTRE.exporter)
+    return Response(texte, mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/api/ordonnanceur', methods=['GET'])
+async def etat_ordonnanceur():
+    """Contrôle d'admission du processus (les analyses, et leurs ordonnanceurs, sont dans le pool de processus)"""
+    etat = ordonnanceur.etat_ordonnanceur()
+    return jsonify({'success': True, 'actif': etat is not None, 'data': etat, 'admission': etat_admission()}), 200
+
+# ==================== DIAGNOSTIC (MÉMOIRE) ====================
+
+
+def jeton_diagnostic(vue):
+    """Réserve une route de diagnostic aux appels munis de l'en-tête X-Jeton-Diagnostic (voir api.py)"""
+    @functools.wraps(vue)
+    async def verifier(*args, **kwargs):
+        if not config.DIAGNOSTIC_JETON:
+            return jsonify({'success': False, 'erreur': 'Diagnostic désactivé (DIAGNOSTIC_JETON)'}), 404
+        jeton = request.headers.get('X-Jeton-Diagnostic', '')
+        if not hmac.compare_digest(jeton.encode('utf-8'), config.DIAGNOSTIC_JETON.encode('utf-8')):
+            return jsonify({'success': False, 'erreur': 'Jeton de diagnostic invalide'}), 403
+        return await vue(*args, **kwargs)
+    return verifier
+
+
+@app.route('/api/diagnostic/memoire', methods=['GET'])
+@jeton_diagnostic
+async def etat_memoire():
+    """RSS, traçage tracemalloc et mémoire de la galerie du processus principal"""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'rss_octets': memoire.rss_octets(),
+        'instrumentation': config.MEMOIRE_INSTRUMENTATION,
+        'limite_worker_octets': config.WORKER_RSS_MAX_MO * memoire.MO or None,
+        'tracemalloc': memoire.INSTANTANES.etat(),
+        'galerie': face_mgr.memoire_galerie()
+    }), 200
+
+
+@app.route('/api/diagnostic/memoire/instantanes', methods=['POST'])
+@jeton_diagnostic
+async def capturer_instantane():
+    """Prend un instantané tracemalloc (démarre le traçage au premier appel)"""
+    instantane = await asyncio.to_thread(memoire.INSTANTANES.capturer)
+    return jsonify({'success': True, 'pid': os.getpid(), 'data': instantane}), 201
+
+
+@app.route('/api/diagnostic/memoire/instantanes', methods=['DELETE'])
+@jeton_diagnostic
+async def arreter_instantanes():
+    """Arrête tracemalloc et oublie les instantanés"""
+    memoire.INSTANTANES.arreter()
+    return jsonify({'success': True, 'pid': os.getpid()}), 200
+
+
+@app.route('/api/diagnostic/memoire/comparaison', methods=['GET'])
+@jeton_diagnostic
+async def comparer_instantanes():
+    """Allocations qui ont le plus augmenté entre deux instantanés (?depuis=0&jusqua=-1&grouper=lineno&limite=25)"""
+    try:
+        comparaison = await asyncio.to_thread(
+            memoire.INSTANTANES.comparer,
+            depuis=request.args.get('depuis', 0, type=int),
+            jusqua=request.args.get('jusqua', -1, type=int),
+            grouper=request.args.get('grouper', 'lineno'),
+            limite=request.args.get('limite', 25, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'erreur': str(e)}), 400
+    return jsonify({'success': True, 'pid': os.getpid(), 'data': comparaison}), 200
+
+
+@app.errorhandler(AppariementIndisponible)
+async def appariement_indisponible(erreur):
+    """Appariement impossible : aucune présence enregistrée, le client peut réessayer"""
+    logger.error(f"❌ {request.path}: {erreur}")
+    return jsonify({'success': False, 'erreur': str(erreur)}), 503
+
+
+@app.errorhandler(AdmissionRefusee)
+async def refus_admission(erreur):
+    """Route lourde saturée (429/503, avec Retry-After) ou envoi trop gros (413)"""
+    logger.warning(f"⛔ {request.path}: {erreur.message} ({erreur.raison})")
+    reponse = jsonify({'success': False, 'erreur': erreur.message, 'raison': erreur.raison})
+    reponse.status_code = erreur.statut
+    if erreur.retry_after:
+        reponse.headers['Retry-After'] = str(erreur.retry_after)
+    return reponse
+
+
+def admettre(nom):
+    """Contrôle d'admission d'une route lourde (voir admission.py et api.admettre)"""
+    admission = ADMISSIONS[nom]
+
+    def decorateur(route):
+        @functools.wraps(route)
+        async def enveloppe(*args, **kwargs):
+            admission.verifier_taille(request.content_length)
+            request.max_content_length = admission.taille_max
+            async with admission.entrer_async(seance_requete(request)):
+                try:
+                    await request.form  # corps sans Content-Length : taille vérifiée à la lecture
+                except RequestEntityTooLarge:
+                    admission.refuser(413, 'taille', 'Requête trop volumineuse', retry_after=False)
+                return await route(*args, **kwargs)
+        return enveloppe
+    return decorateur
+
+
+def _formater_seance(seance):
+    """Convertit une séance MongoDB en dict sérialisable"""
+    return {
+        '_id': seance['_id'],
+        'cours_code': seance.get('cours_code'),
+        'date': seance.get('date'),
+        'source': seance.get('source'),
+        'nb_presents': seance.get('nb_presents', 0),
+        'presents': [
+            {
+                'etudiant_id': p['etudiant_id'],
+                'etudiant_numero': p.get('etudiant_numero'),
+                'confiance': p.get('confiance')
+            }
+            for p in seance.get('presents', [])
+        ]
+    }
+
+# ==================== ROUTES SANTÉ ====================
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Vérification de la santé du service"""
+    try:
+        await db.ping()
+        etudiants_count = await db.etudiants.estimated_document_count()
+
+        return jsonify({
+            'status': 'healthy',
+            'service': 'presence-api-async',
+            'timestamp': datetime.now().isoformat(),
+            'mongodb': 'connected',
+            'etudiants': etudiants_count,
+            'encodages': len(face_mgr.known_encodings)
+        }), 200
+    except Exception as e:
+        logger.error(f"Health check failed: {e}")
+        return jsonify({
+            'status': 'unhealthy',
+            'error': str(e)
+        }), 500
+
+# ÉTUDIANTS
+
+@app.route('/api/etudiants', methods=['GET'])
+async def get_etudiants():
+    """Récupérer tous les étudiants"""
+    try:
+        etudiants = await db.obtenir_tous_etudiants()
+        etudiants_formatted = []
+        for e in etudiants:
+            numero = e.get('numero_etudiant', '')
+            etudiants_formatted.append({
+                '_id': e['_id'],
+                'numero_etudiant': numero,  # Champ principal
+                'id_etudiant': numero,       # Alias pour compatibilité
+                'nom': f"{e.get('nom', '')} {e.get('prenom', '')}".strip(),
+                'email': e.get('email', ''),
+                'date_inscription': e.get('date_inscription', datetime.now()),
+                'miniature': f"/api/photos/{e['photo']}/miniature" if e.get('photo') else None
+            })
+
+        return jsonify({
+            'success': True,
+            'count': len(etudiants_formatted),
+            'etudiants': etudiants_formatted
+        }), 200
+    except Exception as e:
+        logger.error(f"Error getting students: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/etudiants', methods=['POST'])
+async def add_etudiant():
+    """Ajouter un nouvel étudiant"""
+    try:
+        if request.content_length and request.content_length > (config.PHOTOS_TAILLE_MAX_MO + 1) * 1024 * 1024:
+            return jsonify({
+                'success': False, 'erreur': f'Photo trop volumineuse (maximum {config.PHOTOS_TAILLE_MAX_MO} Mo)'
+            }), 413
+
+        form = await request.form
+        files = await request.files
+        id_etudiant = form.get('id_etudiant')
+        nom = form.get('nom')
+        email = form.get('email')
+        photo = files.get('photo')
+
+        if not id_etudiant or not nom or not email:
+            return jsonify({'success': False, 'erreur': 'Champs requis manquants'}), 400
+
+        # Séparer nom et prénom (si fourni avec espace)
+        nom_parts = nom.strip().split(' ', 1)
+        prenom = nom_parts[1] if len(nom_parts) > 1 else ''
+        nom_famille = nom_parts[0]
+
+        photo_empreinte = None
+        encoding = None
+
+        if photo and photo.filename:
+            # Normalisation et encodage hors de la boucle d'événements
+            try:
+                photo_empreinte = await asyncio.to_thread(magasin_photos.ajouter, photo.read())
+            except PhotoInvalide as e:
+                return jsonify({'success': False, 'erreur': str(e)}), 400
+            encoding = await asyncio.to_thread(
+                face_mgr.encoder_visage, magasin_photos.chemin(photo_empreinte), id_etudiant
+            )
+
+        etudiant_id = await db.ajouter_etudiant(id_etudiant, nom_famille, prenom, email, photo_empreinte)
+
+        if not etudiant_id:
+            return jsonify({'success': False, 'erreur': 'Erreur lors de l\'ajout dans la base'}), 500
+
+        response_data = {
+            'success': True,
+            'id': str(etudiant_id),
+            'message': 'Étudiant ajouté avec succès'
+        }
+        if encoding is None and photo:
+            response_data['warning'] = 'Visage non détecté dans la photo'
+
+        return jsonify(response_data), 201
+
+    except Exception as e:
+        logger.error(f"Error adding student: {e}")
+        return jsonify({'success': False, 'erreur': str(e)}), 500
+
+@app.route('/api/etudiants/<numero>', methods=['DELETE'])
+async def delete_etudiant(numero):
+    """Supprimer un étudiant"""
+    try:
+        etudiant = await db.obtenir_etudiant(numero)
+        if not etudiant:
+            return jsonify({'success': False, 'erreur': 'Étudiant introuvable'}), 404
+
+        encoding_file = os.path.join(config.ENCODAGES_DIR, f"{numero}.pkl")
+        if os.path.exists(encoding_file):
+            os.remove(encoding_file)
+            logger.info(f"Encodage supprimé: {encoding_file}")
+
+        # Photos du magasin : retirées par `python photos.py gc` ; anciennes photos : supprimées ici
+        photo_path = etudiant.get('photo_path')
+        if photo_path and os.path.exists(photo_path):
+            os.remove(photo_path)
+            logger.info(f"Photo supprimée: {photo_path}")
+
+        if await db.supprimer_etudiant(numero):
+            await asyncio.to_thread(face_mgr.charger_encodages)
+            return jsonify({
+                'success': True,
+                'message': f'Étudiant {numero} supprimé avec succès'
+            }), 200
+        return jsonify({'success': False, 'erreur': 'Erreur lors de la suppression'}), 500
+
+    except Exception as e:
+        logger.error(f"Error deleting student {numero}: {e}")
+        return jsonify({'success': False, 'erreur': str(e)}), 500
+
+# PHOTOS
+
+@app.route('/api/photos/<empreinte>', defaults={'variante': 'original'}, methods=['GET'])
+@app.route('/api/photos/<empreinte>/<variante>', methods=['GET'])
+async def servir_photo(empreinte, variante):
+    """Photo d'un étudiant (original normalisé ou miniature), mise en cache par le navigateur"""
+    chemin = magasin_photos.chemin(empreinte, variante)
+    if chemin is None or not os.path.exists(chemin):
+        return jsonify({'success': False, 'erreur': 'Photo introuvable'}), 404
+
+    etag = magasin_photos.etag(empreinte, variante)
+    if request.if_none_match.contains(etag):
+        reponse = Response('', status=304)
+    else:
+        reponse = await send_file(chemin, mimetype='image/jpeg', add_etags=False)
+    reponse.set_etag(etag)
+    reponse.headers['Cache-Control'] = ENTETE_CACHE
+    return reponse
+
+# PRÉSENCES
+
+@app.route('/api/presences', methods=['GET'])
+async def get_presences():
+    """Récupérer l'historique des présences (envoyé en flux, sans liste en mémoire)"""
+    try:
+        return await reponse_flux_async(app, {'success': True}, 'presences', db.iterer_presences())
+    except Exception as e:
+        logger.error(f"Error getting presences: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# SÉANCES
+
+@app.route('/api/seances', methods=['GET'])
+async def get_seances():
+    """Récupérer les séances d'un cours ou d'un étudiant"""
+    try:
+        code_cours = request.args.get('code_cours')
+        numero = request.args.get('etudiant')
+
+        if code_cours:
+            seances = await db.obtenir_seances_cours(code_cours)
+        elif numero:
+            seances = await db.obtenir_seances_etudiant(numero)
+        else:
+            return jsonify({'success': False, 'error': 'Paramètre code_cours ou etudiant requis'}), 400
+
+        seances_formatted = [_formater_seance(s) for s in seances]
+        return jsonify({
+            'success': True,
+            'count': len(seances_formatted),
+            'seances': seances_formatted
+        }), 200
+    except Exception as e:
+        logger.error(f"Error getting sessions: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/seances/<seance_id>', methods=['GET'])
+async def get_seance(seance_id):
+    """Récupérer une séance complète (un seul document)"""
+    try:
+        seance = await db.obtenir_seance(seance_id)
+        if not seance:
+            return jsonify({'success': False, 'error': 'Séance introuvable'}), 404
+        return jsonify({'success': True, 'seance': _formater_seance(seance)}), 200
+    except Exception as e:
+        logger.error(f"Error getting session {seance_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+#  COURS
+
+@app.route('/api/cours', methods=['GET'])
+async def get_cours():
+    """Récupérer tous les cours"""
+    try:
+        cours = await db.obtenir_tous_cours()
+
+        return jsonify({
+            'success': True,
+            'count': len(cours),
+            'data': cours
+        }), 200
+    except Exception as e:
+        logger.error(f"Error getting courses: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/cours', methods=['POST'])
+async def add_cours():
+    """Ajouter un nouveau cours"""
+    try:
+        data = await request.get_json()
+
+        for field in ['code_cours', 'nom', 'professeur']:
+            if field not in data:
+                return jsonify({'success': False, 'error': f'Champ requis: {field}'}), 400
+
+        cours_id = await db.ajouter_cours(
+            data['code_cours'],
+            data['nom'],
+            data['professeur'],
+            data.get('salle'),
+            data.get('email_professeur')
+        )
+
+        if not cours_id:
+            return jsonify({'success': False, 'error': 'Erreur lors de l\'ajout'}), 500
+
+        return jsonify({
+            'success': True,
+            'id': cours_id,
+            'message': 'Cours ajouté avec succès'
+        }), 201
+
+    except Exception as e:
+        logger.error(f"Error adding course: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/cours/<code_cours>', methods=['DELETE'])
+async def delete_cours(code_cours):
+    """Supprimer un cours"""
+    try:
+        if not await db.obtenir_cours(code_cours):
+            return jsonify({'success': False, 'erreur': 'Cours introuvable'}), 404
+
+        if await db.supprimer_cours(code_cours):
+            return jsonify({
+                'success': True,
+                'message': f'Cours {code_cours} supprimé avec succès'
+            }), 200
+        return jsonify({'success': False, 'erreur': 'Erreur lors de la suppression'}), 500
+
+    except Exception as e:
+        logger.error(f"Error deleting course {code_cours}: {e}")
+        return jsonify({'success': False, 'erreur': str(e)}), 500
+
+# RECONNAISSANCE
+
+@app.route('/api/presences/video', methods=['POST'])
+@admettre('video')
+async def enregistrer_presence_video():
+    """Enregistrer la présence à partir d'une vidéo"""
+    try:
+        form = await request.form
+        files = await request.files
+        code_cours = form.get('code_cours')
+        video = files.get('video')
+        envoyer_email = form.get('envoyer_email', 'true').lower() == 'true'
+
+        if not code_cours or not video:
+            return jsonify({'success': False, 'error': 'Code cours et vidéo requis'}), 400
+
+        cours = await db.obtenir_cours(code_cours)
+        if not cours:
+            return jsonify({'success': False, 'error': 'Cours introuvable'}), 404
+
+        video_path = f'/tmp/presence_{code_cours}_{datetime.now().timestamp()}.mp4'
+        await video.save(video_path)
+
+        # Durée lue dans l'en-tête, avant tout décodage
+        try:
+            verifier_duree_video(await asyncio.to_thread(duree_video, video_path))
+        except AdmissionRefusee:
+            os.remove(video_path)
+            raise
+
+        logger.info(f" Analyse vidéo pour {code_cours}: {video.filename}")
+
+        try:
+            resultat = await executer_reconnaissance(
+                analyser_video_worker, video_path, config.DETECTEUR_VIDEO, code_cours
+            )
+        finally:
+            try:
+                os.remove(video_path)
+            except OSError:
+                pass
+
+        presents_ids = valider_presents_video(resultat['detections'])
+        logger.info(f" Présents validés: {presents_ids}")
+
+        etudiants = await db.obtenir_etudiants(presents_ids)
+        etudiants_presents = []
+        for etud_id in presents_ids:
+            etudiant = etudiants.get(etud_id)
+            if etudiant:
+                nom_complet = f"{etudiant.get('nom', '')} {etudiant.get('prenom', '')}".strip()
+                etudiants_presents.append(nom_complet or etud_id)
+            else:
+                etudiants_presents.append(etud_id)
+
+        if presents_ids:
+            await enregistrer_presences(
+                code_cours,
+                presents_ids,
+                "video",
+                confiances=confiances(resultat, presents_ids)
+            )
+
+        notification_id = None
+        if envoyer_email:
+            notification_id = await planifier_notification(cours, etudiants_presents, [])
+
+        return jsonify({
+            'success': True,
+            'etudiants_presents': etudiants_presents,
+            'nombre_presents': len(etudiants_presents),
+            'nombre_absents': 0,
+            'visages_ignores': resultat['visages_ignores'],
+            'email_envoye': notification_id is not None,
+            'email_destinataire': cours.get('email_professeur') if notification_id else None,
+            'message': 'Présence enregistrée avec succès'
+        }), 201
+
+    except (AdmissionRefusee, AppariementIndisponible):
+        raise
+    except Exception as e:
+        logger.error(f"Error recording video presence: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/presences/webcam', methods=['POST'])
+@admettre('webcam')
+async def enregistrer_presence_webcam():
+    """Enregistrer présence via frames webcam (capturées côté client)"""
+    try:
+        form = await request.form
+        files = await request.files
+        code_cours = form.get('code_cours')
+        frames = files.getlist('frames')
+
+        if not code_cours:
+            return jsonify({'erreur': 'Code cours requis'}), 400
+        if not frames:
+            return jsonify({'erreur': 'Aucune image reçue'}), 400
+
+        cours = await db.obtenir_cours(code_cours)
+        if not cours:
+            return jsonify({'erreur': 'Cours introuvable'}), 404
+
+        logger.info(f"Analyse webcam pour {code_cours}: {len(frames)} images reçues")
+
+        resultat = await executer_reconnaissance(
+            analyser_images_worker, [f.read() for f in frames], config.DETECTEUR_WEBCAM
+        )
+        presents = valider_presents_webcam(resultat['detections'])
+        logger.info(f" Présents validés: {presents}")
+
+        presence_id = await enregistrer_presences(
+            code_cours,
+            presents,
+            "webcam",
+            confiances=confiances(resultat, presents)
+        )
+
+        notification_id = None
+        if form.get('envoyer_email', 'false').lower() == 'true':
+            etudiants = await db.obtenir_etudiants(presents)
+            noms = [etudiants[i].get('nom', i) if i in etudiants else i for i in presents]
+            notification_id = await planifier_notification(cours, noms, [])
+
+        return jsonify({
+            'success': True,
+            'presence_id': str(presence_id),
+            'presents': presents,
+            'absents': [],
+            'nb_presents': len(presents),
+            'nb_absents': 0,
+            'visages_ignores': resultat['visages_ignores'],
+            'email_envoye': notification_id is not None,
+            'email_destinataire': cours.get('email_professeur') if notification_id else None,
+            'message': f'Présence enregistrée: {len(presents)} étudiant(s) reconnu(s)'
+        }), 201
+
+    except AppariementIndisponible:
+        raise
+    except Exception as e:
+        logger.error(f"Erreur présence webcam: {e}")
+        return jsonify({'erreur': str(e)}), 500
+
+async def reponse_reconnaissance(resultat, nombre_images):
+    """Réponse des routes de reconnaissance : l'étudiant reconnu le plus souvent"""
+    etudiants_detectes = resultat['detections']
+
+    if etudiants_detectes:
+        student_id, detections = max(etudiants_detectes.items(), key=lambda x: x[1])
+        etudiant = await db.obtenir_etudiant(student_id)
+
+        if etudiant:
+            return jsonify({
+                'success': True,
+                'recognized': True,
+                'student_id': student_id,
+                'student_name': etudiant.get('nom'),
+                'detections': detections,
+                'total_frames': nombre_images
+            }), 200
+
+    return jsonify({
+        'success': True,
+        'recognized': False,
+        'message': 'Aucun visage reconnu',
+        'visages_ignores': resultat['visages_ignores']
+    }), 200
+
+@app.route('/api/presences/recognize', methods=['POST'])
+@admettre('reconnaissance')
+async def recognize_face():
+    """Reconnaissance de visage SANS enregistrement"""
+    try:
+        files = await request.files
+        frames = files.getlist('frames')
+
+        if not frames:
+            return jsonify({'success': False, 'recognized': False, 'message': 'Aucune image reçue'}), 400
+
+        resultat = await executer_reconnaissance(
+            analyser_images_worker, [f.read() for f in frames], config.DETECTEUR_RECONNAISSANCE
+        )
+        return await reponse_reconnaissance(resultat, len(frames))
+
+    except AppariementIndisponible:
+        raise
+    except Exception as e:
+        logger.error(f"Erreur reconnaissance: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/presences/recognize/vignettes', methods=['POST'])
+@admettre('reconnaissance')
+async def recognize_face_vignettes():
+    """Reconnaissance SANS enregistrement à partir de vignettes recadrées par le navigateur"""
+    try:
+        form = await request.form
+        files = await request.files
+        vignettes = files.getlist('vignettes')
+
+        if not vignettes:
+            return jsonify({'success': False, 'recognized': False, 'message': 'Aucune vignette reçue'}), 400
+        if len(vignettes) > config.VIGNETTES_CLIENT_NOMBRE_MAX:
+            return jsonify({
+                'success': False, 'recognized': False,
+                'message': f'Au plus {config.VIGNETTES_CLIENT_NOMBRE_MAX} vignettes par requête'
+            }), 400
+
+        try:
+            boites = json.loads(form.get('boites') or 'null') or [None] * len(vignettes)
+        except ValueError:
+            return jsonify({'success': False, 'recognized': False, 'message': 'boites: JSON invalide'}), 400
+        if not isinstance(boites, list) or len(boites) != len(vignettes):
+            return jsonify({
+                'success': False, 'recognized': False,
+                'message': 'boites doit contenir une entrée par vignette'
+            }), 400
+
+        resultat = await executer_reconnaissance(
+            analyser_vignettes_client_worker, [f.read() for f in vignettes], boites,
+            config.DETECTEUR_RECONNAISSANCE
+        )
+        return await reponse_reconnaissance(resultat, len(vignettes))
+
+    except AppariementIndisponible:
+        raise
+    except Exception as e:
+        logger.error(f"Erreur reconnaissance: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/presences/interactive/finalize', methods=['POST'])
+async def finalize_interactive_presence():
+    """Finalise une session de présence interactive"""
+    try:
+        data = await request.get_json()
+        code_cours = data.get('code_cours')
+        presents = data.get('presents', [])
+        absents = data.get('absents', [])
+
+        if not code_cours:
+            return jsonify({'erreur': 'code_cours requis'}), 400
+
+        cours = await db.obtenir_cours(code_cours)
+        if not cours:
+            return jsonify({'erreur': 'Cours non trouvé'}), 404
+
+        presence_id = None
+        if presents:
+            presence_id = await enregistrer_presences(code_cours, presents, "interactive")
+
+        etudiants = await db.obtenir_etudiants(presents + absents)
+        notification_id = await planifier_notification(
+            cours,
+            [etudiants[i].get('nom', i) if i in etudiants else i for i in presents],
+            [etudiants[i].get('nom', i) if i in etudiants else i for i in absents]
+        )
+
+        return jsonify({
+            'success': True,
+            'presence_id': str(presence_id) if presence_id else None,
+            'nb_presents': len(presents),
+            'nb_absents': len(absents),
+            'email_envoye': notification_id is not None,
+            'email_destinataire': cours.get('email_professeur') if notification_id else None,
+            'message': f'Session terminée: {len(presents)} présent(s), {len(absents)} absent(s)'
+        }), 201
+
+    except Exception as e:
+        logger.error(f" Erreur finalisation session: {e}")
+        return jsonify({'erreur': str(e)}), 500
+
+# RAPPORTS
+
+@app.route('/api/rapports/presences', methods=['GET'])
+async def telecharger_rapport_presences():
+    """
+    Télécharger la matrice de présence étudiants × séances d'un cours
+    Paramètres: code_cours, debut/fin (AAAA-MM-JJ, optionnels), format (xlsx|csv)
+    """
+    try:
+        code_cours = request.args.get('code_cours')
+        format_rapport = request.args.get('format', 'xlsx').lower()
+
+        if not code_cours:
+            return jsonify({'success': False, 'error': 'Paramètre code_cours requis'}), 400
+        if format_rapport not in FORMATS:
+            return jsonify({'success': False, 'error': f'Format non supporté: {format_rapport}'}), 400
+
+        try:
+            date_debut = date_fin = None
+            if request.args.get('debut'):
+                date_debut = datetime.strptime(request.args['debut'], '%Y-%m-%d')
+            if request.args.get('fin'):
+                # Fin incluse: jusqu'à la fin de la journée
+                date_fin = datetime.strptime(request.args['fin'], '%Y-%m-%d') + timedelta(days=1, microseconds=-1)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Dates attendues au format AAAA-MM-JJ'}), 400
+
+        # Génération synchrone (MongoDB + écriture du fichier) : hors de la boucle d'événements
+        chemin = await asyncio.to_thread(rapports.generer, code_cours, date_debut, date_fin, format_rapport)
+        if not chemin:
+            return jsonify({'success': False, 'error': 'Cours introuvable'}), 404
+
+        return await send_file(
+            chemin,
+            as_attachment=True,
+            attachment_filename=f"presences_{code_cours}.{format_rapport}"
+        )
+
+    except Exception as e:
+        logger.error(f"Error generating report: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# ==================== DÉMARRAGE ====================
+
+if __name__ == '__main__':
+    logger.info("🚀 Démarrage de l'API Backend asynchrone...")
+    logger.info(f"📊 MongoDB: {config.MONGODB_URI}")
+    logger.info(f"👥 Étudiants encodés: {len(face_mgr.known_encodings)}")
+
+    app.run(host='0.0.0.0', port=5001)
@@ -0,0 +1,142 @@
+"""
+Cache des résultats de reconnaissance pour les images quasi identiques
+
+Le mode interactif et la route webcam envoient souvent des images presque
+identiques (étudiant immobile devant la caméra). Chaque image est résumée
+par une empreinte perceptuelle (dHash) ; si une empreinte proche (distance
+de Hamming <= CACHE_EMPREINTES_DISTANCE) a été vue il y a moins de
+CACHE_EMPREINTES_TTL secondes, le résultat précédent est réutilisé.
+
+Les frames des vidéos n'y passent pas : une caméra fixe de salle donne des
+frames aux empreintes quasi identiques alors que les étudiants bougent.
+
+Deux caches par processus:
+    frames    : empreinte de l'image réduite -> boîtes des visages (évite la détection)
+    visages   : contenu exact de la vignette alignée -> descripteur 128-d (évite l'encodage)
+
+Seul le cache des frames tolère une empreinte approchée : des boîtes
+reprises d'une image voisine sont recadrées sur l'image réelle. Les
+vignettes alignées (150×150) de deux étudiants différents peuvent avoir
+des dHash très proches ; un descripteur n'est donc repris que pour une
+vignette identique au pixel près (empreinte_exacte).
+
+Les descripteurs ne dépendent pas de la galerie : l'appariement est
+toujours refait, une inscription ou suppression est donc prise en compte
+immédiatement.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import config
+from metriques import enregistrer_acces_cache, CACHE_TAILLE
+
+
+def empreinte(image, taille=None):
+    """
+    Empreinte perceptuelle (dHash) d'une image RGB
+
+    L'image est réduite en niveaux de gris à (taille + 1) × taille pixels ;
+    chaque bit indique si un pixel est plus clair que son voisin de droite.
+
+    Returns:
+        int: empreinte de taille² bits
+    """
+    taille = taille or config.CACHE_EMPREINTES_TAILLE_HASH
+    gris = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    reduite = cv2.resize(gris, (taille + 1, taille), interpolation=cv2.INTER_AREA)
+    bits = reduite[:, 1:] > reduite[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def empreinte_exacte(image):
+    """
+    Empreinte du contenu exact d'une image (BLAKE2b de ses pixels et de sa forme)
+
+    Returns:
+        int: empreinte de 128 bits
+    """
+    contenu = hashlib.blake2b(repr(image.shape).encode(), digest_size=16)
+    contenu.update(np.ascontiguousarray(image).data)
+    return int.from_bytes(contenu.digest(), 'big')
+
+
+class CacheEmpreintes:
+    """
+    Cache LRU borné, à expiration, interrogé par empreinte approchée
+
+    Thread-safe : partagé par les threads du pool d'images et du pipeline vidéo.
+    """
+
+    def __init__(self, nom, taille_max=None, ttl=None, distance_max=None):
+        self.nom = nom
+        self.taille_max = taille_max or config.CACHE_EMPREINTES_TAILLE
+        self.ttl = ttl if ttl is not None else config.CACHE_EMPREINTES_TTL
+        self.distance_max = distance_max if distance_max is not None else config.CACHE_EMPREINTES_DISTANCE
+        self._entrees = OrderedDict()  # {(contexte, empreinte): (expiration, valeur)}
+        self._verrou = threading.Lock()
+
+    def chercher(self, cle, contexte=None):
+        """
+        Retourne la valeur associée à l'empreinte la plus proche de `cle`
+
+        Args:
+            cle: Empreinte (int)
+            contexte: Partie exacte de la clé (détecteur, taille d'image...)
+
+        Returns:
+            La valeur en cache, ou None
+        """
+        maintenant = time.monotonic()
+        trouvee = None
+        with self._verrou:
+            self._purger(maintenant)
+            if (contexte, cle) in self._entrees:
+                trouvee = (contexte, cle)
+            elif self.distance_max > 0:
+                meilleure = self.distance_max + 1
+                for entree in self._entrees:
+                    if entree[0] != contexte:
+                        continue
+                    distance = (entree[1] ^ cle).bit_count()
+                    if distance < meilleure:
+                        trouvee, meilleure = entree, distance
+            valeur = None
+            if trouvee is not None:
+                self._entrees.move_to_end(trouvee)
+                valeur = self._entrees[trouvee][1]
+        enregistrer_acces_cache(self.nom, trouvee is not None)
+        return valeur
+
+    def ajouter(self, cle, valeur, contexte=None):
+        """Mémorise `valeur` pour l'empreinte `cle` (évince la plus ancienne si plein)"""
+        with self._verrou:
+            self._entrees[(contexte, cle)] = (time.monotonic() + self.ttl, valeur)
+            self._entrees.move_to_end((contexte, cle))
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+            CACHE_TAILLE.set(len(self._entrees), cache=self.nom)
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+            CACHE_TAILLE.set(0, cache=self.nom)
+
+    def __len__(self):
+        return len(self._entrees)
+
+    def _purger(self, maintenant):
+        """Retire les entrées expirées (appelé sous verrou)"""
+        expirees = [entree for entree, (expiration, _) in self._entrees.items() if expiration <= maintenant]
+        for entree in expirees:
+            del self._entrees[entree]
+        if expirees:
+            CACHE_TAILLE.set(len(self._entrees), cache=self.nom)
+
+
+CACHE_FRAMES = CacheEmpreintes('frames')
+CACHE_VISAGES = CacheEmpreintes('visages', distance_max=0)  # clés exactes uniquement
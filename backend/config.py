@@ -12,6 +12,8 @@ DATABASE_NAME = os.getenv('DATABASE_NAME', 'systeme_presence')
 COLLECTION_ETUDIANTS = os.getenv('COLLECTION_ETUDIANTS', 'etudiants')
 COLLECTION_PRESENCES = os.getenv('COLLECTION_PRESENCES', 'presences')
 COLLECTION_COURS = os.getenv('COLLECTION_COURS', 'cours')
+COLLECTION_SEANCES = os.getenv('COLLECTION_SEANCES', 'seances')
+COLLECTION_NOTIFICATIONS = os.getenv('COLLECTION_NOTIFICATIONS', 'notifications')
 
 # Caméra
 CAMERA_INDEX = int(os.getenv('CAMERA_INDEX', 0))
@@ -22,12 +24,140 @@ TOLERANCE = float(os.getenv('TOLERANCE', 0.6))
 MODEL = os.getenv('MODEL', 'hog')
 FRAME_SKIP = int(os.getenv('FRAME_SKIP', 2))
 
+# Détecteurs de visages (hog, cnn, haar, dnn), voir detecteurs.py
+DETECTEUR = os.getenv('DETECTEUR', MODEL)
+DETECTEUR_VIDEO = os.getenv('DETECTEUR_VIDEO', DETECTEUR)
+DETECTEUR_WEBCAM = os.getenv('DETECTEUR_WEBCAM', DETECTEUR)
+DETECTEUR_RECONNAISSANCE = os.getenv('DETECTEUR_RECONNAISSANCE', DETECTEUR)
+DETECTEUR_INSCRIPTION = os.getenv('DETECTEUR_INSCRIPTION', DETECTEUR)
+DNN_SEUIL = float(os.getenv('DNN_SEUIL', 0.5))
+
+# Encodage par lots (reconnaissance.EncodeurParLots)
+ENCODAGE_TAILLE_LOT = int(os.getenv('ENCODAGE_TAILLE_LOT', 16))  # visages par appel dlib
+ENCODAGE_DELAI_MAX = float(os.getenv('ENCODAGE_DELAI_MAX', 1.0))  # secondes d'attente max d'un visage
+
+# Contrôle qualité des visages avant encodage (voir qualite.py)
+QUALITE_ACTIVE = os.getenv('QUALITE_ACTIVE', 'true').lower() == 'true'
+QUALITE_TAILLE_MIN = int(os.getenv('QUALITE_TAILLE_MIN', 40))  # pixels, plus petit côté du visage
+QUALITE_NETTETE_MIN = float(os.getenv('QUALITE_NETTETE_MIN', 15))  # variance du laplacien
+QUALITE_LUMINOSITE_MIN = float(os.getenv('QUALITE_LUMINOSITE_MIN', 35))  # niveau de gris moyen
+QUALITE_LUMINOSITE_MAX = float(os.getenv('QUALITE_LUMINOSITE_MAX', 225))
+QUALITE_LACET_MAX = float(os.getenv('QUALITE_LACET_MAX', 0.3))  # décalage du nez / distance des yeux
+QUALITE_MEILLEURES_FRAMES = int(os.getenv('QUALITE_MEILLEURES_FRAMES', 3))  # par personne (webcam), 0 = toutes
+
+# Cache des images quasi identiques (voir cache_empreintes.py)
+CACHE_EMPREINTES_ACTIF = os.getenv('CACHE_EMPREINTES_ACTIF', 'true').lower() == 'true'
+CACHE_EMPREINTES_TTL = float(os.getenv('CACHE_EMPREINTES_TTL', 30))  # secondes
+CACHE_EMPREINTES_TAILLE = int(os.getenv('CACHE_EMPREINTES_TAILLE', 512))  # entrées par cache
+CACHE_EMPREINTES_TAILLE_HASH = int(os.getenv('CACHE_EMPREINTES_TAILLE_HASH', 16))  # empreinte de 16×16 bits
+CACHE_EMPREINTES_DISTANCE = int(os.getenv('CACHE_EMPREINTES_DISTANCE', 6))  # bits différents tolérés (cache des frames)
+
+# Vignettes recadrées par le navigateur (/api/presences/recognize/vignettes)
+VIGNETTES_CLIENT_TAILLE_MAX = int(os.getenv('VIGNETTES_CLIENT_TAILLE_MAX', 512))  # pixels, plus grand côté
+VIGNETTES_CLIENT_NOMBRE_MAX = int(os.getenv('VIGNETTES_CLIENT_NOMBRE_MAX', 10))  # par requête
+
+# Photos des étudiants (magasin adressé par contenu, voir photos.py)
+PHOTOS_TAILLE_MAX_MO = int(os.getenv('PHOTOS_TAILLE_MAX_MO', 10))  # taille de l'envoi
+PHOTOS_PIXELS_MAX = int(os.getenv('PHOTOS_PIXELS_MAX', 40_000_000))  # refusée au-delà, avant décodage
+PHOTOS_COTE_MAX = int(os.getenv('PHOTOS_COTE_MAX', 1600))  # pixels, original normalisé
+PHOTOS_MINIATURE = int(os.getenv('PHOTOS_MINIATURE', 160))  # pixels, plus grand côté
+PHOTOS_QUALITE_JPEG = int(os.getenv('PHOTOS_QUALITE_JPEG', 90))
+
+# Email (notifications aux professeurs)
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', 587))
+EMAIL_USER = os.getenv('EMAIL_USER', '')
+EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD', '')  # Mot de passe d'application
+EMAIL_FROM = os.getenv('EMAIL_FROM', 'Système de Présence ISIMM <noreply@isimm.tn>')
+EMAIL_STARTTLS = os.getenv('EMAIL_STARTTLS', 'true').lower() == 'true'
+EMAIL_TIMEOUT = float(os.getenv('EMAIL_TIMEOUT', 30))
+EMAIL_FENETRE_REGROUPEMENT = int(os.getenv('EMAIL_FENETRE_REGROUPEMENT', 60))  # secondes
+EMAIL_INTERVALLE_ENVOI = float(os.getenv('EMAIL_INTERVALLE_ENVOI', 5))  # secondes
+EMAIL_TENTATIVES_MAX = int(os.getenv('EMAIL_TENTATIVES_MAX', 5))
+EMAIL_DELAI_RETRY = int(os.getenv('EMAIL_DELAI_RETRY', 30))  # secondes, doublé à chaque échec
+EMAIL_EXPEDITEUR_INTEGRE = os.getenv('EMAIL_EXPEDITEUR_INTEGRE', 'true').lower() == 'true'
+
+# Journal local des présences, vidé vers MongoDB en arrière-plan (journal_presences.py)
+JOURNAL_PRESENCES_ACTIF = os.getenv('JOURNAL_PRESENCES_ACTIF', 'true').lower() == 'true'
+JOURNAL_INTERVALLE = float(os.getenv('JOURNAL_INTERVALLE', 2))  # secondes entre deux vidanges
+JOURNAL_TAILLE_LOT = int(os.getenv('JOURNAL_TAILLE_LOT', 100))  # entrées écrites par lot
+JOURNAL_BAIL = float(os.getenv('JOURNAL_BAIL', 120))  # secondes de réservation d'un lot par une vidange
+JOURNAL_VIDANGE_INTEGREE = os.getenv('JOURNAL_VIDANGE_INTEGREE', 'true').lower() == 'true'
+
+# Ordonnanceur des analyses (pool de threads partagé par toutes les séances, voir ordonnanceur.py)
+ORDONNANCEUR_THREADS = int(os.getenv('ORDONNANCEUR_THREADS', os.cpu_count() or 2))
+# Non fixé : les cœurs sont répartis entre les processus d'analyse (ordonnanceur.repartir_threads)
+ORDONNANCEUR_THREADS_FIXE = 'ORDONNANCEUR_THREADS' in os.environ
+
+# Pipeline vidéo (décodage -> analyse -> fusion)
+VIDEO_FILE_MAX = int(os.getenv('VIDEO_FILE_MAX', 32))  # frames en attente, au plus
+VIDEO_MEMOIRE_MAX_MO = int(os.getenv('VIDEO_MEMOIRE_MAX_MO', 128))  # plafond des frames en attente
+
+# Pools gunicorn (gunicorn.conf.py) : le pool léger refuse les routes de
+# reconnaissance (421) et renvoie vers POOL_LOURD_URL ; vide = serveur unique
+POOL = os.getenv('POOL', '')
+POOL_LOURD_URL = os.getenv('POOL_LOURD_URL', 'http://localhost:5001')
+
+# Contrôle d'admission des routes lourdes (admission.py), limites par worker
+ADMISSION_VIDEO_CONCURRENCE = int(os.getenv('ADMISSION_VIDEO_CONCURRENCE', 2))  # vidéos décodées à la fois
+ADMISSION_VIDEO_FILE = int(os.getenv('ADMISSION_VIDEO_FILE', 4))  # vidéos en attente, au plus
+ADMISSION_WEBCAM_CONCURRENCE = int(os.getenv('ADMISSION_WEBCAM_CONCURRENCE', 4))
+ADMISSION_WEBCAM_FILE = int(os.getenv('ADMISSION_WEBCAM_FILE', 8))
+ADMISSION_RECONNAISSANCE_CONCURRENCE = int(os.getenv('ADMISSION_RECONNAISSANCE_CONCURRENCE', 8))
+ADMISSION_RECONNAISSANCE_FILE = int(os.getenv('ADMISSION_RECONNAISSANCE_FILE', 16))
+ADMISSION_ATTENTE_MAX = float(os.getenv('ADMISSION_ATTENTE_MAX', 15))  # secondes en file, au plus
+ADMISSION_PAR_SEANCE = int(os.getenv('ADMISSION_PAR_SEANCE', 1))  # analyses vidéo/webcam par cours, 0 = sans limite
+VIDEO_TAILLE_MAX_MO = int(os.getenv('VIDEO_TAILLE_MAX_MO', 200))  # taille de l'envoi
+VIDEO_DUREE_MAX = float(os.getenv('VIDEO_DUREE_MAX', 900))  # secondes
+WEBCAM_TAILLE_MAX_MO = int(os.getenv('WEBCAM_TAILLE_MAX_MO', 25))  # webcam et reconnaissance
+
+# Service d'appariement partitionné (service_appariement.py) ; vide = appariement local
+APPARIEMENT_ADRESSE = os.getenv('APPARIEMENT_ADRESSE', '')  # socket UNIX, ex. /tmp/presence-appariement.sock
+APPARIEMENT_SHARDS = int(os.getenv('APPARIEMENT_SHARDS', os.cpu_count() or 2))
+# Clé partagée du service, obligatoire : les messages reçus après l'authentification sont dépicklés
+APPARIEMENT_CLE = os.getenv('APPARIEMENT_CLE', '').encode('utf-8')
+APPARIEMENT_TIMEOUT = float(os.getenv('APPARIEMENT_TIMEOUT', 5))  # secondes par appel, ensuite appariement local
+
+# Diagnostic (mémoire, profilage) réservé aux administrateurs : en-tête X-Jeton-Diagnostic ; vide = désactivé
+DIAGNOSTIC_JETON = os.getenv('DIAGNOSTIC_JETON', '')
+
+# Instrumentation mémoire (memoire.py) et recyclage des workers
+MEMOIRE_INSTRUMENTATION = os.getenv('MEMOIRE_INSTRUMENTATION', 'false').lower() == 'true'  # RSS par requête
+MEMOIRE_SEUIL_LOG_MO = float(os.getenv('MEMOIRE_SEUIL_LOG_MO', 50))  # avertissement au-delà (par requête)
+MEMOIRE_TRACEMALLOC_FRAMES = int(os.getenv('MEMOIRE_TRACEMALLOC_FRAMES', 10))
+MEMOIRE_INSTANTANES_MAX = int(os.getenv('MEMOIRE_INSTANTANES_MAX', 5))
+# RSS inclut les pages partagées avec le maître (preload_app) ; 0 = sans limite
+WORKER_RSS_MAX_MO = int(os.getenv('WORKER_RSS_MAX_MO', 0))
+
+# Profilage à la demande des requêtes de reconnaissance (profilage.py)
+PROFILAGE_INTERVALLE = float(os.getenv('PROFILAGE_INTERVALLE', 0.005))  # secondes entre deux échantillons
+
+# Export Parquet pour l'analyse (export_parquet.py)
+EXPORT_TAILLE_LOT = int(os.getenv('EXPORT_TAILLE_LOT', 50000))  # documents par groupe de lignes
+EXPORT_MARGE = int(os.getenv('EXPORT_MARGE', 60))  # secondes : documents trop récents exportés au run suivant
+
+# Retraitement des vidéos archivées (retraitement.py)
+RETRAITEMENT_PROCESSUS = int(os.getenv('RETRAITEMENT_PROCESSUS', os.cpu_count() or 2))
+
+# API asynchrone (api_async.py)
+ASYNC_PROCESSUS_RECONNAISSANCE = int(os.getenv('ASYNC_PROCESSUS_RECONNAISSANCE', os.cpu_count() or 2))
+
 # Chemins
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(BASE_DIR)  # Dossier parent (racine du projet)
-ENCODAGES_DIR = os.path.join(PROJECT_ROOT, 'encodages')
+ENCODAGES_DIR = os.getenv('ENCODAGES_DIR', os.path.join(PROJECT_ROOT, 'encodages'))
+# Galerie consolidée (un seul fichier) reconstruite quand ENCODAGES_DIR change
+GALERIE_CACHE = os.getenv('GALERIE_CACHE', os.path.join(PROJECT_ROOT, 'cache', 'galerie.npz'))
+JOURNAL_PRESENCES_CHEMIN = os.getenv('JOURNAL_PRESENCES_CHEMIN', os.path.join(PROJECT_ROOT, 'journal', 'presences.sqlite3'))
+RETRAITEMENT_DIR = os.getenv('RETRAITEMENT_DIR', os.path.join(PROJECT_ROOT, 'cache', 'retraitement'))
+PHOTOS_DIR = os.getenv('PHOTOS_DIR', os.path.join(PROJECT_ROOT, 'photos'))
 RAPPORTS_DIR = os.path.join(PROJECT_ROOT, 'rapports')
+EXPORT_DIR = os.getenv('EXPORT_DIR', os.path.join(PROJECT_ROOT, 'exports', 'parquet'))
 LOGS_DIR = os.path.join(PROJECT_ROOT, 'logs')
+PROFILAGE_DIR = os.path.join(LOGS_DIR, 'profils')
+MODELES_DIR = os.getenv('MODELES_DIR', os.path.join(PROJECT_ROOT, 'modeles'))
+DNN_MODELE = os.getenv('DNN_MODELE', os.path.join(MODELES_DIR, 'res10_300x300_ssd_iter_140000.caffemodel'))
+DNN_CONFIG = os.getenv('DNN_CONFIG', os.path.join(MODELES_DIR, 'deploy.prototxt'))
 
 # Logs
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
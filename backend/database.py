@@ -1,53 +1,110 @@
 """
 Gestionnaire de base de données MongoDB
 """
-from pymongo import MongoClient, DESCENDING
-from datetime import datetime
+from pymongo import MongoClient, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime, timedelta
+import os
 import config
 import logging
+from metriques import mesurer
 
 logging.basicConfig(level=config.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+DOUBLON = 11000  # code MongoDB d'une clé unique déjà présente
+
+# Sources des séances qu'un retraitement vidéo peut réécrire
+SOURCES_VIDEO = ("video", "retraitement")
+
+
+def _ecrire_sans_doublon(collection, operations):
+    """
+    bulk_write d'upserts idempotents : une clé unique déjà présente signifie
+    qu'un écrivain concurrent a inséré le même document, ce n'est pas une erreur
+    """
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        erreurs = e.details.get("writeErrors", [])
+        if e.details.get("writeConcernErrors") or any(err.get("code") != DOUBLON for err in erreurs):
+            raise
+        logger.info(f" {len(erreurs)} document(s) déjà écrit(s) dans {collection.name}")
+
 
 class DatabaseManager:
     """Gère toutes les interactions avec MongoDB"""
     
     def __init__(self):
-        """Initialise la connexion à MongoDB"""
+        """
+        Initialise la connexion à MongoDB
+        
+        Les index ne sont plus créés ici (un aller-retour serveur par index à
+        chaque démarrage) : voir `python migrations.py index`.
+        """
         try:
-            self.client = MongoClient(config.MONGODB_URI)
-            self.db = self.client[config.DATABASE_NAME]
-            self.etudiants = self.db[config.COLLECTION_ETUDIANTS]
-            self.presences = self.db[config.COLLECTION_PRESENCES]
-            self.cours = self.db[config.COLLECTION_COURS]
-            
-            # Créer les index
-            self._creer_index()
+            self._connecter()
             logger.info(" Connexion MongoDB établie")
             
         except Exception as e:
             logger.error(f" Erreur connexion MongoDB: {e}")
             raise
     
-    def _creer_index(self):
-        """Crée les index pour optimiser les requêtes"""
+    def _connecter(self):
+        """Crée le client MongoDB et les références aux collections"""
+        self.client = MongoClient(config.MONGODB_URI)
+        self.db = self.client[config.DATABASE_NAME]
+        self.etudiants = self.db[config.COLLECTION_ETUDIANTS]
+        self.presences = self.db[config.COLLECTION_PRESENCES]
+        self.cours = self.db[config.COLLECTION_COURS]
+        self.seances = self.db[config.COLLECTION_SEANCES]
+    
+    def reconnecter(self):
+        """
+        Recrée le client MongoDB dans un processus fils
+        
+        Un MongoClient n'est pas fork-safe : après un fork (workers gunicorn),
+        chaque processus doit ouvrir ses propres connexions. Le client hérité
+        n'est pas fermé, ses sockets appartiennent au processus parent.
+        """
+        self._connecter()
+        logger.info(f" Connexion MongoDB recréée (pid {os.getpid()})")
+    
+    def creer_index(self):
+        """Crée les index pour optimiser les requêtes (idempotent)"""
         self.etudiants.create_index("numero_etudiant", unique=True)
         self.etudiants.create_index("nom")
         self.presences.create_index([("date", DESCENDING), ("cours_id", 1)])
         self.presences.create_index("etudiant_id")
+        # Une présence par étudiant, cours et jour (remplir `jour` avant :
+        # python migrations.py index s'en charge)
+        self.presences.create_index([("etudiant_id", 1), ("cours_id", 1), ("jour", 1)], unique=True)
         self.cours.create_index("code_cours", unique=True)
+        # Séances d'un cours / séances suivies par un étudiant
+        self.seances.create_index([("cours_id", 1), ("date", DESCENDING)])
+        self.seances.create_index([("etudiant_ids", 1), ("date", DESCENDING)])
+        # Séances écrites depuis le journal local (rejouables sans doublon)
+        self.seances.create_index("journal_id", unique=True, sparse=True)
+        # Séances recalculées depuis une vidéo archivée (retraitement.py)
+        self.seances.create_index("video", sparse=True)
+    
+    def ping(self):
+        """Vérifie que MongoDB répond (temps constant)"""
+        self.client.admin.command("ping")
+        return True
     
     # ÉTUDIANTS 
-    def ajouter_etudiant(self, numero, nom, prenom, email, photo_path=None):
-        """Ajoute un nouvel étudiant"""
+    def ajouter_etudiant(self, numero, nom, prenom, email, photo=None):
+        """Ajoute un nouvel étudiant (photo: empreinte dans le magasin de photos.py)"""
         try:
             etudiant = {
                 "numero_etudiant": numero,
                 "nom": nom,
                 "prenom": prenom,
                 "email": email,
-                "photo_path": photo_path,
+                "photo": photo,
                 "date_inscription": datetime.now(),
                 "actif": True
             }
@@ -69,6 +126,10 @@ class DatabaseManager:
         filtre = {"actif": True} if actifs_seulement else {}
         return list(self.etudiants.find(filtre).sort("nom", 1))
     
+    def compter_etudiants(self):
+        """Nombre approximatif d'étudiants (métadonnées, sans parcourir la collection)"""
+        return self.etudiants.estimated_document_count()
+    
     def modifier_etudiant(self, numero, modifications):
         """Modifie les informations d'un étudiant"""
         try:
@@ -84,6 +145,10 @@ class DatabaseManager:
             logger.error(f" Erreur modification: {e}")
             return False
     
+    def empreintes_photos(self):
+        """Empreintes des photos encore référencées (ramasse-miettes de photos.py)"""
+        return set(self.etudiants.distinct("photo", {"photo": {"$ne": None}}))
+    
     def supprimer_etudiant(self, numero):
         """Supprime définitivement un étudiant"""
         try:
@@ -146,9 +211,15 @@ class DatabaseManager:
     
     def obtenir_toutes_presences(self):
         """Récupère toutes les présences enregistrées"""
-        return list(self.presences.find().sort("date", DESCENDING))
+        return list(self.iterer_presences())
+    
+    def iterer_presences(self):
+        """Curseur sur toutes les présences (plus récentes d'abord), lues par lots"""
+        return self.presences.find().sort("date", DESCENDING)
     
-    def ajouter_presence(self, code_cours, liste_etudiants, date_presence=None):
+    @mesurer('ecriture_db')
+    def ajouter_presence(self, code_cours, liste_etudiants, date_presence=None,
+                         source="automatique", confiances=None):
         """
         Enregistre la présence de plusieurs étudiants pour un cours
         
@@ -156,6 +227,8 @@ class DatabaseManager:
             code_cours: Code du cours
             liste_etudiants: Liste des IDs des étudiants présents
             date_presence: Date de la présence (par défaut: maintenant)
+            source: Origine de la séance ('video', 'webcam', 'interactive')
+            confiances: Dict optionnel {id_etudiant: confiance}
         
         Returns:
             ID de la présence enregistrée
@@ -163,6 +236,7 @@ class DatabaseManager:
         try:
             if date_presence is None:
                 date_presence = datetime.now()
+            confiances = confiances or {}
             
             cours = self.obtenir_cours(code_cours)
             if not cours:
@@ -172,10 +246,21 @@ class DatabaseManager:
             # Enregistrer chaque étudiant individuellement
             presence_ids = []
             for etudiant_id in liste_etudiants:
-                presence_id = self.enregistrer_presence(etudiant_id, code_cours, confiance=0.9)
+                presence_id = self.enregistrer_presence(
+                    etudiant_id, code_cours, confiance=confiances.get(etudiant_id, 0.9)
+                )
                 if presence_id:
                     presence_ids.append(presence_id)
             
+            # Enregistrer la séance complète (un seul document)
+            self.enregistrer_seance(
+                code_cours,
+                {etudiant_id: confiances.get(etudiant_id, 0.9) for etudiant_id in liste_etudiants},
+                source,
+                date_presence,
+                cours=cours
+            )
+            
             logger.info(f" {len(presence_ids)} présence(s) enregistrée(s) pour {code_cours}")
             
             # Retourner le premier ID (pour compatibilité)
@@ -185,6 +270,179 @@ class DatabaseManager:
             logger.error(f" Erreur ajouter_presence: {e}")
             return None
     
+    @mesurer('ecriture_db')
+    def appliquer_entrees_journal(self, entrees):
+        """
+        Écrit des présences du journal local (journal_presences.py), de façon idempotente
+        
+        Rejouer une entrée déjà écrite ne crée aucun doublon : les présences
+        sont dédupliquées par étudiant, cours et jour (index unique), les
+        séances par identifiant d'entrée (journal_id). Contrairement à ajouter_presence,
+        les erreurs MongoDB sont levées : l'appelant garde alors les entrées.
+        
+        Args:
+            entrees: [{'id', 'code_cours', 'etudiants', 'date', 'source', 'confiances'}, ...]
+        
+        Returns:
+            list: IDs des entrées ignorées (cours introuvable)
+        """
+        cours_par_code, etudiants = self._resoudre_entrees(entrees)
+        
+        presences, seances, ignorees = [], [], []
+        for entree in entrees:
+            cours = cours_par_code.get(entree["code_cours"])
+            if not cours:
+                logger.warning(f" Cours introuvable: {entree['code_cours']}")
+                ignorees.append(entree["id"])
+                continue
+            
+            operations, presents = self._presences_entree(entree, cours, etudiants)
+            presences.extend(operations)
+            seances.append(UpdateOne(
+                {"journal_id": entree["id"]},
+                {"$setOnInsert": {
+                    "cours_id": cours["_id"],
+                    "cours_code": cours["code_cours"],
+                    "date": entree["date"],
+                    "source": entree["source"],
+                    "etudiant_ids": [p["etudiant_id"] for p in presents],
+                    "presents": presents,
+                    "nb_presents": len(presents)
+                }},
+                upsert=True
+            ))
+        
+        if presences:
+            _ecrire_sans_doublon(self.presences, presences)
+        if seances:
+            _ecrire_sans_doublon(self.seances, seances)
+        return ignorees
+    
+    def remplacer_seances(self, entrees, retirer=False):
+        """
+        Écrit les séances recalculées depuis des vidéos archivées (retraitement.py)
+        
+        Une séance recalculée est identifiée par le chemin de sa vidéo (champ
+        video) : relancer le retraitement d'une vidéo remplace les présents
+        de sa séance au lieu d'en ajouter une autre. À la première écriture,
+        la séance de la route vidéo du même jour la plus proche en heure, pas
+        encore associée à une vidéo, est reprise ; sinon une séance est créée.
+        Seules les séances SOURCES_VIDEO sont modifiées : les séances webcam,
+        interactives, etc. ne sont jamais touchées.
+        
+        Les présences recalculées sont ajoutées, les présences existantes
+        gardées. Avec retirer=True seulement, les étudiants de
+        entree['non_retrouves'] qui ne figurent plus dans aucune séance du
+        jour perdent leur présence. Les erreurs MongoDB sont levées.
+        
+        Args:
+            entrees: [{'id', 'video', 'code_cours', 'etudiants', 'date', 'source',
+                       'confiances', 'non_retrouves'}, ...]
+            retirer: Supprimer les présences des étudiants non retrouvés
+        
+        Returns:
+            list: IDs des entrées ignorées (cours introuvable)
+        """
+        cours_par_code, etudiants = self._resoudre_entrees(entrees)
+        
+        ignorees = []
+        for entree in entrees:
+            cours = cours_par_code.get(entree["code_cours"])
+            if not cours:
+                logger.warning(f" Cours introuvable: {entree['code_cours']}")
+                ignorees.append(entree["id"])
+                continue
+            
+            operations, presents = self._presences_entree(entree, cours, etudiants)
+            debut = entree["date"].replace(hour=0, minute=0, second=0, microsecond=0)
+            du_jour = {"cours_id": cours["_id"], "date": {"$gte": debut, "$lt": debut + timedelta(days=1)}}
+            
+            seance = self.seances.find_one({"cours_id": cours["_id"], "video": entree["video"]}, {"_id": 1})
+            if seance is None:
+                candidates = list(self.seances.find(
+                    {**du_jour, "source": {"$in": list(SOURCES_VIDEO)}, "video": {"$exists": False}},
+                    {"date": 1}
+                ))
+                if candidates:
+                    seance = min(candidates, key=lambda s: abs(s["date"] - entree["date"]))
+            
+            valeurs = {
+                "video": entree["video"],
+                "etudiant_ids": [p["etudiant_id"] for p in presents],
+                "presents": presents,
+                "nb_presents": len(presents)
+            }
+            if seance is not None:
+                self.seances.update_one({"_id": seance["_id"]}, {"$set": {**valeurs, "recalculee_le": datetime.now()}})
+            else:
+                self.seances.insert_one({
+                    "cours_id": cours["_id"],
+                    "cours_code": cours["code_cours"],
+                    "date": entree["date"],
+                    "source": entree["source"],
+                    **valeurs
+                })
+            
+            if operations:
+                _ecrire_sans_doublon(self.presences, operations)
+            
+            if retirer and entree.get("non_retrouves"):
+                # Un étudiant présent à une autre séance du jour (webcam, autre vidéo...) garde sa présence
+                encore_presents = set(self.seances.distinct("etudiant_ids", du_jour))
+                a_retirer = [
+                    etudiants[numero]["_id"] for numero in entree["non_retrouves"]
+                    if numero in etudiants and etudiants[numero]["_id"] not in encore_presents
+                ]
+                if a_retirer:
+                    resultat = self.presences.delete_many({**du_jour, "etudiant_id": {"$in": a_retirer}})
+                    logger.info(f" {resultat.deleted_count} présence(s) retirée(s): {cours['code_cours']} {debut:%Y-%m-%d}")
+        return ignorees
+    
+    def _resoudre_entrees(self, entrees):
+        """Cours et étudiants des entrées, chargés en deux requêtes"""
+        codes = list({e["code_cours"] for e in entrees})
+        cours_par_code = {c["code_cours"]: c for c in self.cours.find({"code_cours": {"$in": codes}})}
+        numeros = list({numero for e in entrees for numero in [*e["etudiants"], *e.get("non_retrouves", ())]})
+        etudiants = {
+            e["numero_etudiant"]: e
+            for e in self.etudiants.find(
+                {"numero_etudiant": {"$in": numeros}},
+                {"numero_etudiant": 1, "nom": 1, "prenom": 1}
+            )
+        }
+        return cours_par_code, etudiants
+    
+    @staticmethod
+    def _presences_entree(entree, cours, etudiants):
+        """Upserts des présences d'une entrée (un par étudiant et par jour) et présents de sa séance"""
+        jour = entree["date"].replace(hour=0, minute=0, second=0, microsecond=0)
+        operations, presents = [], []
+        for numero in entree["etudiants"]:
+            etudiant = etudiants.get(numero)
+            if not etudiant:
+                logger.warning(f"  Étudiant introuvable: {numero}")
+                continue
+            confiance = entree["confiances"].get(numero, 0.9)
+            operations.append(UpdateOne(
+                {"etudiant_id": etudiant["_id"], "cours_id": cours["_id"], "jour": jour},
+                {"$setOnInsert": {
+                    "etudiant_numero": numero,
+                    "etudiant_nom": f"{etudiant['nom']} {etudiant['prenom']}",
+                    "cours_code": cours["code_cours"],
+                    "cours_nom": cours["nom"],
+                    "date": entree["date"],
+                    "confiance": confiance,
+                    "methode": "automatique"
+                }},
+                upsert=True
+            ))
+            presents.append({
+                "etudiant_id": etudiant["_id"],
+                "etudiant_numero": numero,
+                "confiance": confiance
+            })
+        return operations, presents
+    
     def enregistrer_presence(self, numero_etudiant, code_cours, confiance=None):
         """Enregistre la présence d'un étudiant à un cours"""
         try:
@@ -195,34 +453,30 @@ class DatabaseManager:
                 logger.warning(f"  Étudiant ou cours introuvable")
                 return None
             
-            # Vérifier si déjà présent aujourd'hui pour ce cours
-            aujourd_hui = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            existe = self.presences.find_one({
+            # Une présence par étudiant, cours et jour (index unique) : un
+            # enregistrement concurrent retrouve la présence déjà écrite
+            maintenant = datetime.now()
+            filtre = {
                 "etudiant_id": etudiant["_id"],
                 "cours_id": cours["_id"],
-                "date": {"$gte": aujourd_hui}
-            })
-            
-            if existe:
-                logger.info(f" {etudiant['nom']} déjà marqué présent pour {code_cours}")
-                return str(existe["_id"])
-            
-            # Enregistrer la présence
-            presence = {
-                "etudiant_id": etudiant["_id"],
+                "jour": maintenant.replace(hour=0, minute=0, second=0, microsecond=0)
+            }
+            result = self.presences.update_one(filtre, {"$setOnInsert": {
                 "etudiant_numero": numero_etudiant,
                 "etudiant_nom": f"{etudiant['nom']} {etudiant['prenom']}",
-                "cours_id": cours["_id"],
                 "cours_code": code_cours,
                 "cours_nom": cours["nom"],
-                "date": datetime.now(),
+                "date": maintenant,
                 "confiance": confiance,
                 "methode": "automatique"
-            }
+            }}, upsert=True)
+            
+            if result.upserted_id is None:
+                logger.info(f" {etudiant['nom']} déjà marqué présent pour {code_cours}")
+                return str(self.presences.find_one(filtre, {"_id": 1})["_id"])
             
-            result = self.presences.insert_one(presence)
             logger.info(f" Présence enregistrée: {etudiant['nom']} - {code_cours}")
-            return str(result.inserted_id)
+            return str(result.upserted_id)
             
         except Exception as e:
             logger.error(f"Erreur enregistrement présence: {e}")
@@ -242,6 +496,21 @@ class DatabaseManager:
             "date": {"$gte": date}
         }).sort("date", DESCENDING))
     
+    def numeros_presents(self, code_cours, jour):
+        """Numéros des étudiants déjà enregistrés présents à un cours, le jour donné"""
+        cours = self.obtenir_cours(code_cours)
+        if not cours:
+            return set()
+        
+        debut = jour.replace(hour=0, minute=0, second=0, microsecond=0)
+        return {
+            p["etudiant_numero"]
+            for p in self.presences.find(
+                {"cours_id": cours["_id"], "date": {"$gte": debut, "$lt": debut + timedelta(days=1)}},
+                {"etudiant_numero": 1}
+            )
+        }
+    
     def obtenir_presences_etudiant(self, numero_etudiant, date_debut=None, date_fin=None):
         """Récupère toutes les présences d'un étudiant"""
         etudiant = self.obtenir_etudiant(numero_etudiant)
@@ -306,6 +575,103 @@ class DatabaseManager:
             "moyenne_par_seance": len(presences) / max(1, len(set(p["date"].date() for p in presences)))
         }
     
+    # SÉANCES 
+    
+    def enregistrer_seance(self, code_cours, confiances, source, date_seance=None, cours=None):
+        """
+        Enregistre une séance de cours complète en un seul document
+        
+        L'insertion d'un document unique est atomique : la séance est
+        soit entièrement enregistrée, soit pas du tout.
+        
+        Args:
+            code_cours: Code du cours
+            confiances: Dict {numero_etudiant: confiance} des présents
+            source: Origine ('video', 'webcam', 'interactive', 'migration')
+            date_seance: Date de la séance (par défaut: maintenant)
+            cours: Document du cours s'il a déjà été chargé
+        
+        Returns:
+            ID de la séance enregistrée
+        """
+        try:
+            if date_seance is None:
+                date_seance = datetime.now()
+            
+            cours = cours or self.obtenir_cours(code_cours)
+            if not cours:
+                logger.warning(f" Cours introuvable: {code_cours}")
+                return None
+            
+            # Une seule requête pour résoudre tous les étudiants
+            etudiants = {
+                e["numero_etudiant"]: e["_id"]
+                for e in self.etudiants.find(
+                    {"numero_etudiant": {"$in": list(confiances)}},
+                    {"numero_etudiant": 1}
+                )
+            }
+            
+            presents = [
+                {
+                    "etudiant_id": etudiants[numero],
+                    "etudiant_numero": numero,
+                    "confiance": confiance
+                }
+                for numero, confiance in confiances.items()
+                if numero in etudiants
+            ]
+            
+            seance = {
+                "cours_id": cours["_id"],
+                "cours_code": code_cours,
+                "date": date_seance,
+                "source": source,
+                "etudiant_ids": [p["etudiant_id"] for p in presents],
+                "presents": presents,
+                "nb_presents": len(presents)
+            }
+            
+            result = self.seances.insert_one(seance)
+            logger.info(f" Séance enregistrée: {code_cours} ({len(presents)} présents, {source})")
+            return str(result.inserted_id)
+            
+        except Exception as e:
+            logger.error(f" Erreur enregistrement séance: {e}")
+            return None
+    
+    def obtenir_seance(self, seance_id):
+        """Récupère une séance complète par son ID"""
+        try:
+            return self.seances.find_one({"_id": ObjectId(seance_id)})
+        except InvalidId:
+            return None
+    
+    def obtenir_seances_cours(self, code_cours, date_debut=None, date_fin=None):
+        """Récupère les séances d'un cours, de la plus récente à la plus ancienne"""
+        cours = self.obtenir_cours(code_cours)
+        if not cours:
+            return []
+        
+        filtre = {"cours_id": cours["_id"]}
+        
+        if date_debut or date_fin:
+            filtre["date"] = {}
+            if date_debut:
+                filtre["date"]["$gte"] = date_debut
+            if date_fin:
+                filtre["date"]["$lte"] = date_fin
+        
+        return list(self.seances.find(filtre).sort("date", DESCENDING))
+    
+    def obtenir_seances_etudiant(self, numero_etudiant):
+        """Récupère les séances auxquelles un étudiant a assisté"""
+        etudiant = self.obtenir_etudiant(numero_etudiant)
+        if not etudiant:
+            return []
+        
+        return list(self.seances.find({"etudiant_ids": etudiant["_id"]}).sort("date", DESCENDING))
+    
     def fermer_connexion(self):
         """Ferme la connexion MongoDB"""
         self.client.close()
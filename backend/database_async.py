@@ -0,0 +1,265 @@
+"""
+Gestionnaire de base de données MongoDB asynchrone
+
+Équivalent de DatabaseManager basé sur le driver asynchrone de pymongo
+(AsyncMongoClient), utilisé par l'API ASGI (api_async.py).
+"""
+from pymongo import AsyncMongoClient, DESCENDING, UpdateOne
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabaseManager:
+    """Gère toutes les interactions asynchrones avec MongoDB"""
+
+    def __init__(self):
+        """Prépare le client (la connexion est établie à la première requête)"""
+        self.client = AsyncMongoClient(config.MONGODB_URI)
+        self.db = self.client[config.DATABASE_NAME]
+        self.etudiants = self.db[config.COLLECTION_ETUDIANTS]
+        self.presences = self.db[config.COLLECTION_PRESENCES]
+        self.cours = self.db[config.COLLECTION_COURS]
+        self.seances = self.db[config.COLLECTION_SEANCES]
+
+    async def ping(self):
+        """Vérifie que MongoDB répond"""
+        await self.client.admin.command("ping")
+        return True
+
+    # ÉTUDIANTS
+
+    async def ajouter_etudiant(self, numero, nom, prenom, email, photo=None):
+        """Ajoute un nouvel étudiant (photo: empreinte dans le magasin de photos.py)"""
+        try:
+            etudiant = {
+                "numero_etudiant": numero,
+                "nom": nom,
+                "prenom": prenom,
+                "email": email,
+                "photo": photo,
+                "date_inscription": datetime.now(),
+                "actif": True
+            }
+
+            result = await self.etudiants.insert_one(etudiant)
+            logger.info(f" Étudiant ajouté: {nom} {prenom}")
+            return str(result.inserted_id)
+
+        except Exception as e:
+            logger.error(f" Erreur ajout étudiant: {e}")
+            return None
+
+    async def obtenir_etudiant(self, numero):
+        """Récupère un étudiant par son numéro"""
+        return await self.etudiants.find_one({"numero_etudiant": numero})
+
+    async def obtenir_etudiants(self, numeros):
+        """Récupère plusieurs étudiants en une requête: {numero: etudiant}"""
+        cursor = self.etudiants.find({"numero_etudiant": {"$in": list(numeros)}})
+        return {e["numero_etudiant"]: e async for e in cursor}
+
+    async def obtenir_tous_etudiants(self, actifs_seulement=True):
+        """Récupère tous les étudiants"""
+        filtre = {"actif": True} if actifs_seulement else {}
+        return await self.etudiants.find(filtre).sort("nom", 1).to_list()
+
+    async def supprimer_etudiant(self, numero):
+        """Supprime définitivement un étudiant"""
+        try:
+            result = await self.etudiants.delete_one({"numero_etudiant": numero})
+            if result.deleted_count > 0:
+                logger.info(f"✅ Étudiant {numero} supprimé")
+                return True
+            logger.warning(f"⚠️ Étudiant {numero} introuvable")
+            return False
+        except Exception as e:
+            logger.error(f"❌ Erreur suppression étudiant: {e}")
+            return False
+
+    # COURS
+
+    async def ajouter_cours(self, code, nom, professeur, salle=None, email_professeur=None):
+        """Ajoute un nouveau cours"""
+        try:
+            cours = {
+                "code_cours": code,
+                "nom": nom,
+                "professeur": professeur,
+                "email_professeur": email_professeur,
+                "salle": salle,
+                "date_creation": datetime.now(),
+                "actif": True
+            }
+
+            result = await self.cours.insert_one(cours)
+            logger.info(f" Cours ajouté: {code} - {nom}")
+            return str(result.inserted_id)
+
+        except Exception as e:
+            logger.error(f" Erreur ajout cours: {e}")
+            return None
+
+    async def obtenir_cours(self, code):
+        """Récupère un cours par son code"""
+        return await self.cours.find_one({"code_cours": code})
+
+    async def obtenir_tous_cours(self, actifs_seulement=True):
+        """Récupère tous les cours"""
+        filtre = {"actif": True} if actifs_seulement else {}
+        return await self.cours.find(filtre).sort("code_cours", 1).to_list()
+
+    async def supprimer_cours(self, code):
+        """Supprime définitivement un cours"""
+        try:
+            result = await self.cours.delete_one({"code_cours": code})
+            if result.deleted_count > 0:
+                logger.info(f"✅ Cours {code} supprimé")
+                return True
+            logger.warning(f"⚠️ Cours {code} introuvable")
+            return False
+        except Exception as e:
+            logger.error(f"❌ Erreur suppression cours: {e}")
+            return False
+
+    # PRÉSENCES
+
+    async def obtenir_toutes_presences(self):
+        """Récupère toutes les présences enregistrées"""
+        return await self.iterer_presences().to_list()
+
+    def iterer_presences(self):
+        """Curseur asynchrone sur toutes les présences (plus récentes d'abord), lues par lots"""
+        return self.presences.find().sort("date", DESCENDING)
+
+    async def ajouter_presence(self, code_cours, liste_etudiants, date_presence=None,
+                               source="automatique", confiances=None):
+        """
+        Enregistre la présence de plusieurs étudiants pour un cours
+
+        Même contrat que DatabaseManager.ajouter_presence : une présence par
+        étudiant (dédupliquée par jour) et un document de séance.
+
+        Returns:
+            ID de la première présence enregistrée
+        """
+        try:
+            if date_presence is None:
+                date_presence = datetime.now()
+            confiances = confiances or {}
+
+            cours = await self.obtenir_cours(code_cours)
+            if not cours:
+                logger.warning(f" Cours introuvable: {code_cours}")
+                return None
+
+            etudiants = await self.obtenir_etudiants(liste_etudiants)
+            aujourd_hui = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+            # Présences déjà enregistrées aujourd'hui pour ce cours
+            deja_presents = {
+                p["etudiant_id"]: p["_id"]
+                async for p in self.presences.find(
+                    {
+                        "etudiant_id": {"$in": [e["_id"] for e in etudiants.values()]},
+                        "cours_id": cours["_id"],
+                        "date": {"$gte": aujourd_hui}
+                    },
+                    {"etudiant_id": 1}
+                )
+            }
+
+            presence_ids = []
+            nouvelles = []
+            for numero in liste_etudiants:
+                etudiant = etudiants.get(numero)
+                if not etudiant:
+                    logger.warning(f"  Étudiant introuvable: {numero}")
+                    continue
+                if etudiant["_id"] in deja_presents:
+                    presence_ids.append(str(deja_presents[etudiant["_id"]]))
+                    continue
+                nouvelles.append({
+                    "etudiant_id": etudiant["_id"],
+                    "etudiant_numero": numero,
+                    "etudiant_nom": f"{etudiant['nom']} {etudiant['prenom']}",
+                    "cours_id": cours["_id"],
+                    "cours_code": code_cours,
+                    "cours_nom": cours["nom"],
+                    "date": datetime.now(),
+                    "jour": aujourd_hui,
+                    "confiance": confiances.get(numero, 0.9),
+                    "methode": "automatique"
+                })
+
+            if nouvelles:
+                # Upserts sur la clé unique (étudiant, cours, jour) : un
+                # enregistrement concurrent ne crée pas de doublon
+                cle = ("etudiant_id", "cours_id", "jour")
+                result = await self.presences.bulk_write([
+                    UpdateOne(
+                        {champ: p[champ] for champ in cle},
+                        {"$setOnInsert": {champ: valeur for champ, valeur in p.items() if champ not in cle}},
+                        upsert=True
+                    )
+                    for p in nouvelles
+                ], ordered=False)
+                presence_ids.extend(str(i) for i in result.upserted_ids.values())
+
+            presents = [
+                {
+                    "etudiant_id": etudiants[numero]["_id"],
+                    "etudiant_numero": numero,
+                    "confiance": confiances.get(numero, 0.9)
+                }
+                for numero in liste_etudiants
+                if numero in etudiants
+            ]
+            await self.seances.insert_one({
+                "cours_id": cours["_id"],
+                "cours_code": code_cours,
+                "date": date_presence,
+                "source": source,
+                "etudiant_ids": [p["etudiant_id"] for p in presents],
+                "presents": presents,
+                "nb_presents": len(presents)
+            })
+
+            logger.info(f" {len(presence_ids)} présence(s) enregistrée(s) pour {code_cours}")
+            return presence_ids[0] if presence_ids else None
+
+        except Exception as e:
+            logger.error(f" Erreur ajouter_presence: {e}")
+            return None
+
+    # SÉANCES
+
+    async def obtenir_seance(self, seance_id):
+        """Récupère une séance complète par son ID"""
+        try:
+            return await self.seances.find_one({"_id": ObjectId(seance_id)})
+        except InvalidId:
+            return None
+
+    async def obtenir_seances_cours(self, code_cours):
+        """Récupère les séances d'un cours, de la plus récente à la plus ancienne"""
+        cours = await self.obtenir_cours(code_cours)
+        if not cours:
+            return []
+        return await self.seances.find({"cours_id": cours["_id"]}).sort("date", DESCENDING).to_list()
+
+    async def obtenir_seances_etudiant(self, numero_etudiant):
+        """Récupère les séances auxquelles un étudiant a assisté"""
+        etudiant = await self.obtenir_etudiant(numero_etudiant)
+        if not etudiant:
+            return []
+        return await self.seances.find({"etudiant_ids": etudiant["_id"]}).sort("date", DESCENDING).to_list()
+
+    async def fermer_connexion(self):
+        """Ferme la connexion MongoDB"""
+        await self.client.close()
+        logger.info(" Connexion MongoDB fermée")
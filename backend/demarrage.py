@@ -0,0 +1,156 @@
+"""
+Démarrage paresseux de l'API et rapport des temps de démarrage
+
+Les gestionnaires coûteux (connexion MongoDB, galerie d'encodages, modèles
+dlib) ne sont créés qu'au premier usage, via des singletons paresseux.
+Chaque étape chronométrée est exposée par /metrics
+(presence_demarrage_duree_secondes).
+
+Mesurer un démarrage à froid (imports, galerie):
+    python demarrage.py
+    python demarrage.py --galerie 10000
+"""
+import json
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+
+from metriques import REGISTRE
+
+logger = logging.getLogger(__name__)
+
+DEMARRAGE_DUREE = REGISTRE.jauge(
+    'presence_demarrage_duree_secondes',
+    "Durée des étapes de démarrage (imports, connexion, galerie)",
+    ('etape',))
+
+# {etape: durée en secondes}, dans l'ordre d'exécution
+DUREES = {}
+
+
+@contextmanager
+def chronometrer(etape):
+    """Chronomètre une étape de démarrage et l'ajoute au rapport"""
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        duree = time.perf_counter() - debut
+        DUREES[etape] = duree
+        DEMARRAGE_DUREE.set(duree, etape=etape)
+        logger.info(f"⏱️ {etape}: {duree * 1000:.0f} ms")
+
+
+class Paresseux:
+    """
+    Singleton créé au premier accès à l'un de ses attributs
+
+    S'utilise comme l'objet qu'il enveloppe (db.ping(), face_mgr.known_ids)
+    sans que l'import du module ne paie la construction.
+    """
+
+    def __init__(self, etape, fabrique):
+        """
+        Args:
+            etape: Nom de l'étape dans le rapport de démarrage
+            fabrique: Fonction sans argument qui construit l'objet
+        """
+        self._etape = etape
+        self._fabrique = fabrique
+        self._objet = None
+        self._verrou = threading.Lock()
+
+    @property
+    def est_initialise(self):
+        """True si l'objet a déjà été construit"""
+        return self._objet is not None
+
+    def obtenir(self):
+        """Retourne l'objet, en le construisant au premier appel"""
+        if self._objet is None:
+            with self._verrou:
+                if self._objet is None:
+                    with chronometrer(self._etape):
+                        self._objet = self._fabrique()
+        return self._objet
+
+    def __getattr__(self, nom):
+        return getattr(self.obtenir(), nom)
+
+
+def rapport():
+    """Durées de démarrage mesurées dans ce processus (ms)"""
+    return {etape: round(duree * 1000, 1) for etape, duree in DUREES.items()}
+
+
+def _imports_les_plus_lents(sortie_importtime, nombre):
+    """Extrait de -X importtime les modules importés directement par l'API les plus lents"""
+    modules = []
+    for ligne in sortie_importtime.splitlines():
+        if not ligne.startswith('import time:') or 'cumulative' in ligne:
+            continue
+        _, cumul, nom = ligne[len('import time:'):].split('|')
+        # Profondeur 1 : " api" est à la racine, "   flask" est importé par api
+        if len(nom) - len(nom.lstrip()) == 3:
+            modules.append((int(cumul) / 1000, nom.strip()))
+    return sorted(modules, reverse=True)[:nombre]
+
+
+@click.command()
+@click.option('--galerie', default=0, help="Générer une galerie synthétique de N encodages")
+@click.option('--modules', default=10, show_default=True, help='Nombre de modules affichés')
+def main(galerie, modules):
+    """Mesure un démarrage à froid de l'API dans un processus neuf"""
+    env = dict(os.environ, EMAIL_EXPEDITEUR_INTEGRE='false')
+    if galerie:
+        import numpy as np
+
+        dossier = tempfile.mkdtemp(prefix='galerie_')
+        generateur = np.random.default_rng(0)
+        for i in range(galerie):
+            encodage = generateur.normal(size=128)
+            with open(os.path.join(dossier, f'E{i:06d}.pkl'), 'wb') as f:
+                pickle.dump(encodage / np.linalg.norm(encodage), f)
+        env['ENCODAGES_DIR'] = dossier
+        env['GALERIE_CACHE'] = dossier + '.npz'
+        click.echo(f"Galerie synthétique: {galerie} encodages dans {dossier}")
+
+    # Import de l'API puis chargement de la galerie, deux fois:
+    # sans galerie consolidée (elle est alors construite) puis avec
+    script = (
+        "import json, time\n"
+        "t = time.perf_counter()\n"
+        "import api\n"
+        "import_api = time.perf_counter() - t\n"
+        "api.face_mgr.obtenir()\n"
+        "import demarrage\n"
+        "print('RAPPORT', json.dumps(dict(demarrage.rapport(), import_api=round(import_api * 1000, 1))))\n"
+    )
+    for essai in ('froid', 'avec galerie consolidée'):
+        resultat = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env, capture_output=True, text=True
+        )
+        ligne = next((l for l in resultat.stdout.splitlines() if l.startswith('RAPPORT ')), None)
+        if ligne is None:
+            raise click.ClickException(resultat.stderr[-2000:])
+        click.echo(f"\n▶ Démarrage {essai}")
+        for etape, ms in json.loads(ligne[len('RAPPORT '):]).items():
+            click.echo(f"  {etape:<24}{ms:>10.1f} ms")
+        if essai == 'froid':
+            click.echo("  Imports les plus lents (cumulés):")
+            for ms, nom in _imports_les_plus_lents(resultat.stderr, modules):
+                click.echo(f"    {nom:<22}{ms:>10.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
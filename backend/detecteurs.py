@@ -0,0 +1,195 @@
+"""
+Détecteurs de visages interchangeables
+
+Chaque détecteur reçoit une image RGB (numpy) et retourne les visages au
+format de face_recognition : liste de (haut, droite, bas, gauche).
+
+    hog  : dlib HOG (défaut, précis, lent sur petit CPU)
+    cnn  : dlib MMOD (très précis, GPU conseillé)
+    haar : cascade de Haar OpenCV (plusieurs fois plus rapide, rappel plus faible)
+    dnn  : réseau OpenCV DNN (SSD res10 Caffe ou modèle TensorFlow) chargé
+           depuis config.DNN_MODELE / config.DNN_CONFIG
+
+Le détecteur de chaque route se règle dans config (DETECTEUR_VIDEO,
+DETECTEUR_WEBCAM, DETECTEUR_RECONNAISSANCE, DETECTEUR_INSCRIPTION).
+
+Usage:
+    from detecteurs import obtenir_detecteur
+    face_locations = obtenir_detecteur('haar').detecter(rgb_frame)
+"""
+import logging
+import os
+import threading
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def _borner(haut, droite, bas, gauche, forme):
+    """Ramène une boîte dans les limites de l'image"""
+    hauteur, largeur = forme[:2]
+    return (max(0, haut), min(largeur, droite), min(hauteur, bas), max(0, gauche))
+
+
+class Detecteur:
+    """Interface commune des détecteurs"""
+
+    nom = None
+
+    def detecter(self, image):
+        """
+        Détecte les visages d'une image RGB
+
+        Returns:
+            list: [(haut, droite, bas, gauche), ...]
+        """
+        raise NotImplementedError
+
+
+class DetecteurDlib(Detecteur):
+    """Détecteurs dlib de face_recognition (HOG ou CNN)"""
+
+    def __init__(self, modele='hog', surechantillonnage=1):
+        self.nom = modele
+        self.modele = modele
+        self.surechantillonnage = surechantillonnage
+
+    def detecter(self, image):
+        import face_recognition
+
+        return face_recognition.face_locations(
+            image, number_of_times_to_upsample=self.surechantillonnage, model=self.modele
+        )
+
+
+class _DetecteurOpenCV(Detecteur):
+    """Base des détecteurs OpenCV : un modèle par thread (objets non thread-safe)"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _modele(self):
+        modele = getattr(self._local, 'modele', None)
+        if modele is None:
+            modele = self._local.modele = self._charger()
+        return modele
+
+    def _charger(self):
+        raise NotImplementedError
+
+
+class DetecteurHaar(_DetecteurOpenCV):
+    """Cascade de Haar frontale livrée avec opencv-python"""
+
+    nom = 'haar'
+
+    def __init__(self, chemin=None, facteur_echelle=1.1, voisins_min=5, taille_min=40):
+        super().__init__()
+        self.chemin = chemin
+        self.facteur_echelle = facteur_echelle
+        self.voisins_min = voisins_min
+        self.taille_min = taille_min
+
+    def _charger(self):
+        import cv2
+
+        chemin = self.chemin or os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+        cascade = cv2.CascadeClassifier(chemin)
+        if cascade.empty():
+            raise FileNotFoundError(f"Cascade de Haar introuvable: {chemin}")
+        return cascade
+
+    def detecter(self, image):
+        import cv2
+
+        gris = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        visages = self._modele().detectMultiScale(
+            gris,
+            scaleFactor=self.facteur_echelle,
+            minNeighbors=self.voisins_min,
+            minSize=(self.taille_min, self.taille_min)
+        )
+        return [_borner(int(y), int(x + w), int(y + h), int(x), image.shape) for (x, y, w, h) in visages]
+
+
+class DetecteurDNN(_DetecteurOpenCV):
+    """
+    Réseau de détection OpenCV DNN (format SSD : sortie [1, 1, N, 7])
+
+    Par défaut le SSD ResNet-10 300×300 d'OpenCV (deploy.prototxt +
+    res10_300x300_ssd_iter_140000.caffemodel), à déposer dans config.MODELES_DIR.
+    """
+
+    nom = 'dnn'
+
+    def __init__(self, modele=None, config_modele=None, seuil=None, taille=300):
+        super().__init__()
+        self.modele = modele or config.DNN_MODELE
+        self.config_modele = config_modele if config_modele is not None else config.DNN_CONFIG
+        self.seuil = seuil if seuil is not None else config.DNN_SEUIL
+        self.taille = taille
+
+    def _charger(self):
+        import cv2
+
+        for chemin in (self.modele, self.config_modele):
+            if chemin and not os.path.exists(chemin):
+                raise FileNotFoundError(f"Modèle DNN introuvable: {chemin}")
+        return cv2.dnn.readNet(self.modele, self.config_modele or '')
+
+    def detecter(self, image):
+        import cv2
+
+        hauteur, largeur = image.shape[:2]
+        # Le réseau attend du BGR avec la moyenne d'entraînement retranchée
+        blob = cv2.dnn.blobFromImage(
+            cv2.resize(image, (self.taille, self.taille)), 1.0, (self.taille, self.taille),
+            (123.0, 177.0, 104.0), swapRB=True
+        )
+        reseau = self._modele()
+        reseau.setInput(blob)
+        sorties = reseau.forward()
+
+        visages = []
+        for detection in sorties[0, 0]:
+            if float(detection[2]) < self.seuil:
+                continue
+            gauche, haut, droite, bas = (detection[3:7] * [largeur, hauteur, largeur, hauteur]).astype(int)
+            if droite > gauche and bas > haut:
+                visages.append(_borner(int(haut), int(droite), int(bas), int(gauche), image.shape))
+        return visages
+
+
+DETECTEURS = {
+    'hog': lambda: DetecteurDlib('hog'),
+    'cnn': lambda: DetecteurDlib('cnn'),
+    'haar': DetecteurHaar,
+    'dnn': DetecteurDNN,
+}
+
+_instances = {}
+_verrou = threading.Lock()
+
+
+def obtenir_detecteur(nom=None):
+    """
+    Retourne le détecteur partagé correspondant à `nom`
+
+    Args:
+        nom: 'hog', 'cnn', 'haar', 'dnn' ou une instance de Detecteur
+             (par défaut: config.DETECTEUR)
+
+    Raises:
+        ValueError: Si le détecteur est inconnu
+    """
+    if isinstance(nom, Detecteur):
+        return nom
+    nom = (nom or config.DETECTEUR).lower()
+    if nom not in DETECTEURS:
+        raise ValueError(f"Détecteur inconnu: {nom} (disponibles: {', '.join(DETECTEURS)})")
+    with _verrou:
+        if nom not in _instances:
+            _instances[nom] = DETECTEURS[nom]()
+            logger.info(f"🔎 Détecteur de visages: {nom}")
+        return _instances[nom]
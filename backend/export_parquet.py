@@ -0,0 +1,384 @@
+"""
+Export colonnaire (Parquet) des présences pour l'analyse
+
+Les analyses sur plusieurs années ne passent plus par MongoDB : les
+présences et les séances sont exportées de façon incrémentale dans des
+fichiers Parquet partitionnés par mois de séance, puis lues avec pandas
+(AnalysePresences).
+
+    EXPORT_DIR/presences/mois=2025-10/part-<filigrane>.parquet
+    EXPORT_DIR/seances/mois=2025-10/part-<filigrane>.parquet
+    EXPORT_DIR/etat.json          dernier _id exporté par collection
+
+Chaque exécution n'exporte que les documents insérés depuis la précédente.
+Le filigrane est l'_id (ObjectId, croissant avec l'heure d'insertion) et
+non la date de la séance : les présences écrites en retard (journal,
+retraitement de vidéos archivées) sont exportées dans le mois de leur
+séance. Les documents des EXPORT_MARGE dernières secondes attendent
+l'exécution suivante (ObjectId générés dans la même seconde par plusieurs
+processus). La lecture se fait sur un secondaire s'il y en a un.
+
+Une exécution interrompue est simplement relancée : ses fichiers portent
+le filigrane de départ et sont réécrits. Les modifications et suppressions
+de documents déjà exportés ne sont pas reportées (--complet reconstruit
+l'export).
+
+Usage:
+    python export_parquet.py exporter               # à planifier (cron)
+    python export_parquet.py exporter --complet
+    python export_parquet.py compacter              # un fichier par mois
+    python export_parquet.py taux --par cours --debut 2025-09-01
+    python export_parquet.py taux --cours INF101 --sortie taux.csv
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson import ObjectId
+from pymongo import ReadPreference
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+
+logger = logging.getLogger(__name__)
+
+SCHEMAS = {
+    'presences': pa.schema([
+        ('id', pa.string()),
+        ('etudiant_id', pa.string()),
+        ('etudiant_numero', pa.string()),
+        ('etudiant_nom', pa.string()),
+        ('cours_id', pa.string()),
+        ('cours_code', pa.string()),
+        ('cours_nom', pa.string()),
+        ('date', pa.timestamp('ms')),
+        ('confiance', pa.float64()),
+        ('methode', pa.string()),
+    ]),
+    'seances': pa.schema([
+        ('id', pa.string()),
+        ('cours_id', pa.string()),
+        ('cours_code', pa.string()),
+        ('date', pa.timestamp('ms')),
+        ('source', pa.string()),
+        ('nb_presents', pa.int32()),
+        ('etudiants', pa.list_(pa.string())),
+    ]),
+}
+
+
+def _texte(valeur):
+    """Identifiant ou texte en chaîne (les anciennes présences ont parfois une liste d'ids)"""
+    if valeur is None:
+        return None
+    if isinstance(valeur, list):
+        return ','.join(str(v) for v in valeur)
+    return str(valeur)
+
+
+def _ligne_presence(doc):
+    return {
+        'id': str(doc['_id']),
+        'etudiant_id': _texte(doc.get('etudiant_id')),
+        'etudiant_numero': _texte(doc.get('etudiant_numero')),
+        'etudiant_nom': doc.get('etudiant_nom'),
+        'cours_id': _texte(doc.get('cours_id')),
+        'cours_code': doc.get('cours_code'),
+        'cours_nom': doc.get('cours_nom'),
+        'date': doc.get('date'),
+        'confiance': doc.get('confiance'),
+        'methode': doc.get('methode'),
+    }
+
+
+def _ligne_seance(doc):
+    return {
+        'id': str(doc['_id']),
+        'cours_id': _texte(doc.get('cours_id')),
+        'cours_code': doc.get('cours_code'),
+        'date': doc.get('date'),
+        'source': doc.get('source'),
+        'nb_presents': doc.get('nb_presents', len(doc.get('presents', []))),
+        'etudiants': [p.get('etudiant_numero') for p in doc.get('presents', [])],
+    }
+
+
+LIGNES = {'presences': _ligne_presence, 'seances': _ligne_seance}
+
+
+def _mois(doc):
+    """Partition d'un document : mois de la séance"""
+    date = doc.get('date')
+    return f"{date:%Y-%m}" if isinstance(date, datetime) else 'inconnu'
+
+
+class ExportParquet:
+    """Export incrémental des collections presences et seances"""
+
+    def __init__(self, db, dossier=None):
+        """
+        Args:
+            db: Instance de DatabaseManager
+            dossier: Dossier de l'export (par défaut: config.EXPORT_DIR)
+        """
+        self.db = db
+        self.dossier = dossier or config.EXPORT_DIR
+
+    def _chemin_etat(self):
+        return os.path.join(self.dossier, 'etat.json')
+
+    def etat(self):
+        """Filigrane et nombre de lignes exportées par collection"""
+        try:
+            with open(self._chemin_etat(), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _ecrire_etat(self, etat):
+        os.makedirs(self.dossier, exist_ok=True)
+        temporaire = f"{self._chemin_etat()}.{os.getpid()}.tmp"
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump(etat, f, indent=2)
+        os.replace(temporaire, self._chemin_etat())
+
+    def exporter(self, complet=False):
+        """
+        Exporte les documents insérés depuis la dernière exécution
+
+        Args:
+            complet: Supprimer l'export existant et tout réexporter
+
+        Returns:
+            dict: {collection: lignes exportées}
+        """
+        etat = {} if complet else self.etat()
+        exportees = {}
+        for table in SCHEMAS:
+            if complet:
+                shutil.rmtree(os.path.join(self.dossier, table), ignore_errors=True)
+            depuis = etat.get(table, {}).get('dernier_id')
+            dernier, lignes = self._exporter_table(table, depuis)
+            exportees[table] = lignes
+            if dernier is not None:
+                etat[table] = {
+                    'dernier_id': dernier,
+                    'lignes': etat.get(table, {}).get('lignes', 0) + lignes,
+                    'derniere_execution': datetime.now().isoformat()
+                }
+                self._ecrire_etat(etat)
+            logger.info(f"📦 {table}: {lignes} ligne(s) exportée(s)")
+        return exportees
+
+    def _exporter_table(self, table, depuis):
+        """
+        Exporte une collection au-delà du filigrane `depuis`
+
+        Returns:
+            tuple: (nouveau filigrane ou None si rien à exporter, lignes exportées)
+        """
+        limite = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=config.EXPORT_MARGE))
+        filtre = {'_id': {'$lt': limite}}
+        if depuis:
+            filtre['_id']['$gt'] = ObjectId(depuis)
+        collection = getattr(self.db, table).with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+        curseur = collection.find(filtre).sort('_id', 1).batch_size(config.EXPORT_TAILLE_LOT)
+
+        # Même nom de fichier pour un même point de départ : une reprise réécrit ses fichiers
+        nom = f"part-{depuis or 'debut'}.parquet"
+        ecrivains = {}  # {mois: (ParquetWriter, temporaire, chemin)}
+        dernier, lignes, lot = None, 0, []
+        try:
+            for doc in curseur:
+                lot.append(doc)
+                if len(lot) >= config.EXPORT_TAILLE_LOT:
+                    self._ecrire_lot(table, lot, nom, ecrivains)
+                    dernier, lignes, lot = str(lot[-1]['_id']), lignes + len(lot), []
+            if lot:
+                self._ecrire_lot(table, lot, nom, ecrivains)
+                dernier, lignes = str(lot[-1]['_id']), lignes + len(lot)
+        except BaseException:
+            for ecrivain, temporaire, _ in ecrivains.values():
+                ecrivain.close()
+                os.remove(temporaire)
+            raise
+        for ecrivain, temporaire, chemin in ecrivains.values():
+            ecrivain.close()
+            os.replace(temporaire, chemin)
+        return dernier, lignes
+
+    def _ecrire_lot(self, table, documents, nom, ecrivains):
+        """Ajoute un lot de documents (un groupe de lignes par mois) aux fichiers du run"""
+        par_mois = {}
+        for doc in documents:
+            par_mois.setdefault(_mois(doc), []).append(LIGNES[table](doc))
+        for mois, lignes in par_mois.items():
+            if mois not in ecrivains:
+                dossier = os.path.join(self.dossier, table, f"mois={mois}")
+                os.makedirs(dossier, exist_ok=True)
+                # Préfixe '.' : ignoré par les lecteurs tant que le fichier n'est pas complet
+                temporaire = os.path.join(dossier, f".{nom}.{os.getpid()}.tmp")
+                ecrivains[mois] = (pq.ParquetWriter(temporaire, SCHEMAS[table]), temporaire,
+                                   os.path.join(dossier, nom))
+            ecrivains[mois][0].write_table(pa.Table.from_pylist(lignes, schema=SCHEMAS[table]))
+
+    def compacter(self):
+        """
+        Regroupe les fichiers de chaque partition en un seul (à lancer hors export)
+
+        Returns:
+            int: Partitions compactées
+        """
+        compactees = 0
+        for table in SCHEMAS:
+            racine = os.path.join(self.dossier, table)
+            if not os.path.isdir(racine):
+                continue
+            for partition in sorted(os.listdir(racine)):
+                dossier = os.path.join(racine, partition)
+                fichiers = sorted(
+                    os.path.join(dossier, f) for f in os.listdir(dossier)
+                    if f.endswith('.parquet') and not f.startswith('.')
+                )
+                if len(fichiers) < 2:
+                    continue
+                donnees = pa.concat_tables([pq.read_table(f, schema=SCHEMAS[table]) for f in fichiers])
+                nom = f"compact-{uuid.uuid4().hex[:12]}.parquet"
+                temporaire = os.path.join(dossier, f".{nom}.tmp")
+                pq.write_table(donnees.sort_by([('date', 'ascending')]), temporaire)
+                os.replace(temporaire, os.path.join(dossier, nom))
+                for f in fichiers:
+                    os.remove(f)
+                compactees += 1
+                logger.info(f"📦 {table}/{partition}: {len(fichiers)} fichiers regroupés ({donnees.num_rows} lignes)")
+        return compactees
+
+
+class AnalysePresences:
+    """
+    Taux de présence calculés depuis l'export Parquet (sans MongoDB)
+
+    Une séance correspond à un jour de cours (les présences sont
+    dédupliquées par étudiant, cours et jour) : le taux d'un étudiant est
+    le nombre de jours où il est présent sur le nombre de jours de séance
+    du cours dans la période.
+    """
+
+    def __init__(self, dossier=None):
+        self.dossier = dossier or config.EXPORT_DIR
+
+    def lire(self, table, colonnes=None, debut=None, fin=None, code_cours=None):
+        """
+        Lignes d'une table exportée ; seules les partitions de la période sont lues
+
+        Args:
+            debut, fin: Bornes incluses sur la date de séance (datetime) ou None
+        """
+        chemin = os.path.join(self.dossier, table)
+        if not os.path.isdir(chemin):
+            vide = SCHEMAS[table].empty_table().to_pandas()
+            return vide[colonnes] if colonnes else vide
+        filtres = []
+        if debut:
+            filtres += [('mois', '>=', f"{debut:%Y-%m}"), ('date', '>=', pd.Timestamp(debut))]
+        if fin:
+            filtres += [('mois', '<=', f"{fin:%Y-%m}"), ('date', '<=', pd.Timestamp(fin))]
+        if code_cours:
+            filtres.append(('cours_code', '==', code_cours))
+        return pd.read_parquet(chemin, columns=colonnes, filters=filtres or None)
+
+    def taux_par_etudiant(self, code_cours=None, debut=None, fin=None):
+        """
+        Returns:
+            DataFrame: cours_code, etudiant_numero, etudiant_nom, jours_presents, seances, taux
+        """
+        seances = self.lire('seances', ['cours_code', 'date'], debut, fin, code_cours)
+        presences = self.lire(
+            'presences', ['cours_code', 'etudiant_numero', 'etudiant_nom', 'date'], debut, fin, code_cours
+        )
+        presences['jour'] = presences['date'].dt.normalize()
+        jours_de_cours = (
+            pd.concat([seances[['cours_code', 'date']], presences[['cours_code', 'date']]])
+            .assign(jour=lambda d: d['date'].dt.normalize())
+            .groupby('cours_code')['jour'].nunique()
+        )
+        taux = (
+            presences.groupby(['cours_code', 'etudiant_numero'], as_index=False)
+            .agg(etudiant_nom=('etudiant_nom', 'last'), jours_presents=('jour', 'nunique'))
+        )
+        taux['seances'] = taux['cours_code'].map(jours_de_cours).astype('int64')
+        taux['taux'] = (taux['jours_presents'] / taux['seances']).round(3)
+        return taux.sort_values(['cours_code', 'etudiant_numero'], ignore_index=True)
+
+    def taux_par_cours(self, code_cours=None, debut=None, fin=None):
+        """
+        Returns:
+            DataFrame: cours_code, seances, etudiants, presents_par_seance, taux_moyen
+                       (moyenne des taux des étudiants vus au moins une fois)
+        """
+        par_etudiant = self.taux_par_etudiant(code_cours, debut, fin)
+        cours = (
+            par_etudiant.groupby('cours_code', as_index=False)
+            .agg(seances=('seances', 'first'), etudiants=('etudiant_numero', 'nunique'),
+                 presences=('jours_presents', 'sum'), taux_moyen=('taux', 'mean'))
+        )
+        cours['presents_par_seance'] = (cours.pop('presences') / cours['seances']).round(1)
+        cours['taux_moyen'] = cours['taux_moyen'].round(3)
+        return cours[['cours_code', 'seances', 'etudiants', 'presents_par_seance', 'taux_moyen']]
+
+
+if __name__ == '__main__':
+    import click
+
+    @click.group()
+    def cli():
+        """Export Parquet des présences et taux de présence"""
+
+    @cli.command('exporter')
+    @click.option('--complet', is_flag=True, help="Supprimer l'export existant et tout réexporter")
+    def commande_exporter(complet):
+        """Exporte les présences et séances insérées depuis la dernière exécution"""
+        from database import DatabaseManager
+
+        db = DatabaseManager()
+        try:
+            export = ExportParquet(db)
+            for table, lignes in export.exporter(complet).items():
+                click.echo(f"{table}: {lignes} ligne(s) exportée(s)")
+            click.echo(json.dumps(export.etat(), indent=2))
+        finally:
+            db.fermer_connexion()
+
+    @cli.command('compacter')
+    def commande_compacter():
+        """Regroupe les fichiers de chaque mois en un seul"""
+        click.echo(f"{ExportParquet(None).compacter()} partition(s) compactée(s)")
+
+    @cli.command('taux')
+    @click.option('--par', type=click.Choice(['etudiant', 'cours']), default='etudiant', show_default=True)
+    @click.option('--cours', 'code_cours', default=None, help='Code du cours')
+    @click.option('--debut', type=click.DateTime(), default=None, help='Date de début incluse')
+    @click.option('--fin', type=click.DateTime(), default=None, help='Date de fin incluse')
+    @click.option('--sortie', type=click.Path(dir_okay=False), default=None, help='Écrire le résultat en CSV')
+    def commande_taux(par, code_cours, debut, fin, sortie):
+        """Taux de présence par étudiant ou par cours, depuis l'export"""
+        analyse = AnalysePresences()
+        if par == 'cours':
+            resultat = analyse.taux_par_cours(code_cours, debut, fin)
+        else:
+            resultat = analyse.taux_par_etudiant(code_cours, debut, fin)
+        if sortie:
+            resultat.to_csv(sortie, index=False)
+            click.echo(f"{len(resultat)} ligne(s) écrite(s) dans {sortie}")
+        else:
+            click.echo(resultat.to_string(index=False))
+
+    cli()
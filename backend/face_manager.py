@@ -3,9 +3,17 @@ Gestionnaire de reconnaissance faciale
 """
 import os
 import pickle
-import face_recognition
+import sys
+import time
+import numpy as np
 import logging
 import config
+from detecteurs import obtenir_detecteur
+from service_appariement import obtenir_client
+
+# face_recognition (modèles dlib, ~1 s d'import) n'est importé que par les
+# méthodes qui détectent ou encodent : charger la galerie et apparier n'en
+# ont pas besoin.
 
 logger = logging.getLogger(__name__)
 
@@ -20,42 +28,119 @@ class FaceRecognitionManager:
         """Initialise le gestionnaire et charge les encodages existants"""
         self.known_encodings = []
         self.known_ids = []
+        self.version = None  # st_mtime_ns de ENCODAGES_DIR au chargement
         self.charger_encodages()
     
     def charger_encodages(self):
         """
         Charge tous les encodages depuis le dossier encodages
         Les fichiers sont au format: ETUDIANT_ID.pkl
-        """
-        self.known_encodings = []
-        self.known_ids = []
         
+        La galerie consolidée (config.GALERIE_CACHE) est lue en un seul
+        fichier tant que le dossier n'a pas changé ; sinon elle est
+        reconstruite à partir des fichiers .pkl.
+        """
         # Créer le dossier s'il n'existe pas
         if not os.path.exists(config.ENCODAGES_DIR):
             os.makedirs(config.ENCODAGES_DIR)
             logger.warning(f"📁 Dossier encodages créé: {config.ENCODAGES_DIR}")
+            self.known_encodings, self.known_ids = [], []
+            self.version = self._version_dossier()
+            return
+        
+        # Version lue avant les fichiers : une modification pendant le
+        # chargement provoque un nouveau rechargement (voir actualiser)
+        self.version = self._version_dossier()
+        fichiers = sorted(f for f in os.listdir(config.ENCODAGES_DIR) if f.endswith('.pkl'))
+        if self._charger_galerie(fichiers):
+            logger.info(f"✅ {len(self.known_ids)} encodages chargés depuis {config.GALERIE_CACHE}")
             return
         
-        # Charger tous les fichiers .pkl
+        # Charger tous les fichiers .pkl (la galerie en mémoire est remplacée
+        # à la fin : les analyses en cours ne la voient jamais vide)
+        encodages, ids = [], []
         count = 0
-        for filename in os.listdir(config.ENCODAGES_DIR):
-            if filename.endswith('.pkl'):
-                filepath = os.path.join(config.ENCODAGES_DIR, filename)
-                try:
-                    with open(filepath, 'rb') as f:
-                        encoding = pickle.load(f)
-                    
-                    # Extraire l'ID étudiant du nom de fichier
-                    etudiant_id = filename.replace('.pkl', '')
-                    
-                    self.known_encodings.append(encoding)
-                    self.known_ids.append(etudiant_id)
-                    count += 1
-                    
-                except Exception as e:
-                    logger.error(f"❌ Erreur chargement {filename}: {e}")
+        for filename in fichiers:
+            filepath = os.path.join(config.ENCODAGES_DIR, filename)
+            try:
+                with open(filepath, 'rb') as f:
+                    encoding = pickle.load(f)
+                
+                # Extraire l'ID étudiant du nom de fichier
+                etudiant_id = filename.replace('.pkl', '')
+                
+                encodages.append(encoding)
+                ids.append(etudiant_id)
+                count += 1
+                
+            except Exception as e:
+                logger.error(f"❌ Erreur chargement {filename}: {e}")
         
+        self.known_encodings, self.known_ids = encodages, ids
         logger.info(f"✅ {count} encodages chargés depuis {config.ENCODAGES_DIR}")
+        self._sauvegarder_galerie()
+    
+    def actualiser(self):
+        """
+        Recharge la galerie si ENCODAGES_DIR a changé depuis son chargement
+        
+        Les workers du pool lourd héritent de la galerie chargée par le
+        maître : une inscription ou une suppression faite par un autre
+        processus (pool léger) n'y apparaît qu'après ce rechargement. Coût
+        sans changement : un stat du dossier.
+        
+        Returns:
+            bool: True si la galerie a été rechargée
+        """
+        try:
+            version = self._version_dossier()
+        except FileNotFoundError:
+            version = None
+        if version == self.version:
+            return False
+        logger.info(f"🔄 Dossier encodages modifié, galerie rechargée (pid {os.getpid()})")
+        self.charger_encodages()
+        return True
+    
+    def _version_dossier(self):
+        """Identifie l'état du dossier encodages (change à chaque ajout, remplacement ou suppression)"""
+        return os.stat(config.ENCODAGES_DIR).st_mtime_ns
+    
+    def _charger_galerie(self, fichiers):
+        """
+        Charge la galerie consolidée si elle correspond au dossier
+        
+        Returns:
+            bool: True si la galerie a été chargée
+        """
+        try:
+            with np.load(config.GALERIE_CACHE) as galerie:
+                if int(galerie['version']) != self._version_dossier():
+                    return False
+                ids = galerie['ids'].tolist()
+                if [f"{i}.pkl" for i in ids] != fichiers:
+                    return False
+                encodages = galerie['encodages']
+        except (OSError, KeyError, ValueError):
+            return False
+        
+        self.known_encodings, self.known_ids = list(encodages), ids
+        return True
+    
+    def _sauvegarder_galerie(self):
+        """Écrit la galerie consolidée (écriture atomique)"""
+        try:
+            os.makedirs(os.path.dirname(config.GALERIE_CACHE), exist_ok=True)
+            temporaire = f"{config.GALERIE_CACHE}.{os.getpid()}.tmp.npz"
+            np.savez(
+                temporaire,
+                version=np.int64(self._version_dossier()),
+                ids=np.array(self.known_ids, dtype=str),
+                encodages=np.array(self.known_encodings, dtype=np.float64).reshape(-1, 128)
+            )
+            os.replace(temporaire, config.GALERIE_CACHE)
+        except Exception as e:
+            logger.warning(f"⚠️ Galerie consolidée non écrite: {e}")
     
     def encoder_visage(self, image_path, etudiant_id):
         """
@@ -71,13 +156,15 @@ class FaceRecognitionManager:
         Raises:
             ValueError: Si aucun visage ou plusieurs visages détectés
         """
+        import face_recognition
+        
         try:
             # Charger l'image
             logger.info(f"📸 Chargement image: {image_path}")
             image = face_recognition.load_image_file(image_path)
             
-            # Détecter les visages (utilise HOG pour la vitesse)
-            face_locations = face_recognition.face_locations(image, model='hog')
+            # Détecter les visages (détecteur de l'inscription, HOG par défaut)
+            face_locations = obtenir_detecteur(config.DETECTEUR_INSCRIPTION).detecter(image)
             
             if len(face_locations) == 0:
                 raise ValueError("❌ Aucun visage détecté dans l'image")
@@ -91,15 +178,24 @@ class FaceRecognitionManager:
             encodings = face_recognition.face_encodings(image, face_locations)
             encoding = encodings[0]
             
-            # Sauvegarder l'encodage
+            # Sauvegarder l'encodage (remplacement atomique: la version du
+            # dossier change aussi quand un encodage existant est remplacé)
             encoding_path = os.path.join(config.ENCODAGES_DIR, f"{etudiant_id}.pkl")
-            with open(encoding_path, 'wb') as f:
+            temporaire = f"{encoding_path}.tmp"
+            with open(temporaire, 'wb') as f:
                 pickle.dump(encoding, f)
+            os.replace(temporaire, encoding_path)
             
             logger.info(f"💾 Encodage sauvegardé: {encoding_path}")
             
-            # Recharger tous les encodages pour mettre à jour la liste
-            self.charger_encodages()
+            # Mettre à jour la galerie en mémoire sans relire tous les fichiers
+            if etudiant_id in self.known_ids:
+                self.known_encodings[self.known_ids.index(etudiant_id)] = encoding
+            else:
+                self.known_encodings.append(encoding)
+                self.known_ids.append(etudiant_id)
+            self._sauvegarder_galerie()
+            self._notifier_service('inscrire', etudiant_id, encoding)
             
             return encoding
             
@@ -124,8 +220,13 @@ class FaceRecognitionManager:
                 os.remove(encoding_path)
                 logger.info(f"🗑️ Encodage supprimé: {etudiant_id}")
                 
-                # Recharger les encodages
-                self.charger_encodages()
+                # Retirer de la galerie en mémoire
+                if etudiant_id in self.known_ids:
+                    index = self.known_ids.index(etudiant_id)
+                    del self.known_ids[index]
+                    del self.known_encodings[index]
+                self._sauvegarder_galerie()
+                self._notifier_service('supprimer', etudiant_id)
                 return True
             else:
                 logger.warning(f"⚠️ Encodage non trouvé: {etudiant_id}")
@@ -135,6 +236,17 @@ class FaceRecognitionManager:
             logger.error(f"❌ Erreur suppression encodage {etudiant_id}: {e}")
             return False
     
+    def _notifier_service(self, operation, *args):
+        """Répercute une inscription ou suppression sur le service d'appariement (s'il est utilisé)"""
+        client = obtenir_client()
+        if client is None:
+            return
+        try:
+            getattr(client, operation)(*args)
+        except Exception as e:
+            # Le fichier .pkl fait foi : `service_appariement.py --recharger` resynchronise
+            logger.error(f"❌ Service d'appariement non mis à jour ({operation} {args[0]}): {e}")
+    
     def reconnaitre_visage(self, face_encoding, tolerance=0.5):
         """
         Reconnaît un visage en comparant son encodage avec les encodages connus
@@ -151,7 +263,7 @@ class FaceRecognitionManager:
             return None, None
         
         # Calculer les distances avec tous les encodages connus
-        face_distances = face_recognition.face_distance(self.known_encodings, face_encoding)
+        face_distances = np.linalg.norm(np.asarray(self.known_encodings) - face_encoding, axis=1)
         
         # Trouver la meilleure correspondance
         best_match_index = face_distances.argmin()
@@ -165,6 +277,28 @@ class FaceRecognitionManager:
             logger.info(f"❌ Visage non reconnu (distance min: {min_distance:.3f})")
             return None, None
     
+    def prechauffer(self):
+        """
+        Exécute détection et encodage sur une image factice
+        
+        Les premiers appels dlib allouent leurs buffers : les faire au
+        démarrage évite que la première vraie requête soit lente.
+        
+        Returns:
+            float: Durée du préchauffage en secondes
+        """
+        debut = time.perf_counter()
+        import face_recognition
+        
+        image = np.zeros((480, 640, 3), dtype=np.uint8)
+        for nom in {config.DETECTEUR_VIDEO, config.DETECTEUR_WEBCAM, config.DETECTEUR_RECONNAISSANCE}:
+            obtenir_detecteur(nom).detecter(image)
+        # Encoder une zone arbitraire pour charger le réseau de descripteurs
+        face_recognition.face_encodings(image, [(140, 400, 340, 240)])
+        duree = time.perf_counter() - debut
+        logger.info(f"🔥 Modèles préchauffés en {duree:.2f}s")
+        return duree
+    
     def obtenir_info_encodages(self):
         """
         Retourne des informations sur les encodages chargés
@@ -175,5 +309,26 @@ class FaceRecognitionManager:
         return {
             'total': len(self.known_encodings),
             'etudiants': self.known_ids,
-            'dossier': config.ENCODAGES_DIR
+            'dossier': config.ENCODAGES_DIR,
+            'memoire': self.memoire_galerie()
         }
+    
+    def memoire_galerie(self):
+        """
+        Mémoire occupée par la galerie (octets)
+        
+        Les encodages lus dans la galerie consolidée sont des vues d'un seul
+        tableau : ses données ne sont comptées qu'une fois.
+        
+        Returns:
+            dict: donnees (vecteurs), objets (listes et en-têtes numpy), ids, total
+        """
+        tampons = {}
+        objets = sys.getsizeof(self.known_encodings)
+        for encodage in self.known_encodings:
+            proprietaire = encodage.base if getattr(encodage, 'base', None) is not None else encodage
+            tampons[id(proprietaire)] = getattr(proprietaire, 'nbytes', sys.getsizeof(proprietaire))
+            objets += sys.getsizeof(encodage) - (tampons[id(proprietaire)] if encodage is proprietaire else 0)
+        donnees = sum(tampons.values())
+        ids = sys.getsizeof(self.known_ids) + sum(sys.getsizeof(i) for i in self.known_ids)
+        return {'donnees': donnees, 'objets': objets, 'ids': ids, 'total': donnees + objets + ids}
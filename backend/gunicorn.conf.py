@@ -0,0 +1,129 @@
+"""
+Configuration gunicorn pour la production
+
+Deux pools de workers indépendants servent la même application :
+  - POOL=leger : routes CRUD et listes (workers à threads, réponses rapides)
+  - POOL=lourd : routes de reconnaissance (un processus à threads par machine, timeout long)
+
+Le pool léger répond 421 aux routes de reconnaissance, avec l'adresse du
+pool lourd (POOL_LOURD_URL) : elles ne peuvent pas occuper ses threads ni
+dépasser son timeout de 30 s.
+
+L'application est chargée une fois dans le processus maître (preload_app).
+Pour le pool lourd, les modèles dlib et la galerie d'encodages y sont aussi
+chargés (when_ready) puis partagés par fork ; le pool léger ne les charge
+jamais. Avant chaque analyse, un worker lourd recharge sa galerie si
+ENCODAGES_DIR a changé (inscription ou suppression faite par le pool léger). Chaque worker ouvre sa propre connexion MongoDB au premier usage.
+
+Le pool lourd n'a qu'un worker par défaut : le contrôle d'admission
+(admission.py) et l'ordonnanceur (ordonnanceur.py) sont propres à un
+processus, et ne limitent ou ne répartissent les analyses de toute la
+machine que si un seul processus les reçoit toutes. Ses threads suffisent
+à tenir les analyses admises et les files de toutes les routes lourdes,
+pour que les refus 429/503 (Retry-After) soient bien envoyés ; le calcul
+lui-même passe par le pool de threads de l'ordonnanceur (détection et
+repères dlib libèrent le GIL). Avec WORKERS > 1, chaque limite vaut par
+worker.
+
+Recyclage : un worker est remplacé après MAX_REQUESTS requêtes (± jitter)
+ou dès que sa mémoire résidente dépasse WORKER_RSS_MAX_MO (post_request).
+Il termine d'abord les requêtes en cours (graceful_timeout), puis le
+maître en démarre un nouveau.
+
+Usage:
+    POOL=leger gunicorn -c gunicorn.conf.py api:app
+    POOL=lourd gunicorn -c gunicorn.conf.py api:app
+ou les deux pools à la fois: python production.py
+"""
+import os
+import sys
+
+POOL = os.getenv('POOL', 'leger')
+# Lu par l'application (config.POOL) : le pool léger refuse les routes de reconnaissance
+os.environ['POOL'] = POOL
+
+# L'expéditeur d'emails ne doit pas tourner dans le maître (les threads ne
+# survivent pas au fork): il est démarré dans les workers du pool léger
+os.environ.setdefault('EMAIL_EXPEDITEUR_INTEGRE', 'false')
+os.environ.setdefault('JOURNAL_VIDANGE_INTEGREE', 'false')
+
+preload_app = True
+chdir = os.path.dirname(os.path.abspath(__file__))
+accesslog = '-'
+graceful_timeout = 30
+
+# Recyclage des workers (0 = jamais)
+max_requests = int(os.getenv('MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('MAX_REQUESTS_JITTER', max_requests // 10))
+
+if POOL == 'lourd':
+    sys.path.insert(0, chdir)
+    import admission
+
+    bind = os.getenv('BIND', '0.0.0.0:5001')
+    worker_class = 'gthread'
+    workers = int(os.getenv('WORKERS', 1))
+    # Analyses admises et en file de toutes les routes lourdes, plus /health
+    threads = int(os.getenv('THREADS', sum(
+        a.concurrence + a.file_max for a in admission.ADMISSIONS.values()
+    ) + 1))
+    timeout = int(os.getenv('TIMEOUT', 600))  # analyse de vidéos longues
+else:
+    bind = os.getenv('BIND', '0.0.0.0:5000')
+    worker_class = 'gthread'
+    workers = int(os.getenv('WORKERS', 2))
+    threads = int(os.getenv('THREADS', 8))
+    timeout = int(os.getenv('TIMEOUT', 30))
+
+proc_name = f'presence-api-{POOL}'
+
+
+def when_ready(server):
+    """Charge modèles et galerie dans le maître du pool lourd, avant les forks"""
+    if POOL == 'lourd':
+        import api
+        api.reconnaissance.obtenir()
+        api.face_mgr.obtenir()
+        server.log.info(f"Démarrage: {api.rapport()}")
+
+
+def post_fork(server, worker):
+    """Recrée les ressources non fork-safe dans chaque worker"""
+    import api
+    import config
+    from notifications import ExpediteurEmails
+
+    if api.db.est_initialise:
+        api.db.reconnecter()
+
+    if POOL == 'lourd':
+        # Un ordonnanceur par worker : les cœurs sont partagés entre les workers
+        from ordonnanceur import repartir_threads
+        repartir_threads(server.cfg.workers)
+        api.face_mgr.prechauffer()
+    elif os.getenv('EMAIL_EXPEDITEUR', 'true').lower() == 'true':
+        # Plusieurs expéditeurs peuvent coexister: les notifications sont réservées
+        ExpediteurEmails(api.db).demarrer()
+
+    # Chaque worker vide ses propres dépôts dès qu'ils arrivent (et rejoue
+    # ceux laissés par un worker arrêté: le fichier du journal est partagé,
+    # chaque lot est réservé par une seule vidange)
+    if config.JOURNAL_PRESENCES_ACTIF and os.getenv('JOURNAL_VIDANGE', 'true').lower() == 'true':
+        api.vidange.demarrer()
+
+    server.log.info(f"Worker {worker.pid} prêt (pool {POOL}, MongoDB {config.DATABASE_NAME})")
+
+
+def post_request(worker, req, environ, resp):
+    """Recycle le worker dont la mémoire dépasse WORKER_RSS_MAX_MO, après la requête en cours"""
+    import memoire
+
+    if not worker.alive:
+        return
+    rss = memoire.depasse_limite_worker()
+    if rss is not None:
+        worker.log.warning(
+            f"Worker {worker.pid}: RSS {rss // memoire.MO} Mo après {req.path}, recyclage "
+            f"(requêtes en cours terminées d'abord)"
+        )
+        worker.alive = False
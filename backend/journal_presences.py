@@ -0,0 +1,315 @@
+"""
+Journal local des présences (écriture différée vers MongoDB)
+
+Les routes n'écrivent plus les présences dans MongoDB : elles les déposent
+dans un journal SQLite local (WAL, synchronous=FULL), ce qui prend environ
+une milliseconde quel que soit l'état de la base. Une vidange en
+arrière-plan pousse ensuite les entrées par lots dans MongoDB
+(DatabaseManager.appliquer_entrees_journal, idempotent) et les retire du
+journal une fois écrites. Une entrée n'est jamais perdue :
+
+  - MongoDB lent ou injoignable : l'entrée reste dans le journal et la
+    vidange réessaie avec un délai croissant ;
+  - processus arrêté : le journal est relu au redémarrage ;
+  - entrée écrite mais pas encore retirée : la rejouer ne crée ni présence
+    ni séance en double.
+
+Le fichier est partagé par les workers d'une même machine (verrous SQLite).
+Chaque worker a sa vidange, mais une entrée n'est lue que par une vidange à
+la fois : elle est réservée (BEGIN IMMEDIATE) pour JOURNAL_BAIL secondes.
+Une réservation expirée (worker arrêté pendant l'écriture) est reprise par
+une autre vidange ; l'écriture étant idempotente, rejouer le lot est sans
+risque. Entrées en attente et âge de la plus ancienne: métriques
+presence_journal_en_attente et presence_journal_plus_ancienne_secondes
+(/metrics, pas /health).
+
+Usage (vidange immédiate, par exemple avant une maintenance):
+    python journal_presences.py
+    python journal_presences.py --etat
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+from metriques import JOURNAL_ENTREES, JOURNAL_ECHECS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entrees (
+    id TEXT PRIMARY KEY,
+    cree_le REAL NOT NULL,
+    code_cours TEXT NOT NULL,
+    etudiants TEXT NOT NULL,
+    date TEXT NOT NULL,
+    source TEXT NOT NULL,
+    confiances TEXT NOT NULL,
+    tentatives INTEGER NOT NULL DEFAULT 0,
+    derniere_erreur TEXT,
+    reserve_par TEXT,
+    reserve_jusqua REAL
+)
+"""
+
+# Ordre de vidange et âge de la plus ancienne entrée sans parcourir la table
+INDEX = "CREATE INDEX IF NOT EXISTS entrees_cree_le ON entrees (cree_le)"
+
+# Colonnes ajoutées après la création des premiers journaux
+COLONNES_AJOUTEES = (('reserve_par', 'TEXT'), ('reserve_jusqua', 'REAL'))
+
+# Délai maximal entre deux tentatives quand MongoDB ne répond pas (secondes)
+DELAI_MAX_ECHEC = 60
+
+
+class JournalPresences:
+    """Journal SQLite des présences à écrire dans MongoDB (thread-safe, fork-safe)"""
+
+    def __init__(self, chemin=None):
+        self.chemin = chemin or config.JOURNAL_PRESENCES_CHEMIN
+        self._verrou = threading.Lock()
+        self._connexion = None
+        self._pid = None
+
+    def _ouvrir(self):
+        """Connexion du processus courant (rouverte après un fork, appelé sous verrou)"""
+        if self._connexion is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.chemin) or '.', exist_ok=True)
+            connexion = sqlite3.connect(self.chemin, timeout=30, check_same_thread=False, isolation_level=None)
+            connexion.execute("PRAGMA journal_mode=WAL")
+            connexion.execute("PRAGMA synchronous=FULL")
+            connexion.execute(SCHEMA)
+            colonnes = {ligne[1] for ligne in connexion.execute("PRAGMA table_info(entrees)")}
+            for colonne, type_colonne in COLONNES_AJOUTEES:
+                if colonne not in colonnes:
+                    try:
+                        connexion.execute(f"ALTER TABLE entrees ADD COLUMN {colonne} {type_colonne}")
+                    except sqlite3.OperationalError:
+                        pass  # ajoutée entre-temps par un autre processus
+            connexion.execute(INDEX)
+            self._connexion, self._pid = connexion, os.getpid()
+        return self._connexion
+
+    def deposer(self, code_cours, etudiants, date_presence=None, source="automatique", confiances=None):
+        """
+        Enregistre durablement une présence à écrire dans MongoDB
+
+        Mêmes arguments que DatabaseManager.ajouter_presence.
+
+        Returns:
+            str: ID de l'entrée (aussi stocké dans la séance, champ journal_id)
+        """
+        identifiant = uuid.uuid4().hex
+        date_presence = date_presence or datetime.now()
+        with self._verrou:
+            self._ouvrir().execute(
+                "INSERT INTO entrees (id, cree_le, code_cours, etudiants, date, source, confiances) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    identifiant, time.time(), code_cours, json.dumps(list(etudiants)),
+                    date_presence.isoformat(), source,
+                    json.dumps({numero: float(c) for numero, c in (confiances or {}).items()})
+                )
+            )
+        JOURNAL_ENTREES.inc(resultat='deposee')
+        logger.info(f"📝 Présence journalisée: {code_cours} ({len(etudiants)} étudiant(s), {source})")
+        return identifiant
+
+    def reserver(self, limite, proprietaire, bail=None):
+        """
+        Réserve les entrées libres les plus anciennes pour une vidange
+
+        La sélection et la réservation se font dans une même transaction
+        BEGIN IMMEDIATE : deux vidanges ne reçoivent jamais les mêmes
+        entrées tant que la réservation (`bail` secondes) n'a pas expiré.
+
+        Returns:
+            list: Entrées au format attendu par appliquer_entrees_journal
+        """
+        maintenant = time.time()
+        bail = bail if bail is not None else config.JOURNAL_BAIL
+        with self._verrou:
+            connexion = self._ouvrir()
+            connexion.execute("BEGIN IMMEDIATE")
+            try:
+                lignes = connexion.execute(
+                    "SELECT id, code_cours, etudiants, date, source, confiances FROM entrees "
+                    "WHERE reserve_jusqua IS NULL OR reserve_jusqua < ? ORDER BY cree_le LIMIT ?",
+                    (maintenant, limite)
+                ).fetchall()
+                connexion.executemany(
+                    "UPDATE entrees SET reserve_par = ?, reserve_jusqua = ? WHERE id = ?",
+                    [(proprietaire, maintenant + bail, ligne[0]) for ligne in lignes]
+                )
+                connexion.execute("COMMIT")
+            except BaseException:
+                connexion.execute("ROLLBACK")
+                raise
+        return [
+            {
+                'id': identifiant,
+                'code_cours': code_cours,
+                'etudiants': json.loads(etudiants),
+                'date': datetime.fromisoformat(date),
+                'source': source,
+                'confiances': json.loads(confiances)
+            }
+            for identifiant, code_cours, etudiants, date, source, confiances in lignes
+        ]
+
+    def retirer(self, ids):
+        """Retire les entrées écrites dans MongoDB"""
+        if not ids:
+            return
+        with self._verrou:
+            self._ouvrir().executemany("DELETE FROM entrees WHERE id = ?", [(i,) for i in ids])
+
+    def noter_echec(self, ids, erreur):
+        """Compte une tentative ratée et libère les entrées (elles restent en attente)"""
+        with self._verrou:
+            self._ouvrir().executemany(
+                "UPDATE entrees SET tentatives = tentatives + 1, derniere_erreur = ?, "
+                "reserve_par = NULL, reserve_jusqua = NULL WHERE id = ?",
+                [(str(erreur), i) for i in ids]
+            )
+
+    def taille(self):
+        """Nombre d'entrées en attente d'écriture dans MongoDB"""
+        with self._verrou:
+            return self._ouvrir().execute("SELECT COUNT(*) FROM entrees").fetchone()[0]
+
+    def age(self):
+        """Âge en secondes de la plus ancienne entrée en attente (0 si vide)"""
+        with self._verrou:
+            plus_ancienne = self._ouvrir().execute("SELECT MIN(cree_le) FROM entrees").fetchone()[0]
+        return round(time.time() - plus_ancienne, 1) if plus_ancienne else 0
+
+    def etat(self):
+        """Entrées en attente, âge de la plus ancienne (secondes) et dernière erreur"""
+        with self._verrou:
+            nombre, plus_ancienne = self._ouvrir().execute(
+                "SELECT COUNT(*), MIN(cree_le) FROM entrees"
+            ).fetchone()
+            erreur = self._ouvrir().execute(
+                "SELECT derniere_erreur FROM entrees WHERE derniere_erreur IS NOT NULL ORDER BY cree_le LIMIT 1"
+            ).fetchone()
+        return {
+            'en_attente': nombre,
+            'plus_ancienne_s': round(time.time() - plus_ancienne, 1) if plus_ancienne else None,
+            'derniere_erreur': erreur[0] if erreur else None
+        }
+
+
+class VidangeJournal:
+    """Pousse les entrées du journal dans MongoDB depuis un thread d'arrière-plan"""
+
+    def __init__(self, journal, db):
+        """
+        Args:
+            journal: Instance de JournalPresences
+            db: Instance de DatabaseManager
+        """
+        self.journal = journal
+        self.db = db
+        self._arret = threading.Event()
+        self._reveil = threading.Event()
+        self._thread = None
+        self._echecs = 0
+
+    def demarrer(self):
+        """Démarre le thread de vidange (idempotent) ; les entrées restantes sont rejouées"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._arret.clear()
+        self._thread = threading.Thread(target=self._boucle, name="vidange-journal", daemon=True)
+        self._thread.start()
+        logger.info(f"📝 Vidange du journal des présences démarrée ({self.journal.chemin})")
+
+    def arreter(self, timeout=10):
+        """Arrête le thread après le lot en cours"""
+        self._arret.set()
+        self._reveil.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def signaler(self):
+        """Réveille la vidange sans attendre l'intervalle (nouvelle entrée déposée)"""
+        self._reveil.set()
+
+    def _boucle(self):
+        while not self._arret.is_set():
+            try:
+                self.traiter()
+                self._echecs = 0
+                delai = config.JOURNAL_INTERVALLE
+            except Exception as e:
+                self._echecs += 1
+                delai = min(DELAI_MAX_ECHEC, config.JOURNAL_INTERVALLE * 2 ** self._echecs)
+                logger.warning(f"⚠️ Vidange du journal impossible ({e}), nouvel essai dans {delai:.0f}s")
+            self._reveil.wait(delai)
+            self._reveil.clear()
+
+    def traiter(self):
+        """
+        Écrit toutes les entrées en attente, par lots de JOURNAL_TAILLE_LOT
+
+        Returns:
+            int: Nombre d'entrées écrites
+
+        Raises:
+            Exception: erreur MongoDB (les entrées du lot restent dans le journal)
+        """
+        total = 0
+        proprietaire = f"{socket.gethostname()}:{os.getpid()}"
+        while not self._arret.is_set():
+            entrees = self.journal.reserver(config.JOURNAL_TAILLE_LOT, proprietaire)
+            if not entrees:
+                break
+            ids = [e['id'] for e in entrees]
+            try:
+                rejetees = self.db.appliquer_entrees_journal(entrees)
+            except Exception as e:
+                JOURNAL_ECHECS.inc()
+                self.journal.noter_echec(ids, e)
+                raise
+            for identifiant in rejetees:
+                logger.error(f"❌ Entrée {identifiant} abandonnée: cours introuvable")
+            self.journal.retirer(ids)
+            JOURNAL_ENTREES.inc(len(ids) - len(rejetees), resultat='appliquee')
+            JOURNAL_ENTREES.inc(len(rejetees), resultat='rejetee')
+            total += len(ids)
+            if len(entrees) < config.JOURNAL_TAILLE_LOT:
+                break
+        if total:
+            logger.info(f"✅ {total} entrée(s) du journal écrite(s) dans MongoDB")
+        return total
+
+
+if __name__ == '__main__':
+    import click
+
+    @click.command()
+    @click.option('--etat', 'afficher_etat', is_flag=True, help='Afficher les entrées en attente sans vidanger')
+    def main(afficher_etat):
+        """Vidange le journal des présences dans MongoDB"""
+        journal = JournalPresences()
+        if not afficher_etat:
+            from database import DatabaseManager
+
+            db = DatabaseManager()
+            try:
+                click.echo(f"{VidangeJournal(journal, db).traiter()} entrée(s) écrite(s)")
+            finally:
+                db.fermer_connexion()
+        click.echo(json.dumps(journal.etat(), indent=2, ensure_ascii=False))
+
+    main()
@@ -0,0 +1,182 @@
+"""
+Instrumentation mémoire des processus de l'API (optionnelle)
+
+  - RSS avant/après chaque requête (MEMOIRE_INSTRUMENTATION) : histogramme
+    presence_requete_memoire_octets et compteur
+    presence_memoire_croissance_octets_total par route, ligne de journal par
+    requête (avertissement au-delà de MEMOIRE_SEUIL_LOG_MO). Le RSS est celui
+    du processus : dans un worker à threads, l'écart d'une requête inclut
+    celles qui s'exécutent en même temps ;
+  - instantanés tracemalloc pris à la demande et comparés entre eux
+    (routes /api/diagnostic/memoire, protégées par DIAGNOSTIC_JETON). Le
+    traçage n'est actif qu'entre le premier instantané et l'arrêt : il
+    ralentit les allocations ;
+  - recyclage des workers gunicorn au-delà de WORKER_RSS_MAX_MO (voir
+    post_request dans gunicorn.conf.py).
+
+Chaque worker a sa propre mémoire : les routes de diagnostic décrivent le
+worker qui a servi la requête (champ pid).
+"""
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from datetime import datetime
+
+import config
+from metriques import REGISTRE
+
+logger = logging.getLogger(__name__)
+
+MO = 1024 * 1024
+
+# Écarts de RSS par requête (octets) ; les baisses tombent dans le premier intervalle
+BORNES_MEMOIRE = (0, 64 * 1024, 256 * 1024, MO, 4 * MO, 16 * MO, 64 * MO, 256 * MO, 1024 * MO)
+
+GROUPEMENTS = ('lineno', 'filename', 'traceback')
+
+# Allocations du traçage lui-même et des imports, sans intérêt pour une fuite
+_FILTRES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+try:
+    _TAILLE_PAGE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _TAILLE_PAGE = 4096
+
+
+def rss_octets():
+    """Mémoire résidente du processus (octets), lue dans /proc sous Linux"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _TAILLE_PAGE
+    except OSError:
+        # Hors Linux : pic de mémoire résidente (Ko sous Linux, octets sous macOS)
+        import resource
+        pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pic if sys.platform == 'darwin' else pic * 1024
+
+
+MEMOIRE_RSS = REGISTRE.jauge(
+    'presence_memoire_rss_octets', 'Mémoire résidente du processus', fonction=rss_octets)
+REQUETE_MEMOIRE = REGISTRE.histogramme(
+    'presence_requete_memoire_octets', 'Écart de RSS du processus pendant une requête', ('route',),
+    bornes=BORNES_MEMOIRE)
+MEMOIRE_CROISSANCE = REGISTRE.compteur(
+    'presence_memoire_croissance_octets_total', 'Hausses de RSS cumulées par route', ('route',))
+
+
+def enregistrer_requete(route, methode, rss_debut):
+    """
+    Enregistre l'écart de RSS d'une requête (métriques et journal)
+
+    Returns:
+        int: Écart en octets (négatif si de la mémoire a été rendue au système)
+    """
+    ecart = rss_octets() - rss_debut
+    REQUETE_MEMOIRE.observe(ecart, route=route)
+    if ecart > 0:
+        MEMOIRE_CROISSANCE.inc(ecart, route=route)
+    message = f"🧠 {methode} {route}: RSS {ecart / MO:+.1f} Mo ({(rss_debut + ecart) / MO:.0f} Mo, pid {os.getpid()})"
+    if ecart > config.MEMOIRE_SEUIL_LOG_MO * MO:
+        logger.warning(message)
+    else:
+        logger.info(message)
+    return ecart
+
+
+def depasse_limite_worker():
+    """RSS du processus si elle dépasse WORKER_RSS_MAX_MO, sinon None (0 = sans limite)"""
+    if not config.WORKER_RSS_MAX_MO:
+        return None
+    rss = rss_octets()
+    return rss if rss > config.WORKER_RSS_MAX_MO * MO else None
+
+
+class Instantanes:
+    """Instantanés tracemalloc du processus, les plus anciens retirés au-delà de `maximum`"""
+
+    def __init__(self, maximum=None, profondeur=None):
+        self.maximum = maximum or config.MEMOIRE_INSTANTANES_MAX
+        self.profondeur = profondeur or config.MEMOIRE_TRACEMALLOC_FRAMES
+        self._instantanes = []  # [(date, instantané)]
+        self._verrou = threading.Lock()
+
+    def capturer(self):
+        """
+        Prend un instantané (démarre le traçage au premier appel)
+
+        Returns:
+            dict: Index de l'instantané et mémoire tracée
+        """
+        with self._verrou:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.profondeur)
+                logger.warning(f"🧠 tracemalloc démarré ({self.profondeur} frames, pid {os.getpid()})")
+            instantane = tracemalloc.take_snapshot().filter_traces(_FILTRES)
+            self._instantanes.append((datetime.now(), instantane))
+            del self._instantanes[:-self.maximum]
+            actuelle, pic = tracemalloc.get_traced_memory()
+            return {'index': len(self._instantanes) - 1, 'tracee_octets': actuelle, 'pic_octets': pic}
+
+    def comparer(self, depuis=0, jusqua=-1, grouper='lineno', limite=25):
+        """
+        Allocations qui ont le plus augmenté entre deux instantanés
+
+        Args:
+            depuis, jusqua: Index des instantanés (négatifs comptés depuis la fin)
+            grouper: 'lineno', 'filename' ou 'traceback'
+
+        Raises:
+            ValueError: groupement inconnu ou instantanés manquants
+        """
+        if grouper not in GROUPEMENTS:
+            raise ValueError(f"Groupement inconnu: {grouper} ({', '.join(GROUPEMENTS)})")
+        with self._verrou:
+            try:
+                (date_avant, avant), (date_apres, apres) = self._instantanes[depuis], self._instantanes[jusqua]
+            except IndexError:
+                raise ValueError(f"Instantané introuvable ({len(self._instantanes)} disponible(s))")
+        statistiques = apres.compare_to(avant, grouper)
+        return {
+            'avant': date_avant.isoformat(),
+            'apres': date_apres.isoformat(),
+            'ecart_total_octets': sum(s.size_diff for s in statistiques),
+            'allocations': [
+                {
+                    'emplacement': s.traceback.format() if grouper == 'traceback' else str(s.traceback[0]),
+                    'ecart_octets': s.size_diff,
+                    'taille_octets': s.size,
+                    'ecart_blocs': s.count_diff,
+                    'blocs': s.count
+                }
+                for s in statistiques[:limite]
+            ]
+        }
+
+    def arreter(self):
+        """Arrête le traçage et oublie les instantanés"""
+        with self._verrou:
+            self._instantanes.clear()
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                logger.info(f"🧠 tracemalloc arrêté (pid {os.getpid()})")
+
+    def etat(self):
+        with self._verrou:
+            dates = [date.isoformat() for date, _ in self._instantanes]
+        actuelle, pic = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            'actif': tracemalloc.is_tracing(),
+            'instantanes': dates,
+            'tracee_octets': actuelle,
+            'pic_octets': pic
+        }
+
+
+INSTANTANES = Instantanes()
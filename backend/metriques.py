@@ -0,0 +1,293 @@
+"""
+Métriques au format d'exposition Prometheus (texte)
+
+Implémentation minimale et thread-safe des compteurs, jauges et
+histogrammes, exposée par la route /metrics de l'API.
+
+Usage:
+    from metriques import ETAPE_DUREE, mesurer
+    with mesurer('detection'):
+        face_locations = ...
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Bornes (secondes) adaptées aux étapes de reconnaissance et aux requêtes
+BORNES_DUREE = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(noms, valeurs):
+    """Formate les labels: {route="/health",statut="200"}"""
+    if not noms:
+        return ''
+    paires = []
+    for nom, valeur in zip(noms, valeurs):
+        valeur = str(valeur).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        paires.append(f'{nom}="{valeur}"')
+    return '{' + ','.join(paires) + '}'
+
+
+def _format_nombre(valeur):
+    """Formate un nombre pour l'exposition (entiers sans décimale)"""
+    if valeur == float('inf'):
+        return '+Inf'
+    if float(valeur).is_integer():
+        return str(int(valeur))
+    return repr(float(valeur))
+
+
+class _Metrique:
+    """Base commune: nom, aide, labels et verrou"""
+
+    type_prometheus = 'untyped'
+
+    def __init__(self, nom, aide, labels=()):
+        self.nom = nom
+        self.aide = aide
+        self.labels = tuple(labels)
+        self._verrou = threading.Lock()
+
+    def _cle(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"Labels attendus pour {self.nom}: {self.labels}")
+        return tuple(labels[nom] for nom in self.labels)
+
+    def exporter(self):
+        """Lignes d'exposition de la métrique"""
+        lignes = [f'# HELP {self.nom} {self.aide}', f'# TYPE {self.nom} {self.type_prometheus}']
+        lignes.extend(self._echantillons())
+        return lignes
+
+    def _echantillons(self):
+        raise NotImplementedError
+
+
+class Compteur(_Metrique):
+    """Valeur qui ne fait qu'augmenter"""
+
+    type_prometheus = 'counter'
+
+    def __init__(self, nom, aide, labels=()):
+        super().__init__(nom, aide, labels)
+        self._valeurs = {}
+
+    def inc(self, valeur=1, **labels):
+        cle = self._cle(labels)
+        with self._verrou:
+            self._valeurs[cle] = self._valeurs.get(cle, 0) + valeur
+
+    def valeur(self, **labels):
+        with self._verrou:
+            return self._valeurs.get(self._cle(labels), 0)
+
+    def _echantillons(self):
+        with self._verrou:
+            valeurs = dict(self._valeurs)
+        if not valeurs and not self.labels:
+            valeurs = {(): 0}
+        return [
+            f'{self.nom}{_format_labels(self.labels, cle)} {_format_nombre(v)}'
+            for cle, v in sorted(valeurs.items())
+        ]
+
+
+class Jauge(_Metrique):
+    """Valeur instantanée, fixée directement ou lue via une fonction"""
+
+    type_prometheus = 'gauge'
+
+    def __init__(self, nom, aide, labels=(), fonction=None):
+        super().__init__(nom, aide, labels)
+        self._valeurs = {}
+        self.fonction = fonction
+
+    def set(self, valeur, **labels):
+        cle = self._cle(labels)
+        with self._verrou:
+            self._valeurs[cle] = valeur
+
+    def inc(self, valeur=1, **labels):
+        cle = self._cle(labels)
+        with self._verrou:
+            self._valeurs[cle] = self._valeurs.get(cle, 0) + valeur
+
+    def dec(self, valeur=1, **labels):
+        self.inc(-valeur, **labels)
+
+    def _echantillons(self):
+        if self.fonction is not None:
+            try:
+                return [f'{self.nom} {_format_nombre(self.fonction())}']
+            except Exception:
+                return []
+        with self._verrou:
+            valeurs = dict(self._valeurs)
+        return [
+            f'{self.nom}{_format_labels(self.labels, cle)} {_format_nombre(v)}'
+            for cle, v in sorted(valeurs.items())
+        ]
+
+
+class Histogramme(_Metrique):
+    """Distribution de valeurs par intervalles cumulés (bucket)"""
+
+    type_prometheus = 'histogram'
+
+    def __init__(self, nom, aide, labels=(), bornes=BORNES_DUREE):
+        super().__init__(nom, aide, labels)
+        self.bornes = tuple(sorted(bornes)) + (float('inf'),)
+        self._series = {}  # cle -> [compteurs par borne, somme, total]
+
+    def observe(self, valeur, **labels):
+        cle = self._cle(labels)
+        with self._verrou:
+            serie = self._series.get(cle)
+            if serie is None:
+                serie = self._series[cle] = [[0] * len(self.bornes), 0.0, 0]
+            for i, borne in enumerate(self.bornes):
+                if valeur <= borne:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valeur
+            serie[2] += 1
+
+    def _echantillons(self):
+        with self._verrou:
+            series = {cle: (list(s[0]), s[1], s[2]) for cle, s in self._series.items()}
+        lignes = []
+        for cle, (compteurs, somme, total) in sorted(series.items()):
+            cumul = 0
+            for borne, n in zip(self.bornes, compteurs):
+                cumul += n
+                noms = self.labels + ('le',)
+                lignes.append(f'{self.nom}_bucket{_format_labels(noms, cle + (_format_nombre(borne),))} {cumul}')
+            lignes.append(f'{self.nom}_sum{_format_labels(self.labels, cle)} {_format_nombre(somme)}')
+            lignes.append(f'{self.nom}_count{_format_labels(self.labels, cle)} {total}')
+        return lignes
+
+
+class Registre:
+    """Ensemble des métriques exposées par /metrics"""
+
+    def __init__(self):
+        self._metriques = {}
+        self._verrou = threading.Lock()
+
+    def enregistrer(self, metrique):
+        with self._verrou:
+            if metrique.nom in self._metriques:
+                raise ValueError(f"Métrique déjà enregistrée: {metrique.nom}")
+            self._metriques[metrique.nom] = metrique
+        return metrique
+
+    def compteur(self, nom, aide, labels=()):
+        return self.enregistrer(Compteur(nom, aide, labels))
+
+    def jauge(self, nom, aide, labels=(), fonction=None):
+        return self.enregistrer(Jauge(nom, aide, labels, fonction))
+
+    def histogramme(self, nom, aide, labels=(), bornes=BORNES_DUREE):
+        return self.enregistrer(Histogramme(nom, aide, labels, bornes))
+
+    def exporter(self):
+        """Texte complet au format d'exposition Prometheus"""
+        with self._verrou:
+            metriques = list(self._metriques.values())
+        lignes = []
+        for metrique in metriques:
+            lignes.extend(metrique.exporter())
+        return '\n'.join(lignes) + '\n'
+
+
+REGISTRE = Registre()
+
+# Profil de la requête en cours (profilage.Profil), None hors profilage
+PROFIL_COURANT = contextvars.ContextVar('profil_courant', default=None)
+
+# ==================== MÉTRIQUES DE L'API ====================
+
+REQUETES = REGISTRE.compteur(
+    'presence_requetes_total', 'Requêtes HTTP traitées', ('route', 'methode', 'statut'))
+REQUETE_DUREE = REGISTRE.histogramme(
+    'presence_requete_duree_secondes', 'Durée des requêtes HTTP par route', ('route',))
+
+# ==================== MÉTRIQUES DE RECONNAISSANCE ====================
+
+ETAPE_DUREE = REGISTRE.histogramme(
+    'presence_etape_duree_secondes',
+    'Durée des étapes (decodage, detection, reperes, encodage, appariement, ecriture_db, journal)',
+    ('etape',))
+FRAMES_ANALYSEES = REGISTRE.compteur(
+    'presence_frames_analysees_total', 'Frames (ou images) analysées')
+VISAGES_DETECTES = REGISTRE.compteur(
+    'presence_visages_detectes_total', 'Visages détectés')
+CORRESPONDANCES = REGISTRE.compteur(
+    'presence_correspondances_total', 'Visages associés à un étudiant connu')
+VISAGES_INCONNUS = REGISTRE.compteur(
+    'presence_visages_inconnus_total', 'Visages sans correspondance')
+APPARIEMENT_REPLIS = REGISTRE.compteur(
+    'presence_appariement_replis_total', "Lots appariés localement, service d'appariement indisponible")
+ENCODAGE_LOT = REGISTRE.histogramme(
+    'presence_encodage_lot_taille', "Visages par lot d'encodage",
+    bornes=(1, 2, 4, 8, 16, 32, 64, 128))
+FRAMES_EN_COURS = REGISTRE.jauge(
+    'presence_frames_en_cours', "Images en cours d'analyse dans le pool de threads")
+VIDEO_FILE_FRAMES = REGISTRE.jauge(
+    'presence_video_file_frames', "Frames décodées en attente d'analyse (toutes vidéos)")
+VIDEO_ATTENTE = REGISTRE.compteur(
+    'presence_video_attente_secondes_total',
+    "Temps d'inactivité des étages du pipeline vidéo (file pleine ou vide)", ('etape',))
+VISAGES_IGNORES = REGISTRE.compteur(
+    'presence_visages_ignores_total', 'Visages écartés avant encodage (contrôle qualité)', ('raison',))
+VIGNETTES_CLIENT = REGISTRE.compteur(
+    'presence_vignettes_client_total',
+    'Vignettes client : boîte du client utilisée, détection de repli ou vignette rejetée', ('resultat',))
+ORDONNANCEUR_FILE = REGISTRE.jauge(
+    'presence_ordonnanceur_file', "Tâches d'analyse en attente dans l'ordonnanceur", ('priorite',))
+ORDONNANCEUR_ATTENTE = REGISTRE.histogramme(
+    'presence_ordonnanceur_attente_secondes', "Attente d'une tâche avant son démarrage", ('priorite',))
+ORDONNANCEUR_TACHES = REGISTRE.compteur(
+    'presence_ordonnanceur_taches_total', 'Tâches exécutées par séance', ('session', 'priorite'))
+ADMISSION_EN_COURS = REGISTRE.jauge(
+    'presence_admission_en_cours', 'Requêtes lourdes admises, en cours de traitement', ('route',))
+ADMISSION_FILE = REGISTRE.jauge(
+    'presence_admission_file', "Requêtes lourdes en attente d'admission", ('route',))
+ADMISSION_ATTENTE = REGISTRE.histogramme(
+    'presence_admission_attente_secondes', "Attente d'admission des requêtes lourdes acceptées", ('route',))
+ADMISSION_REFUS = REGISTRE.compteur(
+    'presence_admission_refus_total',
+    'Requêtes lourdes refusées (file_pleine, attente, seance, taille, duree)', ('route', 'raison'))
+JOURNAL_ENTREES = REGISTRE.compteur(
+    'presence_journal_entrees_total',
+    'Entrées du journal des présences (deposee, appliquee, rejetee)', ('resultat',))
+JOURNAL_ECHECS = REGISTRE.compteur(
+    'presence_journal_echecs_total', 'Lots du journal non écrits (MongoDB indisponible)')
+CACHE_REQUETES = REGISTRE.compteur(
+    'presence_cache_requetes_total', 'Accès aux caches', ('cache', 'resultat'))
+CACHE_TAILLE = REGISTRE.jauge(
+    'presence_cache_entrees', 'Entrées présentes dans les caches', ('cache',))
+
+
+@contextmanager
+def mesurer(etape):
+    """
+    Chronomètre une étape et l'ajoute à l'histogramme des étapes
+
+    Utilisable comme gestionnaire de contexte ou comme décorateur.
+    """
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        duree = time.perf_counter() - debut
+        ETAPE_DUREE.observe(duree, etape=etape)
+        profil = PROFIL_COURANT.get()
+        if profil is not None:
+            profil.ajouter(etape, duree)
+
+
+def enregistrer_acces_cache(cache, trouve):
+    """Compte un accès à un cache (le taux de succès se calcule côté Prometheus)"""
+    CACHE_REQUETES.inc(cache=cache, resultat='hit' if trouve else 'miss')
@@ -0,0 +1,177 @@
+"""
+Migrations de la base de données
+
+Usage:
+    python migrations.py index
+    python migrations.py seances
+"""
+import os
+import sys
+import logging
+
+import click
+from pymongo import UpdateOne
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import DatabaseManager
+from notifications import OutboxNotifications
+
+logger = logging.getLogger(__name__)
+
+
+def migrer_seances(db, taille_lot=500):
+    """
+    Construit les documents `seances` à partir des présences existantes
+
+    Les présences sont regroupées par cours et par jour. Seules les
+    présences antérieures à la première séance enregistrée en direct sont
+    migrées, pour ne pas dupliquer les séances déjà écrites par l'API.
+    La migration est idempotente : la relancer met à jour les mêmes séances.
+
+    Args:
+        db: Instance de DatabaseManager
+        taille_lot: Nombre de séances écrites par bulk_write
+
+    Returns:
+        int: Nombre de séances créées ou mises à jour
+    """
+    filtre = {}
+    premiere_seance = db.seances.find_one(
+        {"source": {"$ne": "migration"}},
+        sort=[("date", 1)]
+    )
+    if premiere_seance:
+        filtre["date"] = {"$lt": premiere_seance["date"]}
+        logger.info(f" Présences migrées jusqu'au {premiere_seance['date']}")
+
+    pipeline = [
+        {"$match": filtre},
+        {"$sort": {"date": 1}},
+        {"$group": {
+            "_id": {
+                "cours_id": "$cours_id",
+                "jour": {"$dateTrunc": {"date": "$date", "unit": "day"}}
+            },
+            "cours_code": {"$first": "$cours_code"},
+            "date": {"$min": "$date"},
+            "presents": {"$push": {
+                "etudiant_id": "$etudiant_id",
+                "etudiant_numero": "$etudiant_numero",
+                "confiance": "$confiance"
+            }}
+        }}
+    ]
+
+    total = 0
+    operations = []
+    for groupe in db.presences.aggregate(pipeline, allowDiskUse=True):
+        presents = groupe["presents"]
+        operations.append(UpdateOne(
+            {
+                "cours_id": groupe["_id"]["cours_id"],
+                "date": groupe["date"],
+                "source": "migration"
+            },
+            {"$set": {
+                "cours_code": groupe["cours_code"],
+                "etudiant_ids": [p["etudiant_id"] for p in presents],
+                "presents": presents,
+                "nb_presents": len(presents)
+            }},
+            upsert=True
+        ))
+
+        if len(operations) >= taille_lot:
+            db.seances.bulk_write(operations, ordered=False)
+            total += len(operations)
+            operations = []
+
+    if operations:
+        db.seances.bulk_write(operations, ordered=False)
+        total += len(operations)
+
+    logger.info(f"✅ {total} séance(s) migrée(s) depuis les présences")
+    return total
+
+
+def migrer_jour_presences(db, taille_lot=1000):
+    """
+    Renseigne le champ `jour` des présences et supprime les doublons
+
+    L'index unique (etudiant_id, cours_id, jour) suppose que toutes les
+    présences ont un `jour` (date à minuit). Les présences écrites avant
+    l'index peuvent compter un étudiant deux fois le même jour pour un
+    cours (écritures concurrentes) : seule la plus ancienne est gardée.
+    La migration est idempotente.
+
+    Args:
+        db: Instance de DatabaseManager
+        taille_lot: Nombre de présences mises à jour par bulk_write
+
+    Returns:
+        tuple: (présences complétées, doublons supprimés)
+    """
+    completees = 0
+    operations = []
+    for presence in db.presences.find({"jour": {"$exists": False}}, {"date": 1}):
+        jour = presence["date"].replace(hour=0, minute=0, second=0, microsecond=0)
+        operations.append(UpdateOne({"_id": presence["_id"]}, {"$set": {"jour": jour}}))
+        if len(operations) >= taille_lot:
+            db.presences.bulk_write(operations, ordered=False)
+            completees += len(operations)
+            operations = []
+    if operations:
+        db.presences.bulk_write(operations, ordered=False)
+        completees += len(operations)
+
+    pipeline = [
+        {"$sort": {"date": 1}},
+        {"$group": {
+            "_id": {"etudiant_id": "$etudiant_id", "cours_id": "$cours_id", "jour": "$jour"},
+            "ids": {"$push": "$_id"},
+            "nombre": {"$sum": 1}
+        }},
+        {"$match": {"nombre": {"$gt": 1}}}
+    ]
+    doublons = [i for groupe in db.presences.aggregate(pipeline, allowDiskUse=True) for i in groupe["ids"][1:]]
+    for debut in range(0, len(doublons), taille_lot):
+        db.presences.delete_many({"_id": {"$in": doublons[debut:debut + taille_lot]}})
+
+    logger.info(f"✅ {completees} présence(s) datée(s) au jour, {len(doublons)} doublon(s) supprimé(s)")
+    return completees, len(doublons)
+
+
+@click.group()
+def cli():
+    """Migrations de la base de données du système de présence"""
+
+
+@cli.command('index')
+def commande_index():
+    """Crée les index des collections (à lancer au déploiement, idempotent)"""
+    db = DatabaseManager()
+    try:
+        # L'index unique des présences exige le champ `jour` et aucun doublon
+        migrer_jour_presences(db)
+        db.creer_index()
+        OutboxNotifications(db).creer_index()
+        click.echo("Index créés")
+    finally:
+        db.fermer_connexion()
+
+
+@cli.command('seances')
+@click.option('--taille-lot', default=500, show_default=True, help='Séances écrites par lot')
+def commande_seances(taille_lot):
+    """Construit les séances à partir des présences existantes"""
+    db = DatabaseManager()
+    try:
+        total = migrer_seances(db, taille_lot)
+        click.echo(f"{total} séance(s) migrée(s)")
+    finally:
+        db.fermer_connexion()
+
+
+if __name__ == '__main__':
+    cli()
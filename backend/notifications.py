@@ -0,0 +1,339 @@
+"""
+Notifications email des présences (outbox)
+
+Les routes ne contactent plus le serveur SMTP : elles déposent une
+notification dans la collection `notifications` et un expéditeur en
+arrière-plan se charge de l'envoi. L'expéditeur réutilise une seule
+connexion SMTP par cycle, regroupe les séances d'un même professeur reçues
+dans la fenêtre de regroupement, réessaie avec un délai exponentiel et
+enregistre le statut de chaque notification.
+
+Statuts: en_attente -> en_cours -> envoye | echec
+
+Usage (expéditeur autonome):
+    python notifications.py
+
+Pour les essais, un serveur SMTP local suffit:
+    python -m aiosmtpd -n -l localhost:1025
+    EMAIL_HOST=localhost EMAIL_PORT=1025 EMAIL_STARTTLS=false python notifications.py
+"""
+import os
+import sys
+import smtplib
+import threading
+import uuid
+import logging
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+
+from pymongo import ASCENDING
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+
+logger = logging.getLogger(__name__)
+
+EN_ATTENTE = 'en_attente'
+EN_COURS = 'en_cours'
+ENVOYE = 'envoye'
+ECHEC = 'echec'
+
+
+def construire_notification(destinataire, code_cours, nom_cours, presents, absents, date_seance):
+    """Document de notification tel qu'il est stocké dans l'outbox"""
+    maintenant = datetime.now()
+    return {
+        "type": "presence",
+        "destinataire": destinataire,
+        "statut": EN_ATTENTE,
+        "tentatives": 0,
+        "cree_le": maintenant,
+        "prochaine_tentative": maintenant + timedelta(seconds=config.EMAIL_FENETRE_REGROUPEMENT),
+        "contenu": {
+            "code_cours": code_cours,
+            "nom_cours": nom_cours,
+            "presents": list(presents),
+            "absents": list(absents),
+            "date_seance": date_seance
+        }
+    }
+
+
+class OutboxNotifications:
+    """Dépôt des notifications à envoyer (appelé par les routes)"""
+
+    def __init__(self, db):
+        """
+        Args:
+            db: Instance de DatabaseManager
+        """
+        self.db = db
+
+    @property
+    def collection(self):
+        """Collection lue à chaque accès (la connexion peut être recréée après un fork)"""
+        return self.db.db[config.COLLECTION_NOTIFICATIONS]
+
+    def creer_index(self):
+        """Crée les index utilisés par l'expéditeur"""
+        self.collection.create_index([("statut", ASCENDING), ("prochaine_tentative", ASCENDING)])
+        self.collection.create_index([("destinataire", ASCENDING), ("statut", ASCENDING)])
+        self.collection.create_index("lot")
+
+    def planifier(self, destinataire, code_cours, nom_cours, presents, absents, date_seance):
+        """
+        Dépose une notification de présence pour un professeur
+
+        L'envoi est différé de la fenêtre de regroupement afin que les
+        séances suivantes du même professeur partent dans le même email.
+
+        Args:
+            destinataire: Email du professeur
+            code_cours: Code du cours
+            nom_cours: Nom du cours
+            presents: Noms des étudiants présents
+            absents: Noms des étudiants absents
+            date_seance: Date de la séance (texte affiché)
+
+        Returns:
+            str: ID de la notification, ou None en cas d'erreur
+        """
+        try:
+            notification = construire_notification(
+                destinataire, code_cours, nom_cours, presents, absents, date_seance
+            )
+            result = self.collection.insert_one(notification)
+            logger.info(f"📨 Notification planifiée pour {destinataire} ({code_cours})")
+            return str(result.inserted_id)
+
+        except Exception as e:
+            logger.error(f"❌ Erreur planification notification: {e}")
+            return None
+
+
+def construire_message(destinataire, notifications):
+    """
+    Construit un email regroupant une ou plusieurs séances
+
+    Args:
+        destinataire: Email du professeur
+        notifications: Documents de notification (même destinataire)
+
+    Returns:
+        MIMEText: Message prêt à l'envoi
+    """
+    contenus = [n["contenu"] for n in notifications]
+
+    if len(contenus) == 1:
+        c = contenus[0]
+        sujet = f"Présence {c['code_cours']} - {c['date_seance']}"
+    else:
+        sujet = f"Présences de {len(contenus)} séances"
+
+    sections = []
+    for c in contenus:
+        presents = "\n".join(f"  ✓ {nom}" for nom in c["presents"]) or "  Aucun"
+        absents = "\n".join(f"  ✗ {nom}" for nom in c["absents"]) or "  Aucun"
+        sections.append(
+            f"{c['code_cours']} - {c['nom_cours']}\n"
+            f"Séance du {c['date_seance']}\n\n"
+            f"Présents ({len(c['presents'])}):\n{presents}\n\n"
+            f"Absents ({len(c['absents'])}):\n{absents}"
+        )
+
+    corps = (
+        "Bonjour,\n\n"
+        "Voici le récapitulatif des présences enregistrées par le système "
+        "de reconnaissance faciale.\n\n"
+        + ("\n\n" + "-" * 40 + "\n\n").join(sections) + "\n\n"
+        "Système de Présence ISIMM"
+    )
+
+    message = MIMEText(corps, 'plain', 'utf-8')
+    message['Subject'] = sujet
+    message['From'] = config.EMAIL_FROM
+    message['To'] = destinataire
+    message['Date'] = formatdate(localtime=True)
+    message['Message-ID'] = make_msgid()
+    return message
+
+
+class ExpediteurEmails:
+    """Envoie les notifications en attente depuis un thread d'arrière-plan"""
+
+    # Une notification restée 'en_cours' plus longtemps (processus arrêté
+    # pendant l'envoi) est remise en attente
+    DELAI_VERROU = timedelta(minutes=10)
+
+    def __init__(self, db):
+        """
+        Args:
+            db: Instance de DatabaseManager
+        """
+        self.db = db
+        self._arret = threading.Event()
+        self._thread = None
+        self._smtp = None
+
+    @property
+    def collection(self):
+        """Collection lue à chaque accès (la connexion peut être recréée après un fork)"""
+        return self.db.db[config.COLLECTION_NOTIFICATIONS]
+
+    # ==================== CYCLE DE VIE ====================
+
+    def demarrer(self):
+        """Démarre le thread d'envoi (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._arret.clear()
+        self._thread = threading.Thread(target=self._boucle, name="expediteur-emails", daemon=True)
+        self._thread.start()
+        logger.info("📬 Expéditeur d'emails démarré")
+
+    def arreter(self, timeout=10):
+        """Arrête le thread d'envoi après le cycle en cours"""
+        self._arret.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _boucle(self):
+        """Traite les notifications dues à intervalle régulier"""
+        while not self._arret.is_set():
+            try:
+                self.traiter()
+            except Exception as e:
+                logger.error(f"❌ Erreur expéditeur emails: {e}")
+            self._arret.wait(config.EMAIL_INTERVALLE_ENVOI)
+
+    # ==================== ENVOI ====================
+
+    def traiter(self):
+        """
+        Envoie toutes les notifications dues
+
+        Returns:
+            int: Nombre d'emails envoyés
+        """
+        maintenant = datetime.now()
+
+        # Reprendre les notifications abandonnées en cours d'envoi
+        self.collection.update_many(
+            {"statut": EN_COURS, "verrouille_le": {"$lt": maintenant - self.DELAI_VERROU}},
+            {"$set": {"statut": EN_ATTENTE}, "$unset": {"lot": "", "verrouille_le": ""}}
+        )
+
+        destinataires = self.collection.distinct(
+            "destinataire",
+            {"statut": EN_ATTENTE, "prochaine_tentative": {"$lte": maintenant}}
+        )
+        if not destinataires:
+            return 0
+
+        envoyes = 0
+        try:
+            for destinataire in destinataires:
+                if self._envoyer_lot(destinataire, maintenant):
+                    envoyes += 1
+        finally:
+            self._fermer_smtp()
+
+        return envoyes
+
+    def _envoyer_lot(self, destinataire, maintenant):
+        """Réserve puis envoie toutes les notifications en attente d'un destinataire"""
+        lot = uuid.uuid4().hex
+
+        # Toutes les séances en attente du professeur partent ensemble,
+        # y compris celles dont la fenêtre de regroupement n'est pas écoulée
+        self.collection.update_many(
+            {
+                "destinataire": destinataire,
+                "statut": EN_ATTENTE,
+                "$or": [
+                    {"tentatives": 0},
+                    {"prochaine_tentative": {"$lte": maintenant}}
+                ]
+            },
+            {"$set": {"statut": EN_COURS, "lot": lot, "verrouille_le": maintenant}}
+        )
+        notifications = list(self.collection.find({"lot": lot}).sort("cree_le", ASCENDING))
+        if not notifications:
+            return False  # Réservées par un autre processus
+
+        ids = [n["_id"] for n in notifications]
+        try:
+            message = construire_message(destinataire, notifications)
+            self._connexion_smtp().sendmail(config.EMAIL_FROM, [destinataire], message.as_string())
+
+        except Exception as e:
+            logger.warning(f"⚠️ Échec envoi email à {destinataire}: {e}")
+            # La connexion est peut-être inutilisable: la recréer au prochain envoi
+            self._fermer_smtp()
+            for n in notifications:
+                self._echec(n, e, maintenant)
+            return False
+
+        self.collection.update_many(
+            {"_id": {"$in": ids}},
+            {
+                "$set": {"statut": ENVOYE, "envoye_le": datetime.now(), "regroupees": len(ids)},
+                "$inc": {"tentatives": 1},
+                "$unset": {"lot": "", "verrouille_le": "", "derniere_erreur": ""}
+            }
+        )
+        logger.info(f"✅ Email envoyé à {destinataire} ({len(ids)} séance(s))")
+        return True
+
+    def _echec(self, notification, erreur, maintenant):
+        """Replanifie une notification avec un délai exponentiel, ou l'abandonne"""
+        tentatives = notification.get("tentatives", 0) + 1
+        modifications = {"tentatives": tentatives, "derniere_erreur": str(erreur)}
+
+        if tentatives >= config.EMAIL_TENTATIVES_MAX:
+            modifications["statut"] = ECHEC
+            logger.error(f"❌ Notification {notification['_id']} abandonnée après {tentatives} tentatives")
+        else:
+            delai = config.EMAIL_DELAI_RETRY * (2 ** (tentatives - 1))
+            modifications["statut"] = EN_ATTENTE
+            modifications["prochaine_tentative"] = maintenant + timedelta(seconds=delai)
+
+        self.collection.update_one(
+            {"_id": notification["_id"]},
+            {"$set": modifications, "$unset": {"lot": "", "verrouille_le": ""}}
+        )
+
+    def _connexion_smtp(self):
+        """Ouvre la connexion SMTP une seule fois par cycle d'envoi"""
+        if self._smtp is None:
+            smtp = smtplib.SMTP(config.EMAIL_HOST, config.EMAIL_PORT, timeout=config.EMAIL_TIMEOUT)
+            if config.EMAIL_STARTTLS:
+                smtp.starttls()
+            if config.EMAIL_USER:
+                smtp.login(config.EMAIL_USER, config.EMAIL_PASSWORD)
+            self._smtp = smtp
+        return self._smtp
+
+    def _fermer_smtp(self):
+        """Ferme la connexion SMTP si elle est ouverte"""
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+if __name__ == '__main__':
+    from database import DatabaseManager
+
+    db = DatabaseManager()
+    OutboxNotifications(db).creer_index()
+    expediteur = ExpediteurEmails(db)
+    logger.info("📬 Expéditeur d'emails autonome (Ctrl+C pour arrêter)")
+    try:
+        expediteur._boucle()
+    except KeyboardInterrupt:
+        expediteur.arreter()
@@ -0,0 +1,239 @@
+"""
+Ordonnanceur des analyses de reconnaissance, toutes séances confondues
+
+Toutes les analyses d'un processus (vidéos, envois webcam, reconnaissance
+interactive) passent par un seul pool de config.ORDONNANCEUR_THREADS threads:
+
+  - priorité stricte : les tâches 'interactif' (reconnaissance, webcam)
+    passent avant les tâches 'lot' (frames des vidéos) ;
+  - équité : à priorité égale, les séances sont servies à tour de rôle,
+    une tâche chacune ; une longue vidéo ne ralentit donc pas les autres
+    séances, qui obtiennent chacune leur part du pool.
+
+Une séance est identifiée par le code du cours (ou toute autre clé).
+Files d'attente et débit par séance: /metrics et GET /api/ordonnanceur.
+
+Priorité et équité ne valent qu'entre les analyses d'un même processus :
+deux workers ont chacun leur ordonnanceur et ne se voient pas. Le pool
+lourd de production n'a donc qu'un worker par machine (gunicorn.conf.py).
+Quand plusieurs processus analysent sur la même machine (WORKERS > 1,
+pool de processus d'api_async), repartir_threads leur partage les cœurs
+au lieu de donner un thread par cœur à chacun.
+
+Usage:
+    from ordonnanceur import obtenir_ordonnanceur
+    future = obtenir_ordonnanceur().soumettre('INF101', 'lot', analyser, frame)
+    resultat = future.result()
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import config
+from metriques import ORDONNANCEUR_FILE, ORDONNANCEUR_ATTENTE, ORDONNANCEUR_TACHES
+from profilage import propager
+
+logger = logging.getLogger(__name__)
+
+# Par ordre de priorité décroissante
+PRIORITES = ('interactif', 'lot')
+
+# Fenêtre de calcul du débit par séance (secondes)
+FENETRE_DEBIT = 60
+
+
+class Ordonnanceur:
+    """Pool de threads à files par séance (tour de rôle) et priorité stricte"""
+
+    def __init__(self, nb_threads=None):
+        self.nb_threads = nb_threads or config.ORDONNANCEUR_THREADS
+        self._condition = threading.Condition()
+        # {priorite: {session: deque de tâches}} ; l'ordre des séances est le tour de rôle
+        self._files = {priorite: OrderedDict() for priorite in PRIORITES}
+        self._terminees = {}  # {session: deque des instants de fin, sur FENETRE_DEBIT}
+        self._en_cours = 0
+        self._arret = False
+        self._threads = [
+            threading.Thread(target=self._boucle, name=f'ordonnanceur-{i}', daemon=True)
+            for i in range(self.nb_threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def soumettre(self, session, priorite, fonction, *args, **kwargs):
+        """
+        Met une tâche en file
+
+        Args:
+            session: Clé de la séance (code du cours...), 'anonyme' si None
+            priorite: 'interactif' ou 'lot'
+
+        Returns:
+            concurrent.futures.Future: annulable tant que la tâche n'a pas démarré
+        """
+        if priorite not in PRIORITES:
+            raise ValueError(f"Priorité inconnue: {priorite} (disponibles: {', '.join(PRIORITES)})")
+        session = str(session) if session is not None else 'anonyme'
+        fonction = propager(fonction)  # la tâche suit le profil de la requête qui la soumet
+        future = Future()
+        with self._condition:
+            if self._arret:
+                raise RuntimeError("Ordonnanceur arrêté")
+            self._files[priorite].setdefault(session, deque()).append(
+                (future, fonction, args, kwargs, time.monotonic())
+            )
+            ORDONNANCEUR_FILE.inc(priorite=priorite)
+            self._condition.notify()
+        return future
+
+    def _suivante(self):
+        """Prochaine tâche (sous verrou) : priorité stricte, puis tour de rôle des séances"""
+        for priorite in PRIORITES:
+            files = self._files[priorite]
+            if files:
+                session, file = files.popitem(last=False)
+                tache = file.popleft()
+                if file:
+                    files[session] = file  # la séance repasse en fin de tour
+                return priorite, session, tache
+        return None
+
+    def _boucle(self):
+        while True:
+            with self._condition:
+                suivante = self._suivante()
+                while suivante is None:
+                    if self._arret:
+                        return
+                    self._condition.wait()
+                    suivante = self._suivante()
+                self._en_cours += 1
+
+            priorite, session, (future, fonction, args, kwargs, soumission) = suivante
+            ORDONNANCEUR_FILE.dec(priorite=priorite)
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                ORDONNANCEUR_ATTENTE.observe(time.monotonic() - soumission, priorite=priorite)
+                try:
+                    resultat = fonction(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(resultat)
+                ORDONNANCEUR_TACHES.inc(session=session, priorite=priorite)
+                with self._condition:
+                    self._terminees.setdefault(session, deque()).append(time.monotonic())
+            finally:
+                with self._condition:
+                    self._en_cours -= 1
+
+    def etat(self):
+        """Files d'attente et débit (tâches/s sur FENETRE_DEBIT secondes) par séance"""
+        limite = time.monotonic() - FENETRE_DEBIT
+        with self._condition:
+            sessions = {}
+            for priorite in PRIORITES:
+                for session, file in self._files[priorite].items():
+                    etat = sessions.setdefault(session, {'en_attente': {}, 'debit': 0.0})
+                    etat['en_attente'][priorite] = len(file)
+            for session, fins in list(self._terminees.items()):
+                while fins and fins[0] < limite:
+                    fins.popleft()
+                if not fins:
+                    del self._terminees[session]
+                    continue
+                etat = sessions.setdefault(session, {'en_attente': {}, 'debit': 0.0})
+                etat['debit'] = round(len(fins) / FENETRE_DEBIT, 3)
+            return {
+                'threads': self.nb_threads,
+                'en_cours': self._en_cours,
+                'en_attente': {
+                    priorite: sum(len(file) for file in self._files[priorite].values())
+                    for priorite in PRIORITES
+                },
+                'sessions': sessions
+            }
+
+    def arreter(self):
+        """Annule les tâches en file et arrête les threads après les tâches en cours"""
+        with self._condition:
+            self._arret = True
+            for priorite in PRIORITES:
+                for file in self._files[priorite].values():
+                    for future, *_ in file:
+                        future.cancel()
+                    ORDONNANCEUR_FILE.dec(len(file), priorite=priorite)
+                self._files[priorite].clear()
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+
+class VerrouPrioritaire:
+    """
+    Verrou exclusif où les demandes les plus prioritaires passent devant
+
+    Sert au réseau de descripteurs dlib (un seul calcul à la fois) : une
+    reconnaissance interactive attend au plus la fin du lot vidéo en cours,
+    pas celle de tous les lots vidéo en attente.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pris = False
+        self._attentes = {priorite: 0 for priorite in PRIORITES}
+
+    def _devance(self, priorite):
+        return any(self._attentes[p] for p in PRIORITES[:PRIORITES.index(priorite)])
+
+    @contextmanager
+    def prendre(self, priorite='lot'):
+        with self._condition:
+            self._attentes[priorite] += 1
+            try:
+                while self._pris or self._devance(priorite):
+                    self._condition.wait()
+            finally:
+                self._attentes[priorite] -= 1
+            self._pris = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._pris = False
+                self._condition.notify_all()
+
+
+_ordonnanceur = None
+_verrou = threading.Lock()
+
+
+def obtenir_ordonnanceur():
+    """Ordonnanceur du processus (créé au premier usage, donc après le fork des workers)"""
+    global _ordonnanceur
+    with _verrou:
+        if _ordonnanceur is None:
+            _ordonnanceur = Ordonnanceur()
+            logger.info(f"🗂️ Ordonnanceur de reconnaissance: {_ordonnanceur.nb_threads} thread(s)")
+        return _ordonnanceur
+
+
+def repartir_threads(processus):
+    """
+    Threads de l'ordonnanceur quand `processus` processus analysent sur la
+    même machine : cœurs // processus chacun (au moins 1), sauf si
+    ORDONNANCEUR_THREADS est fixé. À appeler avant le premier usage.
+    """
+    if not config.ORDONNANCEUR_THREADS_FIXE:
+        config.ORDONNANCEUR_THREADS = max(1, (os.cpu_count() or 2) // max(1, processus))
+    return config.ORDONNANCEUR_THREADS
+
+
+def etat_ordonnanceur():
+    """État de l'ordonnanceur du processus, ou None s'il n'a pas encore servi"""
+    return _ordonnanceur.etat() if _ordonnanceur is not None else None
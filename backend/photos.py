@@ -0,0 +1,230 @@
+"""
+Magasin des photos d'étudiants, adressé par contenu
+
+Chaque photo envoyée est normalisée une fois (orientation EXIF appliquée,
+RGB, plus grand côté <= PHOTOS_COTE_MAX, JPEG sans métadonnées) puis
+rangée sous le SHA-256 de ce JPEG, avec sa miniature générée au même
+moment:
+
+    PHOTOS_DIR/ab/abcdef....jpg           original normalisé
+    PHOTOS_DIR/ab/abcdef...._mini.jpg     miniature (PHOTOS_MINIATURE px)
+
+Deux envois identiques ne sont stockés qu'une fois. Le document étudiant
+ne garde que l'empreinte (champ `photo`) ; les fichiers ne sont jamais
+modifiés, ils sont donc servis (GET /api/photos/<empreinte>[/miniature])
+avec un ETag et un Cache-Control immuable. Les fichiers qui ne sont plus
+référencés sont retirés par le ramasse-miettes.
+
+Usage:
+    python photos.py gc               # supprime les photos orphelines
+    python photos.py gc --simulation  # liste sans supprimer
+    python photos.py migrer           # importe les anciennes photos (photo_path)
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+
+logger = logging.getLogger(__name__)
+
+VARIANTES = {'original': '.jpg', 'miniature': '_mini.jpg'}
+_EMPREINTE = re.compile(r'^[0-9a-f]{64}$')
+
+# Une photo envoyée mais pas encore référencée (étudiant en cours d'ajout)
+# n'est pas collectée avant ce délai
+AGE_MIN_COLLECTE = 3600
+
+ENTETE_CACHE = 'public, max-age=31536000, immutable'
+
+
+class PhotoInvalide(ValueError):
+    """Photo illisible, trop grande ou trop volumineuse"""
+
+
+def _encoder_jpeg(image, qualite):
+    tampon = io.BytesIO()
+    image.save(tampon, format='JPEG', quality=qualite, optimize=True)
+    return tampon.getvalue()
+
+
+def normaliser(donnees):
+    """
+    Décode, redresse, réduit et réencode une photo
+
+    Args:
+        donnees: Contenu du fichier envoyé (JPEG, PNG, WebP...)
+
+    Returns:
+        tuple: (JPEG normalisé, JPEG de la miniature)
+
+    Raises:
+        PhotoInvalide
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    if len(donnees) > config.PHOTOS_TAILLE_MAX_MO * 1024 * 1024:
+        raise PhotoInvalide(f"Photo trop volumineuse (maximum {config.PHOTOS_TAILLE_MAX_MO} Mo)")
+    try:
+        image = Image.open(io.BytesIO(donnees))
+        # Refuser les images démesurées avant de décompresser les pixels
+        if image.width * image.height > config.PHOTOS_PIXELS_MAX:
+            raise PhotoInvalide(f"Photo trop grande ({image.width}×{image.height} pixels)")
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    except (UnidentifiedImageError, OSError) as e:
+        raise PhotoInvalide(f"Photo illisible: {e}")
+
+    image.thumbnail((config.PHOTOS_COTE_MAX, config.PHOTOS_COTE_MAX), Image.LANCZOS)
+    original = _encoder_jpeg(image, config.PHOTOS_QUALITE_JPEG)
+    image.thumbnail((config.PHOTOS_MINIATURE, config.PHOTOS_MINIATURE), Image.LANCZOS)
+    miniature = _encoder_jpeg(image, config.PHOTOS_QUALITE_JPEG)
+    return original, miniature
+
+
+class MagasinPhotos:
+    """Fichiers des photos, rangés par empreinte SHA-256"""
+
+    def __init__(self, dossier=None):
+        self.dossier = dossier or config.PHOTOS_DIR
+
+    def chemin(self, empreinte, variante='original'):
+        """Chemin d'une photo, ou None si l'empreinte ou la variante sont invalides"""
+        if variante not in VARIANTES or not _EMPREINTE.match(empreinte or ''):
+            return None
+        return os.path.join(self.dossier, empreinte[:2], empreinte + VARIANTES[variante])
+
+    def existe(self, empreinte, variante='original'):
+        chemin = self.chemin(empreinte, variante)
+        return chemin is not None and os.path.exists(chemin)
+
+    @staticmethod
+    def etag(empreinte, variante='original'):
+        """ETag d'une photo : son contenu ne change jamais pour une empreinte donnée"""
+        return f"{empreinte[:32]}-{variante}"
+
+    def ajouter(self, donnees):
+        """
+        Normalise et range une photo (sans effet si elle est déjà présente)
+
+        Returns:
+            str: Empreinte de la photo
+
+        Raises:
+            PhotoInvalide
+        """
+        original, miniature = normaliser(donnees)
+        empreinte = hashlib.sha256(original).hexdigest()
+        if self.existe(empreinte) and self.existe(empreinte, 'miniature'):
+            logger.info(f"🖼️ Photo déjà présente: {empreinte[:12]}")
+            return empreinte
+
+        os.makedirs(os.path.dirname(self.chemin(empreinte)), exist_ok=True)
+        # La miniature d'abord : un original présent implique sa miniature
+        for variante, contenu in (('miniature', miniature), ('original', original)):
+            chemin = self.chemin(empreinte, variante)
+            temporaire = f"{chemin}.{os.getpid()}.tmp"
+            with open(temporaire, 'wb') as f:
+                f.write(contenu)
+            os.replace(temporaire, chemin)
+        logger.info(f"🖼️ Photo enregistrée: {empreinte[:12]} ({len(original) // 1024} Ko, "
+                    f"miniature {len(miniature) // 1024} Ko)")
+        return empreinte
+
+    def empreintes(self):
+        """Empreintes présentes sur le disque, avec la date de modification de l'original"""
+        if not os.path.isdir(self.dossier):
+            return {}
+        trouvees = {}
+        for prefixe in os.listdir(self.dossier):
+            sous_dossier = os.path.join(self.dossier, prefixe)
+            if not os.path.isdir(sous_dossier):
+                continue
+            for nom in os.listdir(sous_dossier):
+                empreinte = nom.split('_')[0].split('.')[0]
+                if _EMPREINTE.match(empreinte):
+                    mtime = os.path.getmtime(os.path.join(sous_dossier, nom))
+                    trouvees[empreinte] = max(trouvees.get(empreinte, 0), mtime)
+        return trouvees
+
+    def collecter(self, referencees, age_min=AGE_MIN_COLLECTE, simulation=False):
+        """
+        Supprime les photos qui ne sont plus référencées par aucun étudiant
+
+        Args:
+            referencees: Empreintes utilisées (DatabaseManager.empreintes_photos)
+            age_min: Ne pas toucher aux photos plus récentes (secondes)
+            simulation: Lister sans supprimer
+
+        Returns:
+            list: Empreintes supprimées (ou à supprimer)
+        """
+        limite = time.time() - age_min
+        orphelines = [
+            empreinte for empreinte, mtime in self.empreintes().items()
+            if empreinte not in referencees and mtime < limite
+        ]
+        if not simulation:
+            for empreinte in orphelines:
+                for variante in VARIANTES:
+                    try:
+                        os.remove(self.chemin(empreinte, variante))
+                    except FileNotFoundError:
+                        pass
+            for empreinte in orphelines:
+                try:
+                    os.rmdir(os.path.dirname(self.chemin(empreinte)))
+                except OSError:
+                    pass  # dossier encore utilisé
+        logger.info(f"🧹 {len(orphelines)} photo(s) orpheline(s){' (simulation)' if simulation else ' supprimée(s)'}")
+        return orphelines
+
+
+if __name__ == '__main__':
+    import click
+
+    from database import DatabaseManager
+
+    @click.group()
+    def cli():
+        """Magasin des photos d'étudiants"""
+
+    @cli.command('gc')
+    @click.option('--age-min', type=int, default=AGE_MIN_COLLECTE, show_default=True,
+                  help='Garder les photos plus récentes (secondes)')
+    @click.option('--simulation', is_flag=True, help='Lister les photos orphelines sans les supprimer')
+    def commande_gc(age_min, simulation):
+        """Supprime les photos qui ne sont plus référencées"""
+        db = DatabaseManager()
+        try:
+            orphelines = MagasinPhotos().collecter(db.empreintes_photos(), age_min, simulation)
+            click.echo(f"{len(orphelines)} photo(s) orpheline(s){' (simulation)' if simulation else ' supprimée(s)'}")
+        finally:
+            db.fermer_connexion()
+
+    @cli.command('migrer')
+    def commande_migrer():
+        """Range les anciennes photos (champ photo_path) dans le magasin"""
+        db = DatabaseManager()
+        magasin = MagasinPhotos()
+        migrees = 0
+        try:
+            for etudiant in db.etudiants.find({"photo_path": {"$nin": [None, ""]}, "photo": {"$exists": False}}):
+                try:
+                    with open(etudiant["photo_path"], 'rb') as f:
+                        empreinte = magasin.ajouter(f.read())
+                except (OSError, PhotoInvalide) as e:
+                    click.echo(f"{etudiant['numero_etudiant']}: ignorée ({e})")
+                    continue
+                db.etudiants.update_one({"_id": etudiant["_id"]}, {"$set": {"photo": empreinte}})
+                migrees += 1
+            click.echo(f"{migrees} photo(s) migrée(s) ; les anciens fichiers peuvent être supprimés")
+        finally:
+            db.fermer_connexion()
+
+    cli()
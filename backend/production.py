@@ -0,0 +1,57 @@
+"""
+Point d'entrée de production
+
+Lance les deux pools gunicorn (voir gunicorn.conf.py) :
+  - pool léger sur le port 5000 (CRUD, listes, /health, /metrics)
+  - pool lourd sur le port 5001 (vidéo, webcam, reconnaissance)
+
+Le frontend envoie les requêtes de reconnaissance à API_RECONNAISSANCE_URL
+(script.js, http://localhost:5001 par défaut) et le pool léger les refuse
+(421) : une rafale d'analyses ne peut donc plus bloquer les routes légères.
+
+Usage:
+    python production.py
+
+Comparer le débit avec le serveur de développement (même machine, ports différents):
+    python ../benchmarks/charge_serveurs.py --video classe.mp4 \\
+        http://localhost:5000 "http://localhost:5000+http://localhost:5001"
+"""
+import os
+import signal
+import subprocess
+import sys
+import time
+
+DOSSIER = os.path.dirname(os.path.abspath(__file__))
+POOLS = ('leger', 'lourd')
+
+
+def main():
+    """Démarre les pools et les arrête ensemble"""
+    processus = []
+    for pool in POOLS:
+        env = dict(os.environ, POOL=pool)
+        processus.append(subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'api:app'],
+            cwd=DOSSIER,
+            env=env
+        ))
+
+    def arreter(signum, frame):
+        for p in processus:
+            if p.poll() is None:
+                p.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, arreter)
+    signal.signal(signal.SIGINT, arreter)
+
+    # Si un pool s'arrête, arrêter l'autre pour que le superviseur redémarre l'ensemble
+    while all(p.poll() is None for p in processus):
+        time.sleep(1)
+    arreter(None, None)
+    codes = [p.wait() for p in processus]
+    sys.exit(next((c for c in codes if c), 0))
+
+
+if __name__ == '__main__':
+    main()
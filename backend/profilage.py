@@ -0,0 +1,227 @@
+"""
+Profilage à la demande des requêtes de reconnaissance
+
+Une requête de reconnaissance envoyée avec l'en-tête X-Profil (ou le
+paramètre ?profil=) et le jeton de diagnostic (X-Jeton-Diagnostic) est
+exécutée sous profilage :
+
+    etapes        durée cumulée des étapes (decodage, detection, reperes,
+                  encodage, appariement, mongodb, journal...), sans profileur
+    cprofile      profileur déterministe (cProfile), un par thread, fusionnés
+                  dans un fichier .pstats (python -m pstats, snakeviz)
+    echantillons  échantillonnage des piles toutes les PROFILAGE_INTERVALLE
+                  secondes, fichier de piles repliées (flamegraph.pl, speedscope)
+
+Le détail des étapes est ajouté à la réponse JSON (clé 'profil') et à
+l'en-tête Server-Timing ; le résumé et le profil sont écrits dans
+PROFILAGE_DIR. Les threads de l'ordonnanceur et le décodeur vidéo qui
+travaillent pour la requête sont suivis (voir propager). Les durées des
+étapes sont cumulées sur tous les threads : leur somme peut dépasser la
+durée de la requête.
+
+Sans profilage demandé, le seul coût est la lecture d'une ContextVar par
+étape mesurée et par tâche soumise.
+"""
+import cProfile
+import functools
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from pymongo import monitoring
+
+import config
+from metriques import PROFIL_COURANT
+
+logger = logging.getLogger(__name__)
+
+MODES = ('etapes', 'cprofile', 'echantillons')
+
+
+class Profil:
+    """Étapes (et profil) d'une requête, alimentés depuis tous les threads qui y participent"""
+
+    def __init__(self, mode, route):
+        if mode not in MODES:
+            raise ValueError(f"Mode de profilage inconnu: {mode} ({', '.join(MODES)})")
+        self.mode = mode
+        self.route = route
+        self.duree = None
+        self.fichiers = []
+        self._etapes = {}  # {etape: [secondes, appels]}
+        self._threads = {}  # {ident: participations en cours}
+        self._profileurs = []
+        self._piles = Counter()
+        self._verrou = threading.Lock()
+        self._arret = threading.Event()
+
+    def ajouter(self, etape, duree):
+        """Ajoute la durée d'une étape (appelé par metriques.mesurer et l'écoute MongoDB)"""
+        with self._verrou:
+            cumul = self._etapes.setdefault(etape, [0.0, 0])
+            cumul[0] += duree
+            cumul[1] += 1
+
+    @contextmanager
+    def participer(self):
+        """Le thread courant travaille pour la requête (profilé en mode cprofile, échantillonné sinon)"""
+        ident = threading.get_ident()
+        with self._verrou:
+            deja = ident in self._threads
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+        # Un seul profileur par thread : cProfile ne s'imbrique pas
+        profileur = cProfile.Profile() if self.mode == 'cprofile' and not deja else None
+        if profileur is not None:
+            profileur.enable()
+        try:
+            yield
+        finally:
+            if profileur is not None:
+                profileur.disable()
+            with self._verrou:
+                if profileur is not None:
+                    self._profileurs.append(profileur)
+                self._threads[ident] -= 1
+                if not self._threads[ident]:
+                    del self._threads[ident]
+
+    def _echantillonner(self):
+        """Relève les piles des threads participants jusqu'à la fin de la requête"""
+        moi = threading.get_ident()
+        while not self._arret.wait(config.PROFILAGE_INTERVALLE):
+            frames = sys._current_frames()
+            with self._verrou:
+                idents = [i for i in self._threads if i != moi]
+            for ident in idents:
+                frame = frames.get(ident)
+                pile = []
+                while frame is not None:
+                    code = frame.f_code
+                    pile.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if pile:
+                    self._piles[';'.join(reversed(pile))] += 1
+
+    @contextmanager
+    def activer(self):
+        """Profile le bloc (le thread courant et ceux qui reçoivent le profil), puis écrit les fichiers"""
+        jeton = PROFIL_COURANT.set(self)
+        echantillonneur = None
+        if self.mode == 'echantillons':
+            echantillonneur = threading.Thread(target=self._echantillonner, name='profil-echantillons', daemon=True)
+            echantillonneur.start()
+        debut = time.perf_counter()
+        try:
+            with self.participer():
+                yield self
+        finally:
+            self.duree = time.perf_counter() - debut
+            self._arret.set()
+            if echantillonneur is not None:
+                echantillonneur.join()
+            PROFIL_COURANT.reset(jeton)
+            try:
+                self._ecrire()
+            except OSError as e:
+                logger.warning(f"⚠️ Profil non écrit: {e}")
+
+    def _ecrire(self):
+        """Écrit le profil et le résumé dans PROFILAGE_DIR"""
+        os.makedirs(config.PROFILAGE_DIR, exist_ok=True)
+        nom = re.sub(r'[^A-Za-z0-9]+', '-', self.route).strip('-') or 'requete'
+        base = os.path.join(
+            config.PROFILAGE_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{nom}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        )
+        if self.mode == 'cprofile' and self._profileurs:
+            statistiques = pstats.Stats(self._profileurs[0])
+            for profileur in self._profileurs[1:]:
+                statistiques.add(profileur)
+            statistiques.dump_stats(f"{base}.pstats")
+            self.fichiers.append(f"{base}.pstats")
+        elif self.mode == 'echantillons':
+            with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+                for pile, nombre in self._piles.most_common():
+                    f.write(f"{pile} {nombre}\n")
+            self.fichiers.append(f"{base}.txt")
+        with open(f"{base}.json", 'w', encoding='utf-8') as f:
+            json.dump(self.resume(), f, ensure_ascii=False, indent=2)
+        self.fichiers.append(f"{base}.json")
+        logger.info(f"🔬 Profil {self.mode} de {self.route} ({self.duree:.2f}s): {base}")
+
+    def resume(self):
+        """Durée de la requête et durées cumulées par étape (secondes)"""
+        with self._verrou:
+            etapes = {
+                etape: {'secondes': round(secondes, 4), 'appels': appels}
+                for etape, (secondes, appels) in sorted(self._etapes.items(), key=lambda e: -e[1][0])
+            }
+        return {
+            'mode': self.mode,
+            'route': self.route,
+            'duree_s': round(self.duree, 4) if self.duree is not None else None,
+            'etapes': etapes,
+            'fichiers': [os.path.relpath(f, config.LOGS_DIR) for f in self.fichiers],
+            'echantillons': sum(self._piles.values()) if self.mode == 'echantillons' else None
+        }
+
+    def server_timing(self):
+        """Valeur de l'en-tête Server-Timing (millisecondes)"""
+        with self._verrou:
+            etapes = [f"{etape};dur={secondes * 1000:.1f}" for etape, (secondes, _) in self._etapes.items()]
+        return ', '.join(etapes + [f"total;dur={(self.duree or 0) * 1000:.1f}"])
+
+
+def propager(fonction):
+    """
+    Fonction qui travaille pour le profil courant depuis un autre thread
+
+    Sans profil courant, `fonction` est retournée telle quelle.
+    """
+    profil = PROFIL_COURANT.get()
+    if profil is None:
+        return fonction
+
+    @functools.wraps(fonction)
+    def executer(*args, **kwargs):
+        jeton = PROFIL_COURANT.set(profil)
+        try:
+            with profil.participer():
+                return fonction(*args, **kwargs)
+        finally:
+            PROFIL_COURANT.reset(jeton)
+    return executer
+
+
+class _EcouteMongo(monitoring.CommandListener):
+    """Durée des commandes MongoDB, comptée dans l'étape 'mongodb' du profil courant"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        profil = PROFIL_COURANT.get()
+        if profil is not None:
+            profil.ajouter('mongodb', event.duration_micros / 1e6)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+_ecoute_installee = False
+
+
+def installer_ecoute_mongo():
+    """Enregistre l'écoute des commandes (clients MongoDB créés ensuite seulement)"""
+    global _ecoute_installee
+    if not _ecoute_installee:
+        monitoring.register(_EcouteMongo())
+        _ecoute_installee = True
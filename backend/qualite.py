@@ -0,0 +1,152 @@
+"""
+Contrôle qualité des visages détectés, avant encodage
+
+Un visage trop petit, trop sombre ou surexposé, flou ou de profil donnera
+presque toujours un « visage inconnu » : ces contrôles (quelques dixièmes
+de milliseconde) évitent de payer l'encodage 128-d pour rien.
+
+Raisons de rejet:
+    petit      : plus petit côté de la boîte < QUALITE_TAILLE_MIN pixels
+    sombre     : luminosité moyenne < QUALITE_LUMINOSITE_MIN
+    surexpose  : luminosité moyenne > QUALITE_LUMINOSITE_MAX
+    flou       : variance du laplacien < QUALITE_NETTETE_MIN
+    pose       : nez trop décalé de l'axe des yeux (lacet > QUALITE_LACET_MAX)
+    selection  : visage écarté au profit des meilleures images de la même personne
+"""
+import math
+
+import cv2
+import numpy as np
+
+import config
+
+RAISONS = ('petit', 'sombre', 'surexpose', 'flou', 'pose', 'selection')
+
+# Taille de la vignette sur laquelle la netteté est mesurée (indépendante
+# de la distance à la caméra)
+TAILLE_NETTETE = 96
+
+
+def controler_boite(image, boite):
+    """
+    Contrôles sans repères faciaux : taille, luminosité, netteté
+
+    Args:
+        image: Image RGB
+        boite: (haut, droite, bas, gauche)
+
+    Returns:
+        tuple: (raison du rejet ou None, netteté)
+    """
+    haut, droite, bas, gauche = boite
+    if min(bas - haut, droite - gauche) < config.QUALITE_TAILLE_MIN:
+        return 'petit', 0.0
+
+    gris = cv2.cvtColor(image[max(0, haut):bas, max(0, gauche):droite], cv2.COLOR_RGB2GRAY)
+    if gris.size == 0:
+        return 'petit', 0.0
+    luminosite = float(gris.mean())
+    if luminosite < config.QUALITE_LUMINOSITE_MIN:
+        return 'sombre', 0.0
+    if luminosite > config.QUALITE_LUMINOSITE_MAX:
+        return 'surexpose', 0.0
+
+    gris = cv2.resize(gris, (TAILLE_NETTETE, TAILLE_NETTETE), interpolation=cv2.INTER_AREA)
+    nettete = float(cv2.Laplacian(gris, cv2.CV_64F).var())
+    if nettete < config.QUALITE_NETTETE_MIN:
+        return 'flou', nettete
+    return None, nettete
+
+
+def lacet(reperes):
+    """
+    Estimation du lacet (rotation gauche/droite) à partir des 5 repères dlib
+
+    Décalage du nez par rapport au milieu des yeux, mesuré le long de l'axe
+    des yeux et rapporté à la distance entre les yeux : ~0 de face,
+    au-delà de 0.3 le visage est nettement de trois quarts.
+    """
+    points = np.array([(reperes.part(i).x, reperes.part(i).y) for i in range(5)], dtype=float)
+    oeil_1, oeil_2 = points[0:2].mean(axis=0), points[2:4].mean(axis=0)
+    axe = oeil_2 - oeil_1
+    distance = np.linalg.norm(axe)
+    if distance == 0:
+        return 1.0
+    return abs(float(np.dot(points[4] - (oeil_1 + oeil_2) / 2, axe / distance))) / distance
+
+
+def controler_pose(reperes):
+    """
+    Returns:
+        tuple: (raison du rejet ou None, lacet)
+    """
+    valeur = lacet(reperes)
+    if valeur > config.QUALITE_LACET_MAX:
+        return 'pose', valeur
+    return None, valeur
+
+
+def score(boite, nettete, valeur_lacet):
+    """Score de qualité (0..1) pour choisir les meilleures images d'une personne"""
+    haut, droite, bas, gauche = boite
+    taille = min(1.0, min(bas - haut, droite - gauche) / 150)
+    nettete = min(1.0, math.log1p(nettete) / math.log1p(500))
+    return taille * nettete * max(0.0, 1.0 - valeur_lacet)
+
+
+def iou(a, b):
+    """Intersection sur union de deux boîtes (haut, droite, bas, gauche)"""
+    haut, droite = max(a[0], b[0]), min(a[1], b[1])
+    bas, gauche = min(a[2], b[2]), max(a[3], b[3])
+    intersection = max(0, droite - gauche) * max(0, bas - haut)
+    union = (a[1] - a[3]) * (a[2] - a[0]) + (b[1] - b[3]) * (b[2] - b[0]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def pistes(visages_par_image, seuil_iou=0.3):
+    """
+    Regroupe les visages d'images successives en pistes (une par personne)
+
+    Un visage rejoint la piste dont la dernière boîte le recouvre le plus
+    (IoU >= seuil_iou), sinon il ouvre une nouvelle piste.
+
+    Args:
+        visages_par_image: [[visage, ...], ...] où visage['boite'] est défini
+
+    Returns:
+        list: pistes, chacune une liste de (index_image, visage)
+    """
+    resultat = []
+    for index, visages in enumerate(visages_par_image):
+        prises = set()
+        for visage in visages:
+            candidates = [
+                (iou(piste[-1][1]['boite'], visage['boite']), n)
+                for n, piste in enumerate(resultat)
+                if n not in prises and piste[-1][0] < index
+            ]
+            meilleure = max(candidates, default=(0.0, None))
+            if meilleure[1] is not None and meilleure[0] >= seuil_iou:
+                resultat[meilleure[1]].append((index, visage))
+                prises.add(meilleure[1])
+            else:
+                resultat.append([(index, visage)])
+                prises.add(len(resultat) - 1)
+    return resultat
+
+
+def meilleurs_par_personne(visages_par_image, nombre):
+    """
+    Garde les `nombre` meilleurs visages de chaque piste
+
+    Returns:
+        tuple: (visages retenus dans l'ordre des images, nombre de visages écartés)
+    """
+    retenus = []
+    ecartes = 0
+    for piste in pistes(visages_par_image):
+        classes = sorted(piste, key=lambda element: (-element[1]['score'], element[0]))
+        retenus.extend(classes[:nombre])
+        ecartes += max(0, len(piste) - nombre)
+    retenus.sort(key=lambda element: element[0])
+    return [visage for _, visage in retenus], ecartes
@@ -0,0 +1,206 @@
+"""
+Génération des rapports de présence (Excel et CSV)
+
+Le rapport d'un cours est une matrice étudiants × séances construite en
+parcourant directement les curseurs MongoDB : la mémoire utilisée dépend du
+nombre de séances (une ligne à la fois), pas du nombre d'étudiants.
+"""
+import csv
+import glob
+import hashlib
+import json
+import logging
+import os
+
+import config
+from metriques import enregistrer_acces_cache
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('xlsx', 'csv')
+TAILLE_LOT_CSV = 1000
+
+
+class GenerateurRapports:
+    """Construit et met en cache les rapports de présence dans RAPPORTS_DIR"""
+
+    def __init__(self, db, dossier=None):
+        """
+        Args:
+            db: Instance de DatabaseManager
+            dossier: Dossier des rapports (par défaut: config.RAPPORTS_DIR)
+        """
+        self.db = db
+        self.dossier = dossier or config.RAPPORTS_DIR
+        os.makedirs(self.dossier, exist_ok=True)
+
+    # ==================== CACHE ====================
+
+    def _filigrane(self, filtre):
+        """
+        Identifie l'état des données couvertes par un rapport
+
+        Toute nouvelle séance, suppression de séance ou inscription
+        d'étudiant change le filigrane et invalide le rapport en cache.
+        """
+        derniere_seance = self.db.seances.find_one(filtre, {"_id": 1}, sort=[("_id", -1)])
+        dernier_etudiant = self.db.etudiants.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        return [
+            str(derniere_seance["_id"]) if derniere_seance else None,
+            self.db.seances.count_documents(filtre),
+            str(dernier_etudiant["_id"]) if dernier_etudiant else None,
+            self.db.etudiants.count_documents({"actif": True})
+        ]
+
+    @staticmethod
+    def _empreinte(valeur):
+        """Hash court et stable d'une valeur sérialisable en JSON"""
+        brut = json.dumps(valeur, sort_keys=True, default=str).encode()
+        return hashlib.sha256(brut).hexdigest()[:16]
+
+    # ==================== GÉNÉRATION ====================
+
+    def generer(self, code_cours, date_debut=None, date_fin=None, format_rapport='xlsx'):
+        """
+        Génère (ou récupère du cache) le rapport de présence d'un cours
+
+        Args:
+            code_cours: Code du cours
+            date_debut: Date de début incluse (datetime) ou None
+            date_fin: Date de fin incluse (datetime) ou None
+            format_rapport: 'xlsx' ou 'csv'
+
+        Returns:
+            str: Chemin du fichier généré, ou None si le cours est introuvable
+
+        Raises:
+            ValueError: Si le format n'est pas supporté
+        """
+        if format_rapport not in FORMATS:
+            raise ValueError(f"Format non supporté: {format_rapport}")
+
+        cours = self.db.obtenir_cours(code_cours)
+        if not cours:
+            return None
+
+        filtre = {"cours_id": cours["_id"]}
+        if date_debut or date_fin:
+            filtre["date"] = {}
+            if date_debut:
+                filtre["date"]["$gte"] = date_debut
+            if date_fin:
+                filtre["date"]["$lte"] = date_fin
+
+        requete = self._empreinte([code_cours, date_debut, date_fin, format_rapport])
+        filigrane = self._empreinte(self._filigrane(filtre))
+        prefixe = os.path.join(self.dossier, f"presences_{code_cours}_{requete}_")
+        chemin = f"{prefixe}{filigrane}.{format_rapport}"
+
+        en_cache = os.path.exists(chemin)
+        enregistrer_acces_cache('rapports', en_cache)
+        if en_cache:
+            logger.info(f"📄 Rapport en cache: {chemin}")
+            return chemin
+
+        entete, lignes = self._matrice(filtre)
+        temporaire = f"{chemin}.tmp"
+        if format_rapport == 'xlsx':
+            self._ecrire_xlsx(temporaire, cours, entete, lignes)
+        else:
+            self._ecrire_csv(temporaire, entete, lignes)
+        os.replace(temporaire, chemin)
+
+        # Supprimer les versions périmées du même rapport
+        for ancien in glob.glob(f"{glob.escape(prefixe)}*.{format_rapport}"):
+            if ancien != chemin:
+                os.remove(ancien)
+
+        logger.info(f"📄 Rapport généré: {chemin}")
+        return chemin
+
+    def _matrice(self, filtre):
+        """
+        Prépare l'en-tête et un itérateur sur les lignes de la matrice
+
+        Les étudiants (triés par numéro) et les présences dépliées depuis les
+        séances (triées par numéro) sont fusionnés au fil des deux curseurs.
+        """
+        seances = list(self.db.seances.find(filtre, {"date": 1}).sort("date", 1))
+        colonnes = {s["_id"]: i for i, s in enumerate(seances)}
+
+        entete = ["Numéro", "Nom", "Prénom"]
+        entete += [s["date"].strftime('%d/%m/%Y %H:%M') for s in seances]
+        entete += ["Total présences", "Taux (%)"]
+
+        etudiants = self.db.etudiants.find(
+            {"actif": True},
+            {"numero_etudiant": 1, "nom": 1, "prenom": 1}
+        ).sort("numero_etudiant", 1)
+
+        presences = self.db.seances.aggregate([
+            {"$match": filtre},
+            {"$project": {"presents.etudiant_numero": 1}},
+            {"$unwind": "$presents"},
+            {"$project": {"_id": 0, "numero": "$presents.etudiant_numero", "seance": "$_id"}},
+            {"$sort": {"numero": 1}}
+        ], allowDiskUse=True)
+
+        return entete, self._fusionner(etudiants, presences, colonnes)
+
+    @staticmethod
+    def _fusionner(etudiants, presences, colonnes):
+        """Fusionne deux curseurs triés par numéro en lignes de la matrice"""
+        nb_seances = len(colonnes)
+        etudiant = next(etudiants, None)
+        presence = next(presences, None)
+
+        while etudiant is not None or presence is not None:
+            # Numéro de la prochaine ligne (le plus petit des deux curseurs)
+            candidats = []
+            if etudiant is not None:
+                candidats.append(etudiant["numero_etudiant"])
+            if presence is not None:
+                candidats.append(presence["numero"])
+            numero = min(candidats)
+
+            nom, prenom = "", ""
+            if etudiant is not None and etudiant["numero_etudiant"] == numero:
+                nom, prenom = etudiant.get("nom", ""), etudiant.get("prenom", "")
+                etudiant = next(etudiants, None)
+
+            cases = ["A"] * nb_seances
+            while presence is not None and presence["numero"] == numero:
+                cases[colonnes[presence["seance"]]] = "P"
+                presence = next(presences, None)
+
+            total = cases.count("P")
+            taux = round(100 * total / nb_seances, 1) if nb_seances else 0
+            yield [numero, nom, prenom, *cases, total, taux]
+
+    @staticmethod
+    def _ecrire_xlsx(chemin, cours, entete, lignes):
+        """Écrit le rapport en mode write-only (lignes envoyées au fil de l'eau)"""
+        from openpyxl import Workbook  # import différé: inutile pour le CSV et au démarrage
+
+        classeur = Workbook(write_only=True)
+        feuille = classeur.create_sheet(title=cours["code_cours"][:31])
+        feuille.append(entete)
+        for ligne in lignes:
+            feuille.append(ligne)
+        # openpyxl déduit le format du suffixe: écrire via un objet fichier
+        with open(chemin, 'wb') as f:
+            classeur.save(f)
+
+    @staticmethod
+    def _ecrire_csv(chemin, entete, lignes):
+        """Écrit le rapport CSV par lots de lignes"""
+        with open(chemin, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(entete)
+            lot = []
+            for ligne in lignes:
+                lot.append(ligne)
+                if len(lot) >= TAILLE_LOT_CSV:
+                    writer.writerows(lot)
+                    lot = []
+            writer.writerows(lot)
@@ -0,0 +1,770 @@
+"""
+Analyse de reconnaissance faciale (vidéos et images)
+
+Fonctions CPU-bound partagées par l'API Flask et l'API asynchrone.
+"""
+import io
+import os
+import logging
+import queue
+import threading
+import time
+
+import cv2
+import dlib
+import face_recognition
+import numpy as np
+
+import config
+import qualite
+from cache_empreintes import empreinte, empreinte_exacte, CACHE_FRAMES, CACHE_VISAGES
+from detecteurs import obtenir_detecteur
+from ordonnanceur import obtenir_ordonnanceur, repartir_threads, VerrouPrioritaire
+from profilage import propager
+from service_appariement import obtenir_client, AppariementIndisponible
+from metriques import (
+    mesurer, FRAMES_ANALYSEES, VISAGES_DETECTES, CORRESPONDANCES, VISAGES_INCONNUS, ENCODAGE_LOT,
+    APPARIEMENT_REPLIS, FRAMES_EN_COURS, VIDEO_FILE_FRAMES, VIDEO_ATTENTE, VISAGES_IGNORES, VIGNETTES_CLIENT
+)
+
+logger = logging.getLogger(__name__)
+
+# Tolérance stricte (plus bas = plus strict)
+TOLERANCE_STRICTE = 0.5
+
+
+def _nouveau_resultat():
+    """Structure commune des résultats d'analyse"""
+    return {
+        'detections': {},      # {id: nombre_detections}
+        'distances_min': {},   # {id: meilleure distance}
+        'visages_inconnus': 0,
+        'visages_ignores': {},  # {raison: nombre} (contrôle qualité, voir qualite.py)
+        'frames_analysees': 0
+    }
+
+
+def _fusionner(resultat, partiel):
+    """Ajoute les votes d'un résultat partiel (une frame) au résultat global"""
+    detections = resultat['detections']
+    for etudiant_id, nombre in partiel['detections'].items():
+        detections[etudiant_id] = detections.get(etudiant_id, 0) + nombre
+    for etudiant_id, distance in partiel['distances_min'].items():
+        resultat['distances_min'][etudiant_id] = min(
+            distance, resultat['distances_min'].get(etudiant_id, 1.0)
+        )
+    resultat['visages_inconnus'] += partiel['visages_inconnus']
+    for raison, nombre in partiel['visages_ignores'].items():
+        resultat['visages_ignores'][raison] = resultat['visages_ignores'].get(raison, 0) + nombre
+    resultat['frames_analysees'] += partiel['frames_analysees']
+
+
+# Le réseau de descripteurs dlib n'est pas thread-safe ; il garde de toute
+# façon le GIL pendant le calcul, le verrou ne coûte donc aucun parallélisme
+# (détection HOG et repères, eux, libèrent le GIL). Les demandes
+# interactives passent devant les lots vidéo en attente.
+_verrou_encodeur = VerrouPrioritaire()
+
+
+def _ignorer(ignores, raison, nombre=1):
+    """Compte des visages écartés avant encodage"""
+    ignores[raison] = ignores.get(raison, 0) + nombre
+    VISAGES_IGNORES.inc(nombre, raison=raison)
+
+
+def _preparer_visages(image, face_locations, ignores):
+    """
+    Contrôle qualité puis vignettes alignées 150×150 des visages retenus
+    (même alignement que face_recognition.face_encodings)
+
+    Les repères 5 points servent à la fois au contrôle de pose et à
+    l'alignement : ils ne sont calculés qu'une fois par visage.
+
+    Args:
+        image: Image RGB
+        face_locations: Boîtes (haut, droite, bas, gauche) du détecteur
+        ignores: {raison: nombre}, complété avec les visages écartés
+
+    Returns:
+        list: [{'boite', 'score', 'vignette'}, ...] des visages retenus
+    """
+    retenus = []
+    reperes = dlib.full_object_detections()
+    for boite in face_locations:
+        raison, nettete, lacet = None, 0.0, 0.0
+        if config.QUALITE_ACTIVE:
+            raison, nettete = qualite.controler_boite(image, boite)
+        if raison is None:
+            haut, droite, bas, gauche = boite
+            points = face_recognition.api.pose_predictor_5_point(image, dlib.rectangle(gauche, haut, droite, bas))
+            if config.QUALITE_ACTIVE:
+                raison, lacet = qualite.controler_pose(points)
+        if raison is not None:
+            _ignorer(ignores, raison)
+            continue
+        reperes.append(points)
+        retenus.append({'boite': boite, 'score': qualite.score(boite, nettete, lacet)})
+
+    if retenus:
+        for visage, vignette in zip(retenus, dlib.get_face_chips(image, reperes, size=150, padding=0.25)):
+            visage['vignette'] = vignette
+    return retenus
+
+
+def _detecter(detecteur, image, cache=True):
+    """
+    Boîtes des visages d'une image, reprises du cache si une image quasi identique a été vue
+
+    cache=False pour les frames vidéo : avec une caméra fixe, deux frames
+    échantillonnées ont des empreintes quasi identiques alors que les
+    étudiants ont bougé, et elles évinceraient les entrées webcam/interactif.
+    """
+    if not cache or not config.CACHE_EMPREINTES_ACTIF:
+        with mesurer('detection'):
+            return detecteur.detecter(image)
+
+    cle = empreinte(image)
+    contexte = (detecteur.nom or id(detecteur), image.shape)
+    face_locations = CACHE_FRAMES.chercher(cle, contexte)
+    if face_locations is None:
+        with mesurer('detection'):
+            face_locations = detecteur.detecter(image)
+        CACHE_FRAMES.ajouter(cle, face_locations, contexte)
+    return face_locations
+
+
+def _descripteurs(vignettes, priorite='lot'):
+    """
+    Descripteurs 128-d d'un lot de vignettes
+
+    Les vignettes identiques à une vignette récente reprennent son
+    descripteur ; les autres sont calculées en un seul appel dlib.
+
+    Args:
+        priorite: Priorité d'accès au réseau de descripteurs ('interactif' ou 'lot')
+    """
+    cles = [None] * len(vignettes)
+    descripteurs = [None] * len(vignettes)
+    if config.CACHE_EMPREINTES_ACTIF:
+        cles = [empreinte_exacte(vignette) for vignette in vignettes]
+        descripteurs = [CACHE_VISAGES.chercher(cle) for cle in cles]
+
+    a_calculer = [i for i, descripteur in enumerate(descripteurs) if descripteur is None]
+    if a_calculer:
+        with _verrou_encodeur.prendre(priorite):
+            calcules = face_recognition.api.face_encoder.compute_face_descriptor(
+                [vignettes[i] for i in a_calculer]
+            )
+        ENCODAGE_LOT.observe(len(a_calculer))
+        for i, descripteur in zip(a_calculer, calcules):
+            descripteurs[i] = np.array(descripteur)
+            if config.CACHE_EMPREINTES_ACTIF:
+                CACHE_VISAGES.ajouter(cles[i], descripteurs[i])
+    return descripteurs
+
+
+def _meilleurs(face_mgr, face_encodings):
+    """
+    Meilleure correspondance de chaque encodage
+
+    Avec config.APPARIEMENT_ADRESSE, le lot est envoyé au service
+    d'appariement partitionné ; sinon, ou si le service ne répond pas, il
+    est comparé à la galerie locale.
+
+    Returns:
+        list: [(etudiant_id, distance) ou (None, None), ...]
+
+    Raises:
+        AppariementIndisponible: service en échec et galerie locale vide
+            (tous les visages passeraient pour inconnus)
+    """
+    try:
+        client = obtenir_client()
+        if client is not None:
+            with mesurer('appariement'):
+                return [top[0] if top else (None, None) for top in client.apparier(face_encodings, k=1)]
+    except Exception as e:
+        APPARIEMENT_REPLIS.inc()
+        if len(face_mgr.known_encodings) == 0:
+            raise AppariementIndisponible(f"Service d'appariement indisponible ({e}), galerie locale vide") from e
+        logger.warning(f"⚠️ Service d'appariement indisponible ({e}) : appariement local")
+
+    meilleurs = []
+    for encoding in face_encodings:
+        if len(face_mgr.known_encodings) == 0:
+            meilleurs.append((None, None))
+            continue
+
+        with mesurer('appariement'):
+            # Calculer les distances avec TOUS les encodages
+            face_distances = face_recognition.face_distance(face_mgr.known_encodings, encoding)
+
+            # Trouver le meilleur match
+            best_match_index = np.argmin(face_distances)
+            meilleurs.append((face_mgr.known_ids[best_match_index], float(face_distances[best_match_index])))
+    return meilleurs
+
+
+def _apparier(face_mgr, face_encodings, resultat, tolerance):
+    """Compare des encodages avec les encodages connus et compte les votes"""
+    if len(face_encodings) == 0:
+        return
+    for etudiant_id, best_distance in _meilleurs(face_mgr, face_encodings):
+        if best_distance is not None and best_distance < tolerance:
+            CORRESPONDANCES.inc()
+            detections = resultat['detections']
+
+            if etudiant_id not in detections:
+                logger.info(f" Étudiant détecté: {etudiant_id} (distance: {best_distance:.3f})")
+            detections[etudiant_id] = detections.get(etudiant_id, 0) + 1
+            resultat['distances_min'][etudiant_id] = min(
+                best_distance, resultat['distances_min'].get(etudiant_id, 1.0)
+            )
+        else:
+            resultat['visages_inconnus'] += 1
+            VISAGES_INCONNUS.inc()
+
+
+class EncodeurParLots:
+    """
+    Encode les visages par lots plutôt qu'image par image
+
+    Pour chaque image, seuls les repères (5 points) et la vignette alignée
+    150×150 du visage sont calculés ; les descripteurs 128-d sont ensuite
+    calculés en un seul appel dlib par lot, puis appariés. Un lot est vidé
+    quand il atteint `taille_lot` visages ou quand son plus ancien visage
+    attend depuis `delai_max` secondes.
+    """
+
+    def __init__(self, face_mgr, resultat, tolerance, taille_lot=None, delai_max=None, priorite='lot'):
+        self.face_mgr = face_mgr
+        self.resultat = resultat
+        self.tolerance = tolerance
+        self.priorite = priorite
+        self.taille_lot = taille_lot or config.ENCODAGE_TAILLE_LOT
+        self.delai_max = delai_max if delai_max is not None else config.ENCODAGE_DELAI_MAX
+        self._vignettes = []
+        self._debut_lot = None
+
+    def ajouter(self, image, face_locations):
+        """Contrôle et prépare les visages d'une image RGB et vide le lot si nécessaire"""
+        with mesurer('reperes'):
+            visages = _preparer_visages(image, face_locations, self.resultat['visages_ignores'])
+        self.ajouter_vignettes([visage['vignette'] for visage in visages])
+
+    def ajouter_vignettes(self, vignettes):
+        """Ajoute des vignettes déjà alignées et vide le lot si nécessaire"""
+        self._vignettes.extend(vignettes)
+        if self._debut_lot is None:
+            self._debut_lot = time.monotonic()
+
+        if (len(self._vignettes) >= self.taille_lot
+                or time.monotonic() - self._debut_lot >= self.delai_max):
+            self.vider()
+
+    def vider(self):
+        """Encode et apparie les visages en attente"""
+        while self._vignettes:
+            lot = self._vignettes[:self.taille_lot]
+            del self._vignettes[:self.taille_lot]
+            with mesurer('encodage'):
+                descripteurs = _descripteurs(lot, self.priorite)
+            _apparier(self.face_mgr, descripteurs, self.resultat, self.tolerance)
+        self._debut_lot = None
+
+
+# ==================== PIPELINE VIDÉO ====================
+# décodage (1 thread par vidéo) -> analyse de chaque frame retenue dans
+# l'ordonnanceur (priorité 'lot', détection + vignettes) -> fusion (thread
+# appelant : encodage par lots et appariement, dans l'ordre des frames).
+# Le décodeur attend quand `_capacite_file` frames sont en vol : il ne
+# prend jamais plus d'avance que le plafond mémoire des frames en attente.
+
+_FIN = object()
+
+
+def _deposer(file, element, arret, etape):
+    """
+    Dépose dans une file bornée ; l'attente (file pleine) est comptée pour l'étage
+
+    Returns:
+        bool: False si le pipeline a été arrêté avant le dépôt
+    """
+    debut = time.perf_counter()
+    try:
+        while not arret.is_set():
+            try:
+                file.put(element, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    finally:
+        VIDEO_ATTENTE.inc(time.perf_counter() - debut, etape=etape)
+
+
+def _prendre(file, arret, etape):
+    """Prend dans une file ; retourne _FIN si le pipeline est arrêté"""
+    debut = time.perf_counter()
+    try:
+        while not arret.is_set():
+            try:
+                return file.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _FIN
+    finally:
+        VIDEO_ATTENTE.inc(time.perf_counter() - debut, etape=etape)
+
+
+def _capacite_file(video_capture):
+    """Nombre de frames en attente autorisé par config.VIDEO_MEMOIRE_MAX_MO"""
+    largeur = int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)) or 1920
+    hauteur = int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)) or 1080
+    plafond = config.VIDEO_MEMOIRE_MAX_MO * 1024 * 1024 // (largeur * hauteur * 3)
+    return max(1, min(config.VIDEO_FILE_MAX, plafond))
+
+
+def _analyser_frame_video(rgb_frame, index, detecteur):
+    """Tâche de l'ordonnanceur : détecte et contrôle les visages d'une frame vidéo"""
+    VIDEO_FILE_FRAMES.dec()
+    vignettes_frame = []
+    ignores = {}
+    try:
+        face_locations = _detecter(detecteur, rgb_frame, cache=False)
+        if face_locations:
+            VISAGES_DETECTES.inc(len(face_locations))
+            with mesurer('reperes'):
+                visages = _preparer_visages(rgb_frame, face_locations, ignores)
+            vignettes_frame = [visage['vignette'] for visage in visages]
+    except Exception as e:
+        logger.warning(f"Erreur analyse frame vidéo {index}: {e}")
+    return vignettes_frame, ignores
+
+
+def _etage_decodage(video_capture, pas_frames, en_vol, arret, ordonnanceur, session, detecteur):
+    """Décode la vidéo et soumet l'analyse d'1 frame sur `pas_frames` à l'ordonnanceur"""
+    try:
+        index = 0
+        frame_count = 0
+        while not arret.is_set():
+            # Les frames ignorées sont seulement avancées (grab), pas converties
+            frame_count += 1
+            with mesurer('decodage'):
+                if frame_count % pas_frames != 0:
+                    if not video_capture.grab():
+                        break
+                    continue
+                ret, frame = video_capture.read()
+                if not ret:
+                    break
+                # Convertir BGR (OpenCV) en RGB (face_recognition)
+                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            VIDEO_FILE_FRAMES.inc()
+            future = ordonnanceur.soumettre(session, 'lot', _analyser_frame_video, rgb_frame, index, detecteur)
+            if not _deposer(en_vol, future, arret, 'decodage'):
+                if future.cancel():
+                    VIDEO_FILE_FRAMES.dec()
+                break
+            index += 1
+    except Exception as e:
+        logger.error(f" Erreur décodage vidéo: {e}")
+    finally:
+        video_capture.release()
+        _deposer(en_vol, _FIN, arret, 'decodage')
+
+
+def duree_video(video_path):
+    """
+    Durée d'une vidéo en secondes, lue dans l'en-tête du conteneur (sans décoder)
+
+    Returns:
+        float ou None si le conteneur n'indique pas la durée
+    """
+    video_capture = cv2.VideoCapture(video_path)
+    try:
+        if not video_capture.isOpened():
+            return None
+        frames = video_capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        fps = video_capture.get(cv2.CAP_PROP_FPS)
+        if frames <= 0 or fps <= 0:
+            return None
+        return frames / fps
+    finally:
+        video_capture.release()
+
+
+def analyser_video(video_path, face_mgr, pas_frames=10, tolerance=TOLERANCE_STRICTE, detecteur=None,
+                   session=None):
+    """
+    Analyse une vidéo et compte les détections par étudiant
+
+    Le décodage se fait dans un thread dédié, en parallèle de la détection
+    (tâches 'lot' de l'ordonnanceur, partagé avec les autres séances) et de
+    l'encodage.
+
+    Args:
+        video_path: Chemin du fichier vidéo
+        face_mgr: Instance de FaceRecognitionManager
+        pas_frames: Analyser 1 frame sur `pas_frames`
+        tolerance: Distance maximale pour valider une correspondance
+        detecteur: Nom du détecteur de visages (par défaut: config.DETECTEUR)
+        session: Séance pour le tour de rôle de l'ordonnanceur (code du cours)
+
+    Returns:
+        dict: detections, distances_min, visages_inconnus, visages_ignores, frames_analysees
+    """
+    resultat = _nouveau_resultat()
+    detecteur = obtenir_detecteur(detecteur)
+    encodeur = EncodeurParLots(face_mgr, resultat, tolerance)
+    arret = threading.Event()
+    decodeur = None
+
+    try:
+        video_capture = cv2.VideoCapture(video_path)
+        if not video_capture.isOpened():
+            raise ValueError(f"Vidéo illisible: {video_path}")
+
+        en_vol = queue.Queue(maxsize=_capacite_file(video_capture))
+        decodeur = threading.Thread(
+            target=propager(_etage_decodage),
+            args=(video_capture, pas_frames, en_vol, arret, obtenir_ordonnanceur(), session, detecteur),
+            name='video-decodage', daemon=True
+        )
+        decodeur.start()
+
+        # Étage fusion : encodage par lots et votes, dans l'ordre des frames
+        while True:
+            future = _prendre(en_vol, arret, 'fusion')
+            if future is _FIN:
+                break
+            debut = time.perf_counter()
+            vignettes_frame, ignores = future.result()
+            VIDEO_ATTENTE.inc(time.perf_counter() - debut, etape='fusion')
+
+            resultat['frames_analysees'] += 1
+            FRAMES_ANALYSEES.inc()
+            for raison, nombre in ignores.items():
+                resultat['visages_ignores'][raison] = resultat['visages_ignores'].get(raison, 0) + nombre
+            if vignettes_frame:
+                encodeur.ajouter_vignettes(vignettes_frame)
+
+        encodeur.vider()
+
+    except AppariementIndisponible:
+        raise
+    except Exception as e:
+        logger.error(f" Erreur analyse vidéo: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        arret.set()
+        if decodeur is not None:
+            decodeur.join()
+            # Frames en vol abandonnées en cas d'arrêt anticipé
+            for future in list(en_vol.queue):
+                if future is not _FIN and future.cancel():
+                    VIDEO_FILE_FRAMES.dec()
+
+    return resultat
+
+
+def _preparer_image(contenu, idx, detecteur):
+    """
+    Décode une image, détecte et contrôle ses visages (sans encodage)
+
+    Returns:
+        tuple: (résultat partiel, visages retenus)
+    """
+    partiel = _nouveau_resultat()
+    visages = []
+    try:
+        with mesurer('decodage'):
+            image = face_recognition.load_image_file(io.BytesIO(contenu))
+        partiel['frames_analysees'] += 1
+        FRAMES_ANALYSEES.inc()
+
+        face_locations = _detecter(detecteur, image)
+
+        if face_locations:
+            logger.info(f"Frame {idx+1}: {len(face_locations)} visage(s) détecté(s)")
+            VISAGES_DETECTES.inc(len(face_locations))
+            with mesurer('reperes'):
+                visages = _preparer_visages(image, face_locations, partiel['visages_ignores'])
+        else:
+            logger.info(f"Frame {idx+1}: Aucun visage détecté")
+
+    except Exception as e:
+        logger.warning(f"Erreur analyse frame {idx+1}: {e}")
+    return partiel, visages
+
+
+def _encoder_meilleurs(visages_par_image, face_mgr, resultat, tolerance, priorite='interactif'):
+    """
+    Encode et apparie les visages d'un envoi multi-images
+
+    Les visages d'une même personne sur les images successives sont
+    regroupés ; seuls ses config.QUALITE_MEILLEURES_FRAMES meilleurs
+    visages sont encodés, les autres sont comptés en 'selection'.
+    """
+    if config.QUALITE_ACTIVE and config.QUALITE_MEILLEURES_FRAMES > 0:
+        visages, ecartes = qualite.meilleurs_par_personne(visages_par_image, config.QUALITE_MEILLEURES_FRAMES)
+        if ecartes:
+            _ignorer(resultat['visages_ignores'], 'selection', ecartes)
+    else:
+        visages = [visage for visages_image in visages_par_image for visage in visages_image]
+
+    try:
+        encodeur = EncodeurParLots(face_mgr, resultat, tolerance, priorite=priorite)
+        encodeur.ajouter_vignettes([visage['vignette'] for visage in visages])
+        encodeur.vider()
+    except AppariementIndisponible:
+        raise
+    except Exception as e:
+        logger.warning(f"Erreur encodage des visages: {e}")
+
+
+def analyser_images(images, face_mgr, tolerance=TOLERANCE_STRICTE, detecteur=None):
+    """
+    Analyse une liste d'images encodées (JPEG/PNG) et compte les détections
+
+    Args:
+        images: Liste de contenus d'images (bytes)
+        face_mgr: Instance de FaceRecognitionManager
+        tolerance: Distance maximale pour valider une correspondance
+        detecteur: Nom du détecteur de visages (par défaut: config.DETECTEUR)
+
+    Returns:
+        dict: detections, distances_min, visages_inconnus, visages_ignores, frames_analysees
+    """
+    resultat = _nouveau_resultat()
+    detecteur = obtenir_detecteur(detecteur)
+
+    visages_par_image = []
+    for idx, contenu in enumerate(images):
+        partiel, visages = _preparer_image(contenu, idx, detecteur)
+        _fusionner(resultat, partiel)
+        visages_par_image.append(visages)
+
+    _encoder_meilleurs(visages_par_image, face_mgr, resultat, tolerance)
+    return resultat
+
+
+# ==================== ANALYSE CONCURRENTE DES IMAGES ====================
+# Routes webcam et reconnaissance : les images d'une requête sont préparées
+# en parallèle par l'ordonnanceur partagé (priorité 'interactif'), puis
+# encodées par lots dans le thread de la requête.
+
+def _suivre(fonction, *args):
+    """Tâche de l'ordonnanceur comptée dans la jauge des images en cours"""
+    FRAMES_EN_COURS.inc()
+    try:
+        return fonction(*args)
+    finally:
+        FRAMES_EN_COURS.dec()
+
+
+def _preparer_en_parallele(fonction, taches, session):
+    """Soumet les tâches à l'ordonnanceur et retourne leurs résultats dans l'ordre"""
+    ordonnanceur = obtenir_ordonnanceur()
+    futures = [ordonnanceur.soumettre(session, 'interactif', _suivre, fonction, *args) for args in taches]
+    return [future.result() for future in futures]
+
+
+def analyser_images_concurrentes(images, face_mgr, tolerance=TOLERANCE_STRICTE, detecteur=None,
+                                 session=None):
+    """
+    Comme analyser_images(), mais les images sont analysées en parallèle
+
+    Les images passent par l'ordonnanceur, à tour de rôle avec celles des
+    autres séances. Les meilleurs visages sont ensuite encodés par lots
+    dans l'ordre des images : le résultat est identique à celui de
+    l'analyse séquentielle.
+
+    Args:
+        session: Séance pour le tour de rôle de l'ordonnanceur (code du cours)
+    """
+    detecteur = obtenir_detecteur(detecteur)
+    partiels = _preparer_en_parallele(
+        _preparer_image, [(contenu, idx, detecteur) for idx, contenu in enumerate(images)], session
+    )
+
+    resultat = _nouveau_resultat()
+    for partiel, _ in partiels:
+        _fusionner(resultat, partiel)
+    _encoder_meilleurs([visages for _, visages in partiels], face_mgr, resultat, tolerance)
+    return resultat
+
+
+# ==================== VIGNETTES RECADRÉES PAR LE CLIENT ====================
+# Le navigateur recadre l'image autour du visage (FaceDetector ou zone
+# centrale), la réduit et l'envoie avec la boîte du visage : le serveur ne
+# calcule plus que repères et descripteur. Sans boîte exploitable, la
+# détection est faite sur la vignette (petite, donc peu coûteuse).
+
+def _valider_boite(boite, forme):
+    """
+    Valide une boîte envoyée par le client
+
+    Returns:
+        tuple: (haut, droite, bas, gauche) entiers, ou None si absente ou hors de l'image
+    """
+    if boite is None:
+        return None
+    try:
+        haut, droite, bas, gauche = (int(round(float(v))) for v in boite)
+    except (TypeError, ValueError):
+        return None
+    hauteur, largeur = forme[:2]
+    if not (0 <= haut < bas <= hauteur and 0 <= gauche < droite <= largeur):
+        return None
+    return haut, droite, bas, gauche
+
+
+def _preparer_vignette_client(contenu, boite, idx, detecteur):
+    """
+    Prépare une vignette client : repères sur la boîte fournie, sinon détection
+
+    Returns:
+        tuple: (résultat partiel, visages retenus)
+    """
+    partiel = _nouveau_resultat()
+    visages = []
+    try:
+        with mesurer('decodage'):
+            image = face_recognition.load_image_file(io.BytesIO(contenu))
+        hauteur, largeur = image.shape[:2]
+        if max(hauteur, largeur) > config.VIGNETTES_CLIENT_TAILLE_MAX:
+            VIGNETTES_CLIENT.inc(resultat='rejetee')
+            logger.warning(f"Vignette {idx+1} trop grande ({largeur}x{hauteur}), ignorée")
+            return partiel, visages
+        partiel['frames_analysees'] += 1
+        FRAMES_ANALYSEES.inc()
+
+        boite = _valider_boite(boite, image.shape)
+        if boite is not None:
+            with mesurer('reperes'):
+                visages = _preparer_visages(image, [boite], {})
+        if visages:
+            VIGNETTES_CLIENT.inc(resultat='boite_client')
+            VISAGES_DETECTES.inc()
+            return partiel, visages
+
+        # Boîte absente, hors de l'image ou refusée par le contrôle qualité
+        VIGNETTES_CLIENT.inc(resultat='detection')
+        face_locations = _detecter(detecteur, image)
+        if face_locations:
+            VISAGES_DETECTES.inc(len(face_locations))
+            with mesurer('reperes'):
+                visages = _preparer_visages(image, face_locations, partiel['visages_ignores'])
+        else:
+            logger.info(f"Vignette {idx+1}: Aucun visage détecté")
+
+    except Exception as e:
+        logger.warning(f"Erreur analyse vignette {idx+1}: {e}")
+    return partiel, visages
+
+
+def analyser_vignettes_client(vignettes, boites, face_mgr, tolerance=TOLERANCE_STRICTE, detecteur=None,
+                              session=None):
+    """
+    Analyse des vignettes recadrées par le client
+
+    Args:
+        vignettes: Liste de contenus d'images (bytes), au plus
+            config.VIGNETTES_CLIENT_TAILLE_MAX pixels de côté
+        boites: Pour chaque vignette, la boîte (haut, droite, bas, gauche) du
+            visage dans la vignette, ou None
+        face_mgr: Instance de FaceRecognitionManager
+        tolerance: Distance maximale pour valider une correspondance
+        detecteur: Détecteur utilisé quand la boîte client est inexploitable
+        session: Séance pour le tour de rôle de l'ordonnanceur (code du cours)
+
+    Returns:
+        dict: detections, distances_min, visages_inconnus, visages_ignores, frames_analysees
+    """
+    detecteur = obtenir_detecteur(detecteur)
+    partiels = _preparer_en_parallele(
+        _preparer_vignette_client,
+        [(contenu, boite, idx, detecteur) for idx, (contenu, boite) in enumerate(zip(vignettes, boites))],
+        session
+    )
+
+    resultat = _nouveau_resultat()
+    for partiel, _ in partiels:
+        _fusionner(resultat, partiel)
+    _encoder_meilleurs([visages for _, visages in partiels], face_mgr, resultat, tolerance)
+    return resultat
+
+
+def valider_presents_video(detections):
+    """Ne garde que les étudiants détectés au moins 3 fois dans une vidéo"""
+    presents = [i for i, count in detections.items() if count >= 3]
+
+    # Si personne n'est détecté 3 fois mais qu'il y a des détections, prendre ceux détectés au moins 1 fois
+    if len(presents) == 0 and len(detections) > 0:
+        presents = list(detections.keys())
+    return presents
+
+
+def valider_presents_webcam(detections):
+    """Ne garde que les étudiants détectés au moins 2 fois (évite les faux positifs)"""
+    presents = [i for i, count in detections.items() if count >= 2]
+
+    # Si un étudiant n'est détecté qu'une fois mais qu'il n'y a qu'une personne, le garder
+    if len(presents) == 0 and len(detections) == 1:
+        presents = list(detections.keys())
+    return presents
+
+
+def confiances(resultat, presents):
+    """Confiance (1 - distance) des étudiants présents"""
+    return {i: round(1 - resultat['distances_min'][i], 3) for i in presents}
+
+
+# ==================== EXÉCUTION EN PROCESSUS SÉPARÉ ====================
+# Utilisé par l'API asynchrone : chaque processus du pool possède sa propre
+# galerie, rechargée quand le dossier des encodages change.
+
+_face_mgr_worker = None
+_version_galerie = None
+
+
+def _galerie_worker():
+    """Retourne la galerie du processus, rechargée si les encodages ont changé"""
+    global _face_mgr_worker, _version_galerie
+    from face_manager import FaceRecognitionManager
+
+    try:
+        version = os.stat(config.ENCODAGES_DIR).st_mtime_ns
+    except FileNotFoundError:
+        version = None
+
+    if _face_mgr_worker is None:
+        _face_mgr_worker = FaceRecognitionManager()
+    elif version != _version_galerie:
+        _face_mgr_worker.charger_encodages()
+    _version_galerie = version
+    return _face_mgr_worker
+
+
+def initialiser_worker(processus=1):
+    """Initialiseur du pool de processus : partage les cœurs entre les `processus` et charge la galerie une fois"""
+    repartir_threads(processus)
+    _galerie_worker()
+
+
+def analyser_video_worker(video_path, detecteur=None, session=None, pas_frames=10, tolerance=TOLERANCE_STRICTE):
+    """analyser_video() avec la galerie du processus courant"""
+    return analyser_video(video_path, _galerie_worker(), pas_frames=pas_frames, tolerance=tolerance,
+                          detecteur=detecteur, session=session)
+
+
+def analyser_images_worker(images, detecteur=None):
+    """analyser_images() avec la galerie du processus courant"""
+    return analyser_images(images, _galerie_worker(), detecteur=detecteur)
+
+
+def analyser_vignettes_client_worker(vignettes, boites, detecteur=None):
+    """analyser_vignettes_client() avec la galerie du processus courant"""
+    return analyser_vignettes_client(vignettes, boites, _galerie_worker(), detecteur=detecteur)
@@ -0,0 +1,389 @@
+"""
+Retraitement par lots des vidéos de cours archivées
+
+Recalcule les présences des séances passées après un changement de
+tolérance, de détecteur ou de galerie (inscriptions tardives...), sans
+renvoyer chaque vidéo à POST /api/presences/video.
+
+Chaque vidéo du dossier est associée à un cours et à la date de sa séance,
+soit par un manifeste CSV (colonnes fichier, code_cours, date au format
+ISO), soit par son nom : <CODE_COURS>_<AAAA-MM-JJ>[_HHMM].<ext>
+
+  - les vidéos sont analysées en parallèle, un processus par cœur
+    (RETRAITEMENT_PROCESSUS), chacun avec sa galerie et sa part des cœurs
+    pour son ordonnanceur (un thread quand ils les occupent tous) ;
+  - le résultat de chaque vidéo est gardé dans un point de reprise dès
+    qu'elle est terminée (RETRAITEMENT_DIR) : une exécution interrompue
+    reprend où elle s'était arrêtée. Un point de reprise n'est valable que
+    pour la même vidéo (taille, date de modification), les mêmes paramètres
+    et la même version de la galerie ;
+  - une séance recalculée est identifiée par sa vidéo, quels que soient
+    les paramètres : DatabaseManager.remplacer_seances remplace ses
+    présents (et reprend à la première écriture la séance de la route
+    vidéo du même jour) au lieu d'en ajouter une autre. Relancer un
+    retraitement ne crée ni présence ni séance en double, et les séances
+    webcam ou interactives ne sont jamais modifiées ;
+  - le rapport compare chaque séance recalculée aux présences déjà
+    enregistrées ce jour-là. Les présences existantes sont conservées, les
+    étudiants que le retraitement ne retrouve pas sont seulement signalés
+    (--retirer les supprime, sauf s'ils figurent dans une autre séance du
+    jour).
+
+Usage:
+    python retraitement.py /archives/videos
+    python retraitement.py /archives/videos --manifeste seances.csv --tolerance 0.45
+    python retraitement.py /archives/videos --simulation --rapport ecarts.json
+    python retraitement.py /archives/videos --retirer
+"""
+import csv
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+
+logger = logging.getLogger(__name__)
+
+FORMATS_VIDEO = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+_NOM_VIDEO = re.compile(r'^(?P<code>.+)_(?P<jour>\d{4}-\d{2}-\d{2})(?:_(?P<heure>\d{4}))?$')
+
+SOURCE = 'retraitement'
+
+
+def lister_videos(dossier, manifeste=None):
+    """
+    Vidéos à retraiter, avec leur cours et la date de la séance
+
+    Args:
+        dossier: Dossier des vidéos archivées
+        manifeste: CSV optionnel (fichier, code_cours, date) ; sinon le nom des fichiers
+
+    Returns:
+        list: [{'chemin', 'code_cours', 'date'}, ...]
+
+    Raises:
+        ValueError: ligne du manifeste invalide
+    """
+    videos = []
+    if manifeste:
+        with open(manifeste, newline='', encoding='utf-8') as f:
+            for numero, ligne in enumerate(csv.DictReader(f), start=2):
+                try:
+                    videos.append({
+                        'chemin': os.path.join(dossier, ligne['fichier'].strip()),
+                        'code_cours': ligne['code_cours'].strip(),
+                        'date': datetime.fromisoformat(ligne['date'].strip())
+                    })
+                except (KeyError, AttributeError, ValueError) as e:
+                    raise ValueError(f"Manifeste, ligne {numero} invalide: {e}")
+        return videos
+
+    for nom in sorted(os.listdir(dossier)):
+        base, extension = os.path.splitext(nom)
+        if extension.lower() not in FORMATS_VIDEO:
+            continue
+        correspondance = _NOM_VIDEO.match(base)
+        if not correspondance:
+            logger.warning(f"⚠️ Vidéo ignorée (ni cours ni date dans le nom): {nom}")
+            continue
+        videos.append({
+            'chemin': os.path.join(dossier, nom),
+            'code_cours': correspondance['code'],
+            'date': datetime.strptime(
+                correspondance['jour'] + (correspondance['heure'] or '0000'), '%Y-%m-%d%H%M'
+            )
+        })
+    return videos
+
+
+def signature(parametres):
+    """Empreinte des paramètres d'analyse et de la version de la galerie"""
+    try:
+        version_galerie = os.stat(config.ENCODAGES_DIR).st_mtime_ns
+    except FileNotFoundError:
+        version_galerie = None
+    contenu = json.dumps({**parametres, 'galerie': version_galerie}, sort_keys=True)
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()[:16]
+
+
+def cle_video(video, signature_parametres):
+    """Clé du point de reprise d'une vidéo (change si la vidéo ou les paramètres changent)"""
+    etat = os.stat(video['chemin'])
+    contenu = '|'.join([
+        os.path.abspath(video['chemin']), str(etat.st_size), str(etat.st_mtime_ns),
+        video['code_cours'], video['date'].isoformat(), signature_parametres
+    ])
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()[:32]
+
+
+class PointsReprise:
+    """Résultats des vidéos déjà traitées, un fichier JSON par vidéo"""
+
+    def __init__(self, dossier=None):
+        self.dossier = dossier or config.RETRAITEMENT_DIR
+
+    def chemin(self, cle):
+        return os.path.join(self.dossier, f"{cle}.json")
+
+    def lire(self, cle):
+        """Point de reprise d'une vidéo, ou None si elle reste à traiter"""
+        try:
+            with open(self.chemin(cle), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning(f"⚠️ Point de reprise illisible, vidéo retraitée: {cle}")
+            return None
+
+    def ecrire(self, cle, contenu):
+        """Écriture atomique : un point de reprise est complet ou absent"""
+        os.makedirs(self.dossier, exist_ok=True)
+        temporaire = f"{self.chemin(cle)}.{os.getpid()}.tmp"
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump(contenu, f, ensure_ascii=False, indent=2)
+        os.replace(temporaire, self.chemin(cle))
+
+
+# ==================== PROCESSUS D'ANALYSE ====================
+
+def _initialiser_processus(processus):
+    """Partage les cœurs entre les `processus` du pool : ils en occupent déjà la plupart"""
+    import reconnaissance
+    reconnaissance.initialiser_worker(processus)
+
+
+def _analyser(chemin, code_cours, parametres):
+    """Analyse une vidéo dans un processus du pool et valide les présents"""
+    import reconnaissance
+
+    debut = time.perf_counter()
+    resultat = reconnaissance.analyser_video_worker(
+        chemin, detecteur=parametres['detecteur'], session=code_cours,
+        pas_frames=parametres['pas_frames'], tolerance=parametres['tolerance']
+    )
+    if resultat['frames_analysees'] == 0:
+        raise ValueError(f"Aucune frame analysée (vidéo illisible ?): {chemin}")
+    presents = reconnaissance.valider_presents_video(resultat['detections'])
+    return {
+        'presents': sorted(presents),
+        'confiances': reconnaissance.confiances(resultat, presents),
+        'frames_analysees': resultat['frames_analysees'],
+        'visages_inconnus': resultat['visages_inconnus'],
+        'duree_s': round(time.perf_counter() - debut, 1)
+    }
+
+
+def analyser_videos(videos, points, parametres, processus=None, progression=None):
+    """
+    Analyse les vidéos qui n'ont pas encore de point de reprise
+
+    Args:
+        videos: Vidéos de lister_videos, avec leur clé ('cle')
+        points: Instance de PointsReprise
+        parametres: {'tolerance', 'detecteur', 'pas_frames'}
+        processus: Taille du pool (par défaut RETRAITEMENT_PROCESSUS)
+        progression: Fonction appelée (video, point ou None, erreur ou None) après chaque vidéo
+
+    Returns:
+        dict: {chemin: message d'erreur} des vidéos en échec (à retraiter au prochain lancement)
+    """
+    a_faire = [v for v in videos if points.lire(v['cle']) is None]
+    echecs = {}
+    if not a_faire:
+        return echecs
+
+    processus = min(processus or config.RETRAITEMENT_PROCESSUS, len(a_faire))
+    executeur = ProcessPoolExecutor(
+        max_workers=processus,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_initialiser_processus,
+        initargs=(processus,)
+    )
+    try:
+        # Les plus longues d'abord : la dernière vidéo ne finit pas seule sur un cœur
+        a_faire.sort(key=lambda v: os.path.getsize(v['chemin']), reverse=True)
+        futures = {
+            executeur.submit(_analyser, v['chemin'], v['code_cours'], parametres): v
+            for v in a_faire
+        }
+        for future in as_completed(futures):
+            video = futures[future]
+            try:
+                point = {
+                    'fichier': os.path.basename(video['chemin']),
+                    'code_cours': video['code_cours'],
+                    'date': video['date'].isoformat(),
+                    'parametres': parametres,
+                    **future.result()
+                }
+            except Exception as e:
+                logger.error(f"❌ Retraitement impossible: {video['chemin']} ({e})")
+                echecs[video['chemin']] = str(e)
+                if progression:
+                    progression(video, None, e)
+                continue
+            points.ecrire(video['cle'], point)
+            if progression:
+                progression(video, point, None)
+    except KeyboardInterrupt:
+        # Les vidéos terminées ont leur point de reprise ; les autres seront reprises
+        executeur.shutdown(wait=False, cancel_futures=True)
+        raise
+    executeur.shutdown(wait=True)
+    return echecs
+
+
+def appliquer(videos, points, db, simulation=False, retirer=False):
+    """
+    Compare les séances recalculées aux présences enregistrées, puis les écrit
+
+    Les écarts sont calculés avant l'écriture et gardés dans le point de
+    reprise : une vidéo déjà écrite n'est ni réécrite ni recomparée.
+
+    Args:
+        retirer: Supprimer les présences des étudiants non retrouvés (voir remplacer_seances)
+
+    Returns:
+        list: Écarts par séance ({'fichier', 'code_cours', 'date', 'presents',
+              'ajoutes', 'non_retrouves', 'ecrit'}), dans l'ordre des vidéos
+    """
+    traitees, a_ecrire = [], []
+    for video in videos:
+        point = points.lire(video['cle'])
+        if point is None:
+            continue
+        if not point.get('ecrit'):
+            enregistres = db.numeros_presents(video['code_cours'], video['date'])
+            recalcules = set(point['presents'])
+            point['ajoutes'] = sorted(recalcules - enregistres)
+            point['non_retrouves'] = sorted(enregistres - recalcules)
+            if not simulation:
+                a_ecrire.append((video, point))
+        traitees.append(point)
+
+    for debut in range(0, len(a_ecrire), config.JOURNAL_TAILLE_LOT):
+        lot = a_ecrire[debut:debut + config.JOURNAL_TAILLE_LOT]
+        rejetees = set(db.remplacer_seances([
+            {
+                'id': f"{SOURCE}-{video['cle']}",
+                'video': os.path.abspath(video['chemin']),
+                'code_cours': video['code_cours'],
+                'etudiants': point['presents'],
+                'date': video['date'],
+                'source': SOURCE,
+                'confiances': point['confiances'],
+                'non_retrouves': point['non_retrouves']
+            }
+            for video, point in lot
+        ], retirer=retirer))
+        for video, point in lot:
+            if f"{SOURCE}-{video['cle']}" in rejetees:
+                logger.error(f"❌ Cours introuvable, séance non écrite: {video['code_cours']}")
+                continue
+            point['ecrit'] = True
+            points.ecrire(video['cle'], point)
+
+    return [
+        {
+            'fichier': point['fichier'],
+            'code_cours': point['code_cours'],
+            'date': point['date'],
+            'presents': len(point['presents']),
+            'ajoutes': point['ajoutes'],
+            'non_retrouves': point['non_retrouves'],
+            'ecrit': point.get('ecrit', False)
+        }
+        for point in traitees
+    ]
+
+
+if __name__ == '__main__':
+    import click
+
+    @click.command()
+    @click.argument('dossier', type=click.Path(exists=True, file_okay=False))
+    @click.option('--manifeste', type=click.Path(exists=True, dir_okay=False), default=None,
+                  help='CSV fichier,code_cours,date (sinon <CODE>_<AAAA-MM-JJ>[_HHMM].mp4)')
+    @click.option('--tolerance', type=float, default=None, help='Distance maximale (défaut: celle de l\'API)')
+    @click.option('--detecteur', default=None, help='Détecteur de visages (défaut: DETECTEUR_VIDEO)')
+    @click.option('--pas-frames', type=int, default=10, show_default=True, help='Analyser 1 frame sur N')
+    @click.option('--processus', type=int, default=None, help='Taille du pool (défaut: RETRAITEMENT_PROCESSUS)')
+    @click.option('--points', type=click.Path(file_okay=False), default=None,
+                  help='Dossier des points de reprise (défaut: RETRAITEMENT_DIR)')
+    @click.option('--simulation', is_flag=True, help='Analyser et comparer sans écrire les présences')
+    @click.option('--retirer', is_flag=True,
+                  help='Supprimer les présences des étudiants non retrouvés (absents des autres séances du jour)')
+    @click.option('--rapport', type=click.Path(dir_okay=False), default=None, help='Écrire les écarts en JSON')
+    def main(dossier, manifeste, tolerance, detecteur, pas_frames, processus, points, simulation, retirer, rapport):
+        """Recalcule les présences des vidéos archivées de DOSSIER"""
+        from reconnaissance import TOLERANCE_STRICTE
+
+        parametres = {
+            'tolerance': tolerance if tolerance is not None else TOLERANCE_STRICTE,
+            'detecteur': detecteur or config.DETECTEUR_VIDEO,
+            'pas_frames': pas_frames
+        }
+        try:
+            videos = lister_videos(dossier, manifeste)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        signature_parametres = signature(parametres)
+        for video in videos:
+            video['cle'] = cle_video(video, signature_parametres)
+
+        points_reprise = PointsReprise(points)
+        deja_faites = sum(1 for v in videos if points_reprise.lire(v['cle']) is not None)
+        click.echo(f"{len(videos)} vidéo(s), {deja_faites} déjà analysée(s) "
+                   f"(paramètres {signature_parametres}: {json.dumps(parametres)})")
+
+        restantes = len(videos) - deja_faites
+
+        def progression(video, point, erreur):
+            nonlocal restantes
+            restantes -= 1
+            etat = f"échec: {erreur}" if erreur else \
+                f"{len(point['presents'])} présent(s), {point['frames_analysees']} frames, {point['duree_s']}s"
+            click.echo(f"  [{restantes} restante(s)] {os.path.basename(video['chemin'])}: {etat}")
+
+        try:
+            echecs = analyser_videos(videos, points_reprise, parametres, processus, progression)
+        except KeyboardInterrupt:
+            raise click.ClickException("Interrompu : relancer la même commande pour reprendre")
+
+        from database import DatabaseManager
+
+        db = DatabaseManager()
+        try:
+            ecarts = appliquer(videos, points_reprise, db, simulation, retirer)
+        finally:
+            db.fermer_connexion()
+
+        click.echo(f"\n{'fichier':<40} {'cours':<10} {'date':<17} {'présents':>8} {'ajoutés':>8} {'non retrouvés':>14}")
+        for e in ecarts:
+            click.echo(f"{e['fichier'][:40]:<40} {e['code_cours'][:10]:<10} {e['date'][:16]:<17} "
+                       f"{e['presents']:>8} {len(e['ajoutes']):>8} {len(e['non_retrouves']):>14}")
+        click.echo(f"\n{sum(len(e['ajoutes']) for e in ecarts)} présence(s) ajoutée(s)"
+                   f"{' (simulation, rien écrit)' if simulation else ''}, "
+                   f"{sum(len(e['non_retrouves']) for e in ecarts)} non retrouvée(s)"
+                   f"{' (retirées)' if retirer and not simulation else ' (conservées)'}, "
+                   f"{len(echecs)} vidéo(s) en échec")
+
+        if rapport:
+            with open(rapport, 'w', encoding='utf-8') as f:
+                json.dump({'parametres': parametres, 'simulation': simulation, 'seances': ecarts,
+                           'echecs': echecs}, f, ensure_ascii=False, indent=2)
+            click.echo(f"Rapport écrit dans {rapport}")
+        if echecs:
+            sys.exit(1)
+
+    main()
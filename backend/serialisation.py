@@ -0,0 +1,178 @@
+"""
+Sérialisation JSON des réponses, types BSON compris
+
+Un seul sérialiseur pour toutes les routes : ObjectId, datetime, Decimal128
+et les scalaires numpy (confiances, distances) sont convertis pendant
+l'encodage, les routes renvoient donc les documents MongoDB tels quels.
+orjson est utilisé s'il est installé (5 à 10 fois plus rapide), sinon le
+module json de la bibliothèque standard.
+
+Installé comme fournisseur JSON de l'application (Flask ou Quart) :
+jsonify() passe alors par ce module.
+
+Usage:
+    from serialisation import FournisseurJSON, reponse_flux, reponse_flux_async
+    app.json = FournisseurJSON(app)
+    return reponse_flux(app, {'success': True}, 'presences', db.iterer_presences())
+    return await reponse_flux_async(app, {'success': True}, 'presences', db_async.iterer_presences())
+"""
+import datetime
+import itertools
+import json
+
+from bson import ObjectId, Decimal128
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # dépendance optionnelle
+    orjson = None
+
+# Documents encodés ensemble dans un flux (un morceau HTTP par bloc)
+TAILLE_BLOC_FLUX = 1000
+
+
+def convertir(valeur):
+    """Conversion des types que le moteur JSON ne connaît pas"""
+    if isinstance(valeur, ObjectId):
+        return str(valeur)
+    if isinstance(valeur, (datetime.datetime, datetime.date)):
+        return valeur.isoformat()
+    if isinstance(valeur, Decimal128):
+        return str(valeur)
+    if isinstance(valeur, (set, frozenset, tuple)):
+        return list(valeur)
+    if hasattr(valeur, 'tolist'):  # numpy : scalaires et tableaux
+        return valeur.tolist()
+    raise TypeError(f"Type non sérialisable en JSON: {type(valeur).__name__}")
+
+
+def dumps(donnees, trier=False):
+    """
+    Encode en JSON (UTF-8)
+
+    Args:
+        donnees: Objet à encoder (documents MongoDB acceptés)
+        trier: Trier les clés des objets
+
+    Returns:
+        bytes
+    """
+    if orjson is not None:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if trier:
+            options |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(donnees, default=convertir, option=options)
+    return json.dumps(
+        donnees, default=convertir, ensure_ascii=False, separators=(',', ':'), sort_keys=trier
+    ).encode('utf-8')
+
+
+def flux(enveloppe, cle, elements, trier=False, taille_bloc=TAILLE_BLOC_FLUX):
+    """
+    Encode un objet dont le tableau `cle` est produit au fil de l'eau
+
+    Le tableau n'est jamais matérialisé : chaque bloc de `taille_bloc`
+    éléments est encodé puis envoyé. Le nombre d'éléments est ajouté en fin
+    d'objet sous la clé 'count'.
+
+    Args:
+        enveloppe: Champs fixes de l'objet ({'success': True})
+        cle: Nom du tableau
+        elements: Itérable (curseur MongoDB...)
+
+    Yields:
+        bytes
+    """
+    yield _ouverture(enveloppe, cle, trier)
+    nombre = 0
+    bloc = []
+    for element in elements:
+        bloc.append(element)
+        if len(bloc) >= taille_bloc:
+            yield _bloc(bloc, nombre, trier)
+            nombre += len(bloc)
+            bloc = []
+    if bloc:
+        yield _bloc(bloc, nombre, trier)
+        nombre += len(bloc)
+    yield _fermeture(nombre)
+
+
+async def flux_async(enveloppe, cle, elements, trier=False, taille_bloc=TAILLE_BLOC_FLUX):
+    """Variante de flux pour un itérable asynchrone (curseur AsyncMongoClient, api_async)"""
+    yield _ouverture(enveloppe, cle, trier)
+    nombre = 0
+    bloc = []
+    async for element in elements:
+        bloc.append(element)
+        if len(bloc) >= taille_bloc:
+            yield _bloc(bloc, nombre, trier)
+            nombre += len(bloc)
+            bloc = []
+    if bloc:
+        yield _bloc(bloc, nombre, trier)
+        nombre += len(bloc)
+    yield _fermeture(nombre)
+
+
+def _ouverture(enveloppe, cle, trier):
+    """Début de l'objet, jusqu'à l'ouverture du tableau"""
+    debut = dumps(enveloppe, trier)
+    return debut[:-1] + (b',' if len(debut) > 2 else b'') + dumps(cle) + b':['
+
+
+def _bloc(bloc, nombre, trier):
+    """Éléments d'un bloc, précédés d'une virgule s'ils ne sont pas les premiers"""
+    return (b',' if nombre else b'') + dumps(bloc, trier)[1:-1]
+
+
+def _fermeture(nombre):
+    return b'],"count":' + str(nombre).encode('ascii') + b'}'
+
+
+def reponse_flux(app, enveloppe, cle, elements, statut=200):
+    """
+    Réponse HTTP en flux (voir flux) pour Flask ou Quart
+
+    Le premier élément est lu tout de suite : une erreur de requête MongoDB
+    est levée dans la route (réponse 500), pas au milieu du flux.
+    """
+    elements = iter(elements)
+    premiers = list(itertools.islice(elements, 1))
+    return app.response_class(
+        flux(enveloppe, cle, itertools.chain(premiers, elements), app.json.sort_keys),
+        status=statut, mimetype=app.json.mimetype
+    )
+
+
+async def reponse_flux_async(app, enveloppe, cle, elements, statut=200):
+    """reponse_flux pour un itérable asynchrone (Quart) : premier élément lu dans la route"""
+    elements = aiter(elements)
+    premiers = []
+    try:
+        premiers.append(await anext(elements))
+    except StopAsyncIteration:
+        pass
+
+    async def tous():
+        for element in premiers:
+            yield element
+        async for element in elements:
+            yield element
+
+    return app.response_class(
+        flux_async(enveloppe, cle, tous(), app.json.sort_keys),
+        status=statut, mimetype=app.json.mimetype
+    )
+
+
+class FournisseurJSON(DefaultJSONProvider):
+    """Fournisseur JSON de l'application : jsonify() utilise dumps()"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, kwargs.get('sort_keys', self.sort_keys)).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        donnees = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(donnees, self.sort_keys), mimetype=self.mimetype)
@@ -0,0 +1,483 @@
+"""
+Service d'appariement partitionné (galeries multi-campus)
+
+La galerie est répartie en N shards selon un hachage de l'identifiant
+étudiant ; chaque shard est tenu par un processus local. Le coordinateur
+écoute sur une socket UNIX, reçoit des lots d'encodages, les diffuse à
+tous les shards puis fusionne leurs k meilleurs résultats:
+
+    api.py --lot--> coordinateur --lot--> shard 0 .. shard N-1
+           <-top-k-              <-top-k de chaque shard-
+
+Les inscriptions et suppressions (FaceRecognitionManager) sont transmises
+au shard propriétaire ; changer le nombre de shards (`redimensionner`)
+redistribue toute la galerie.
+
+La connexion est authentifiée par la clé partagée APPARIEMENT_CLE, sans
+valeur par défaut : les messages reçus sont dépicklés, un client qui
+connaîtrait la clé pourrait exécuter du code dans le service. La socket
+n'est accessible qu'à son propriétaire (0600).
+
+Usage:
+    export APPARIEMENT_CLE=$(python -c 'import secrets; print(secrets.token_hex(32))')
+    python service_appariement.py --shards 4
+    APPARIEMENT_ADRESSE=/tmp/presence-appariement.sock python api.py
+
+    python service_appariement.py --etat          # taille des shards
+    python service_appariement.py --recharger     # relire ENCODAGES_DIR
+    python service_appariement.py --redimensionner 8
+"""
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import click
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+DIMENSION = 128
+
+
+class AppariementIndisponible(RuntimeError):
+    """Ni le service ni la galerie locale n'ont pu apparier : aucune présence ne doit être enregistrée"""
+
+
+def cle_partagee(cle=None):
+    """
+    Clé d'authentification du service (argument ou APPARIEMENT_CLE)
+
+    Raises:
+        ValueError: aucune clé configurée
+    """
+    cle = cle or config.APPARIEMENT_CLE
+    if not cle:
+        raise ValueError("APPARIEMENT_CLE non définie : le service d'appariement exige une clé partagée")
+    return cle
+
+
+def shard_de(etudiant_id, nb_shards):
+    """Shard propriétaire d'un identifiant (stable d'un processus à l'autre)"""
+    return zlib.crc32(str(etudiant_id).encode('utf-8')) % nb_shards
+
+
+# ==================== SHARD (processus) ====================
+
+class GaleriePartielle:
+    """Partie de la galerie tenue par un shard (float32, normes précalculées)"""
+
+    def __init__(self, ids=(), encodages=None):
+        self.ids = list(ids)
+        self.encodages = np.asarray(
+            encodages if encodages is not None else np.zeros((0, DIMENSION)), dtype=np.float32
+        ).reshape(-1, DIMENSION)
+        self.normes = np.einsum('ij,ij->i', self.encodages, self.encodages)
+        self.index = {etudiant_id: i for i, etudiant_id in enumerate(self.ids)}
+
+    def inscrire(self, etudiant_id, encodage):
+        encodage = np.asarray(encodage, dtype=np.float32).reshape(DIMENSION)
+        if etudiant_id in self.index:
+            i = self.index[etudiant_id]
+            self.encodages[i] = encodage
+            self.normes[i] = encodage @ encodage
+            return
+        self.index[etudiant_id] = len(self.ids)
+        self.ids.append(etudiant_id)
+        self.encodages = np.vstack([self.encodages, encodage])
+        self.normes = np.append(self.normes, encodage @ encodage)
+
+    def supprimer(self, etudiant_id):
+        """Retire un identifiant (la dernière ligne prend sa place)"""
+        i = self.index.pop(etudiant_id, None)
+        if i is None:
+            return False
+        dernier = len(self.ids) - 1
+        if i != dernier:
+            self.ids[i] = self.ids[dernier]
+            self.encodages[i] = self.encodages[dernier]
+            self.normes[i] = self.normes[dernier]
+            self.index[self.ids[i]] = i
+        self.ids.pop()
+        self.encodages = self.encodages[:dernier]
+        self.normes = self.normes[:dernier]
+        return True
+
+    def top_k(self, requetes, k):
+        """
+        Les k plus proches identifiants de chaque requête
+
+        Returns:
+            list: pour chaque requête, [(etudiant_id, distance), ...] triés
+        """
+        if not self.ids:
+            return [[] for _ in range(len(requetes))]
+        requetes = np.asarray(requetes, dtype=np.float32).reshape(-1, DIMENSION)
+        # |q - g|² = |q|² + |g|² - 2 q·g : un seul produit matriciel par lot
+        carres = self.normes[None, :] + np.einsum('ij,ij->i', requetes, requetes)[:, None] \
+            - 2 * (requetes @ self.encodages.T)
+        distances = np.sqrt(np.maximum(carres, 0))
+        k = min(k, len(self.ids))
+        meilleurs = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        resultats = []
+        for ligne, indices in zip(distances, meilleurs):
+            indices = indices[np.argsort(ligne[indices])]
+            resultats.append([(self.ids[j], float(ligne[j])) for j in indices])
+        return resultats
+
+
+def _boucle_shard(connexion):
+    """Processus shard : exécute les demandes du coordinateur dans l'ordre"""
+    galerie = GaleriePartielle()
+    while True:
+        try:
+            numero, operation, donnees = connexion.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            reponse = None
+            if operation == 'charger':
+                galerie = GaleriePartielle(*donnees)
+            elif operation == 'apparier':
+                reponse = galerie.top_k(*donnees)
+            elif operation == 'inscrire':
+                galerie.inscrire(*donnees)
+            elif operation == 'supprimer':
+                reponse = galerie.supprimer(donnees)
+            elif operation == 'exporter':
+                reponse = (galerie.ids, galerie.encodages)
+            elif operation == 'taille':
+                reponse = len(galerie.ids)
+            elif operation == 'arreter':
+                connexion.send((numero, True, None))
+                return
+            else:
+                raise ValueError(f"Opération inconnue: {operation}")
+            connexion.send((numero, True, reponse))
+        except Exception as e:
+            connexion.send((numero, False, str(e)))
+
+
+class _Shard:
+    """Côté coordinateur : processus shard et demandes en attente de réponse"""
+
+    def __init__(self, index, contexte):
+        self.index = index
+        # Un thread BLAS par shard : le parallélisme vient du nombre de shards
+        for variable in ('OPENBLAS_NUM_THREADS', 'OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+            os.environ.setdefault(variable, '1')
+        self.connexion, enfant = contexte.Pipe()
+        self.processus = contexte.Process(
+            target=_boucle_shard, args=(enfant,), name=f'appariement-shard-{index}', daemon=True
+        )
+        self.processus.start()
+        enfant.close()
+        self._numeros = itertools.count()
+        self._attentes = {}
+        self._verrou = threading.Lock()
+        self._verrou_envoi = threading.Lock()
+        self._lecteur = threading.Thread(target=self._lire, name=f'shard-{index}-lecteur', daemon=True)
+        self._lecteur.start()
+
+    def envoyer(self, operation, donnees=None):
+        """Envoie une demande ; la réponse arrive dans le Future retourné"""
+        future = Future()
+        numero = next(self._numeros)
+        with self._verrou:
+            self._attentes[numero] = future
+        with self._verrou_envoi:
+            self.connexion.send((numero, operation, donnees))
+        return future
+
+    def _lire(self):
+        while True:
+            try:
+                numero, ok, reponse = self.connexion.recv()
+            except (EOFError, OSError):
+                break
+            with self._verrou:
+                future = self._attentes.pop(numero)
+            if ok:
+                future.set_result(reponse)
+            else:
+                future.set_exception(RuntimeError(f"Shard {self.index}: {reponse}"))
+        with self._verrou:
+            for future in self._attentes.values():
+                future.set_exception(RuntimeError(f"Shard {self.index} arrêté"))
+            self._attentes.clear()
+
+    def arreter(self):
+        try:
+            self.envoyer('arreter').result(timeout=10)
+        except Exception:
+            self.processus.terminate()
+        self.processus.join()
+        self.connexion.close()
+
+
+# ==================== COORDINATEUR ====================
+
+class ServiceAppariement:
+    """Coordinateur : répartit la galerie, diffuse les lots, fusionne les top-k"""
+
+    def __init__(self, nb_shards=None):
+        self._contexte = multiprocessing.get_context('spawn')
+        self._shards = []
+        self._verrou = threading.RLock()  # protège la liste des shards (redimensionnement)
+        self.nb_shards = nb_shards or config.APPARIEMENT_SHARDS
+
+    def demarrer(self, ids, encodages):
+        """Lance les shards et leur distribue la galerie"""
+        with self._verrou:
+            self._shards = [_Shard(i, self._contexte) for i in range(self.nb_shards)]
+            self._distribuer(ids, encodages)
+        logger.info(f"🧩 Appariement: {len(ids)} encodages répartis sur {self.nb_shards} shard(s)")
+
+    def _distribuer(self, ids, encodages):
+        encodages = np.asarray(encodages, dtype=np.float32).reshape(-1, DIMENSION)
+        proprietaires = np.array([shard_de(i, self.nb_shards) for i in ids], dtype=np.int64)
+        futures = []
+        for shard in self._shards:
+            lignes = np.flatnonzero(proprietaires == shard.index)
+            futures.append(shard.envoyer('charger', ([ids[j] for j in lignes], encodages[lignes])))
+        for future in futures:
+            future.result()
+
+    def apparier(self, requetes, k=1):
+        """
+        Les k meilleurs identifiants de chaque requête, toutes partitions confondues
+
+        Returns:
+            list: pour chaque requête, [(etudiant_id, distance), ...] triés
+        """
+        requetes = np.asarray(requetes, dtype=np.float32).reshape(-1, DIMENSION)
+        with self._verrou:
+            futures = [shard.envoyer('apparier', (requetes, k)) for shard in self._shards]
+        partiels = [future.result() for future in futures]
+        return [
+            sorted((candidat for partiel in par_shard for candidat in partiel), key=lambda c: c[1])[:k]
+            for par_shard in zip(*partiels)
+        ]
+
+    def _proprietaire(self, etudiant_id):
+        return self._shards[shard_de(etudiant_id, self.nb_shards)]
+
+    def inscrire(self, etudiant_id, encodage):
+        with self._verrou:
+            self._proprietaire(etudiant_id).envoyer('inscrire', (etudiant_id, encodage)).result()
+
+    def supprimer(self, etudiant_id):
+        with self._verrou:
+            return self._proprietaire(etudiant_id).envoyer('supprimer', etudiant_id).result()
+
+    def exporter(self):
+        """Toute la galerie (ids, encodages float32), rassemblée depuis les shards"""
+        with self._verrou:
+            parties = [future.result() for future in [s.envoyer('exporter') for s in self._shards]]
+        ids = [etudiant_id for partie_ids, _ in parties for etudiant_id in partie_ids]
+        encodages = np.vstack([partie for _, partie in parties]) if parties else np.zeros((0, DIMENSION))
+        return ids, encodages
+
+    def redimensionner(self, nb_shards):
+        """Change le nombre de shards et redistribue la galerie"""
+        with self._verrou:
+            ids, encodages = self.exporter()
+            for shard in self._shards:
+                shard.arreter()
+            self.nb_shards = nb_shards
+            self._shards = [_Shard(i, self._contexte) for i in range(nb_shards)]
+            self._distribuer(ids, encodages)
+        logger.info(f"🧩 Appariement redimensionné: {len(ids)} encodages sur {nb_shards} shard(s)")
+        return self.etat()
+
+    def recharger(self):
+        """Relit la galerie depuis config.ENCODAGES_DIR"""
+        ids, encodages = charger_galerie()
+        with self._verrou:
+            self._distribuer(ids, encodages)
+        return self.etat()
+
+    def etat(self):
+        with self._verrou:
+            tailles = [future.result() for future in [s.envoyer('taille') for s in self._shards]]
+        return {'shards': self.nb_shards, 'tailles': tailles, 'total': sum(tailles)}
+
+    def arreter(self):
+        with self._verrou:
+            for shard in self._shards:
+                shard.arreter()
+            self._shards = []
+
+    def servir(self, adresse=None, cle=None):
+        """Accepte les clients sur la socket locale (un thread par connexion)"""
+        adresse = adresse or config.APPARIEMENT_ADRESSE
+        cle = cle_partagee(cle)
+        if os.path.exists(adresse):
+            os.remove(adresse)
+        # Socket créée directement en 0600 (pas de fenêtre avant le chmod)
+        masque = os.umask(0o177)
+        try:
+            ecoute = Listener(adresse, family='AF_UNIX', authkey=cle)
+        finally:
+            os.umask(masque)
+        os.chmod(adresse, 0o600)
+        with ecoute:
+            logger.info(f"🧩 Service d'appariement à l'écoute sur {adresse}")
+            while True:
+                try:
+                    connexion = ecoute.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    # Mauvaise clé ou client parti pendant l'authentification
+                    logger.warning(f"Connexion refusée: {e!r}")
+                    continue
+                threading.Thread(target=self._servir_client, args=(connexion,), daemon=True).start()
+
+    def _servir_client(self, connexion):
+        operations = {
+            'apparier': self.apparier,
+            'inscrire': self.inscrire,
+            'supprimer': self.supprimer,
+            'etat': self.etat,
+            'recharger': self.recharger,
+            'redimensionner': self.redimensionner,
+        }
+        with connexion:
+            while True:
+                try:
+                    operation, args = connexion.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    connexion.send((True, operations[operation](*args)))
+                except Exception as e:
+                    logger.error(f"❌ Appariement {operation}: {e}")
+                    connexion.send((False, str(e)))
+
+
+def charger_galerie():
+    """Galerie de config.ENCODAGES_DIR (galerie consolidée si elle est à jour)"""
+    from face_manager import FaceRecognitionManager
+
+    face_mgr = FaceRecognitionManager()
+    return list(face_mgr.known_ids), np.asarray(face_mgr.known_encodings).reshape(-1, DIMENSION)
+
+
+# ==================== CLIENT ====================
+
+class ClientAppariement:
+    """
+    Client du service (thread-safe : une connexion par appel en cours,
+    réutilisée ensuite)
+    """
+
+    def __init__(self, adresse=None, cle=None, timeout=None):
+        self.adresse = adresse or config.APPARIEMENT_ADRESSE
+        self.cle = cle_partagee(cle)
+        self.timeout = timeout or config.APPARIEMENT_TIMEOUT
+        self._libres = []
+        self._verrou = threading.Lock()
+
+    def _appeler(self, operation, *args, timeout=None):
+        """
+        Raises:
+            TimeoutError: pas de réponse dans le délai (la connexion est abandonnée)
+        """
+        with self._verrou:
+            connexion = self._libres.pop() if self._libres else None
+        if connexion is None:
+            connexion = Client(self.adresse, family='AF_UNIX', authkey=self.cle)
+        try:
+            connexion.send((operation, args))
+            delai = timeout or self.timeout
+            if not connexion.poll(delai):
+                raise TimeoutError(f"Service d'appariement: pas de réponse à {operation} en {delai:g}s")
+            ok, reponse = connexion.recv()
+        except Exception:
+            connexion.close()
+            raise
+        with self._verrou:
+            self._libres.append(connexion)
+        if not ok:
+            raise RuntimeError(f"Service d'appariement: {reponse}")
+        return reponse
+
+    def apparier(self, encodages, k=1):
+        """[(etudiant_id, distance), ...] des k meilleurs pour chaque encodage"""
+        return self._appeler('apparier', np.asarray(encodages, dtype=np.float32).reshape(-1, DIMENSION), k)
+
+    def inscrire(self, etudiant_id, encodage):
+        return self._appeler('inscrire', etudiant_id, np.asarray(encodage, dtype=np.float32))
+
+    def supprimer(self, etudiant_id):
+        return self._appeler('supprimer', etudiant_id)
+
+    def etat(self):
+        return self._appeler('etat')
+
+    def recharger(self):
+        return self._appeler('recharger', timeout=600)
+
+    def redimensionner(self, nb_shards):
+        return self._appeler('redimensionner', nb_shards, timeout=600)
+
+
+_client = None
+_verrou_client = threading.Lock()
+
+
+def obtenir_client():
+    """Client partagé, ou None si config.APPARIEMENT_ADRESSE n'est pas défini (appariement local)"""
+    global _client
+    if not config.APPARIEMENT_ADRESSE:
+        return None
+    with _verrou_client:
+        if _client is None:
+            _client = ClientAppariement()
+        return _client
+
+
+@click.command()
+@click.option('--shards', type=int, default=None, help='Nombre de shards (défaut: APPARIEMENT_SHARDS)')
+@click.option('--adresse', default=None, help='Socket UNIX (défaut: APPARIEMENT_ADRESSE)')
+@click.option('--etat', 'afficher_etat', is_flag=True, help="Afficher la taille des shards d'un service lancé")
+@click.option('--recharger', is_flag=True, help='Faire relire ENCODAGES_DIR à un service lancé')
+@click.option('--redimensionner', type=int, default=None, help="Changer le nombre de shards d'un service lancé")
+def main(shards, adresse, afficher_etat, recharger, redimensionner):
+    """Lance le service d'appariement, ou pilote un service lancé"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    adresse = adresse or config.APPARIEMENT_ADRESSE or '/tmp/presence-appariement.sock'
+
+    if afficher_etat or recharger or redimensionner:
+        client = ClientAppariement(adresse)
+        if recharger:
+            click.echo(client.recharger())
+        if redimensionner:
+            click.echo(client.redimensionner(redimensionner))
+        if afficher_etat:
+            click.echo(client.etat())
+        return
+
+    try:
+        cle_partagee()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    service = ServiceAppariement(shards)
+    service.demarrer(*charger_galerie())
+    try:
+        service.servir(adresse)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.arreter()
+
+
+if __name__ == '__main__':
+    main()
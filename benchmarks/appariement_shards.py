@@ -0,0 +1,108 @@
+"""
+Benchmark du service d'appariement partitionné : débit selon le nombre de shards
+
+Lance, sur la machine locale, le service (backend/service_appariement.py)
+avec 1, 2, 4... shards sur une galerie synthétique, et mesure le nombre de
+visages appariés par seconde à travers la socket locale, avec plusieurs
+clients simultanés. Vérifie aussi que le top-1 est identique à
+l'appariement local (reconnaissance._apparier).
+
+Usage:
+    python benchmarks/appariement_shards.py --galerie 500000 --shards 1,2,4,8
+    python benchmarks/appariement_shards.py --galerie 200000 --lot 64 --clients 8 --sortie shards.json
+"""
+import json
+import os
+import secrets
+import sys
+import tempfile
+import threading
+import time
+
+import click
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from suite_performances import galerie_synthetique, requetes_synthetiques  # noqa: E402
+
+
+def mesurer_debit(client, requetes, lot, clients, duree):
+    """Visages appariés par seconde avec `clients` threads envoyant des lots de `lot` requêtes"""
+    arret = threading.Event()
+    comptes = [0] * clients
+
+    def boucle(numero):
+        position = numero * lot
+        while not arret.is_set():
+            debut = position % (len(requetes) - lot)
+            client.apparier(requetes[debut:debut + lot], k=1)
+            comptes[numero] += lot
+            position += lot * clients
+
+    threads = [threading.Thread(target=boucle, args=(i,)) for i in range(clients)]
+    debut = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duree)
+    arret.set()
+    for thread in threads:
+        thread.join()
+    return sum(comptes) / (time.perf_counter() - debut)
+
+
+@click.command()
+@click.option('--galerie', 'taille', type=int, default=200000, show_default=True, help='Encodages dans la galerie')
+@click.option('--shards', default='1,2,4', show_default=True, help='Nombres de shards à comparer')
+@click.option('--lot', type=int, default=32, show_default=True, help='Encodages par requête')
+@click.option('--clients', type=int, default=4, show_default=True, help='Clients simultanés')
+@click.option('--duree', type=float, default=5.0, show_default=True, help='Secondes de mesure par configuration')
+@click.option('--sortie', type=click.Path(), default=None, help='Écrire les résultats en JSON')
+def main(taille, shards, lot, clients, duree, sortie):
+    """Compare le débit du service d'appariement selon le nombre de shards"""
+    from service_appariement import ServiceAppariement, ClientAppariement
+
+    encodages, ids = galerie_synthetique(taille)
+    requetes = np.array(requetes_synthetiques(encodages, max(lot * clients * 4, 256)))
+    click.echo(f"Galerie: {taille} encodages, lots de {lot}, {clients} client(s), {os.cpu_count()} CPU")
+
+    # Référence : appariement local (float64) pour vérifier le top-1
+    echantillon = requetes[:lot]
+    distances = np.linalg.norm(encodages[None, :, :] - echantillon[:, None, :], axis=2) \
+        if taille * lot <= 5_000_000 else None
+    attendus = [ids[i] for i in distances.argmin(axis=1)] if distances is not None else None
+
+    cle = secrets.token_bytes(32)  # clé propre à la mesure
+    resultats = []
+    for nombre in [int(n) for n in shards.split(',')]:
+        adresse = os.path.join(tempfile.mkdtemp(), 'appariement.sock')
+        service = ServiceAppariement(nombre)
+        service.demarrer(ids, encodages)
+        threading.Thread(target=service.servir, args=(adresse, cle), daemon=True).start()
+        while not os.path.exists(adresse):
+            time.sleep(0.05)
+        client = ClientAppariement(adresse, cle)
+        try:
+            top1 = [top[0][0] for top in client.apparier(echantillon, k=1)]
+            identiques = None if attendus is None else top1 == attendus
+            client.apparier(requetes[:lot])  # échauffement
+            debit = mesurer_debit(client, requetes, lot, clients, duree)
+        finally:
+            service.arreter()
+        resultats.append({'shards': nombre, 'visages_par_s': round(debit, 1), 'top1_identique': identiques})
+
+    reference = resultats[0]['visages_par_s']
+    click.echo(f"\n{'shards':>6} {'visages/s':>12} {'vs 1er':>8}  top-1 identique")
+    for r in resultats:
+        click.echo(f"{r['shards']:>6} {r['visages_par_s']:>12.1f} {r['visages_par_s'] / reference:>7.2f}x  "
+                   f"{r['top1_identique']}")
+
+    if sortie:
+        with open(sortie, 'w') as f:
+            json.dump({'galerie': taille, 'lot': lot, 'clients': clients, 'cpu': os.cpu_count(),
+                       'resultats': resultats}, f, indent=2)
+        click.echo(f"\nRésultats écrits dans {sortie}")
+
+
+if __name__ == '__main__':
+    main()
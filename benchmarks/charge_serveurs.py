@@ -0,0 +1,175 @@
+"""
+Test de charge : latence des routes légères pendant des analyses lourdes
+
+Envoie en continu des requêtes lourdes (POST /api/presences/video) et mesure
+pendant ce temps la latence des routes légères (/health, /api/etudiants,
+/api/cours). Permet de comparer le serveur Flask et la variante ASGI.
+
+Un serveur s'écrit URL, ou URL_LEGERE+URL_LOURDE quand les routes de
+reconnaissance sont servies par un autre pool (backend/production.py).
+
+Prérequis: MongoDB local, un cours existant et une vidéo de test.
+
+Usage:
+    # Flask (développement) contre la variante ASGI
+    python benchmarks/charge_serveurs.py --video classe.mp4 --cours DEMO101 \\
+        http://localhost:5000 http://localhost:5001
+
+    # Flask (développement) contre les deux pools gunicorn
+    python benchmarks/charge_serveurs.py --video classe.mp4 \\
+        http://localhost:5000 "http://localhost:5000+http://localhost:5001"
+"""
+import json
+import statistics
+import threading
+import time
+import urllib.request
+import uuid
+
+import click
+
+ROUTES_LEGERES = ['/health', '/api/etudiants', '/api/cours']
+
+
+def _multipart(champs, fichiers):
+    """Encode un formulaire multipart/form-data (sans dépendance externe)"""
+    limite = uuid.uuid4().hex
+    corps = bytearray()
+    for nom, valeur in champs.items():
+        corps += f'--{limite}\r\nContent-Disposition: form-data; name="{nom}"\r\n\r\n{valeur}\r\n'.encode()
+    for nom, (nom_fichier, contenu) in fichiers.items():
+        corps += (
+            f'--{limite}\r\nContent-Disposition: form-data; name="{nom}"; filename="{nom_fichier}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode()
+        corps += contenu + b'\r\n'
+    corps += f'--{limite}--\r\n'.encode()
+    return bytes(corps), f'multipart/form-data; boundary={limite}'
+
+
+def _requete(url, corps=None, content_type=None, timeout=600):
+    """Exécute une requête HTTP et retourne (statut, durée en secondes)"""
+    req = urllib.request.Request(url, data=corps, method='POST' if corps else 'GET')
+    if content_type:
+        req.add_header('Content-Type', content_type)
+    debut = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as reponse:
+            reponse.read()
+            statut = reponse.status
+    except urllib.error.HTTPError as e:
+        statut = e.code
+    except Exception:
+        statut = 0
+    return statut, time.perf_counter() - debut
+
+
+def _percentile(valeurs, p):
+    """Percentile simple (valeurs en secondes)"""
+    if not valeurs:
+        return float('nan')
+    valeurs = sorted(valeurs)
+    index = min(len(valeurs) - 1, int(round(p / 100 * (len(valeurs) - 1))))
+    return valeurs[index]
+
+
+def mesurer_serveur(serveur, video, code_cours, requetes_lourdes, duree):
+    """
+    Mesure la latence des routes légères sous charge lourde
+
+    Args:
+        serveur: URL, ou URL_LEGERE+URL_LOURDE
+
+    Returns:
+        dict: latences (ms) au repos et sous charge, débit des requêtes lourdes
+    """
+    base_url, _, url_lourde = serveur.partition('+')
+    base_url = base_url.rstrip('/')
+    url_lourde = (url_lourde or base_url).rstrip('/')
+    corps, content_type = _multipart(
+        {'code_cours': code_cours, 'envoyer_email': 'false'},
+        {'video': ('charge.mp4', video)}
+    )
+
+    def sonder(fin, latences):
+        i = 0
+        while time.perf_counter() < fin:
+            statut, t = _requete(base_url + ROUTES_LEGERES[i % len(ROUTES_LEGERES)])
+            if statut == 200:
+                latences.append(t)
+            i += 1
+            time.sleep(0.05)
+
+    # Référence au repos
+    repos = []
+    sonder(time.perf_counter() + min(5.0, duree / 4), repos)
+
+    # Sous charge
+    fin = time.perf_counter() + duree
+    lourdes = []
+
+    def charger():
+        while time.perf_counter() < fin:
+            statut, t = _requete(url_lourde + '/api/presences/video', corps, content_type)
+            lourdes.append((statut, t))
+
+    threads = [threading.Thread(target=charger) for _ in range(requetes_lourdes)]
+    for t in threads:
+        t.start()
+    sous_charge = []
+    sonder(fin, sous_charge)
+    for t in threads:
+        t.join()
+
+    def resume(latences):
+        return {
+            'n': len(latences),
+            'p50_ms': round(_percentile(latences, 50) * 1000, 1),
+            'p95_ms': round(_percentile(latences, 95) * 1000, 1),
+            'p99_ms': round(_percentile(latences, 99) * 1000, 1),
+            'max_ms': round(max(latences) * 1000, 1) if latences else None
+        }
+
+    reussies = [t for statut, t in lourdes if 200 <= statut < 300]
+    return {
+        'serveur': serveur,
+        'repos': resume(repos),
+        'sous_charge': resume(sous_charge),
+        'lourdes': {
+            'total': len(lourdes),
+            'reussies': len(reussies),
+            'moyenne_s': round(statistics.mean(reussies), 2) if reussies else None,
+            'par_minute': round(len(reussies) * 60 / duree, 1)
+        }
+    }
+
+
+@click.command()
+@click.argument('serveurs', nargs=-1, required=True)
+@click.option('--video', type=click.File('rb'), required=True, help='Vidéo envoyée par les requêtes lourdes')
+@click.option('--cours', 'code_cours', default='DEMO101', show_default=True)
+@click.option('--lourdes', 'requetes_lourdes', default=4, show_default=True, help='Requêtes lourdes concurrentes')
+@click.option('--duree', default=60.0, show_default=True, help='Durée de la phase sous charge (s)')
+@click.option('--sortie', type=click.Path(), help='Fichier JSON de résultats')
+def main(serveurs, video, code_cours, requetes_lourdes, duree, sortie):
+    """Compare la latence des routes légères de plusieurs SERVEURS sous charge"""
+    contenu = video.read()
+    resultats = []
+    for base_url in serveurs:
+        click.echo(f"▶ {base_url} ...")
+        resultats.append(mesurer_serveur(base_url, contenu, code_cours, requetes_lourdes, duree))
+
+    click.echo(f"\n{'Serveur':<50}{'repos p50':>11}{'charge p50':>12}{'charge p99':>12}{'lourdes/min':>13}")
+    for r in resultats:
+        click.echo(
+            f"{r['serveur']:<50}{r['repos']['p50_ms']:>9}ms{r['sous_charge']['p50_ms']:>10}ms"
+            f"{r['sous_charge']['p99_ms']:>10}ms{r['lourdes']['par_minute']:>13}"
+        )
+
+    if sortie:
+        with open(sortie, 'w') as f:
+            json.dump(resultats, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Benchmark des détecteurs de visages : débit et accord avec HOG
+
+Pour chaque détecteur (voir backend/detecteurs.py), mesure le nombre
+d'images traitées par seconde et compare ses détections à celles de HOG,
+pris comme référence : un visage est retrouvé si les boîtes se recouvrent
+avec une IoU >= --iou.
+
+    rappel    : part des visages HOG retrouvés par le détecteur
+    precision : part des visages du détecteur également trouvés par HOG
+
+Usage:
+    python benchmarks/comparer_detecteurs.py --images photos_classe/
+    python benchmarks/comparer_detecteurs.py --video classe.mp4 --pas 10 --detecteurs hog,haar,dnn
+"""
+import json
+import os
+import sys
+import time
+
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def charger_images(dossier=None, video=None, pas=10, nombre_max=200, largeur_max=None):
+    """Images RGB du jeu de test (dossier d'images ou frames d'une vidéo)"""
+    import cv2
+
+    images = []
+    if dossier:
+        for racine, _, fichiers in sorted(os.walk(dossier)):
+            for nom in sorted(fichiers):
+                if nom.lower().endswith(EXTENSIONS):
+                    image = cv2.imread(os.path.join(racine, nom))
+                    if image is not None:
+                        images.append(image)
+    else:
+        capture = cv2.VideoCapture(video)
+        index = 0
+        while len(images) < nombre_max:
+            ok, image = capture.read()
+            if not ok:
+                break
+            if index % pas == 0:
+                images.append(image)
+            index += 1
+        capture.release()
+
+    resultat = []
+    for image in images[:nombre_max]:
+        if largeur_max and image.shape[1] > largeur_max:
+            echelle = largeur_max / image.shape[1]
+            image = cv2.resize(image, None, fx=echelle, fy=echelle)
+        resultat.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    return resultat
+
+
+def iou(a, b):
+    """Intersection sur union de deux boîtes (haut, droite, bas, gauche)"""
+    haut, droite = max(a[0], b[0]), min(a[1], b[1])
+    bas, gauche = min(a[2], b[2]), max(a[3], b[3])
+    intersection = max(0, droite - gauche) * max(0, bas - haut)
+    aire_a = (a[1] - a[3]) * (a[2] - a[0])
+    aire_b = (b[1] - b[3]) * (b[2] - b[0])
+    union = aire_a + aire_b - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def apparier_boites(reference, candidates, seuil):
+    """Nombre de boîtes appariées (glouton, meilleure IoU d'abord)"""
+    paires = sorted(
+        ((iou(r, c), i, j) for i, r in enumerate(reference) for j, c in enumerate(candidates)),
+        reverse=True
+    )
+    prises_ref, prises_cand = set(), set()
+    for score, i, j in paires:
+        if score < seuil:
+            break
+        if i not in prises_ref and j not in prises_cand:
+            prises_ref.add(i)
+            prises_cand.add(j)
+    return len(prises_ref)
+
+
+def mesurer(detecteur, images):
+    """Détections par image et durée totale"""
+    detecteur.detecter(images[0])  # chargement du modèle
+    debut = time.perf_counter()
+    detections = [detecteur.detecter(image) for image in images]
+    return detections, time.perf_counter() - debut
+
+
+@click.command()
+@click.option('--images', 'dossier', type=click.Path(exists=True, file_okay=False), help="Dossier d'images")
+@click.option('--video', type=click.Path(exists=True, dir_okay=False), help='Vidéo (une frame sur --pas)')
+@click.option('--pas', default=10, show_default=True)
+@click.option('--max', 'nombre_max', default=200, show_default=True, help="Nombre maximal d'images")
+@click.option('--largeur-max', default=None, type=int, help='Redimensionner les images plus larges')
+@click.option('--detecteurs', default='hog,haar,dnn', show_default=True)
+@click.option('--iou', 'seuil_iou', default=0.4, show_default=True, help='IoU minimale pour apparier deux boîtes')
+@click.option('--sortie', type=click.Path(), help='Fichier JSON de résultats')
+def main(dossier, video, pas, nombre_max, largeur_max, detecteurs, seuil_iou, sortie):
+    """Compare débit et accord avec HOG des détecteurs de visages"""
+    from detecteurs import obtenir_detecteur
+
+    if not dossier and not video:
+        raise click.UsageError('--images ou --video requis')
+    images = charger_images(dossier, video, pas, nombre_max, largeur_max)
+    if not images:
+        raise click.ClickException('Aucune image chargée')
+    click.echo(f"{len(images)} image(s), {images[0].shape[1]}x{images[0].shape[0]}")
+
+    noms = [n.strip() for n in detecteurs.split(',') if n.strip()]
+    if 'hog' not in noms:
+        noms.insert(0, 'hog')
+
+    mesures = {}
+    for nom in noms:
+        try:
+            mesures[nom] = mesurer(obtenir_detecteur(nom), images)
+        except (FileNotFoundError, ValueError) as e:
+            click.echo(f"⚠️ {nom} ignoré: {e}")
+
+    reference = mesures['hog'][0]
+    total_ref = sum(len(d) for d in reference)
+    resultats = []
+    click.echo(f"\n{'Détecteur':<10}{'images/s':>10}{'vs HOG':>9}{'visages':>9}{'rappel':>9}{'précision':>11}")
+    for nom, (detections, duree) in mesures.items():
+        trouves = sum(len(d) for d in detections)
+        communs = sum(apparier_boites(r, d, seuil_iou) for r, d in zip(reference, detections))
+        ligne = {
+            'detecteur': nom,
+            'images_par_s': round(len(images) / duree, 2),
+            'acceleration_vs_hog': round(mesures['hog'][1] / duree, 2),
+            'visages': trouves,
+            'rappel': round(communs / total_ref, 3) if total_ref else None,
+            'precision': round(communs / trouves, 3) if trouves else None,
+        }
+        resultats.append(ligne)
+        click.echo(
+            f"{nom:<10}{ligne['images_par_s']:>10}{ligne['acceleration_vs_hog']:>8}x{trouves:>9}"
+            f"{str(ligne['rappel']):>9}{str(ligne['precision']):>11}"
+        )
+
+    if sortie:
+        with open(sortie, 'w') as f:
+            json.dump({'images': len(images), 'iou': seuil_iou, 'resultats': resultats}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
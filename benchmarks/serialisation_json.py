@@ -0,0 +1,137 @@
+"""
+Benchmark de la sérialisation JSON des présences : avant / après serialisation.py
+
+Sérialise --nombre documents de présence synthétiques (ObjectId, datetime)
+de trois façons:
+
+    avant     : boucle de conversion de l'ancienne route GET /api/presences
+                (str(), isoformat()) puis jsonify par défaut de Flask ; la
+                boucle d'origine oubliait etudiant_id quand c'est un ObjectId
+                (TypeError), il est converti ici pour que la mesure aboutisse
+    apres     : serialisation.dumps, types BSON convertis à l'encodage
+                (orjson si installé, sinon json)
+    flux      : serialisation.flux, encodage par blocs sans liste complète
+
+Chaque variante travaille sur une copie fraîche des documents (la boucle
+d'avant les modifiait sur place).
+
+Usage:
+    python benchmarks/serialisation_json.py --nombre 100000
+    python benchmarks/serialisation_json.py --nombre 100000 --repetitions 5 --sortie json.json
+"""
+import copy
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import click
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+
+def presences_synthetiques(nombre, graine=42):
+    """Documents au format de la collection presences"""
+    from bson import ObjectId
+
+    generateur = np.random.default_rng(graine)
+    cours = [(ObjectId(), f"INF{100 + i}", f"Cours {i}") for i in range(20)]
+    etudiants = [(ObjectId(), f"E{i:05d}", f"Nom{i} Prénom{i}") for i in range(2000)]
+    debut = datetime(2025, 9, 1, 8, 0)
+    documents = []
+    for i in range(nombre):
+        etudiant = etudiants[generateur.integers(len(etudiants))]
+        un_cours = cours[generateur.integers(len(cours))]
+        documents.append({
+            '_id': ObjectId(),
+            'etudiant_id': etudiant[0],
+            'etudiant_numero': etudiant[1],
+            'etudiant_nom': etudiant[2],
+            'cours_id': un_cours[0],
+            'cours_code': un_cours[1],
+            'cours_nom': un_cours[2],
+            'date': debut + timedelta(minutes=int(i)),
+            'confiance': float(generateur.uniform(0.5, 1.0)),
+            'methode': 'automatique'
+        })
+    return documents
+
+
+def serialiser_avant(presences):
+    """Ancienne route : conversion champ par champ, puis jsonify par défaut (json, clés triées)"""
+    from flask import Flask
+
+    for p in presences:
+        if '_id' in p:
+            p['_id'] = str(p['_id'])
+        if 'cours_id' in p:
+            p['cours_id'] = str(p['cours_id'])
+        if 'etudiant_id' in p:
+            if isinstance(p['etudiant_id'], list):
+                p['etudiant_id'] = [str(eid) if not isinstance(eid, str) else eid for eid in p['etudiant_id']]
+            else:
+                p['etudiant_id'] = str(p['etudiant_id'])
+        if 'date' in p and hasattr(p['date'], 'isoformat'):
+            p['date'] = p['date'].isoformat()
+    app = Flask(__name__)
+    return app.json.dumps({'success': True, 'count': len(presences), 'presences': presences}).encode('utf-8')
+
+
+def serialiser_apres(presences):
+    import serialisation
+    return serialisation.dumps({'success': True, 'count': len(presences), 'presences': presences}, trier=True)
+
+
+def serialiser_flux(presences):
+    import serialisation
+    return b''.join(serialisation.flux({'success': True}, 'presences', iter(presences), trier=True))
+
+
+VARIANTES = {'avant': serialiser_avant, 'apres': serialiser_apres, 'flux': serialiser_flux}
+
+
+@click.command()
+@click.option('--nombre', type=int, default=100000, show_default=True, help='Documents de présence')
+@click.option('--repetitions', type=int, default=3, show_default=True, help='Mesures par variante (meilleure gardée)')
+@click.option('--sortie', type=click.Path(), default=None, help='Écrire les résultats en JSON')
+def main(nombre, repetitions, sortie):
+    """Compare la sérialisation des présences avant et après serialisation.py"""
+    import serialisation
+
+    moteur = 'orjson' if serialisation.orjson is not None else 'json'
+    documents = presences_synthetiques(nombre)
+    click.echo(f"{nombre} présences, moteur: {moteur}")
+
+    resultats = {}
+    references = {}
+    for nom, fonction in VARIANTES.items():
+        durees = []
+        for _ in range(repetitions):
+            copie = copy.copy(documents) if nom != 'avant' else [dict(d) for d in documents]
+            debut = time.perf_counter()
+            octets = fonction(copie)
+            durees.append(time.perf_counter() - debut)
+        references[nom] = json.loads(octets)
+        resultats[nom] = {'secondes': round(min(durees), 4), 'octets': len(octets)}
+
+    identiques = references['apres']['presences'] == references['avant']['presences'] \
+        and references['flux']['presences'] == references['avant']['presences']
+
+    base = resultats['avant']['secondes']
+    click.echo(f"\n{'variante':<10} {'secondes':>10} {'docs/s':>12} {'octets':>12} {'gain':>7}")
+    for nom, r in resultats.items():
+        click.echo(f"{nom:<10} {r['secondes']:>10.4f} {nombre / r['secondes']:>12.0f} "
+                   f"{r['octets']:>12} {base / r['secondes']:>6.1f}x")
+    click.echo(f"\nContenu identique: {identiques}")
+
+    if sortie:
+        with open(sortie, 'w') as f:
+            json.dump({'nombre': nombre, 'moteur': moteur, 'identiques': identiques, 'resultats': resultats},
+                      f, indent=2)
+        click.echo(f"Résultats écrits dans {sortie}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+"""
+Suite de benchmarks reproductibles : reconnaissance et enregistrement des présences
+
+Toutes les entrées sont synthétiques et générées à partir d'une graine fixe :
+  - galeries d'encodages aléatoires normalisés (128 dimensions)
+  - vidéo et images JPEG
+  - base MongoDB locale, ou mongomock (en mémoire) par défaut
+
+Mesures:
+  - appariement      : visages appariés par seconde selon la taille de la galerie
+  - pipeline         : latence par frame (décodage, détection, encodage, vidéo complète, JPEG)
+  - presences        : coût de ajouter_presence() par étudiant
+  - listes           : latence des routes GET /api/etudiants, /api/presences, /api/seances
+
+Les résultats sont écrits en JSON ; une exécution peut être comparée à une
+référence avec des seuils de régression (code de sortie 1 si régression).
+
+Usage:
+    python benchmarks/suite_performances.py --sortie reference.json
+    python benchmarks/suite_performances.py --reference reference.json --seuil 0.15
+    python benchmarks/suite_performances.py --mongodb mongodb://localhost:27017/ \\
+        --tailles 1000,10000 --seulement appariement --seulement presences
+"""
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime
+
+import click
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+GRAINE = 2024
+SCENARIOS = ('appariement', 'pipeline', 'presences', 'listes')
+CODE_COURS = 'BENCH101'
+
+
+# ==================== OUTILS ====================
+
+def _chronometrer(fonction, repetitions):
+    """Exécute `fonction` plusieurs fois et retourne les durées (secondes)"""
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return durees
+
+
+def _percentile(valeurs, p):
+    """Percentile simple (sans interpolation)"""
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(round(p / 100 * (len(valeurs) - 1))))]
+
+
+def _ajouter(resultats, nom, valeur, unite, meilleur):
+    """Enregistre une mesure ; `meilleur` vaut 'haut' ou 'bas'"""
+    resultats[nom] = {'valeur': round(valeur, 4), 'unite': unite, 'meilleur': meilleur}
+    click.echo(f"  {nom:<40}{valeur:>14.3f} {unite}")
+
+
+def galerie_synthetique(taille, graine=GRAINE):
+    """Galerie d'encodages aléatoires normalisés et identifiants associés"""
+    generateur = np.random.default_rng(graine)
+    encodages = generateur.normal(size=(taille, 128))
+    encodages /= np.linalg.norm(encodages, axis=1, keepdims=True)
+    ids = [f"E{i:06d}" for i in range(taille)]
+    return encodages, ids
+
+
+def requetes_synthetiques(encodages, nombre, graine=GRAINE):
+    """Moitié de visages connus (bruités), moitié de visages inconnus"""
+    generateur = np.random.default_rng(graine + 1)
+    connus = encodages[generateur.integers(0, len(encodages), nombre // 2)]
+    connus = connus + generateur.normal(scale=0.01, size=connus.shape)
+    inconnus = generateur.normal(size=(nombre - len(connus), 128))
+    inconnus /= np.linalg.norm(inconnus, axis=1, keepdims=True)
+    return list(np.vstack([connus, inconnus]))
+
+
+def frames_synthetiques(nombre, largeur=640, hauteur=480, graine=GRAINE):
+    """Frames BGR déterministes : dégradé, bruit et formes en mouvement"""
+    import cv2
+
+    generateur = np.random.default_rng(graine)
+    fond = np.tile(np.linspace(40, 200, largeur, dtype=np.uint8), (hauteur, 1))
+    frames = []
+    for i in range(nombre):
+        frame = np.stack([fond, np.roll(fond, i * 4, axis=1), fond[::-1]], axis=2).copy()
+        frame = cv2.add(frame, generateur.integers(0, 25, frame.shape, dtype=np.uint8))
+        x = (i * 9) % (largeur - 160)
+        cv2.ellipse(frame, (x + 80, 240), (60, 80), 0, 0, 360, (150, 170, 210), -1)
+        cv2.rectangle(frame, (largeur - x - 120, 60), (largeur - x - 40, 160), (30, 30, 30), -1)
+        frames.append(frame)
+    return frames
+
+
+def ecrire_video(frames, chemin, fps=25):
+    """Écrit les frames dans une vidéo mp4"""
+    import cv2
+
+    hauteur, largeur = frames[0].shape[:2]
+    video = cv2.VideoWriter(chemin, cv2.VideoWriter_fourcc(*'mp4v'), fps, (largeur, hauteur))
+    for frame in frames:
+        video.write(frame)
+    video.release()
+
+
+# ==================== SCÉNARIOS ====================
+
+def bench_appariement(resultats, tailles, nombre_requetes):
+    """Débit d'appariement (reconnaissance._apparier) par taille de galerie"""
+    import reconnaissance
+
+    for taille in tailles:
+        encodages, ids = galerie_synthetique(taille)
+        galerie = types.SimpleNamespace(known_encodings=list(encodages), known_ids=ids)
+        requetes = requetes_synthetiques(encodages, nombre_requetes)
+
+        def apparier():
+            reconnaissance._apparier(
+                galerie, requetes, reconnaissance._nouveau_resultat(), reconnaissance.TOLERANCE_STRICTE
+            )
+
+        apparier()  # échauffement
+        duree = statistics.median(_chronometrer(apparier, 3))
+        _ajouter(resultats, f'appariement_{taille}_visages_par_s', len(requetes) / duree, 'visages/s', 'haut')
+
+
+def bench_pipeline(resultats, dossier, nombre_frames):
+    """Latence par frame : décodage, détection HOG, encodage, vidéo et JPEG complets"""
+    import cv2
+    import face_recognition
+    import config
+    import reconnaissance
+
+    frames = frames_synthetiques(nombre_frames)
+    chemin_video = os.path.join(dossier, 'synthetique.mp4')
+    ecrire_video(frames, chemin_video)
+    jpegs = [cv2.imencode('.jpg', f, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes() for f in frames]
+    encodages, ids = galerie_synthetique(1000)
+    galerie = types.SimpleNamespace(known_encodings=list(encodages), known_ids=ids)
+
+    def decoder():
+        capture = cv2.VideoCapture(chemin_video)
+        while capture.read()[0]:
+            pass
+        capture.release()
+
+    rgb = [cv2.cvtColor(f, cv2.COLOR_BGR2RGB) for f in frames]
+
+    def detecter():
+        for image in rgb:
+            face_recognition.face_locations(image, model='hog')
+
+    # Les frames synthétiques ne contiennent pas de vrais visages : l'encodage
+    # est mesuré sur une zone fixe de la taille d'un visage, sans contrôle qualité.
+    # Les mêmes frames sont rejouées : le cache des images quasi identiques
+    # fausserait les mesures.
+    zone = [(140, 400, 340, 240)]
+    config.QUALITE_ACTIVE = False
+    config.CACHE_EMPREINTES_ACTIF = False
+
+    def encoder():
+        for image in rgb:
+            face_recognition.face_encodings(image, zone)
+
+    def encoder_par_lots():
+        encodeur = reconnaissance.EncodeurParLots(
+            galerie, reconnaissance._nouveau_resultat(), reconnaissance.TOLERANCE_STRICTE
+        )
+        for image in rgb:
+            encodeur.ajouter(image, zone)
+        encodeur.vider()
+
+    encoder()  # chargement des modèles
+    _ajouter(resultats, 'frame_decodage_ms', min(_chronometrer(decoder, 3)) * 1000 / len(frames), 'ms', 'bas')
+    _ajouter(resultats, 'frame_detection_ms', min(_chronometrer(detecter, 3)) * 1000 / len(frames), 'ms', 'bas')
+    _ajouter(resultats, 'visage_encodage_ms', min(_chronometrer(encoder, 3)) * 1000 / len(frames), 'ms', 'bas')
+    _ajouter(resultats, 'visage_encodage_lot_ms',
+             min(_chronometrer(encoder_par_lots, 3)) * 1000 / len(frames), 'ms', 'bas')
+
+    duree = min(_chronometrer(lambda: reconnaissance.analyser_video(chemin_video, galerie, pas_frames=1), 3))
+    _ajouter(resultats, 'frame_video_complete_ms', duree * 1000 / len(frames), 'ms', 'bas')
+
+    duree = min(_chronometrer(lambda: reconnaissance.analyser_images(jpegs, galerie), 3))
+    _ajouter(resultats, 'image_jpeg_complete_ms', duree * 1000 / len(jpegs), 'ms', 'bas')
+
+    # Envoi webcam typique : 10 images analysées en parallèle dans le pool partagé
+    duree = min(_chronometrer(lambda: reconnaissance.analyser_images_concurrentes(jpegs[:10], galerie), 3))
+    _ajouter(resultats, 'webcam_10_images_ms', duree * 1000, 'ms', 'bas')
+
+
+def _peupler(db, nombre_etudiants):
+    """Crée le cours de test et des étudiants synthétiques"""
+    db.ajouter_cours(CODE_COURS, 'Cours de benchmark', 'Pr. Benchmark', 'B1', 'prof@example.com')
+    db.etudiants.insert_many([
+        {
+            "numero_etudiant": f"E{i:06d}",
+            "nom": f"Nom{i:06d}",
+            "prenom": "Prenom",
+            "email": f"e{i}@example.com",
+            "photo_path": None,
+            "date_inscription": datetime(2024, 9, 1),
+            "actif": True
+        }
+        for i in range(nombre_etudiants)
+    ])
+
+
+def bench_presences(resultats, db, repetitions, taille_classe):
+    """Coût de ajouter_presence() par étudiant (classes distinctes à chaque séance)"""
+    classes = iter(range(repetitions))
+
+    def seance():
+        debut = next(classes) * taille_classe
+        db.ajouter_presence(CODE_COURS, [f"E{i:06d}" for i in range(debut, debut + taille_classe)])
+
+    durees = _chronometrer(seance, repetitions)
+    _ajouter(resultats, 'ajouter_presence_ms_par_etudiant',
+             statistics.median(durees) * 1000 / taille_classe, 'ms', 'bas')
+
+
+def bench_listes(resultats, client, repetitions):
+    """Latence des routes de liste (client de test Flask, sans réseau)"""
+    routes = {
+        'etudiants': '/api/etudiants',
+        'presences': '/api/presences',
+        'seances': f'/api/seances?code_cours={CODE_COURS}',
+    }
+    for nom, route in routes.items():
+        reponse = client.get(route)  # échauffement
+        if reponse.status_code != 200:
+            raise click.ClickException(f"{route}: statut {reponse.status_code}")
+        durees = _chronometrer(lambda: client.get(route), repetitions)
+        _ajouter(resultats, f'liste_{nom}_p50_ms', _percentile(durees, 50) * 1000, 'ms', 'bas')
+        _ajouter(resultats, f'liste_{nom}_p95_ms', _percentile(durees, 95) * 1000, 'ms', 'bas')
+
+
+# ==================== COMPARAISON ====================
+
+def comparer(resultats, reference, seuil, seuils_metriques):
+    """
+    Compare une exécution à une référence
+
+    Returns:
+        list: (nom, référence, actuel, variation, régression) par mesure commune
+    """
+    lignes = []
+    for nom, mesure in resultats.items():
+        if nom not in reference:
+            continue
+        ancien, nouveau = reference[nom]['valeur'], mesure['valeur']
+        if not ancien:
+            continue
+        variation = (nouveau - ancien) / ancien
+        limite = seuils_metriques.get(nom, seuil)
+        if mesure['meilleur'] == 'haut':
+            regression = variation < -limite
+        else:
+            regression = variation > limite
+        lignes.append((nom, ancien, nouveau, variation, regression))
+    return lignes
+
+
+def _meta(base):
+    """Contexte de l'exécution (pour comparer des mesures comparables)"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processeurs': os.cpu_count(),
+        'base': base,
+        'graine': GRAINE,
+    }
+
+
+@click.command()
+@click.option('--tailles', default='1000,10000,100000', show_default=True, help='Tailles de galerie (appariement)')
+@click.option('--requetes', 'nombre_requetes', default=200, show_default=True, help='Visages appariés par mesure')
+@click.option('--frames', 'nombre_frames', default=60, show_default=True, help='Frames de la vidéo synthétique')
+@click.option('--repetitions', default=20, show_default=True, help='Répétitions (présences, listes)')
+@click.option('--classe', 'taille_classe', default=30, show_default=True, help='Étudiants par séance')
+@click.option('--etudiants', 'nombre_etudiants', default=2000, show_default=True, help='Étudiants en base')
+@click.option('--mongodb', help='URI MongoDB locale (par défaut: mongomock en mémoire)')
+@click.option('--seulement', multiple=True, type=click.Choice(SCENARIOS), help='Scénarios à exécuter')
+@click.option('--sortie', type=click.Path(), help='Fichier JSON de résultats')
+@click.option('--reference', type=click.File('r'), help='Résultats JSON de référence')
+@click.option('--seuil', default=0.15, show_default=True, help='Dégradation tolérée (0.15 = 15 %)')
+@click.option('--seuil-metrique', 'seuils', multiple=True, help='Seuil propre à une mesure: nom=0.25')
+def main(tailles, nombre_requetes, nombre_frames, repetitions, taille_classe, nombre_etudiants,
+         mongodb, seulement, sortie, reference, seuil, seuils):
+    """Exécute la suite de benchmarks et la compare éventuellement à une référence"""
+    scenarios = seulement or SCENARIOS
+    if taille_classe * repetitions > nombre_etudiants:
+        raise click.BadParameter('--classe × --repetitions dépasse --etudiants')
+    seuils_metriques = {}
+    for s in seuils:
+        nom, _, valeur = s.partition('=')
+        seuils_metriques[nom] = float(valeur)
+
+    logging.basicConfig(level=logging.WARNING)
+    dossier = tempfile.mkdtemp(prefix='bench_presence_')
+
+    # La configuration est lue à l'import des modules du backend
+    os.environ.update(
+        DATABASE_NAME='presence_benchmark',
+        EMAIL_EXPEDITEUR_INTEGRE='false',
+        ENCODAGES_DIR=os.path.join(dossier, 'encodages'),
+        GALERIE_CACHE=os.path.join(dossier, 'galerie.npz'),
+        LOG_LEVEL='WARNING',
+    )
+    if mongodb:
+        os.environ['MONGODB_URI'] = mongodb
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            raise click.ClickException("mongomock absent : pip install mongomock, ou --mongodb URI")
+        import database
+        database.MongoClient = mongomock.MongoClient
+
+    resultats = {}
+    if 'appariement' in scenarios:
+        click.echo("▶ Appariement")
+        bench_appariement(resultats, [int(t) for t in tailles.split(',')], nombre_requetes)
+    if 'pipeline' in scenarios:
+        click.echo("▶ Pipeline par frame")
+        bench_pipeline(resultats, dossier, nombre_frames)
+
+    if 'presences' in scenarios or 'listes' in scenarios:
+        import api
+
+        logging.getLogger().setLevel(logging.WARNING)
+        db = api.db.obtenir()
+        db.client.drop_database(db.db.name)
+        db.creer_index()
+        _peupler(db, nombre_etudiants)
+        try:
+            if 'presences' in scenarios:
+                click.echo("▶ Enregistrement des présences")
+                bench_presences(resultats, db, repetitions, taille_classe)
+            if 'listes' in scenarios:
+                click.echo("▶ Routes de liste")
+                bench_listes(resultats, api.app.test_client(), repetitions)
+        finally:
+            db.client.drop_database(db.db.name)
+
+    rapport = {'meta': _meta(mongodb or 'mongomock'), 'resultats': resultats}
+    if sortie:
+        with open(sortie, 'w') as f:
+            json.dump(rapport, f, indent=2)
+        click.echo(f"\n💾 Résultats: {sortie}")
+
+    if reference:
+        lignes = comparer(resultats, json.load(reference)['resultats'], seuil, seuils_metriques)
+        click.echo(f"\n{'Mesure':<40}{'référence':>14}{'actuel':>14}{'écart':>10}")
+        for nom, ancien, nouveau, variation, regression in lignes:
+            statut = '  ❌ régression' if regression else ''
+            click.echo(f"{nom:<40}{ancien:>14.3f}{nouveau:>14.3f}{variation:>+9.1%}{statut}")
+        regressions = [l for l in lignes if l[4]]
+        if regressions:
+            raise SystemExit(f"{len(regressions)} régression(s) au-delà du seuil")
+        click.echo("✅ Aucune régression")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,23 @@
 // Configuration API
 const API_URL = 'http://localhost:5000';
+// Routes de reconnaissance (vidéo, webcam) : pool lourd de production
+// (backend/production.py, port 5001). Le pool léger (5000) les refuse (421).
+// Si rien n'écoute sur 5001 (serveur de développement `python api.py`),
+// les requêtes repartent vers API_URL.
+const API_RECONNAISSANCE_URL = 'http://localhost:5001';
+let reconnaissanceUrl = API_RECONNAISSANCE_URL;
+
+async function fetchReconnaissance(chemin, options) {
+    try {
+        return await fetch(`${reconnaissanceUrl}${chemin}`, options);
+    } catch (erreur) {
+        // Erreur réseau (connexion refusée) : serveur unique de développement
+        if (reconnaissanceUrl === API_URL) throw erreur;
+        console.warn(`⚠️ ${reconnaissanceUrl} injoignable, reconnaissance envoyée à ${API_URL}`);
+        reconnaissanceUrl = API_URL;
+        return fetch(`${reconnaissanceUrl}${chemin}`, options);
+    }
+}
 
 // Navigation entre onglets
 function showTab(tabName, event) {
@@ -60,8 +78,14 @@ async function loadStudents() {
                 const studentName = student.nom || student.nom_complet || 'Sans nom';
                 const studentEmail = student.email || 'Non renseigné';
                 
+                // Miniature servie avec un cache long (jamais la photo d'origine)
+                const miniature = student.miniature
+                    ? `<img class="miniature" src="${API_URL}${student.miniature}" alt="" loading="lazy">`
+                    : '';
+                
                 return `
                     <div class="list-item">
+                        ${miniature}
                         <div class="list-item-info">
                             <h3>${studentName}</h3>
                             <p>ID: ${studentId} | Email: ${studentEmail}</p>
@@ -316,7 +340,8 @@ document.getElementById('takeAttendanceForm')?.addEventListener('submit', async
     resultBox.style.display = 'block';
     
     try {
-        const response = await fetch(`${API_URL}/api/presences/video`, {
+        // Séance dans l'URL : le serveur peut refuser avant de recevoir la vidéo
+        const response = await fetchReconnaissance(`/api/presences/video?code_cours=${encodeURIComponent(courseId)}`, {
             method: 'POST',
             body: formData
         });
@@ -351,7 +376,7 @@ document.getElementById('takeAttendanceForm')?.addEventListener('submit', async
                     <div style="background:#dcfce7; padding:12px; border-radius:5px; margin-top:10px; border-left:4px solid #10b981;">
                         <p style="margin:0; color:#059669;">
                             <span style="font-size:1.3em;">📧</span>
-                            <strong style="margin-left:8px;">Email envoyé au professeur</strong>
+                            <strong style="margin-left:8px;">Email programmé pour le professeur</strong>
                         </p>
                         <p style="margin:5px 0 0 0; color:#666; font-size:0.9em; padding-left:30px;">
                             → ${data.email_destinataire || 'Professeur'}
@@ -517,27 +542,35 @@ document.getElementById('captureNextBtn')?.addEventListener('click', async funct
     try {
         const video = document.getElementById('webcam');
         const canvas = document.getElementById('webcamCanvas');
-        const ctx = canvas.getContext('2d');
-        
-        canvas.width = video.videoWidth;
-        canvas.height = video.videoHeight;
         
-        // Capturer 3 frames avec un petit délai
+        // Capturer 3 vignettes du visage avec un petit délai
         const formData = new FormData();
+        const boites = [];
         
         for (let i = 0; i < 3; i++) {
-            ctx.drawImage(video, 0, 0);
-            const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.9));
-            formData.append('frames', blob, `frame_${i}.jpg`);
+            const vignette = await capturerVignette(video, canvas);
+            formData.append('vignettes', vignette.blob, `vignette_${i}.jpg`);
+            boites.push(vignette.boite);
             if (i < 2) await new Promise(resolve => setTimeout(resolve, 200));
         }
+        formData.append('boites', JSON.stringify(boites));
+        formData.append('code_cours', liveSession.courseId);
         
         // Envoyer au serveur pour reconnaissance SEULEMENT
-        const response = await fetch(`${API_URL}/api/presences/recognize`, {
+        const seance = `?code_cours=${encodeURIComponent(liveSession.courseId)}`;
+        let response = await fetchReconnaissance(`/api/presences/recognize/vignettes${seance}`, {
             method: 'POST',
             body: formData
         });
         
+        // Serveur sans la route des vignettes : envoyer les images complètes
+        if (response.status === 404) {
+            response = await fetchReconnaissance(`/api/presences/recognize${seance}`, {
+                method: 'POST',
+                body: await capturerFramesCompletes(video, canvas)
+            });
+        }
+        
         const data = await response.json();
         
         console.log('🔍 Données reconnaissance:', data);
@@ -603,6 +636,69 @@ document.getElementById('captureNextBtn')?.addEventListener('click', async funct
     }
 });
 
+// Vignettes envoyées au serveur : visage recadré et réduit (au plus 256 px de côté)
+const VIGNETTE_TAILLE_MAX = 256;
+const detecteurVisages = ('FaceDetector' in window)
+    ? new FaceDetector({ fastMode: true, maxDetectedFaces: 1 })
+    : null;
+
+// Capture une vignette autour du visage (FaceDetector du navigateur, sinon zone centrale)
+// Retourne { blob, boite } où boite = [haut, droite, bas, gauche] dans la vignette, ou null
+async function capturerVignette(video, canvas) {
+    const largeur = video.videoWidth;
+    const hauteur = video.videoHeight;
+    
+    let visage = null;
+    if (detecteurVisages) {
+        try {
+            const visages = await detecteurVisages.detect(video);
+            if (visages.length > 0) visage = visages[0].boundingBox;
+        } catch (error) {
+            console.warn('FaceDetector indisponible:', error);
+        }
+    }
+    
+    // Zone carrée : visage élargi (front, menton), ou centre de l'image
+    let cote = visage
+        ? Math.max(visage.width, visage.height) * 1.6
+        : Math.min(largeur, hauteur) * 0.6;
+    cote = Math.min(cote, largeur, hauteur);
+    const centreX = visage ? visage.x + visage.width / 2 : largeur / 2;
+    const centreY = visage ? visage.y + visage.height / 2 : hauteur / 2;
+    const x = Math.max(0, Math.min(centreX - cote / 2, largeur - cote));
+    const y = Math.max(0, Math.min(centreY - cote / 2, hauteur - cote));
+    
+    const echelle = Math.min(1, VIGNETTE_TAILLE_MAX / cote);
+    canvas.width = canvas.height = Math.round(cote * echelle);
+    canvas.getContext('2d').drawImage(video, x, y, cote, cote, 0, 0, canvas.width, canvas.height);
+    const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.85));
+    
+    const boite = visage ? [
+        Math.round((visage.y - y) * echelle),
+        Math.round((visage.x + visage.width - x) * echelle),
+        Math.round((visage.y + visage.height - y) * echelle),
+        Math.round((visage.x - x) * echelle)
+    ] : null;
+    return { blob, boite };
+}
+
+// Ancien format : 3 images complètes (serveur sans /api/presences/recognize/vignettes)
+async function capturerFramesCompletes(video, canvas) {
+    const ctx = canvas.getContext('2d');
+    canvas.width = video.videoWidth;
+    canvas.height = video.videoHeight;
+    
+    const formData = new FormData();
+    for (let i = 0; i < 3; i++) {
+        ctx.drawImage(video, 0, 0);
+        const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.9));
+        formData.append('frames', blob, `frame_${i}.jpg`);
+        if (i < 2) await new Promise(resolve => setTimeout(resolve, 200));
+    }
+    formData.append('code_cours', liveSession.courseId);
+    return formData;
+}
+
 // Passer à l'étudiant suivant
 document.getElementById('nextStudentBtn')?.addEventListener('click', function() {
     console.log('\n🔘 ========== BOUTON SUIVANT CLIQUÉ =========='  );
@@ -757,7 +853,7 @@ document.getElementById('stopWebcam')?.addEventListener('click', async function(
                 showNotification(`✅ Présence enregistrée: ${liveSession.presents.size} présent(s), ${absents.length} absent(s)`, 'success');
                 
                 if (data.email_envoye) {
-                    showNotification(`📧 Email envoyé au professeur`, 'success');
+                    showNotification(`📧 Email programmé pour le professeur`, 'success');
                 }
                 
                 // Afficher le résumé dans webcamStatus
@@ -7,6 +7,7 @@ db = db.getSiblingDB('systeme_presence');
 db.createCollection('etudiants');
 db.createCollection('cours');
 db.createCollection('presences');
+db.createCollection('seances');
 
 // Index pour etudiants
 db.etudiants.createIndex({ "numero_etudiant": 1 }, { unique: true });
@@ -23,6 +24,10 @@ db.presences.createIndex({ "etudiant_id": 1 });
 db.presences.createIndex({ "cours_code": 1 });
 db.presences.createIndex({ "etudiant_numero": 1 });
 
+// Index pour seances (un document par séance de cours)
+db.seances.createIndex({ "cours_id": 1, "date": -1 });
+db.seances.createIndex({ "etudiant_ids": 1, "date": -1 });
+
 // Insérer des données de test (optionnel)
 db.cours.insertOne({
     "code_cours": "DEMO101",
@@ -34,6 +39,6 @@ db.cours.insertOne({
 });
 
 print('✅ Base de données initialisée avec succès!');
-print('✅ Collections créées: etudiants, cours, presences');
+print('✅ Collections créées: etudiants, cours, presences, seances');
 print('✅ Index créés pour optimiser les performances');
 print('✅ Cours de démonstration créé: DEMO101');
@@ -83,7 +83,8 @@ if [ "$BACKEND_ALREADY_RUNNING" != true ]; then
     cd "$PROJECT_DIR/backend"
     source ../env/bin/activate
     
-    # Démarrer l'API en arrière-plan
+    # Créer les index MongoDB (idempotent) puis démarrer l'API en arrière-plan
+    python migrations.py index > ../logs/migrations.log 2>&1
     nohup python api.py > ../logs/api.log 2>&1 &
     BACKEND_PID=$!
     
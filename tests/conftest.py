@@ -0,0 +1,36 @@
+"""Configuration commune des tests (modules du backend importables, MongoDB en mémoire)"""
+import inspect
+import os
+import sys
+
+import mongomock
+import pytest
+from mongomock.collection import BulkOperationBuilder
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+
+def _sans_options_recentes(methode):
+    """pymongo 4.11+ passe `sort` (et d'autres options) aux opérations de bulk_write, que mongomock ignore"""
+    parametres = set(inspect.signature(methode).parameters)
+
+    def appel(self, *args, **kwargs):
+        return methode(self, *args, **{cle: valeur for cle, valeur in kwargs.items() if cle in parametres})
+    return appel
+
+
+BulkOperationBuilder.add_update = _sans_options_recentes(BulkOperationBuilder.add_update)
+BulkOperationBuilder.add_replace = _sans_options_recentes(BulkOperationBuilder.add_replace)
+
+
+class BaseMemoire:
+    """Remplace DatabaseManager là où seul `db.db` est utilisé"""
+
+    def __init__(self):
+        self.client = mongomock.MongoClient()
+        self.db = self.client['presence_tests']
+
+
+@pytest.fixture
+def base():
+    return BaseMemoire()
@@ -0,0 +1,101 @@
+"""Contrôle d'admission : part par séance comptant les requêtes admises et en attente"""
+import threading
+import time
+
+import pytest
+
+from admission import Admission, AdmissionRefusee
+
+
+def occuper(admission, seance, liberation, admises):
+    """Entre dans l'admission et garde la place jusqu'à `liberation`"""
+    try:
+        with admission.entrer(seance):
+            admises.append(seance)
+            liberation.wait(5)
+    except AdmissionRefusee as e:
+        admises.append((seance, e.statut))
+
+
+def attendre(condition, delai=2):
+    fin = time.monotonic() + delai
+    while not condition():
+        assert time.monotonic() < fin, "condition non atteinte"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def liberation():
+    evenement = threading.Event()
+    yield evenement
+    evenement.set()
+
+
+def test_requetes_en_attente_comptent_dans_la_part_de_la_seance(liberation):
+    admission = Admission('test', concurrence=1, file_max=3, attente_max=5, par_seance=2)
+    admises = []
+    threads = [
+        threading.Thread(target=occuper, args=(admission, 'INF101', liberation, admises)),
+        threading.Thread(target=occuper, args=(admission, 'INF101', liberation, admises)),
+    ]
+    for thread in threads:
+        thread.start()
+    attendre(lambda: admission.etat()['en_cours'] == 1 and admission.etat()['en_attente'] == 1)
+
+    # Une admise + une en attente : la séance a atteint sa part
+    with pytest.raises(AdmissionRefusee) as refus:
+        with admission.entrer('INF101'):
+            pass
+    assert (refus.value.statut, refus.value.raison) == (429, 'seance')
+    assert admission.etat()['en_attente'] == 1
+
+    # Une autre séance garde sa place dans la file
+    autre = threading.Thread(target=occuper, args=(admission, 'MAT201', liberation, admises))
+    autre.start()
+    attendre(lambda: admission.etat()['en_attente'] == 2)
+
+    liberation.set()
+    for thread in threads + [autre]:
+        thread.join(5)
+    assert sorted(admises) == ['INF101', 'INF101', 'MAT201']
+    assert admission._seances == {}
+
+
+def test_attente_expiree_rend_la_part_de_la_seance(liberation):
+    admission = Admission('test', concurrence=1, file_max=2, attente_max=0.2, par_seance=2)
+    admises = []
+    premiere = threading.Thread(target=occuper, args=(admission, 'INF101', liberation, admises))
+    premiere.start()
+    attendre(lambda: admission.etat()['en_cours'] == 1)
+
+    with pytest.raises(AdmissionRefusee) as refus:
+        with admission.entrer('INF101'):
+            pass
+    assert (refus.value.statut, refus.value.raison) == (503, 'attente')
+    assert admission._seances == {'INF101': 1}
+
+    liberation.set()
+    premiere.join(5)
+    assert admission._seances == {}
+
+
+def test_seance_lue_sans_le_corps():
+    from werkzeug.test import EnvironBuilder
+    from werkzeug.wrappers import Request
+
+    from admission import seance_requete
+
+    class CorpsInterdit:
+        def read(self, *args):
+            raise AssertionError("corps lu avant l'admission")
+        readline = read
+
+    for options, attendu in (
+        ({'query_string': 'code_cours=INF101'}, 'INF101'),
+        ({'headers': {'X-Code-Cours': 'INF102'}}, 'INF102'),
+        ({}, None),
+    ):
+        environ = EnvironBuilder(method='POST', content_type='multipart/form-data; boundary=x',
+                                 content_length=10 ** 9, **options).get_environ()
+        environ['wsgi.input'] = CorpsInterdit()
+        assert seance_requete(Request(environ)) == attendu
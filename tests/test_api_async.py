@@ -0,0 +1,39 @@
+"""api_async : mêmes routes que api.py, /api/presences envoyé en flux"""
+import asyncio
+import json
+import os
+import re
+
+import pytest
+
+api_async = pytest.importorskip('api_async')
+
+# api.py et api_async.py enregistrent les mêmes métriques : on compare leurs sources
+ROUTE = re.compile(r"@app\.route\('([^']+)'.*methods=\[([^\]]+)\]")
+
+
+def routes(module):
+    chemin = os.path.join(os.path.dirname(api_async.__file__), f'{module}.py')
+    with open(chemin, encoding='utf-8') as f:
+        return {(regle, methodes) for regle, methodes in ROUTE.findall(f.read())}
+
+
+def test_memes_routes_que_api():
+    assert routes('api') == routes('api_async')
+
+
+def test_presences_en_flux(monkeypatch):
+    async def presences():
+        for numero in range(2500):
+            yield {'etudiant_numero': f'E{numero}'}
+
+    monkeypatch.setattr(api_async.db, 'iterer_presences', presences)
+
+    async def appeler():
+        reponse = await api_async.app.test_client().get('/api/presences')
+        return reponse.status_code, await reponse.get_data()
+
+    statut, corps = asyncio.run(appeler())
+    donnees = json.loads(corps)
+    assert statut == 200 and donnees['success'] and donnees['count'] == 2500
+    assert donnees['presences'][-1] == {'etudiant_numero': 'E2499'}
@@ -0,0 +1,119 @@
+"""Service d'appariement partitionné : le top-k fusionné des shards égale la recherche exhaustive"""
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from service_appariement import ClientAppariement, ServiceAppariement, shard_de
+
+K = 5
+
+
+def top_k_exhaustif(ids, encodages, requetes, k):
+    """Référence : distances à toute la galerie, triées"""
+    distances = np.linalg.norm(encodages[None, :, :] - requetes[:, None, :], axis=2)
+    return [[ids[j] for j in np.argsort(ligne, kind='stable')[:k]] for ligne in distances]
+
+
+def ids_de(resultats):
+    return [[etudiant_id for etudiant_id, _ in top] for top in resultats]
+
+
+@pytest.fixture(scope='module')
+def galerie():
+    generateur = np.random.default_rng(42)
+    encodages = generateur.normal(size=(300, 128)).astype(np.float32)
+    ids = [f"E{i:04d}" for i in range(len(encodages))]
+    requetes = encodages[generateur.choice(len(encodages), 20)] + \
+        generateur.normal(scale=0.05, size=(20, 128)).astype(np.float32)
+    return ids, encodages, requetes
+
+
+@pytest.fixture(params=[2, 3], ids=['2-shards', '3-shards'])
+def service(request, galerie):
+    ids, encodages, _ = galerie
+    service = ServiceAppariement(request.param)
+    service.demarrer(ids, encodages)
+    yield service
+    service.arreter()
+
+
+def test_galerie_repartie_sur_tous_les_shards(service, galerie):
+    ids, _, _ = galerie
+    etat = service.etat()
+    assert etat['total'] == len(ids)
+    assert len(etat['tailles']) == service.nb_shards
+    assert all(taille > 0 for taille in etat['tailles'])
+    attendues = [sum(1 for i in ids if shard_de(i, service.nb_shards) == n) for n in range(service.nb_shards)]
+    assert etat['tailles'] == attendues
+
+
+def test_top_k_fusionne_egal_recherche_exhaustive(service, galerie):
+    ids, encodages, requetes = galerie
+    resultats = service.apparier(requetes, k=K)
+    assert ids_de(resultats) == top_k_exhaustif(ids, encodages, requetes, K)
+    # Distances triées et cohérentes avec la référence
+    for requete, top in zip(requetes, resultats):
+        distances = [d for _, d in top]
+        assert distances == sorted(distances)
+        attendues = [np.linalg.norm(encodages[ids.index(i)] - requete) for i, _ in top]
+        assert distances == pytest.approx(attendues, abs=1e-4)
+
+
+def test_top_k_apres_inscription_et_suppression(service, galerie):
+    ids, encodages, requetes = galerie
+    ids, encodages = list(ids), encodages.copy()
+
+    # Inscription d'un visage au plus près de la première requête
+    service.inscrire('NOUVEAU', requetes[0])
+    ids.append('NOUVEAU')
+    encodages = np.vstack([encodages, requetes[0]])
+    resultats = service.apparier(requetes, k=K)
+    assert resultats[0][0][0] == 'NOUVEAU'
+    assert ids_de(resultats) == top_k_exhaustif(ids, encodages, requetes, K)
+
+    # Suppression du meilleur candidat de chaque requête, sur plusieurs shards
+    supprimes = {top[1][0] for top in resultats} | {'NOUVEAU'}
+    for etudiant_id in supprimes:
+        assert service.supprimer(etudiant_id) is True
+    assert service.supprimer('NOUVEAU') is False
+    gardes = [i for i, etudiant_id in enumerate(ids) if etudiant_id not in supprimes]
+    ids = [ids[i] for i in gardes]
+    encodages = encodages[gardes]
+
+    resultats = service.apparier(requetes, k=K)
+    assert not supprimes & {etudiant_id for top in ids_de(resultats) for etudiant_id in top}
+    assert ids_de(resultats) == top_k_exhaustif(ids, encodages, requetes, K)
+    assert service.etat()['total'] == len(ids)
+
+
+def test_redimensionner_conserve_les_resultats(service, galerie):
+    ids, encodages, requetes = galerie
+    service.redimensionner(service.nb_shards + 1)
+    assert service.etat()['total'] == len(ids)
+    assert ids_de(service.apparier(requetes, k=K)) == top_k_exhaustif(ids, encodages, requetes, K)
+
+
+def test_client_par_socket(service, galerie):
+    ids, encodages, requetes = galerie
+    adresse = os.path.join(tempfile.mkdtemp(), 'appariement.sock')
+    cle = secrets.token_bytes(16)
+    threading.Thread(target=service.servir, args=(adresse, cle), daemon=True).start()
+    while not os.path.exists(adresse):
+        time.sleep(0.02)
+    assert os.stat(adresse).st_mode & 0o777 == 0o600
+
+    client = ClientAppariement(adresse, cle)
+    client.inscrire('PAR_SOCKET', requetes[1])
+    assert client.apparier(requetes[1:2], k=1)[0][0][0] == 'PAR_SOCKET'
+    assert client.supprimer('PAR_SOCKET') is True
+    assert ids_de(client.apparier(requetes, k=K)) == top_k_exhaustif(ids, encodages, requetes, K)
+
+    # Un client sans la bonne clé est refusé, le service continue d'accepter les autres
+    with pytest.raises(Exception):
+        ClientAppariement(adresse, b'mauvaise-cle').etat()
+    assert ClientAppariement(adresse, cle).etat()['total'] == len(ids)
@@ -0,0 +1,39 @@
+"""Cache des boîtes par empreinte : réservé aux images webcam/interactives"""
+import numpy as np
+import pytest
+
+from cache_empreintes import CacheEmpreintes
+
+reconnaissance = pytest.importorskip('reconnaissance')
+
+
+class Detecteur:
+    nom = 'test'
+
+    def __init__(self):
+        self.appels = 0
+
+    def detecter(self, image):
+        self.appels += 1
+        return [(10, 60, 60, 10)]
+
+
+@pytest.fixture
+def cache_frames(monkeypatch):
+    cache = CacheEmpreintes('frames_test')
+    monkeypatch.setattr(reconnaissance, 'CACHE_FRAMES', cache)
+    monkeypatch.setattr(reconnaissance.config, 'CACHE_EMPREINTES_ACTIF', True)
+    return cache
+
+
+def test_frames_video_hors_cache(cache_frames):
+    image = np.random.default_rng(0).integers(0, 255, (120, 160, 3), dtype=np.uint8)
+    detecteur = Detecteur()
+
+    for _ in range(2):
+        reconnaissance._detecter(detecteur, image, cache=False)
+    assert detecteur.appels == 2 and len(cache_frames) == 0
+
+    for _ in range(2):
+        reconnaissance._detecter(detecteur, image)
+    assert detecteur.appels == 3 and len(cache_frames) == 1
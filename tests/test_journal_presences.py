@@ -0,0 +1,115 @@
+"""Journal local des présences : réservation des lots et écriture idempotente dans MongoDB"""
+import threading
+from datetime import datetime
+
+import mongomock
+import pytest
+
+import config
+import database
+import journal_presences
+from journal_presences import JournalPresences, VidangeJournal
+from migrations import migrer_jour_presences
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(database, 'MongoClient', lambda uri: mongomock.MongoClient())
+    gestionnaire = database.DatabaseManager()
+    gestionnaire.creer_index()
+    gestionnaire.ajouter_cours('INF101', 'Algorithmique', 'Prof')
+    for numero in ('E1', 'E2', 'E3'):
+        gestionnaire.ajouter_etudiant(numero, f'Nom{numero}', 'Prenom', f'{numero}@isimm.tn')
+    return gestionnaire
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return JournalPresences(str(tmp_path / 'presences.sqlite3'))
+
+
+def test_un_lot_n_est_reserve_que_par_une_vidange(journal):
+    for _ in range(5):
+        journal.deposer('INF101', ['E1'])
+
+    premier = journal.reserver(3, 'a')
+    second = journal.reserver(10, 'b')
+    assert len(premier) == 3 and len(second) == 2
+    assert not {e['id'] for e in premier} & {e['id'] for e in second}
+    assert journal.reserver(10, 'c') == []
+
+
+def test_reservation_expiree_ou_echec_rend_les_entrees(journal):
+    journal.deposer('INF101', ['E1'])
+    journal.deposer('INF101', ['E2'])
+
+    # Vidange arrêtée pendant l'écriture : sa réservation expire
+    expiree = journal.reserver(1, 'arretee', bail=-1)
+    reprises = journal.reserver(10, 'b')
+    assert expiree[0]['id'] in {e['id'] for e in reprises}
+    assert len(reprises) == 2
+
+    # Échec MongoDB : les entrées sont libérées aussitôt
+    journal.noter_echec([e['id'] for e in reprises], RuntimeError('MongoDB injoignable'))
+    assert len(journal.reserver(10, 'c')) == 2
+    assert journal.etat()['derniere_erreur'] == 'MongoDB injoignable'
+
+
+def test_age_de_la_plus_ancienne_entree(journal, monkeypatch):
+    assert journal.age() == 0
+    monkeypatch.setattr(journal_presences.time, 'time', lambda: 1000.0)
+    journal.deposer('INF101', ['E1'])
+    monkeypatch.setattr(journal_presences.time, 'time', lambda: 1042.0)
+    journal.deposer('INF101', ['E2'])
+    assert journal.age() == 42.0
+
+
+def test_vidanges_concurrentes_sans_doublon(db, journal, monkeypatch):
+    monkeypatch.setattr(config, 'JOURNAL_TAILLE_LOT', 3)
+    for _ in range(20):
+        journal.deposer('INF101', ['E1', 'E2', 'E3'])
+
+    vidanges = [VidangeJournal(JournalPresences(journal.chemin), db) for _ in range(4)]
+    ecrites = []
+    threads = [threading.Thread(target=lambda v=v: ecrites.append(v.traiter())) for v in vidanges]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert sum(ecrites) == 20
+    assert journal.taille() == 0
+    assert db.presences.count_documents({}) == 3
+    assert db.seances.count_documents({}) == 20
+
+
+def test_rejouer_une_entree_deja_ecrite_ne_cree_rien(db, journal):
+    journal.deposer('INF101', ['E1', 'E2'])
+    entrees = journal.reserver(10, 'a')
+    assert db.appliquer_entrees_journal(entrees) == []
+    assert db.appliquer_entrees_journal(entrees) == []
+    assert db.presences.count_documents({}) == 2
+    assert db.seances.count_documents({}) == 1
+
+
+def test_enregistrer_presence_une_fois_par_jour(db):
+    premier = db.enregistrer_presence('E1', 'INF101')
+    assert db.enregistrer_presence('E1', 'INF101') == premier
+    presence = db.presences.find_one()
+    assert presence['jour'] == presence['date'].replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def test_migration_jour_supprime_les_doublons(monkeypatch):
+    monkeypatch.setattr(database, 'MongoClient', lambda uri: mongomock.MongoClient())
+    db = database.DatabaseManager()
+    commun = {'etudiant_id': 'e1', 'cours_id': 'c1'}
+    db.presences.insert_many([
+        dict(commun, date=datetime(2025, 10, 1, 9, 0)),
+        dict(commun, date=datetime(2025, 10, 1, 8, 0)),
+        dict(commun, date=datetime(2025, 10, 2, 8, 0)),
+    ])
+
+    assert migrer_jour_presences(db) == (3, 1)
+    assert sorted(p['date'] for p in db.presences.find()) == [datetime(2025, 10, 1, 8, 0), datetime(2025, 10, 2, 8, 0)]
+    assert migrer_jour_presences(db) == (0, 0)
+    db.creer_index()
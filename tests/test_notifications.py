@@ -0,0 +1,179 @@
+"""Outbox des notifications : regroupement, statuts et nouvelles tentatives (SMTP local aiosmtpd)"""
+import email
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+from aiosmtpd.controller import Controller
+
+import config
+from notifications import (
+    ECHEC, EN_ATTENTE, EN_COURS, ENVOYE, ExpediteurEmails, OutboxNotifications
+)
+
+
+class BoiteSmtp:
+    """Gestionnaire aiosmtpd qui garde les messages reçus (ou les refuse)"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.messages = []
+        self.sessions = set()
+        self.statuts_pendant_envoi = []
+        self.refuser = False
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        self.statuts_pendant_envoi.append(sorted(n['statut'] for n in self.collection.find()))
+        if self.refuser:
+            return '451 Service temporairement indisponible'
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+@pytest.fixture
+def outbox(base):
+    outbox = OutboxNotifications(base)
+    outbox.creer_index()
+    return outbox
+
+
+def port_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp(outbox, monkeypatch):
+    boite = BoiteSmtp(outbox.collection)
+    controleur = Controller(boite, hostname='127.0.0.1', port=port_libre())
+    controleur.start()
+    monkeypatch.setattr(config, 'EMAIL_HOST', '127.0.0.1')
+    monkeypatch.setattr(config, 'EMAIL_PORT', controleur.port)
+    monkeypatch.setattr(config, 'EMAIL_STARTTLS', False)
+    monkeypatch.setattr(config, 'EMAIL_USER', '')
+    monkeypatch.setattr(config, 'EMAIL_TIMEOUT', 5)
+    yield boite
+    controleur.stop()
+
+
+def planifier(outbox, destinataire, code_cours, dues=True):
+    """Dépose une notification, due immédiatement si `dues`"""
+    notification_id = outbox.planifier(destinataire, code_cours, f"Cours {code_cours}", ['Ali'], ['Sami'], '2025-10-01')
+    if dues:
+        rendre_dues(outbox)
+    return notification_id
+
+
+def rendre_dues(outbox):
+    outbox.collection.update_many({}, {'$set': {'prochaine_tentative': datetime.now() - timedelta(seconds=1)}})
+
+
+def statuts(outbox):
+    return sorted(n['statut'] for n in outbox.collection.find())
+
+
+def test_planifier_depose_en_attente_apres_fenetre(outbox):
+    planifier(outbox, 'prof@isimm.tn', 'INF101', dues=False)
+    notification = outbox.collection.find_one()
+    assert notification['statut'] == EN_ATTENTE
+    assert notification['tentatives'] == 0
+    assert notification['prochaine_tentative'] > datetime.now()
+
+
+def test_notifications_non_dues_ne_partent_pas(outbox, smtp):
+    planifier(outbox, 'prof@isimm.tn', 'INF101', dues=False)
+    assert ExpediteurEmails(outbox.db).traiter() == 0
+    assert smtp.messages == []
+
+
+def test_regroupement_par_destinataire_sur_une_connexion(outbox, smtp):
+    planifier(outbox, 'a@isimm.tn', 'INF101')
+    planifier(outbox, 'a@isimm.tn', 'INF102')
+    planifier(outbox, 'a@isimm.tn', 'INF103')
+    planifier(outbox, 'b@isimm.tn', 'MAT201')
+
+    assert ExpediteurEmails(outbox.db).traiter() == 2
+
+    # Un email par professeur, tous envoyés sur la même connexion SMTP
+    assert sorted(m.rcpt_tos[0] for m in smtp.messages) == ['a@isimm.tn', 'b@isimm.tn']
+    assert len(smtp.sessions) == 1
+    message_a = email.message_from_bytes(next(m for m in smtp.messages if m.rcpt_tos == ['a@isimm.tn']).content)
+    corps = message_a.get_payload(decode=True).decode()
+    assert all(code in corps for code in ('INF101', 'INF102', 'INF103'))
+
+    regroupees = {n['contenu']['code_cours']: n['regroupees'] for n in outbox.collection.find()}
+    assert regroupees == {'INF101': 3, 'INF102': 3, 'INF103': 3, 'MAT201': 1}
+
+
+def test_transitions_de_statut_jusqu_a_envoye(outbox, smtp):
+    planifier(outbox, 'prof@isimm.tn', 'INF101')
+
+    ExpediteurEmails(outbox.db).traiter()
+
+    # Réservée pendant l'envoi, envoyée ensuite
+    assert smtp.statuts_pendant_envoi == [[EN_COURS]]
+    notification = outbox.collection.find_one()
+    assert notification['statut'] == ENVOYE
+    assert notification['tentatives'] == 1
+    assert 'lot' not in notification and 'verrouille_le' not in notification
+
+
+def test_echec_smtp_replanifie_avec_delai_exponentiel(outbox, smtp, monkeypatch):
+    monkeypatch.setattr(config, 'EMAIL_DELAI_RETRY', 30)
+    monkeypatch.setattr(config, 'EMAIL_TENTATIVES_MAX', 3)
+    planifier(outbox, 'prof@isimm.tn', 'INF101')
+    expediteur = ExpediteurEmails(outbox.db)
+    smtp.refuser = True
+
+    delais = []
+    for _ in range(2):
+        debut = datetime.now()
+        assert expediteur.traiter() == 0
+        notification = outbox.collection.find_one()
+        assert notification['statut'] == EN_ATTENTE
+        assert '451' in notification['derniere_erreur']
+        delais.append((notification['prochaine_tentative'] - debut).total_seconds())
+        rendre_dues(outbox)
+
+    assert delais[0] == pytest.approx(30, abs=2)
+    assert delais[1] == pytest.approx(60, abs=2)
+
+    # Dernière tentative autorisée : abandon
+    expediteur.traiter()
+    notification = outbox.collection.find_one()
+    assert notification['statut'] == ECHEC
+    assert notification['tentatives'] == 3
+    assert smtp.statuts_pendant_envoi == [[EN_COURS]] * 3
+
+
+def test_nouvel_essai_reussi_apres_echec(outbox, smtp):
+    planifier(outbox, 'prof@isimm.tn', 'INF101')
+    expediteur = ExpediteurEmails(outbox.db)
+
+    smtp.refuser = True
+    expediteur.traiter()
+    assert statuts(outbox) == [EN_ATTENTE]
+
+    # Pas de nouvel envoi avant l'échéance du délai
+    smtp.refuser = False
+    assert expediteur.traiter() == 0
+    assert smtp.messages == []
+
+    rendre_dues(outbox)
+    assert expediteur.traiter() == 1
+    notification = outbox.collection.find_one()
+    assert notification['statut'] == ENVOYE
+    assert notification['tentatives'] == 2
+    assert 'derniere_erreur' not in notification
+
+
+def test_envoi_abandonne_en_cours_est_repris(outbox, smtp):
+    planifier(outbox, 'prof@isimm.tn', 'INF101')
+    outbox.collection.update_many({}, {'$set': {
+        'statut': EN_COURS, 'lot': 'ancien', 'verrouille_le': datetime.now() - timedelta(hours=1)
+    }})
+
+    assert ExpediteurEmails(outbox.db).traiter() == 1
+    assert statuts(outbox) == [ENVOYE]
@@ -0,0 +1,15 @@
+"""Ordonnanceur : partage des cœurs entre processus d'analyse"""
+import config
+import ordonnanceur
+
+
+def test_threads_de_l_ordonnanceur_repartis_entre_processus(monkeypatch):
+    monkeypatch.setattr(ordonnanceur.os, 'cpu_count', lambda: 8)
+    monkeypatch.setattr(config, 'ORDONNANCEUR_THREADS', 8)
+    monkeypatch.setattr(config, 'ORDONNANCEUR_THREADS_FIXE', False)
+    assert ordonnanceur.repartir_threads(4) == 2
+    assert ordonnanceur.repartir_threads(16) == 1
+
+    monkeypatch.setattr(config, 'ORDONNANCEUR_THREADS', 3)
+    monkeypatch.setattr(config, 'ORDONNANCEUR_THREADS_FIXE', True)
+    assert ordonnanceur.repartir_threads(4) == 3
@@ -0,0 +1,90 @@
+from datetime import datetime
+
+import mongomock
+import pytest
+
+import database
+from retraitement import PointsReprise, appliquer
+from rapports import GenerateurRapports
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(database, 'MongoClient', lambda uri: mongomock.MongoClient())
+    gestionnaire = database.DatabaseManager()
+    gestionnaire.creer_index()
+    gestionnaire.ajouter_cours('INF101', 'Algorithmique', 'Prof')
+    for numero in ('E1', 'E2', 'E3', 'E4'):
+        gestionnaire.ajouter_etudiant(numero, f'Nom{numero}', 'Prenom', f'{numero}@isimm.tn')
+    return gestionnaire
+
+
+def seance_route(db, identifiant, source, etudiants, heure):
+    """Séance écrite par une route de l'API (via le journal)"""
+    db.appliquer_entrees_journal([{
+        'id': identifiant, 'code_cours': 'INF101', 'etudiants': etudiants,
+        'date': datetime(2026, 3, 2, *heure), 'source': source, 'confiances': {}
+    }])
+    return db.seances.find_one({'journal_id': identifiant})
+
+
+def retraiter(db, tmp_path, cle, presents, fichier='INF101_2026-03-02_0830.mp4', heure=(8, 30), **options):
+    """Un retraitement (nouvelle clé = nouveaux paramètres) d'une vidéo déjà analysée"""
+    points = PointsReprise(str(tmp_path / 'points'))
+    video = {'chemin': fichier, 'code_cours': 'INF101', 'date': datetime(2026, 3, 2, *heure), 'cle': cle}
+    points.ecrire(cle, {
+        'fichier': fichier, 'code_cours': 'INF101', 'date': video['date'].isoformat(),
+        'presents': presents, 'confiances': {numero: 0.8 for numero in presents}
+    })
+    return appliquer([video], points, db, **options)
+
+
+def test_relancer_reprend_la_seance_de_la_route_video(db, tmp_path):
+    seance = seance_route(db, 'route-video', 'video', ['E1', 'E2'], (8, 35))
+
+    ecarts = retraiter(db, tmp_path, 'tolerance-045', ['E2', 'E3'])
+    assert ecarts[0]['ajoutes'] == ['E3'] and ecarts[0]['non_retrouves'] == ['E1']
+    retraiter(db, tmp_path, 'tolerance-050', ['E2', 'E3'])
+
+    seances = list(db.seances.find())
+    assert [s['_id'] for s in seances] == [seance['_id']]
+    assert [p['etudiant_numero'] for p in seances[0]['presents']] == ['E2', 'E3']
+    # Non retrouvé : seulement signalé, la présence reste
+    assert db.numeros_presents('INF101', datetime(2026, 3, 2)) == {'E1', 'E2', 'E3'}
+
+    # Une seule colonne de séance dans la matrice des rapports
+    entete, _ = GenerateurRapports(db, str(tmp_path / 'rapports'))._matrice({'cours_id': seance['cours_id']})
+    assert len(entete) == 3 + 1 + 2
+
+
+def test_seances_webcam_et_interactives_intactes(db, tmp_path):
+    webcam = seance_route(db, 'route-webcam', 'webcam', ['E4'], (8, 40))
+    interactive = seance_route(db, 'route-interactive', 'interactive', ['E1'], (8, 45))
+
+    retraiter(db, tmp_path, 'retirer', ['E2'], retirer=True)
+
+    assert db.seances.find_one({'_id': webcam['_id']}) == webcam
+    assert db.seances.find_one({'_id': interactive['_id']}) == interactive
+    assert db.seances.count_documents({'source': 'retraitement'}) == 1
+    # --retirer ne supprime pas la présence d'un étudiant vu par une autre séance du jour
+    assert db.numeros_presents('INF101', datetime(2026, 3, 2)) == {'E1', 'E2', 'E4'}
+
+
+def test_retirer_supprime_les_non_retrouves(db, tmp_path):
+    seance_route(db, 'route-video', 'video', ['E1', 'E2'], (8, 35))
+
+    ecarts = retraiter(db, tmp_path, 'retirer', ['E2'], retirer=True)
+    assert ecarts[0]['non_retrouves'] == ['E1']
+    assert db.numeros_presents('INF101', datetime(2026, 3, 2)) == {'E2'}
+
+
+def test_deux_cours_le_meme_jour_deux_seances(db, tmp_path):
+    matin = seance_route(db, 'route-matin', 'video', ['E1'], (8, 35))
+    apres_midi = seance_route(db, 'route-apres-midi', 'video', ['E3'], (14, 5))
+
+    retraiter(db, tmp_path, 'matin', ['E1', 'E2'], fichier='INF101_2026-03-02_0830.mp4', heure=(8, 30))
+    retraiter(db, tmp_path, 'apres-midi', ['E3'], fichier='INF101_2026-03-02_1400.mp4', heure=(14, 0))
+
+    assert db.seances.count_documents({}) == 2
+    assert db.seances.find_one({'_id': matin['_id']})['nb_presents'] == 2
+    assert db.seances.find_one({'_id': apres_midi['_id']})['video'].endswith('_1400.mp4')